@@ -978,18 +978,28 @@ class CloudController(object):
                 'status': volume['attach_status'],
                 'volumeId': ec2utils.id_to_ec2_vol_id(volume_id)}
 
-    def _format_kernel_id(self, context, instance_ref, result, key):
+    def _format_kernel_id(self, context, instance_ref, result, key,
+                          image_ids=None):
         kernel_uuid = instance_ref['kernel_id']
         if kernel_uuid is None or kernel_uuid == '':
             return
-        result[key] = ec2utils.glance_id_to_ec2_id(context, kernel_uuid, 'aki')
+        if image_ids is None:
+            result[key] = ec2utils.glance_id_to_ec2_id(context, kernel_uuid,
+                                                       'aki')
+        else:
+            result[key] = ec2utils.image_ec2_id(image_ids[kernel_uuid], 'aki')
 
-    def _format_ramdisk_id(self, context, instance_ref, result, key):
+    def _format_ramdisk_id(self, context, instance_ref, result, key,
+                           image_ids=None):
         ramdisk_uuid = instance_ref['ramdisk_id']
         if ramdisk_uuid is None or ramdisk_uuid == '':
             return
-        result[key] = ec2utils.glance_id_to_ec2_id(context, ramdisk_uuid,
-                                                   'ari')
+        if image_ids is None:
+            result[key] = ec2utils.glance_id_to_ec2_id(context, ramdisk_uuid,
+                                                       'ari')
+        else:
+            result[key] = ec2utils.image_ec2_id(image_ids[ramdisk_uuid],
+                                                'ari')
 
     def describe_instance_attribute(self, context, instance_id, attribute,
                                     **kwargs):
@@ -1101,12 +1111,18 @@ class CloudController(object):
         return {'instancesSet': instances_set}
 
     def _format_instance_bdm(self, context, instance_id, root_device_name,
-                             result):
-        """Format InstanceBlockDeviceMappingResponseItemType"""
+                             result, bdms=None, volumes=None):
+        """Format InstanceBlockDeviceMappingResponseItemType
+
+        bdms, the block device mappings of the instance, and volumes, a
+        dict of their volumes by id, are read here unless given.
+        """
         root_device_type = 'instance-store'
         mapping = []
-        for bdm in db.block_device_mapping_get_all_by_instance(context,
-                                                               instance_id):
+        if bdms is None:
+            bdms = db.block_device_mapping_get_all_by_instance(context,
+                                                               instance_id)
+        for bdm in bdms:
             volume_id = bdm['volume_id']
             if (volume_id is None or bdm['no_device']):
                 continue
@@ -1116,7 +1132,10 @@ class CloudController(object):
                 assert not bdm['virtual_name']
                 root_device_type = 'ebs'
 
-            vol = self.volume_api.get(context, volume_id)
+            if volumes is not None and volume_id in volumes:
+                vol = volumes[volume_id]
+            else:
+                vol = self.volume_api.get(context, volume_id)
             LOG.debug(_("vol = %s\n"), vol)
             # TODO(yamahata): volume attach time
             ebs = {'volumeId': volume_id,
@@ -1178,18 +1197,44 @@ class CloudController(object):
                                                      sort_dir='asc')
             except exception.NotFound:
                 instances = []
+        if not context.is_admin:
+            instances = [inst for inst in instances
+                         if inst['image_ref'] != str(FLAGS.vpn_image_id)]
+
+        # NOTE: read what the instances refer to for all of them at once,
+        # their addresses and security groups came joined to them
+        glance_ids = []
+        for inst in instances:
+            glance_ids.append(inst['image_ref'])
+            glance_ids.extend(inst[key] for key in ('kernel_id', 'ramdisk_id')
+                              if inst[key])
+        image_ids = ec2utils.glance_ids_to_ids(context, glance_ids)
+        bdms = {}
+        for bdm in db.block_device_mapping_get_all_by_instances(context,
+                [inst['id'] for inst in instances]):
+            bdms.setdefault(bdm['instance_id'], []).append(bdm)
+        volume_ids = set(bdm['volume_id'] for instance_bdms in bdms.values()
+                         for bdm in instance_bdms
+                         if bdm['volume_id'] is not None)
+        volumes = dict((volume['id'], volume) for volume in
+                       self.volume_api.get_all_by_ids(context,
+                                                      list(volume_ids)))
+        services = {}
+        for service in db.service_get_all_by_hosts(context.elevated(),
+                list(set(inst['host'] for inst in instances))):
+            services.setdefault(service['host'], []).append(service)
+
         for instance in instances:
-            if not context.is_admin:
-                if instance['image_ref'] == str(FLAGS.vpn_image_id):
-                    continue
             i = {}
             instance_id = instance['id']
             ec2_id = ec2utils.id_to_ec2_id(instance_id)
             i['instanceId'] = ec2_id
             image_uuid = instance['image_ref']
-            i['imageId'] = ec2utils.glance_id_to_ec2_id(context, image_uuid)
-            self._format_kernel_id(context, instance, i, 'kernelId')
-            self._format_ramdisk_id(context, instance, i, 'ramdiskId')
+            i['imageId'] = ec2utils.image_ec2_id(image_ids.get(image_uuid))
+            self._format_kernel_id(context, instance, i, 'kernelId',
+                                   image_ids)
+            self._format_ramdisk_id(context, instance, i, 'ramdiskId',
+                                    image_ids)
             i['instanceState'] = _state_description(
                 instance['vm_state'], instance['shutdown_terminate'])
 
@@ -1223,10 +1268,11 @@ class CloudController(object):
             i['amiLaunchIndex'] = instance['launch_index']
             self._format_instance_root_device_name(instance, i)
             self._format_instance_bdm(context, instance_id,
-                                      i['rootDeviceName'], i)
+                                      i['rootDeviceName'], i,
+                                      bdms.get(instance_id, []), volumes)
             host = instance['host']
-            services = db.service_get_all_by_host(context.elevated(), host)
-            zone = ec2utils.get_availability_zone_by_host(services, host)
+            zone = ec2utils.get_availability_zone_by_host(
+                    services.get(host, []), host)
             i['placement'] = {'availabilityZone': zone}
             if instance['reservation_id'] not in reservations:
                 r = {}
@@ -62,6 +62,17 @@ def glance_id_to_id(context, glance_id):
         return db.s3_image_create(context, glance_id)['id']
 
 
+def glance_ids_to_ids(context, glance_ids):
+    """Convert glance ids to internal (db) ids, returned as a dict."""
+    glance_ids = set(glance_id for glance_id in glance_ids
+                     if glance_id is not None)
+    ids = dict((s3_image['uuid'], s3_image['id']) for s3_image in
+               db.s3_image_get_all_by_uuids(context, list(glance_ids)))
+    for glance_id in glance_ids - set(ids):
+        ids[glance_id] = db.s3_image_create(context, glance_id)['id']
+    return ids
+
+
 def ec2_id_to_glance_id(context, ec2_id):
     image_id = ec2_id_to_id(ec2_id)
     return id_to_glance_id(context, image_id)
@@ -112,12 +123,16 @@ def get_ip_info_for_instance_from_nw_info(nw_info):
 def get_ip_info_for_instance(context, instance):
     """Return a dictionary of IP information for an instance"""
 
-    info_cache = instance['info_cache'] or {}
-    cached_nwinfo = info_cache.get('network_info')
-    # Make sure empty response is turned into []
-    if not cached_nwinfo:
-        cached_nwinfo = []
-    nw_info = network_model.NetworkInfo.hydrate(cached_nwinfo)
+    nw_info = network_model.NetworkInfo.hydrate_from_instance(instance)
+    if nw_info is None:
+        # NOTE: one instance the network service fails for, e.g. deleted
+        #       meanwhile, must not fail a whole DescribeInstances
+        try:
+            nw_info = network.API().get_instance_nw_info(context, instance)
+        except Exception:
+            LOG.exception(_("Failed to get the network info of instance "
+                            "%s"), instance['uuid'])
+            nw_info = network_model.NetworkInfo()
     return get_ip_info_for_instance_from_nw_info(nw_info)
 
 
@@ -0,0 +1,125 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In process cache of the metadata served to instances."""
+
+import sys
+
+from eventlet import event
+
+from nova.common import memorycache
+
+
+class MetadataCache(object):
+    """LRU cache of the metadata of instances, keyed by fixed ip.
+
+    Entries expire ttl seconds after they were loaded and the least
+    recently used one is dropped once max_entries are cached, as the
+    memorycache client they are kept in does.  Concurrent misses of a key
+    wait for the first one to load it instead of loading it again.
+    Entries are tagged with the uuid of their instance so they can be
+    invalidated when the instance changes.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._client = memorycache.Client(max_entries=max(max_entries, 0))
+        # keys by tag, entries dropped by the client since are skipped
+        self._tags = {}
+        self._loading = {}
+        # bumped by invalidate() so loads running meanwhile are not cached
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._client.cache)
+
+    @property
+    def evictions(self):
+        return self._client.evictions
+
+    def get(self, key):
+        """Return the cached value of key or None."""
+        cached = self._client.get(key)
+        if cached is None:
+            return None
+        return cached[0]
+
+    def set(self, key, value, tag=None):
+        """Cache value for key, tagged with tag."""
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        self._client.set(key, (value, tag), self.ttl)
+        if tag is not None:
+            self._tags.setdefault(tag, set()).add(key)
+            if len(self._tags) > 2 * len(self._client.cache) + 64:
+                self._compact()
+
+    def get_or_load(self, key, load):
+        """Return the cached value of key, loading it on a miss.
+
+        load() returns the value and its tag, a value of None is returned
+        but not cached.  Exceptions of load() are raised to every caller
+        waiting for it.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        waiter = self._loading.get(key)
+        if waiter is not None:
+            self.hits += 1
+            return waiter.wait()
+        self.misses += 1
+        waiter = self._loading[key] = event.Event()
+        generation = self._generation
+        try:
+            value, tag = load()
+        except Exception:
+            exc_info = sys.exc_info()
+            del self._loading[key]
+            waiter.send_exception(*exc_info)
+            raise exc_info[0], exc_info[1], exc_info[2]
+        del self._loading[key]
+        if value is not None and generation == self._generation:
+            self.set(key, value, tag)
+        waiter.send(value)
+        return value
+
+    def invalidate(self, tag):
+        """Drop the entries tagged with tag."""
+        self._generation += 1
+        for key in self._tags.pop(tag, ()):
+            cached = self._client.get(key)
+            if cached is not None and cached[1] == tag:
+                self._client.delete(key)
+
+    def clear(self):
+        self._generation += 1
+        self._client = memorycache.Client(
+                max_entries=max(self.max_entries, 0))
+        self._tags.clear()
+
+    def _compact(self):
+        """Drop the keys no longer cached, and the tags left without any."""
+        cache = self._client.cache
+        for tag, keys in self._tags.items():
+            keys.intersection_update(cache)
+            if not keys:
+                del self._tags[tag]
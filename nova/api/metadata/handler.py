@@ -24,6 +24,7 @@ import webob.dec
 import webob.exc
 
 from nova.api.ec2 import ec2utils
+from nova.api.metadata import cache
 from nova import block_device
 from nova import compute
 from nova import context
@@ -32,11 +33,31 @@ from nova import exception
 from nova import flags
 from nova import log as logging
 from nova import network
+from nova.openstack.common import cfg
+from nova import rpc
 from nova import volume
 from nova import wsgi
 
 LOG = logging.getLogger(__name__)
+
+metadata_opts = [
+    cfg.IntOpt('metadata_cache_expiration',
+               default=15,
+               help='Seconds the metadata of an instance is cached, 0 to '
+                    'not cache it'),
+    cfg.IntOpt('metadata_cache_invalidated_expiration',
+               default=300,
+               help='Seconds the metadata of an instance is cached when '
+                    'metadata_cache_invalidation is set, which drops it '
+                    'as soon as the instance changes, 0 to not cache it'),
+    cfg.IntOpt('metadata_cache_max_entries',
+               default=10000,
+               help='Number of instances a metadata api worker caches the '
+                    'metadata of when memcached_servers is not set'),
+    ]
+
 FLAGS = flags.FLAGS
+FLAGS.register_opts(metadata_opts)
 flags.DECLARE('use_forwarded_for', 'nova.api.auth')
 flags.DECLARE('dhcp_domain', 'nova.network.manager')
 
@@ -79,7 +100,35 @@ class MetadataRequestHandler(wsgi.Application):
         self.compute_api = compute.API(
                 network_api=self.network_api,
                 volume_api=volume.API())
-        self._cache = memcache.Client(FLAGS.memcached_servers, debug=0)
+        self._memcache = None
+        max_entries = FLAGS.metadata_cache_max_entries
+        if FLAGS.memcached_servers:
+            self._memcache = memcache.Client(FLAGS.memcached_servers, debug=0)
+            # NOTE: only coalesce the concurrent misses
+            max_entries = 0
+        if FLAGS.metadata_cache_invalidation:
+            self._ttl = FLAGS.metadata_cache_invalidated_expiration
+        else:
+            self._ttl = FLAGS.metadata_cache_expiration
+        self._cache = cache.MetadataCache(max_entries, self._ttl)
+        if FLAGS.metadata_cache_invalidation:
+            self._conn = rpc.create_connection(new=True)
+            self._conn.create_consumer(FLAGS.metadata_cache_topic, self,
+                                       fanout=True)
+            self._conn.consume_in_thread()
+
+    def invalidate_instance(self, context, instance_uuid):
+        """Drop the cached metadata of an instance, called over rpc."""
+        self._cache.invalidate(instance_uuid)
+        if self._memcache:
+            index_key = 'metadata-instance-%s' % instance_uuid
+            for address in self._memcache.get(index_key) or []:
+                cache_key = 'metadata-%s' % address
+                cached = self._memcache.get(cache_key)
+                # NOTE: the address may be used by another instance since
+                if cached and cached[1] == instance_uuid:
+                    self._memcache.delete(cache_key)
+            self._memcache.delete(index_key)
 
     def _format_instance_mapping(self, ctxt, instance_ref):
         root_device_name = instance_ref['root_device_name']
@@ -131,17 +180,24 @@ class MetadataRequestHandler(wsgi.Application):
         if not address:
             raise exception.FixedIpNotFoundForAddress(address=address)
 
-        cache_key = 'metadata-%s' % address
-        data = self._cache.get(cache_key)
-        if data:
-            return data
+        return self._cache.get_or_load(address,
+                                       lambda: self._load_metadata(address))
+
+    def _load_metadata(self, address):
+        """Return the metadata of the instance with address and its uuid."""
+        if self._memcache:
+            cache_key = 'metadata-%s' % address
+            cached = self._memcache.get(cache_key)
+            # NOTE: the entries are (data, instance uuid) tuples
+            if isinstance(cached, tuple):
+                return cached
 
         ctxt = context.get_admin_context()
         try:
             fixed_ip = self.network_api.get_fixed_ip_by_address(ctxt, address)
             instance_ref = db.instance_get(ctxt, fixed_ip['instance_id'])
         except exception.NotFound:
-            return None
+            return None, None
 
         hostname = "%s.%s" % (instance_ref['hostname'], FLAGS.dhcp_domain)
         host = instance_ref['host']
@@ -200,9 +256,17 @@ class MetadataRequestHandler(wsgi.Application):
         if False:  # TODO(vish): store product codes
             data['product-codes'] = []
 
-        self._cache.set(cache_key, data, 15)
-
-        return data
+        instance_uuid = instance_ref['uuid']
+        if self._memcache and self._ttl:
+            self._memcache.set(cache_key, (data, instance_uuid), self._ttl)
+            # The addresses cached per instance, for invalidate_instance()
+            index_key = 'metadata-instance-%s' % instance_uuid
+            addresses = self._memcache.get(index_key) or []
+            if address not in addresses:
+                addresses = addresses + [address]
+            self._memcache.set(index_key, addresses, self._ttl)
+
+        return data, instance_uuid
 
     def print_data(self, data):
         if isinstance(data, dict):
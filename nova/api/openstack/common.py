@@ -29,6 +29,7 @@ from nova.compute import vm_states
 from nova.compute import task_states
 from nova import flags
 from nova import log as logging
+from nova import network
 from nova.network import model as network_model
 from nova import quota
 
@@ -180,14 +181,20 @@ def limited(items, request, max_limit=FLAGS.osapi_max_limit):
     return items[offset:range_end]
 
 
-def limited_by_marker(items, request, max_limit=FLAGS.osapi_max_limit):
-    """Return a slice of items according to the requested marker and limit."""
+def get_limit_and_marker(request, max_limit=FLAGS.osapi_max_limit):
+    """Return the limit, at most max_limit, and marker of a request."""
     params = get_pagination_params(request)
-
     limit = params.get('limit', max_limit)
+    limit = min(max_limit, limit)
     marker = params.get('marker')
 
-    limit = min(max_limit, limit)
+    return limit, marker
+
+
+def limited_by_marker(items, request, max_limit=FLAGS.osapi_max_limit):
+    """Return a slice of items according to the requested marker and limit."""
+    limit, marker = get_limit_and_marker(request, max_limit)
+
     start_index = 0
     if marker:
         start_index = -1
@@ -288,7 +295,7 @@ def dict_to_query_str(params):
 
 def get_networks_for_instance_from_nw_info(nw_info):
     networks = {}
-    LOG.debug(_('Converting nw_info: %s') % nw_info)
+    LOG.debug(_('Converting nw_info: %s'), nw_info)
     for vif in nw_info:
         ips = vif.fixed_ips()
         floaters = vif.floating_ips()
@@ -298,14 +305,22 @@ def get_networks_for_instance_from_nw_info(nw_info):
 
         networks[label]['ips'].extend(ips)
         networks[label]['floating_ips'].extend(floaters)
-        LOG.debug(_('Converted networks: %s') % networks)
+    LOG.debug(_('Converted networks: %s'), networks)
     return networks
 
 
 def get_nw_info_for_instance(context, instance):
-    info_cache = instance['info_cache'] or {}
-    cached_nwinfo = info_cache.get('network_info') or []
-    return network_model.NetworkInfo.hydrate(cached_nwinfo)
+    nw_info = network_model.NetworkInfo.hydrate_from_instance(instance)
+    if nw_info is None:
+        # NOTE: one instance the network service fails for, e.g. deleted
+        #       meanwhile, must not fail a whole listing
+        try:
+            nw_info = network.API().get_instance_nw_info(context, instance)
+        except Exception:
+            LOG.exception(_("Failed to get the network info of instance "
+                            "%s"), instance['uuid'])
+            nw_info = network_model.NetworkInfo()
+    return nw_info
 
 
 def get_networks_for_instance(context, instance):
@@ -323,6 +338,18 @@ def get_networks_for_instance(context, instance):
     return get_networks_for_instance_from_nw_info(nw_info)
 
 
+def get_networks_for_instance_in_request(request, instance):
+    """Returns get_networks_for_instance() of an instance, built once per
+    request however many views of the instance the request renders.
+    """
+    networks = request.environ.setdefault('nova.networks_by_instance', {})
+    if instance['uuid'] not in networks:
+        context = request.environ['nova.context']
+        networks[instance['uuid']] = get_networks_for_instance(context,
+                                                               instance)
+    return networks[instance['uuid']]
+
+
 def raise_http_conflict_for_instance_invalid_state(exc, action):
     """Return a webob.exc.HTTPConflict instance containing a message
     appropriate to return via the API based on the original
@@ -68,6 +68,18 @@ class HostActionTemplate(xmlutil.TemplateBuilder):
         return xmlutil.MasterTemplate(root, 1)
 
 
+class HostsActionTemplate(xmlutil.TemplateBuilder):
+    def construct(self):
+        root = xmlutil.TemplateElement('hosts')
+        elem = xmlutil.SubTemplateElement(root, 'host', selector='hosts')
+        elem.set('host')
+        elem.set('status')
+        elem.set('power_action')
+        elem.set('error')
+
+        return xmlutil.MasterTemplate(root, 1)
+
+
 class HostShowTemplate(xmlutil.TemplateBuilder):
     def construct(self):
         root = xmlutil.TemplateElement('host')
@@ -93,6 +105,26 @@ class HostDeserializer(wsgi.XMLDeserializer):
         return dict(body=updates)
 
 
+class HostsDeserializer(wsgi.XMLDeserializer):
+    def default(self, string):
+        try:
+            node = minidom.parseString(string)
+        except expat.ExpatError:
+            msg = _("cannot understand XML")
+            raise exception.MalformedRequestBody(reason=msg)
+
+        body = {'hosts': []}
+        for child in node.childNodes[0].childNodes:
+            if child.nodeType != child.ELEMENT_NODE:
+                continue
+            if child.tagName == 'host':
+                body['hosts'].append(self.extract_text(child))
+            else:
+                body[child.tagName] = self.extract_text(child)
+
+        return dict(body=body)
+
+
 def _list_hosts(req, service=None):
     """Returns a summary list of hosts, optionally filtering
     by service type.
@@ -197,6 +229,86 @@ class HostController(object):
             raise webob.exc.HTTPBadRequest(explanation=e.msg)
         return {"host": host, "power_action": result}
 
+    def _hosts_from_body(self, req, body):
+        """Split the hosts named in body into known and unknown ones."""
+        hosts = body.get('hosts')
+        if not isinstance(hosts, list) or not hosts:
+            explanation = _("A non-empty list of hosts is required")
+            raise webob.exc.HTTPBadRequest(explanation=explanation)
+        listed_hosts = set(h["host_name"]
+                           for h in _list_hosts(req, "compute"))
+        known = [host for host in hosts if host in listed_hosts]
+        unknown = [host for host in hosts if host not in listed_hosts]
+        return known, unknown
+
+    def _hosts_result(self, hosts, unknown, results, key):
+        """Build the per host entries of a multi-host action.
+
+        results is a dict of host -> (result, error) as returned by the
+        HostAPI, a host whose call failed gets an error entry.
+        """
+        entries = []
+        for host in hosts:
+            if host in unknown:
+                entries.append({"host": host,
+                                "error": _("Host not found")})
+                continue
+            result, error = results[host]
+            if error is not None:
+                LOG.warn(_("Action on host %(host)s failed: %(error)s") %
+                         locals())
+                entries.append({"host": host, "error": unicode(error)})
+            else:
+                entries.append({"host": host, key: result})
+        return {"hosts": entries}
+
+    @wsgi.serializers(xml=HostsActionTemplate)
+    @wsgi.deserializers(xml=HostsDeserializer)
+    def update_many(self, req, body):
+        """Enables or disables a number of hosts at once.
+
+        The body names the hosts and the status, e.g.
+        {"hosts": ["host1", "host2"], "status": "disable"}.  Every host
+        is reported on separately, a host that could not be reached
+        doesn't fail the others.
+        """
+        context = req.environ['nova.context']
+        authorize(context)
+        raw_val = body.get("status") or ""
+        val = raw_val.lower().strip()
+        if val not in ("enable", "disable"):
+            explanation = _("Invalid status: '%s'") % raw_val
+            raise webob.exc.HTTPBadRequest(explanation=explanation)
+        enabled = val == "enable"
+        state = "enabled" if enabled else "disabled"
+        known, unknown = self._hosts_from_body(req, body)
+        LOG.audit(_("Setting hosts %(known)s to %(state)s.") % locals())
+        results = {}
+        if known:
+            results = self.api.set_hosts_enabled(context, known, enabled)
+        return self._hosts_result(body['hosts'], unknown, results, "status")
+
+    @wsgi.serializers(xml=HostsActionTemplate)
+    @wsgi.deserializers(xml=HostsDeserializer)
+    def power_action(self, req, body):
+        """Reboots, shuts down or powers up a number of hosts at once.
+
+        The body names the hosts and the action, e.g.
+        {"hosts": ["host1", "host2"], "action": "reboot"}.
+        """
+        context = req.environ['nova.context']
+        authorize(context)
+        action = body.get("action")
+        if action not in ("startup", "shutdown", "reboot"):
+            explanation = _("Invalid power action: '%s'") % action
+            raise webob.exc.HTTPBadRequest(explanation=explanation)
+        known, unknown = self._hosts_from_body(req, body)
+        results = {}
+        if known:
+            results = self.api.hosts_power_action(context, known, action)
+        return self._hosts_result(body['hosts'], unknown, results,
+                                  "power_action")
+
     @wsgi.serializers(xml=HostActionTemplate)
     def startup(self, req, id):
         return self._host_power_action(req, host=id, action="startup")
@@ -297,7 +409,8 @@ class Hosts(extensions.ExtensionDescriptor):
     def get_resources(self):
         resources = [extensions.ResourceExtension('os-hosts',
                 HostController(),
-                collection_actions={'update': 'PUT'},
+                collection_actions={'update': 'PUT', 'update_many': 'PUT',
+                        'power_action': 'POST'},
                 member_actions={"startup": "GET", "shutdown": "GET",
                         "reboot": "GET"})]
         return resources
@@ -83,6 +83,7 @@ class QuotaSetsController(object):
                     db.quota_create(context, project_id, key, value)
                 except exception.AdminRequired:
                     raise webob.exc.HTTPForbidden()
+        quota.invalidate_project_quotas(project_id)
         return {'quota_set': quota.get_project_quotas(context, project_id)}
 
     @wsgi.serializers(xml=QuotaTemplate)
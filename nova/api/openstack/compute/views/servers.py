@@ -152,8 +152,8 @@ class ViewBuilder(common.ViewBuilder):
             return sha_hash.hexdigest()
 
     def _get_addresses(self, request, instance):
-        context = request.environ["nova.context"]
-        networks = common.get_networks_for_instance(context, instance)
+        networks = common.get_networks_for_instance_in_request(request,
+                                                               instance)
         return self._address_builder.index(networks)["addresses"]
 
     def _get_image(self, request, instance):
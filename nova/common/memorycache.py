@@ -18,47 +18,144 @@
 
 """Super simple fake memcache client."""
 
+import heapq
+import itertools
+
+from nova import flags
+from nova.openstack.common import cfg
 from nova import utils
 
 
+memorycache_opts = [
+    cfg.IntOpt('memorycache_max_entries',
+               default=10000,
+               help='Number of entries the in process cache used without '
+                    'memcached_servers holds before dropping the least '
+                    'recently used one, 0 for no limit'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(memorycache_opts)
+
+# fields of the cache entries
+_PREV, _NEXT, _KEY, _VALUE, _TIMEOUT = range(5)
+
+
 class Client(object):
-    """Replicates a tiny subset of memcached client interface."""
+    """Replicates a tiny subset of memcached client interface.
+
+    Entries that expire are kept in a heap ordered by their timeout, so
+    only the expired ones are looked at, and the least recently used
+    entry is dropped once max_entries are cached.
+    """
 
     def __init__(self, *args, **kwargs):
-        """Ignores the passed in args."""
+        """Ignores the passed in args, but max_entries."""
+        self.max_entries = kwargs.get('max_entries',
+                                      FLAGS.memorycache_max_entries)
         self.cache = {}
+        # circular doubly linked list of the entries, most recently used
+        # first, linked to the root sentinel
+        self._root = root = []
+        root[:] = [root, root, None, None, None]
+        # (timeout, seq, key, entry), entries replaced since are skipped
+        self._timeouts = []
+        self._seq = itertools.count()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
     def get(self, key):
         """Retrieves the value for a key or None.
 
         this expunges expired keys during each get"""
-
-        for k in self.cache.keys():
-            (timeout, _value) = self.cache[k]
-            if timeout and utils.utcnow_ts() >= timeout:
-                del self.cache[k]
-
-        return self.cache.get(key, (0, None))[1]
+        entry = self._lookup(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[_VALUE]
 
     def set(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key."""
+        now = utils.utcnow_ts()
+        self._expunge(now)
+        entry = self.cache.get(key)
+        if entry is not None:
+            self._remove(entry)
         timeout = 0
         if time != 0:
-            timeout = utils.utcnow_ts() + time
-        self.cache[key] = (timeout, value)
+            timeout = now + time
+        entry = [None, None, key, value, timeout]
+        self.cache[key] = entry
+        self._link(entry)
+        if timeout:
+            heapq.heappush(self._timeouts,
+                           (timeout, self._seq.next(), key, entry))
+            if len(self._timeouts) > 2 * len(self.cache) + 64:
+                self._compact()
+        while self.max_entries and len(self.cache) > self.max_entries:
+            self._remove(self._root[_PREV])
+            self.evictions += 1
         return True
 
     def add(self, key, value, time=0, min_compress_len=0):
         """Sets the value for a key if it doesn't exist."""
-        if not self.get(key) is None:
+        if self._lookup(key) is not None:
             return False
         return self.set(key, value, time, min_compress_len)
 
     def incr(self, key, delta=1):
         """Increments the value for a key."""
-        value = self.get(key)
-        if value is None:
+        entry = self._lookup(key)
+        if entry is None:
             return None
-        new_value = int(value) + delta
-        self.cache[key] = (self.cache[key][0], str(new_value))
+        new_value = int(entry[_VALUE]) + delta
+        entry[_VALUE] = str(new_value)
         return new_value
+
+    def delete(self, key, time=0):
+        """Deletes the value for a key."""
+        entry = self._lookup(key)
+        if entry is not None:
+            self._remove(entry)
+        return True
+
+    def _lookup(self, key):
+        """Return the unexpired entry of key, marked as used, or None."""
+        self._expunge(utils.utcnow_ts())
+        entry = self.cache.get(key)
+        if entry is not None:
+            self._unlink(entry)
+            self._link(entry)
+        return entry
+
+    def _expunge(self, now):
+        timeouts = self._timeouts
+        while timeouts and timeouts[0][0] <= now:
+            _timeout, _seq, key, entry = heapq.heappop(timeouts)
+            if self.cache.get(key) is entry:
+                self._remove(entry)
+
+    def _compact(self):
+        """Drop the timeouts of the entries replaced or removed since."""
+        self._timeouts = [item for item in self._timeouts
+                          if self.cache.get(item[2]) is item[3]]
+        heapq.heapify(self._timeouts)
+
+    def _link(self, entry):
+        root = self._root
+        first = root[_NEXT]
+        entry[_PREV] = root
+        entry[_NEXT] = first
+        first[_PREV] = root[_NEXT] = entry
+
+    def _unlink(self, entry):
+        entry[_PREV][_NEXT] = entry[_NEXT]
+        entry[_NEXT][_PREV] = entry[_PREV]
+
+    def _remove(self, entry):
+        self._unlink(entry)
+        # NOTE: the entry may be gone already if the cache was reset
+        if self.cache.get(entry[_KEY]) is entry:
+            del self.cache[entry[_KEY]]
@@ -33,6 +33,7 @@ from nova.compute import instance_types
 from nova.compute import power_state
 from nova.compute import task_states
 from nova.compute import vm_states
+from nova.compute import workload_classes
 from nova.db import base
 from nova import exception
 from nova import flags
@@ -150,6 +151,22 @@ class BaseAPI(base.Base):
         """Generic handler for RPC calls to compute."""
         return self._cast_or_call_compute_message(rpc.call, *args, **kwargs)
 
+    def _call_compute_message_for_hosts(self, compute_method, context,
+            hosts, params=None, timeout=None):
+        """Generic handler for RPC calls to a number of compute hosts.
+
+        The calls are all made at once, see rpc.call_many().
+
+        :returns: A dict of host -> (result, error), where error is the
+                  exception the call to that host failed with or None
+        """
+        if not params:
+            params = {}
+        calls = [(self.db.queue_get_for(context, FLAGS.compute_topic, host),
+                  {'method': compute_method, 'args': params})
+                 for host in hosts]
+        return dict(zip(hosts, rpc.call_many(context, calls, timeout)))
+
     @staticmethod
     def _cast_scheduler_message(context, args):
         """Generic handler for RPC calls to the scheduler."""
@@ -256,19 +273,6 @@ class API(BaseAPI):
 
         block_device_mapping = block_device_mapping or []
 
-        num_instances = quota.allowed_instances(context, max_count,
-                                                instance_type)
-        if num_instances < min_count:
-            pid = context.project_id
-            if num_instances <= 0:
-                msg = _("Cannot run any more instances of this type.")
-            else:
-                msg = (_("Can only run %s more instances of this type.") %
-                       num_instances)
-            LOG.warn(_("Quota exceeded for %(pid)s,"
-                  " tried to run %(min_count)s instances. " + msg) % locals())
-            raise exception.QuotaError(code="InstanceLimitExceeded")
-
         self._check_metadata_properties_quota(context, metadata)
         self._check_injected_file_quota(context, injected_files)
         self._check_requested_networks(context, requested_networks)
@@ -386,41 +390,111 @@ class API(BaseAPI):
             'root_device_name': root_device_name,
             'progress': 0,
             'auto_disk_config': auto_disk_config}
+        base_options['workload_class'] = workload_classes.classify(
+                base_options)
+
+        num_instances, reservations = self._reserve_instances(context,
+                instance_type, min_count, max_count)
 
         LOG.debug(_("Going to run %s instances...") % num_instances)
 
         if create_instance_here:
-            instance = self.create_db_entry_for_new_instance(
-                    context, instance_type, image, base_options,
-                    security_group, block_device_mapping)
-            # Tells scheduler we created the instance already.
-            base_options['uuid'] = instance['uuid']
-            rpc_method = rpc.cast
-        else:
-            # We need to wait for the scheduler to create the instance
-            # DB entries, because the instance *could* be # created in
-            # a child zone.
-            rpc_method = rpc.call
-
-        # TODO(comstud): We should use rpc.multicall when we can
-        # retrieve the full instance dictionary from the scheduler.
-        # Otherwise, we could exceed the AMQP max message size limit.
-        # This would require the schedulers' schedule_run_instances
-        # methods to return an iterator vs a list.
-        instances = self._schedule_run_instance(
-                rpc_method,
-                context, base_options,
-                instance_type,
-                availability_zone, injected_files,
-                admin_password, image,
-                num_instances, requested_networks,
-                block_device_mapping, security_group,
-                filter_properties)
+            # Tells scheduler we created the instance already.  It is set
+            # up front to find the instance if the creation fails midway.
+            base_options['uuid'] = str(utils.gen_uuid())
+
+        try:
+            if create_instance_here:
+                instance = self.create_db_entry_for_new_instance(
+                        context, instance_type, image, base_options,
+                        security_group, block_device_mapping)
+                rpc_method = rpc.cast
+            else:
+                # We need to wait for the scheduler to create the instance
+                # DB entries, because the instance *could* be # created in
+                # a child zone.
+                rpc_method = rpc.call
+
+            # TODO(comstud): We should use rpc.multicall when we can
+            # retrieve the full instance dictionary from the scheduler.
+            # Otherwise, we could exceed the AMQP max message size limit.
+            # This would require the schedulers' schedule_run_instances
+            # methods to return an iterator vs a list.
+            instances = self._schedule_run_instance(
+                    rpc_method,
+                    context, base_options,
+                    instance_type,
+                    availability_zone, injected_files,
+                    admin_password, image,
+                    num_instances, requested_networks,
+                    block_device_mapping, security_group,
+                    filter_properties)
+        except Exception:
+            with utils.save_and_reraise_exception():
+                self._rollback_create(context, base_options.get('uuid'),
+                                      reservations)
+        quota.commit(context, reservations)
 
         if create_instance_here:
             return ([instance], reservation_id)
         return (instances, reservation_id)
 
+    def _rollback_create(self, context, instance_uuid, reservations):
+        """Undo a create that failed, deleting the instance created here,
+        if any, and releasing its reservations.
+        """
+        instance = None
+        if instance_uuid:
+            try:
+                instance = self.db.instance_get_by_uuid(context,
+                                                        instance_uuid)
+            except exception.InstanceNotFound:
+                pass
+        if instance is None:
+            quota.rollback(context, reservations)
+            return
+        # NOTE: deleting the instance takes it off the usages, so they
+        #       must count it first or they would end up short of it
+        quota.commit(context, reservations)
+        self.db.instance_destroy(context, instance['id'])
+
+    def _reserve_instances(self, context, instance_type, min_count,
+                           max_count):
+        """Reserve the quota of max_count instances, or of as many as the
+        quota left allows if at least min_count.
+
+        Returns the number of instances and their reservations.
+        """
+        def _reserve(num_instances):
+            return quota.reserve(context,
+                    instances=num_instances,
+                    cores=num_instances * instance_type['vcpus'],
+                    ram=num_instances * instance_type['memory_mb'])
+
+        try:
+            return max_count, _reserve(max_count)
+        except exception.OverQuota:
+            pass
+
+        num_instances = quota.allowed_instances(context, max_count,
+                                                instance_type)
+        if num_instances >= min_count:
+            try:
+                return num_instances, _reserve(num_instances)
+            except exception.OverQuota:
+                # NOTE: concurrent requests used the quota left since
+                pass
+
+        pid = context.project_id
+        if num_instances <= 0:
+            msg = _("Cannot run any more instances of this type.")
+        else:
+            msg = (_("Can only run %s more instances of this type.") %
+                   num_instances)
+        LOG.warn(_("Quota exceeded for %(pid)s,"
+              " tried to run %(min_count)s instances. " + msg) % locals())
+        raise exception.QuotaError(code="InstanceLimitExceeded")
+
     @staticmethod
     def _volume_size(instance_type, virtual_name):
         size = 0
@@ -576,6 +650,63 @@ class API(BaseAPI):
         instance = self.update(context, instance, **updates)
         return instance
 
+    def create_db_entries_for_new_instances(self, context, instance_type,
+            image, base_options, security_group, block_device_mapping,
+            instances_values):
+        """Create the DB entries of several new instances at once.
+
+        instances_values is a list with one dict per instance of the
+        values, such as launch_index and host, that differ from
+        base_options.  The instance rows and their security group
+        associations are written in a single transaction.
+
+        This is called by the scheduler after the locations for the
+        instances have been determined.
+        """
+        elevated = context.elevated()
+        if security_group is None:
+            security_group = ['default']
+        if not isinstance(security_group, list):
+            security_group = [security_group]
+
+        security_groups = []
+        for security_group_name in security_group:
+            group = self.db.security_group_get_by_name(context,
+                    context.project_id,
+                    security_group_name)
+            security_groups.append(group['id'])
+
+        mappings = image['properties'].get('mappings', [])
+        image_bdm = image['properties'].get('block_device_mapping', [])
+
+        values_list = []
+        for instance_values in instances_values:
+            values = dict(base_options, **instance_values)
+            values.setdefault('launch_index', 0)
+            if values.get('hostname') is not None:
+                values['hostname'] = utils.sanitize_hostname(
+                        values['hostname'])
+            values['vm_state'] = vm_states.BUILDING
+            values['task_state'] = task_states.SCHEDULING
+            if mappings or image_bdm or block_device_mapping:
+                values['shutdown_terminate'] = False
+            values_list.append(values)
+
+        instances = self.db.instance_create_many(context, values_list,
+                                                 security_groups)
+
+        if mappings or image_bdm or block_device_mapping:
+            for instance in instances:
+                instance_id = instance['id']
+                self._update_image_block_device_mapping(elevated,
+                        instance_type, instance_id, mappings)
+                self._update_block_device_mapping(elevated, instance_type,
+                        instance_id, image_bdm)
+                # override via command line option
+                self._update_block_device_mapping(elevated, instance_type,
+                        instance_id, block_device_mapping)
+        return [dict(instance.iteritems()) for instance in instances]
+
     def _default_display_name(self, instance_id):
         return "Server %s" % instance_id
 
@@ -719,11 +850,11 @@ class API(BaseAPI):
             if instance['host'] is not None:
                 hosts.add(instance['host'])
 
-        for host in hosts:
-            rpc.cast(context,
-                     self.db.queue_get_for(context, FLAGS.compute_topic, host),
-                     {"method": "refresh_security_group_rules",
-                      "args": {"security_group_id": security_group.id}})
+        rpc.cast_many(context,
+                [(self.db.queue_get_for(context, FLAGS.compute_topic, host),
+                  {"method": "refresh_security_group_rules",
+                   "args": {"security_group_id": security_group.id}})
+                 for host in hosts])
 
     def trigger_security_group_members_refresh(self, context, group_ids):
         """Called when a security group gains a new or loses a member.
@@ -762,21 +893,21 @@ class API(BaseAPI):
 
         # ...and finally we tell these nodes to refresh their view of this
         # particular security group.
-        for host in hosts:
-            rpc.cast(context,
-                     self.db.queue_get_for(context, FLAGS.compute_topic, host),
-                     {"method": "refresh_security_group_members",
-                      "args": {"security_group_id": group_id}})
+        rpc.cast_many(context,
+                [(self.db.queue_get_for(context, FLAGS.compute_topic, host),
+                  {"method": "refresh_security_group_members",
+                   "args": {"security_group_id": group_id}})
+                 for host in hosts])
 
     def trigger_provider_fw_rules_refresh(self, context):
         """Called when a rule is added/removed from a provider firewall"""
 
         hosts = [x['host'] for (x, idx)
                            in self.db.service_get_all_compute_sorted(context)]
-        for host in hosts:
-            rpc.cast(context,
-                     self.db.queue_get_for(context, FLAGS.compute_topic, host),
-                     {'method': 'refresh_provider_fw_rules', 'args': {}})
+        rpc.cast_many(context,
+                [(self.db.queue_get_for(context, FLAGS.compute_topic, host),
+                  {'method': 'refresh_provider_fw_rules', 'args': {}})
+                 for host in hosts])
 
     def _is_security_group_associated_with_server(self, security_group,
                                                   instance_uuid):
@@ -825,6 +956,7 @@ class API(BaseAPI):
         # call
         self._cast_compute_message('refresh_security_group_rules',
                 context, host=instance['host'], params=params)
+        self._invalidate_metadata_cache(context, instance_uuid)
 
     @wrap_check_policy
     def remove_security_group(self, context, instance, security_group_name):
@@ -854,6 +986,7 @@ class API(BaseAPI):
         # call
         self._cast_compute_message('refresh_security_group_rules',
                 context, host=instance['host'], params=params)
+        self._invalidate_metadata_cache(context, instance_uuid)
 
     @wrap_check_policy
     def update(self, context, instance, **kwargs):
@@ -868,8 +1001,19 @@ class API(BaseAPI):
         :returns: None
         """
         rv = self.db.instance_update(context, instance["id"], kwargs)
+        self._invalidate_metadata_cache(context, rv['uuid'])
         return dict(rv.iteritems())
 
+    def _invalidate_metadata_cache(self, context, instance_uuid):
+        """Drop the metadata the metadata api workers cached for the
+        instance.  The changes made by compute hosts reach them through
+        nova.notifier.metadata_cache_notifier.
+        """
+        if FLAGS.metadata_cache_invalidation:
+            rpc.fanout_cast(context, FLAGS.metadata_cache_topic,
+                            {'method': 'invalidate_instance',
+                             'args': {'instance_uuid': instance_uuid}})
+
     @wrap_check_policy
     @check_instance_state(vm_state=[vm_states.ACTIVE, vm_states.SHUTOFF,
                                     vm_states.ERROR])
@@ -1036,7 +1180,7 @@ class API(BaseAPI):
         return inst
 
     def get_all(self, context, search_opts=None, sort_key='created_at',
-                sort_dir='desc'):
+                sort_dir='desc', limit=None, marker=None):
         """Get all instances filtered by one of the given parameters.
 
         If there is no filter and the context is an admin, it will retrieve
@@ -1048,6 +1192,10 @@ class API(BaseAPI):
         The results will be returned sorted in the order specified by the
         'sort_dir' parameter using the key specified in the 'sort_key'
         parameter.
+
+        With a 'limit', at most that many instances are returned, those
+        sorted after the instance whose uuid is 'marker' when one is given.
+        The database reads only the rows needed for that page.
         """
 
         #TODO(bcwaldon): determine the best argument for target here
@@ -1114,7 +1262,9 @@ class API(BaseAPI):
                         return []
 
         inst_models = self._get_instances_by_filters(context, filters,
-                                                     sort_key, sort_dir)
+                                                     sort_key, sort_dir,
+                                                     limit=limit,
+                                                     marker=marker)
 
         # Convert the models to dictionaries
         instances = []
@@ -1126,7 +1276,8 @@ class API(BaseAPI):
 
         return instances
 
-    def _get_instances_by_filters(self, context, filters, sort_key, sort_dir):
+    def _get_instances_by_filters(self, context, filters, sort_key, sort_dir,
+                                  limit=None, marker=None):
         if 'ip6' in filters or 'ip' in filters:
             res = self.network_api.get_instance_uuids_by_ip_filter(context,
                                                                    filters)
@@ -1136,7 +1287,8 @@ class API(BaseAPI):
             filters['uuid'] = uuids
 
         return self.db.instance_get_all_by_filters(context, filters, sort_key,
-                                                   sort_dir)
+                                                   sort_dir, limit=limit,
+                                                   marker=marker)
 
     @wrap_check_policy
     @check_instance_state(vm_state=[vm_states.ACTIVE, vm_states.SHUTOFF])
@@ -1700,6 +1852,20 @@ class HostAPI(BaseAPI):
         return self._call_compute_message("host_power_action", context,
                 host=host, params={"action": action})
 
+    def set_hosts_enabled(self, context, hosts, enabled):
+        """Sets the ability of a number of hosts to accept new instances.
+
+        Returns a dict of host -> (result, error)."""
+        return self._call_compute_message_for_hosts("set_host_enabled",
+                context, hosts, params={"enabled": enabled})
+
+    def hosts_power_action(self, context, hosts, action):
+        """Reboots, shuts down or powers up a number of hosts.
+
+        Returns a dict of host -> (result, error)."""
+        return self._call_compute_message_for_hosts("host_power_action",
+                context, hosts, params={"action": action})
+
     def set_host_maintenance(self, context, host, mode):
         """Start/Stop host maintenance window. On start, it triggers
         guest VMs evacuation."""
@@ -675,6 +675,16 @@ class ComputeManager(manager.SchedulerDependentManager):
             self._run_instance(context, instance_uuid, **kwargs)
         do_run_instance()
 
+    def run_instances(self, context, instance_uuids, **kwargs):
+        """Run several instances scheduled to this host in one request.
+
+        Each instance is built as if it had its own run_instance
+        request, concurrently.
+        """
+        for instance_uuid in instance_uuids:
+            greenthread.spawn_n(self.run_instance, context, instance_uuid,
+                                **kwargs)
+
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
     @checks_instance_lock
     @wrap_instance_fault
@@ -2306,7 +2316,8 @@ class ComputeManager(manager.SchedulerDependentManager):
             capabilities = _get_additional_capabilities()   
             capabilities.update(self.driver.get_host_stats(refresh=True))
             #Eneabegin
-            LOG.debug(_("Enea: _report_driver_status, capabilities: %(capabilities)s") % locals())
+            LOG.debug(_("Enea: _report_driver_status, capabilities: "
+                        "%(capabilities)s"), {'capabilities': capabilities})
             #Eneaend
             self.update_service_capabilities(capabilities)
             #Eneaend
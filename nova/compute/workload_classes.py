@@ -0,0 +1,113 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Possible workload classes for instances.
+
+The workload class describes the dominant resource an instance is expected
+to stress (cpu, io or memory).  Instances that were not classified are
+counted as undefined.  The class is persisted on the instance so that
+per-host counters can be computed by the database instead of decoding
+user_data for every instance.
+
+The class is chosen once, when the instance is created, by the function
+named in the workload_classifier flag.  It is given the instance
+properties and returns one of the classes below.
+
+"""
+
+import base64
+import binascii
+
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
+from nova import utils
+
+
+LOG = logging.getLogger(__name__)
+
+workload_class_opts = [
+    cfg.StrOpt('workload_classifier',
+               default='nova.compute.workload_classes.user_data_classifier',
+               help='Function choosing the workload class of a new '
+                    'instance from its properties'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(workload_class_opts)
+
+CPU = 'cpu'
+IO = 'io'
+MEM = 'mem'
+UND = 'und'
+
+ALL = (CPU, IO, MEM, UND)
+
+
+def from_user_data(user_data):
+    """Return the workload class encoded in base64 user_data.
+
+    user_data holding exactly one of the class names selects that class,
+    anything else (including no user_data at all) is undefined.
+    """
+    if not user_data:
+        return UND
+    try:
+        decoded = base64.b64decode(user_data)
+    except (TypeError, binascii.Error):
+        return UND
+    if decoded in (CPU, IO, MEM):
+        return decoded
+    return UND
+
+
+def counter_name(workload_class):
+    """Return the compute_nodes counter column for a workload class."""
+    if workload_class not in ALL:
+        workload_class = UND
+    return 'n_%s_vms' % workload_class
+
+
+def user_data_classifier(instance_properties):
+    """Classify an instance from the class name in its user_data."""
+    return from_user_data(instance_properties.get('user_data'))
+
+
+def classify(instance_properties):
+    """Return the workload class of an instance about to be created,
+    as chosen by the workload_classifier.
+    """
+    classifier = utils.import_class(FLAGS.workload_classifier)
+    workload_class = classifier(instance_properties)
+    if workload_class not in ALL:
+        LOG.warn(_("Workload classifier %(classifier)s returned unknown "
+                   "class %(workload_class)s, using und") %
+                 {'classifier': FLAGS.workload_classifier,
+                  'workload_class': workload_class})
+        return UND
+    return workload_class
+
+
+def get_workload_class(instance):
+    """Return the workload class of an instance or of the instance
+    properties of a request, classifying it when it predates the
+    workload_class attribute.
+    """
+    workload_class = instance.get('workload_class')
+    if workload_class in ALL:
+        return workload_class
+    return classify(instance)
@@ -117,6 +117,11 @@ def service_get_all_by_host(context, host):
     return IMPL.service_get_all_by_host(context, host)
 
 
+def service_get_all_by_hosts(context, hosts):
+    """Get all services for the given hosts, ordered by id."""
+    return IMPL.service_get_all_by_hosts(context, hosts)
+
+
 def service_get_all_compute_by_host(context, host):
     """Get all compute services for a given host."""
     return IMPL.service_get_all_compute_by_host(context, host)
@@ -199,6 +204,13 @@ def compute_node_utilization_update(context, host, free_ram_mb_delta=0,
                           vm_delta, n_cpu_delta, n_io_delta, n_mem_delta, n_und_delta )
 
 
+def compute_node_utilization_update_many(context, deltas_by_host):
+    """Apply compute_node_utilization_update() deltas to many hosts at
+    once, {host: {'free_ram_mb_delta': x, ...}}.  Returns the hosts
+    without a ComputeNode."""
+    return IMPL.compute_node_utilization_update_many(context, deltas_by_host)
+
+
 def compute_node_utilization_set(context, host, free_ram_mb=None,
                                  free_disk_gb=None, work=None, vms=None,
                                  n_cpu_vms=None, n_io_vms=None, n_mem_vms=None, n_und_vms=None):
@@ -409,6 +421,32 @@ def fixed_ip_associate_pool(context, network_id, instance_id=None, host=None):
                                         instance_id, host)
 
 
+def fixed_ip_reserve_pool(context, network_id, owner, count):
+    """Reserve up to count free ips of a network for owner.
+
+    Returns the addresses reserved, which fixed_ip_associate_pool no
+    longer hands out.
+
+    """
+    return IMPL.fixed_ip_reserve_pool(context, network_id, owner, count)
+
+
+def fixed_ip_associate_reserved(context, owner, instance_ids_by_address):
+    """Associate ips reserved by owner to instances.
+
+    Takes a list of (address, instance_id) and returns the addresses that
+    were associated, leaving out those owner no longer holds.
+
+    """
+    return IMPL.fixed_ip_associate_reserved(context, owner,
+                                            instance_ids_by_address)
+
+
+def fixed_ip_release_pool(context, owner, addresses=None):
+    """Give back the ips reserved by owner, or only the addresses given."""
+    return IMPL.fixed_ip_release_pool(context, owner, addresses)
+
+
 def fixed_ip_create(context, values):
     """Create a fixed ip from the values dictionary."""
     return IMPL.fixed_ip_create(context, values)
@@ -459,6 +497,15 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return IMPL.fixed_ips_by_virtual_interface(context, vif_id)
 
 
+def fixed_ip_get_all_with_instance_uuid(context, address=None, prefix=None):
+    """Get the fixed ips of virtual interfaces with their instance uuid.
+
+    Only the fixed ips equal to address or whose fixed or floating ips
+    start with prefix are returned if either is given.
+    """
+    return IMPL.fixed_ip_get_all_with_instance_uuid(context, address, prefix)
+
+
 def fixed_ip_get_network(context, address):
     """Get a network for a fixed ip by address."""
     return IMPL.fixed_ip_get_network(context, address)
@@ -504,6 +551,12 @@ def virtual_interface_get_by_instance_and_network(context, instance_id,
                                                               network_id)
 
 
+def virtual_interface_get_first_ids_by_instances(context, instance_ids):
+    """Gets the id of the first virtual interface of each instance."""
+    return IMPL.virtual_interface_get_first_ids_by_instances(context,
+                                                             instance_ids)
+
+
 def virtual_interface_delete(context, vif_id):
     """Delete virtual interface record from the database."""
     return IMPL.virtual_interface_delete(context, vif_id)
@@ -519,6 +572,11 @@ def virtual_interface_get_all(context):
     return IMPL.virtual_interface_get_all(context)
 
 
+def virtual_interface_get_all_with_instance_uuid(context):
+    """Gets all virtual interfaces of instances with their instance uuid."""
+    return IMPL.virtual_interface_get_all_with_instance_uuid(context)
+
+
 ####################
 
 
@@ -527,11 +585,22 @@ def instance_create(context, values):
     return IMPL.instance_create(context, values)
 
 
+def instance_create_many(context, values_list, security_group_ids=None):
+    """Create instances from a list of values dictionaries at once."""
+    return IMPL.instance_create_many(context, values_list,
+                                     security_group_ids)
+
+
 def instance_data_get_for_project(context, project_id):
     """Get (instance_count, total_cores, total_ram) for project."""
     return IMPL.instance_data_get_for_project(context, project_id)
 
 
+def instance_utilization_get_by_host(context, host=None):
+    """Get per-host instance counts, resource sums and class counters."""
+    return IMPL.instance_utilization_get_by_host(context, host)
+
+
 def instance_destroy(context, instance_id):
     """Destroy the instance or raise if it does not exist."""
     return IMPL.instance_destroy(context, instance_id)
@@ -553,10 +622,15 @@ def instance_get_all(context):
 
 
 def instance_get_all_by_filters(context, filters, sort_key='created_at',
-                                sort_dir='desc'):
-    """Get all instances that match all filters."""
+                                sort_dir='desc', limit=None, marker=None):
+    """Get all instances that match all filters.
+
+    With a limit, return at most that many of them, starting after the
+    instance whose uuid is marker if one is given.
+    """
     return IMPL.instance_get_all_by_filters(context, filters, sort_key,
-                                            sort_dir)
+                                            sort_dir, limit=limit,
+                                            marker=marker)
 
 
 def instance_get_active_by_window(context, begin, end=None, project_id=None):
@@ -775,9 +849,14 @@ def network_get_all_by_uuids(context, network_uuids, project_id=None):
 # pylint: disable=C0103
 
 
-def network_get_associated_fixed_ips(context, network_id, host=None):
-    """Get all network's ips that have been associated."""
-    return IMPL.network_get_associated_fixed_ips(context, network_id, host)
+def network_get_associated_fixed_ips(context, network_id, host=None,
+                                     addresses=None):
+    """Get all network's ips that have been associated.
+
+    Only the ips in addresses are returned when it is given.
+    """
+    return IMPL.network_get_associated_fixed_ips(context, network_id, host,
+                                                 addresses)
 
 
 def network_get_by_bridge(context, bridge):
@@ -920,6 +999,42 @@ def quota_destroy_all_by_project(context, project_id):
 ###################
 
 
+def quota_usage_get_all_by_project(context, project_id, resources,
+                                   max_age=0):
+    """Get the in_use and reserved of resources of a project."""
+    return IMPL.quota_usage_get_all_by_project(context, project_id,
+                                               resources, max_age)
+
+
+def quota_usage_reconcile(context):
+    """Recount the usages of every project, return those which drifted."""
+    return IMPL.quota_usage_reconcile(context)
+
+
+def quota_reserve(context, project_id, deltas, limits, expire, max_age=0):
+    """Reserve deltas of resources of a project within limits."""
+    return IMPL.quota_reserve(context, project_id, deltas, limits, expire,
+                              max_age)
+
+
+def reservation_commit(context, reservations):
+    """Add reservations to the usages they were made against."""
+    return IMPL.reservation_commit(context, reservations)
+
+
+def reservation_rollback(context, reservations):
+    """Release reservations without using them."""
+    return IMPL.reservation_rollback(context, reservations)
+
+
+def reservation_expire(context):
+    """Roll back the reservations past their expire."""
+    return IMPL.reservation_expire(context)
+
+
+###################
+
+
 def volume_allocate_iscsi_target(context, volume_id, host):
     """Atomically allocate a free iscsi_target from the pool."""
     return IMPL.volume_allocate_iscsi_target(context, volume_id, host)
@@ -955,6 +1070,11 @@ def volume_get(context, volume_id):
     return IMPL.volume_get(context, volume_id)
 
 
+def volume_get_all_by_ids(context, volume_ids):
+    """Get the volumes of the given ids that exist."""
+    return IMPL.volume_get_all_by_ids(context, volume_ids)
+
+
 def volume_get_all(context):
     """Get all volumes."""
     return IMPL.volume_get_all(context)
@@ -1065,6 +1185,12 @@ def block_device_mapping_get_all_by_instance(context, instance_id):
     return IMPL.block_device_mapping_get_all_by_instance(context, instance_id)
 
 
+def block_device_mapping_get_all_by_instances(context, instance_ids):
+    """Get all block device mapping belonging to the instances"""
+    return IMPL.block_device_mapping_get_all_by_instances(context,
+                                                          instance_ids)
+
+
 def block_device_mapping_destroy(context, bdm_id):
     """Destroy the block device mapping."""
     return IMPL.block_device_mapping_destroy(context, bdm_id)
@@ -1589,6 +1715,11 @@ def s3_image_get_by_uuid(context, image_uuid):
     return IMPL.s3_image_get_by_uuid(context, image_uuid)
 
 
+def s3_image_get_all_by_uuids(context, image_uuids):
+    """Find the local s3 images represented by the provided uuids"""
+    return IMPL.s3_image_get_all_by_uuids(context, image_uuids)
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid"""
     return IMPL.s3_image_create(context, image_uuid)
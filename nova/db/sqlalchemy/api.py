@@ -23,7 +23,6 @@ import datetime
 import functools
 import re
 import warnings
-import base64
 
 from nova import block_device
 from nova import db
@@ -33,15 +32,18 @@ from nova import utils
 from nova import log as logging
 from nova.compute import aggregate_states
 from nova.compute import vm_states
+from nova.compute import workload_classes
 from nova.db.sqlalchemy import models
 from nova.db.sqlalchemy.session import get_session
 from sqlalchemy import and_
 from sqlalchemy import or_
+from sqlalchemy import String
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql import func
 from sqlalchemy.sql.expression import asc
+from sqlalchemy.sql.expression import case
 from sqlalchemy.sql.expression import desc
 from sqlalchemy.sql.expression import literal_column
 
@@ -237,6 +239,69 @@ def exact_filter(query, model, filters, legal_keys):
     return query
 
 
+def _regexp_prefix(pattern):
+    """Return the text every string matched by pattern starts with, and
+    whether it is the only string matched.
+
+    The patterns are applied with re.match(), so they are anchored at the
+    start whether or not they begin with '^'.
+    """
+    if '|' in pattern:
+        return '', False
+    prefix = []
+    i = 1 if pattern.startswith('^') else 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            # an escaped punctuation character stands for itself, the
+            # others are classes like \d
+            if i + 1 == len(pattern) or pattern[i + 1].isalnum():
+                break
+            literal, width = pattern[i + 1], 2
+        elif char in '.^$*+?{}[]()':
+            break
+        else:
+            literal, width = char, 1
+        if pattern[i + width:i + width + 1] in ('*', '+', '?', '{'):
+            break
+        prefix.append(literal)
+        i += width
+    return ''.join(prefix), pattern[i:] == '$'
+
+
+def regexp_filter(query, model, filters):
+    """Narrows a query with the regexp filters SQL can check.
+
+    Returns the updated query.  A regexp on a string column with a
+    literal prefix becomes a LIKE 'prefix%' test, or an equality test
+    when it matches nothing but that prefix, which an index on the column
+    can answer.  The rows returned are a superset of the matching ones,
+    LIKE ignores case on some databases, so the filters are left in
+    place for the caller to check with re.match().
+
+    :param query: query to apply filters to
+    :param model: model object the query applies to
+    :param filters: dictionary of filters; the names of string columns
+                    of model are taken to be regexps, others are ignored
+    """
+    for name, value in filters.iteritems():
+        column = model.__table__.columns.get(name)
+        if column is None or not isinstance(column.type, String):
+            continue
+        prefix, exact = _regexp_prefix(str(value))
+        if not prefix:
+            continue
+        attr = getattr(model, name)
+        if exact:
+            # '$' also matches before a trailing newline
+            query = query.filter(attr.in_([prefix, prefix + '\n']))
+        else:
+            escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').\
+                             replace('_', '\\_')
+            query = query.filter(attr.like(escaped + '%', escape='\\'))
+    return query
+
+
 ###################
 
 
@@ -298,6 +363,16 @@ def service_get_all_by_host(context, host):
                 all()
 
 
+@require_admin_context
+def service_get_all_by_hosts(context, hosts):
+    if not hosts:
+        return []
+    return model_query(context, models.Service, read_deleted="no").\
+                filter(models.Service.host.in_(hosts)).\
+                order_by(models.Service.id).\
+                all()
+
+
 @require_admin_context
 def service_get_all_compute_by_host(context, host):
     result = model_query(context, models.Service, read_deleted="no").\
@@ -424,39 +499,21 @@ def compute_node_get_all(context, session=None):
 
 def _get_host_utilization(context, host, ram_mb, disk_gb):
     """Compute the current utilization of a given host."""
-    instances = instance_get_all_by_host(context, host)
-    vms = len(instances)
-    #Eneabegin da fare il filtro
-    running_cpu_vms = len(instance_get_all_by_filters(context,
-                                                {'user_data':base64.b64encode('cpu'),'deleted':0,'host':host},'host','desc')) #len(instance_get_all_by_filters(context,{'user_data':base64.b64encode('cpu'),'host':host,'deleted':0}))
-    running_io_vms = len(instance_get_all_by_filters(context,
-                                                {'user_data':base64.b64encode('io'),'deleted':0,'host':host},'host','desc')) #len(instance_get_all_by_filters(context,{'user_data':base64.b64encode('io'),'host':host,'deleted':0}))
-    running_mem_vms = len(instance_get_all_by_filters(context,
-                                                {'user_data':base64.b64encode('mem'),'deleted':0,'host':host},'host','desc'))
-    #running_und_vms = len(instance_get_all_by_filters(context,
-    #                                            {'hostname':'und','deleted':0},'host','desc')) #len(instance_get_all_by_filters(context,{'user_data':base64.b64encode('und'),'host':host,'deleted':0}))
-    running_und_vms = vms - running_cpu_vms - running_io_vms - running_mem_vms
-    #Eneaend
+    usage = instance_utilization_get_by_host(context, host=host).get(host, {})
+
     free_ram_mb = ram_mb - FLAGS.reserved_host_memory_mb
     free_disk_gb = disk_gb - (FLAGS.reserved_host_disk_mb * 1024)
+    free_ram_mb -= usage.get('memory_mb', 0)
+    free_disk_gb -= usage.get('disk_gb', 0)
 
-    work = 0
-    for instance in instances:
-        free_ram_mb -= instance.memory_mb
-        free_disk_gb -= instance.root_gb
-        free_disk_gb -= instance.ephemeral_gb
-    
-        if instance.vm_state in [vm_states.BUILDING, vm_states.REBUILDING,
-                                 vm_states.MIGRATING, vm_states.RESIZING]:
-            work += 1
     return dict(free_ram_mb=free_ram_mb,
                 free_disk_gb=free_disk_gb,
-                current_workload=work,
-                running_vms=vms,
-                n_cpu_vms=running_cpu_vms,
-                n_io_vms=running_io_vms,
-                n_mem_vms=running_mem_vms,
-                n_und_vms=running_und_vms) #Eneabegin    #Eneaend
+                current_workload=usage.get('current_workload', 0),
+                running_vms=usage.get('running_vms', 0),
+                n_cpu_vms=usage.get('n_cpu_vms', 0),
+                n_io_vms=usage.get('n_io_vms', 0),
+                n_mem_vms=usage.get('n_mem_vms', 0),
+                n_und_vms=usage.get('n_und_vms', 0))
 
 
 def _adjust_compute_node_values_for_utilization(context, values, session):
@@ -553,6 +610,52 @@ def compute_node_utilization_update(context, host, free_ram_mb_delta=0,
     return compute_node
 
 
+# compute_node_utilization_update() delta names to ComputeNode columns
+_UTILIZATION_DELTA_COLUMNS = {
+    'free_ram_mb_delta': 'free_ram_mb',
+    'free_disk_gb_delta': 'free_disk_gb',
+    'work_delta': 'current_workload',
+    'vm_delta': 'running_vms',
+    'n_cpu_delta': 'n_cpu_vms',
+    'n_io_delta': 'n_io_vms',
+    'n_mem_delta': 'n_mem_vms',
+    'n_und_delta': 'n_und_vms',
+}
+
+
+def compute_node_utilization_update_many(context, deltas_by_host):
+    """Apply compute_node_utilization_update() deltas to many hosts.
+
+    deltas_by_host is {host: {'free_ram_mb_delta': x, 'vm_delta': y, ...}}.
+    Each host gets a single UPDATE x = x + delta statement, all in one
+    transaction and without locking the rows beforehand.  Returns the
+    hosts without a ComputeNode.
+    """
+    session = get_session()
+    missing = []
+    with session.begin():
+        for host, deltas in deltas_by_host.iteritems():
+            values = {}
+            for name, delta in deltas.iteritems():
+                if delta:
+                    column = _UTILIZATION_DELTA_COLUMNS[name]
+                    values[column] = getattr(models.ComputeNode,
+                                             column) + delta
+            if not values:
+                continue
+            service_ids = session.query(models.Service.id).\
+                                  filter_by(host=host).\
+                                  filter_by(deleted=False)
+            updated = session.query(models.ComputeNode).\
+                              filter(models.ComputeNode.service_id.in_(
+                                     service_ids.subquery())).\
+                              filter_by(deleted=False).\
+                              update(values, synchronize_session=False)
+            if not updated:
+                missing.append(host)
+    return missing
+
+
 def compute_node_utilization_set(context, host, free_ram_mb=None,
                                  free_disk_gb=None, work=None, vms=None,
                                  n_cpu_vms=None, n_io_vms=None, n_mem_vms=None, n_und_vms=None):
@@ -690,10 +793,11 @@ def floating_ip_create(context, values):
 
 
 @require_context
-def floating_ip_count_by_project(context, project_id):
+def floating_ip_count_by_project(context, project_id, session=None):
     authorize_project_context(context, project_id)
     # TODO(tr3buchet): why leave auto_assigned floating IPs out?
-    return model_query(context, models.FloatingIp, read_deleted="no").\
+    return model_query(context, models.FloatingIp, read_deleted="no",
+                       session=session).\
                    filter_by(project_id=project_id).\
                    filter_by(auto_assigned=False).\
                    count()
@@ -722,6 +826,10 @@ def floating_ip_deallocate(context, address):
         floating_ip_ref = floating_ip_get_by_address(context,
                                                      address,
                                                      session=session)
+        if (floating_ip_ref['project_id'] and
+            not floating_ip_ref['auto_assigned']):
+            _quota_usage_release(context, floating_ip_ref['project_id'],
+                                 {'floating_ips': 1}, session)
         floating_ip_ref['project_id'] = None
         floating_ip_ref['host'] = None
         floating_ip_ref['auto_assigned'] = False
@@ -955,6 +1063,7 @@ def fixed_ip_associate(context, address, instance_id, network_id=None,
         if not fixed_ip_ref.network_id:
             fixed_ip_ref.network_id = network_id
         fixed_ip_ref.instance_id = instance_id
+        fixed_ip_ref.pool_owner = None
         session.add(fixed_ip_ref)
     return fixed_ip_ref['address']
 
@@ -971,6 +1080,7 @@ def fixed_ip_associate_pool(context, network_id, instance_id=None, host=None):
                                filter_by(reserved=False).\
                                filter_by(instance_id=None).\
                                filter_by(host=None).\
+                               filter_by(pool_owner=None).\
                                with_lockmode('update').\
                                first()
         # NOTE(vish): if with_lockmode isn't supported, as in sqlite,
@@ -990,6 +1100,74 @@ def fixed_ip_associate_pool(context, network_id, instance_id=None, host=None):
     return fixed_ip_ref['address']
 
 
+@require_admin_context
+def fixed_ip_reserve_pool(context, network_id, owner, count):
+    # NOTE: no row is locked, the free ips are picked first and then
+    #       claimed by an update that only matches them while they are
+    #       still free, so concurrent owners may get less than count.
+    session = get_session()
+    with session.begin():
+        network_or_none = or_(models.FixedIp.network_id == network_id,
+                              models.FixedIp.network_id == None)
+        rows = model_query(context, models.FixedIp.id, session=session,
+                           read_deleted="no").\
+                       filter(network_or_none).\
+                       filter_by(reserved=False).\
+                       filter_by(instance_id=None).\
+                       filter_by(host=None).\
+                       filter_by(pool_owner=None).\
+                       limit(count).\
+                       all()
+        ids = [row[0] for row in rows]
+        if not ids:
+            return []
+        model_query(context, models.FixedIp, session=session,
+                    read_deleted="no").\
+                filter(models.FixedIp.id.in_(ids)).\
+                filter_by(instance_id=None).\
+                filter_by(pool_owner=None).\
+                update({'pool_owner': owner,
+                        'network_id': network_id},
+                       synchronize_session=False)
+        rows = model_query(context, models.FixedIp.address, session=session,
+                           read_deleted="no").\
+                       filter(models.FixedIp.id.in_(ids)).\
+                       filter_by(pool_owner=owner).\
+                       order_by(models.FixedIp.id).\
+                       all()
+    return [row[0] for row in rows]
+
+
+@require_admin_context
+def fixed_ip_associate_reserved(context, owner, instance_ids_by_address):
+    session = get_session()
+    associated = []
+    with session.begin():
+        for address, instance_id in instance_ids_by_address:
+            result = model_query(context, models.FixedIp, session=session,
+                                 read_deleted="no").\
+                             filter_by(address=address).\
+                             filter_by(pool_owner=owner).\
+                             filter_by(instance_id=None).\
+                             update({'instance_id': instance_id,
+                                     'pool_owner': None},
+                                    synchronize_session=False)
+            if result:
+                associated.append(address)
+    return associated
+
+
+@require_admin_context
+def fixed_ip_release_pool(context, owner, addresses=None):
+    query = model_query(context, models.FixedIp, read_deleted="no").\
+                    filter_by(pool_owner=owner)
+    if addresses is not None:
+        if not addresses:
+            return 0
+        query = query.filter(models.FixedIp.address.in_(addresses))
+    return query.update({'pool_owner': None}, synchronize_session=False)
+
+
 @require_context
 def fixed_ip_create(context, values):
     fixed_ip_ref = models.FixedIp()
@@ -1131,6 +1309,61 @@ def fixed_ips_by_virtual_interface(context, vif_id):
     return result
 
 
+@require_context
+def fixed_ip_get_all_with_instance_uuid(context, address=None, prefix=None):
+    """Get the fixed ips of virtual interfaces with their instance uuid.
+
+    :param address: = only get the fixed ip with this address
+    :param prefix: = only get the fixed ips whose address or one of whose
+                     floating ip addresses starts with prefix
+    :returns: list of dicts with the address, floating_addresses, vif_id,
+              instance_id and instance_uuid of each fixed ip
+    """
+    floating_and = and_(models.FloatingIp.fixed_ip_id == models.FixedIp.id,
+                        models.FloatingIp.deleted == False)
+    query = model_query(context, models.FixedIp.id,
+                        models.FixedIp.address,
+                        models.FixedIp.virtual_interface_id,
+                        models.VirtualInterface.instance_id,
+                        models.Instance.uuid,
+                        models.FloatingIp.address,
+                        read_deleted="yes").\
+                filter(models.FixedIp.deleted == False).\
+                join((models.VirtualInterface,
+                      models.VirtualInterface.id ==
+                      models.FixedIp.virtual_interface_id)).\
+                join((models.Instance,
+                      models.Instance.id ==
+                      models.VirtualInterface.instance_id)).\
+                outerjoin((models.FloatingIp, floating_and))
+    conditions = []
+    if address is not None:
+        conditions.append(models.FixedIp.address == address)
+    if prefix is not None:
+        conditions.append(models.FixedIp.address.like(prefix + '%'))
+        conditions.append(models.FloatingIp.address.like(prefix + '%'))
+    if conditions:
+        query = query.filter(or_(*conditions))
+    query = query.order_by(models.FixedIp.virtual_interface_id,
+                           models.FixedIp.id)
+
+    data = []
+    fixed_ip_id = None
+    for datum in query.all():
+        if datum[0] != fixed_ip_id:
+            fixed_ip_id = datum[0]
+            cleaned = {}
+            cleaned['address'] = datum[1]
+            cleaned['vif_id'] = datum[2]
+            cleaned['instance_id'] = datum[3]
+            cleaned['instance_uuid'] = datum[4]
+            cleaned['floating_addresses'] = []
+            data.append(cleaned)
+        if datum[5]:
+            cleaned['floating_addresses'].append(datum[5])
+    return data
+
+
 @require_admin_context
 def fixed_ip_get_network(context, address):
     fixed_ip_ref = fixed_ip_get_by_address(context, address)
@@ -1233,6 +1466,28 @@ def virtual_interface_get_by_instance_and_network(context, instance_id,
     return vif_ref
 
 
+@require_context
+def virtual_interface_get_first_ids_by_instances(context, instance_ids):
+    """Gets the id of the first virtual interface of each instance.
+
+    :param instance_ids: = ids of the instances to retrieve vif ids for
+    :returns: dict of vif id by instance id
+    """
+    instance_ids = list(instance_ids)
+    result = {}
+    # NOTE: keep the IN clauses below the bind parameter limit of sqlite
+    for i in xrange(0, len(instance_ids), 500):
+        rows = model_query(context, models.VirtualInterface.instance_id,
+                           func.min(models.VirtualInterface.id),
+                           read_deleted="yes").\
+                filter(models.VirtualInterface.instance_id.in_(
+                        instance_ids[i:i + 500])).\
+                group_by(models.VirtualInterface.instance_id).\
+                all()
+        result.update(rows)
+    return result
+
+
 @require_context
 def virtual_interface_delete(context, vif_id):
     """Delete virtual interface record from the database.
@@ -1264,6 +1519,35 @@ def virtual_interface_get_all(context):
     return vif_refs
 
 
+@require_context
+def virtual_interface_get_all_with_instance_uuid(context):
+    """Get all vifs of instances with their instance uuid.
+
+    :returns: list of dicts with the id, address, network_id, instance_id
+              and instance_uuid of each vif
+    """
+    query = model_query(context, models.VirtualInterface.id,
+                        models.VirtualInterface.address,
+                        models.VirtualInterface.network_id,
+                        models.VirtualInterface.instance_id,
+                        models.Instance.uuid,
+                        read_deleted="yes").\
+                join((models.Instance,
+                      models.Instance.id ==
+                      models.VirtualInterface.instance_id)).\
+                order_by(models.VirtualInterface.id)
+    data = []
+    for datum in query.all():
+        cleaned = {}
+        cleaned['id'] = datum[0]
+        cleaned['address'] = datum[1]
+        cleaned['network_id'] = datum[2]
+        cleaned['instance_id'] = datum[3]
+        cleaned['instance_uuid'] = datum[4]
+        data.append(cleaned)
+    return data
+
+
 ###################
 
 
@@ -1288,6 +1572,8 @@ def instance_create(context, values):
     values = values.copy()
     values['metadata'] = _metadata_refs(values.get('metadata'),
                                         models.InstanceMetadata)
+    if not values.get('workload_class'):
+        values['workload_class'] = workload_classes.classify(values)
     instance_ref = models.Instance()
     if not values.get('uuid'):
         values['uuid'] = str(utils.gen_uuid())
@@ -1303,19 +1589,117 @@ def instance_create(context, values):
     return instance_ref
 
 
-@require_admin_context
-def instance_data_get_for_project(context, project_id):
+@require_context
+def instance_create_many(context, values_list, security_group_ids=None):
+    """Create several Instance records in a single transaction.
+
+    context - request context object
+    values_list - list of dicts containing column values, one per instance
+    security_group_ids - ids of the security groups to add every instance to
+
+    Instances without a display_name are named after their id, as done by
+    compute.api for a single instance, and their hostname defaults to the
+    sanitized display_name.
+    """
+    session = get_session()
+    with session.begin():
+        instance_refs = []
+        for values in values_list:
+            values = values.copy()
+            values['metadata'] = _metadata_refs(values.get('metadata'),
+                                                models.InstanceMetadata)
+            if not values.get('workload_class'):
+                values['workload_class'] = workload_classes.classify(values)
+            if not values.get('uuid'):
+                values['uuid'] = str(utils.gen_uuid())
+            instance_ref = models.Instance()
+            instance_ref.update(values)
+            session.add(instance_ref)
+            instance_refs.append(instance_ref)
+        # Assigns the instance ids
+        session.flush()
+
+        for instance_ref in instance_refs:
+            if instance_ref['display_name'] is None:
+                instance_ref['display_name'] = "Server %s" % instance_ref['id']
+            if instance_ref['hostname'] is None:
+                instance_ref['hostname'] = utils.sanitize_hostname(
+                        instance_ref['display_name'])
+            for security_group_id in security_group_ids or []:
+                association = models.SecurityGroupInstanceAssociation()
+                association.update({'security_group_id': security_group_id,
+                                    'instance_id': instance_ref['id']})
+                session.add(association)
+            info_cache = models.InstanceInfoCache()
+            info_cache.update({'instance_id': instance_ref['uuid']})
+            session.add(info_cache)
+
+    return instance_refs
+
+
+@require_admin_context
+def instance_data_get_for_project(context, project_id, session=None):
     result = model_query(context,
                          func.count(models.Instance.id),
                          func.sum(models.Instance.vcpus),
                          func.sum(models.Instance.memory_mb),
-                         read_deleted="no").\
+                         read_deleted="no",
+                         session=session).\
                      filter_by(project_id=project_id).\
                      first()
     # NOTE(vish): convert None to 0
     return (result[0] or 0, result[1] or 0, result[2] or 0)
 
 
+@require_admin_context
+def instance_utilization_get_by_host(context, host=None):
+    """Aggregate the resources used by the instances of each host.
+
+    A single GROUP BY over (host, workload_class) backed by the
+    instances_host_workload_class_idx index; pass host to restrict the
+    query to one host.  Returns a dict keyed by host.
+    """
+    busy_states = [vm_states.BUILDING, vm_states.REBUILDING,
+                   vm_states.MIGRATING, vm_states.RESIZING]
+    busy = case([(models.Instance.vm_state.in_(busy_states), 1)], else_=0)
+
+    query = model_query(context,
+                        models.Instance.host,
+                        models.Instance.workload_class,
+                        func.count(models.Instance.id),
+                        func.sum(models.Instance.vcpus),
+                        func.sum(models.Instance.memory_mb),
+                        func.sum(models.Instance.root_gb),
+                        func.sum(models.Instance.ephemeral_gb),
+                        func.sum(busy),
+                        read_deleted="no")
+    if host is not None:
+        query = query.filter(models.Instance.host == host)
+    else:
+        query = query.filter(models.Instance.host != None)
+    query = query.group_by(models.Instance.host,
+                           models.Instance.workload_class)
+
+    result = {}
+    for (inst_host, workload_class, count, vcpus, memory_mb, root_gb,
+         ephemeral_gb, work) in query.all():
+        usage = result.get(inst_host)
+        if usage is None:
+            usage = dict(running_vms=0, vcpus=0, memory_mb=0, disk_gb=0,
+                         current_workload=0)
+            for name in workload_classes.ALL:
+                usage[workload_classes.counter_name(name)] = 0
+            result[inst_host] = usage
+        # NOTE: convert None to 0, SUM over NULL columns is NULL
+        usage['running_vms'] += count
+        usage['vcpus'] += vcpus or 0
+        usage['memory_mb'] += memory_mb or 0
+        usage['disk_gb'] += (root_gb or 0) + (ephemeral_gb or 0)
+        usage['current_workload'] += work or 0
+        usage[workload_classes.counter_name(workload_class)] += count
+    return result
+
+
 @require_context
 def instance_destroy(context, instance_id):
     session = get_session()
@@ -1327,6 +1711,12 @@ def instance_destroy(context, instance_id):
         else:
             instance_ref = instance_get(context, instance_id,
                     session=session)
+        if not instance_ref['deleted']:
+            _quota_usage_release(context, instance_ref['project_id'],
+                                 {'instances': 1,
+                                  'cores': instance_ref['vcpus'] or 0,
+                                  'ram': instance_ref['memory_mb'] or 0},
+                                 session)
         session.query(models.Instance).\
                 filter_by(id=instance_id).\
                 update({'deleted': True,
@@ -1398,11 +1788,41 @@ def instance_get_all(context):
                    all()
 
 
+def _keyset_filter(query, model, sort_key, sort_dir, marker_ref):
+    """Limit a query sorted on (sort_key, id) to the rows after marker_ref.
+
+    NULL values of sort_key are taken to sort first ascending and last
+    descending, as they do in MySQL and SQLite.
+    """
+    column = getattr(model, sort_key)
+    value = marker_ref[sort_key]
+    if sort_dir == 'asc':
+        after_id = model.id > marker_ref['id']
+        if value is None:
+            criteria = or_(column != None, and_(column == None, after_id))
+        else:
+            criteria = or_(column > value, and_(column == value, after_id))
+    else:
+        after_id = model.id < marker_ref['id']
+        if value is None:
+            criteria = and_(column == None, after_id)
+        else:
+            criteria = or_(column < value, column == None,
+                           and_(column == value, after_id))
+    return query.filter(criteria)
+
+
 @require_context
-def instance_get_all_by_filters(context, filters, sort_key, sort_dir):
+def instance_get_all_by_filters(context, filters, sort_key, sort_dir,
+                                limit=None, marker=None):
     """Return instances that match all filters.  Deleted instances
     will be returned by default, unless there's a filter that says
-    otherwise"""
+    otherwise.
+
+    With a limit only that many instances are read, those sorted after
+    the instance whose uuid is marker when one is given.  The rows are
+    paged on (sort_key, id) and, when some filters can only be matched
+    here, read in growing batches until enough instances matched."""
 
     def _regexp_filter_by_metadata(instance, meta):
         inst_metadata = [{node['key']: node['value']}
@@ -1426,15 +1846,33 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir):
             return True
         return False
 
+    def _regexp_filter(instances):
+        # Now filter on everything else for regexp matching..
+        # For filters not in the list, we'll attempt to use the filter_name
+        # as a column name in Instance..
+        regexp_filter_funcs = {}
+
+        for filter_name in filters.iterkeys():
+            if not instances:
+                break
+            filter_func = regexp_filter_funcs.get(filter_name, None)
+            filter_re = re.compile(str(filters[filter_name]))
+            if filter_func:
+                filter_l = lambda instance: filter_func(instance, filter_re)
+            elif filter_name == 'metadata':
+                filter_l = lambda instance: _regexp_filter_by_metadata(
+                        instance, filters[filter_name])
+            else:
+                filter_l = lambda instance: _regexp_filter_by_column(
+                        instance, filter_name, filter_re)
+            instances = filter(filter_l, instances)
+
+        return instances
+
     sort_fn = {'desc': desc, 'asc': asc}
 
     session = get_session()
-    query_prefix = session.query(models.Instance).\
-            options(joinedload('info_cache')).\
-            options(joinedload('security_groups')).\
-            options(joinedload('metadata')).\
-            options(joinedload('instance_type')).\
-            order_by(sort_fn[sort_dir](getattr(models.Instance, sort_key)))
+    query_prefix = session.query(models.Instance)
 
     # Make a copy of the filters dictionary to use going forward, as we'll
     # be modifying it and we shouldn't affect the caller's use of it.
@@ -1473,31 +1911,52 @@ def instance_get_all_by_filters(context, filters, sort_key, sort_dir):
     query_prefix = exact_filter(query_prefix, models.Instance,
                                 filters, exact_match_filter_names)
 
-    instances = query_prefix.all()
-    if not instances:
-        return []
-
-    # Now filter on everything else for regexp matching..
-    # For filters not in the list, we'll attempt to use the filter_name
-    # as a column name in Instance..
-    regexp_filter_funcs = {}
-
-    for filter_name in filters.iterkeys():
-        filter_func = regexp_filter_funcs.get(filter_name, None)
-        filter_re = re.compile(str(filters[filter_name]))
-        if filter_func:
-            filter_l = lambda instance: filter_func(instance, filter_re)
-        elif filter_name == 'metadata':
-            filter_l = lambda instance: _regexp_filter_by_metadata(instance,
-                    filters[filter_name])
-        else:
-            filter_l = lambda instance: _regexp_filter_by_column(instance,
-                    filter_name, filter_re)
-        instances = filter(filter_l, instances)
-        if not instances:
+    # ... and narrow it with what SQL can check of the other filters
+    query_prefix = regexp_filter(query_prefix, models.Instance, filters)
+    meta = filters.get('metadata')
+    if isinstance(meta, dict):
+        meta = [meta]
+    if isinstance(meta, list):
+        for node in meta:
+            for k, v in node.iteritems():
+                query_prefix = query_prefix.filter(
+                        models.Instance.metadata.any(and_(
+                            models.InstanceMetadata.key == k,
+                            models.InstanceMetadata.value == v)))
+
+    if marker is not None:
+        marker_ref = query_prefix.filter_by(uuid=marker).first()
+        if not marker_ref:
+            raise exception.MarkerNotFound(marker=marker)
+
+    query_prefix = query_prefix.\
+            options(joinedload('info_cache')).\
+            options(joinedload('security_groups')).\
+            options(joinedload('metadata')).\
+            options(joinedload('instance_type')).\
+            order_by(sort_fn[sort_dir](getattr(models.Instance, sort_key)),
+                     sort_fn[sort_dir](models.Instance.id))
+
+    query = query_prefix
+    if marker is not None:
+        query = _keyset_filter(query_prefix, models.Instance, sort_key,
+                               sort_dir, marker_ref)
+
+    if limit is None:
+        return _regexp_filter(query.all())
+
+    instances = []
+    batch = limit
+    while len(instances) < limit:
+        rows = query.limit(batch).all()
+        instances.extend(_regexp_filter(rows))
+        if len(rows) < batch:
             break
+        query = _keyset_filter(query_prefix, models.Instance, sort_key,
+                               sort_dir, rows[-1])
+        batch *= 2
 
-    return instances
+    return instances[:limit]
 
 
 @require_context
@@ -2021,7 +2480,8 @@ def network_get_all_by_uuids(context, network_uuids, project_id=None):
 
 
 @require_admin_context
-def network_get_associated_fixed_ips(context, network_id, host=None):
+def network_get_associated_fixed_ips(context, network_id, host=None,
+                                     addresses=None):
     # FIXME(sirp): since this returns fixed_ips, this would be better named
     # fixed_ip_get_all_by_network.
     # NOTE(vish): The ugly joins here are to solve a performance issue and
@@ -2050,6 +2510,8 @@ def network_get_associated_fixed_ips(context, network_id, host=None):
                           filter(models.FixedIp.virtual_interface_id != None)
     if host:
         query = query.filter(models.Instance.host == host)
+    if addresses is not None:
+        query = query.filter(models.FixedIp.address.in_(addresses))
     result = query.all()
     data = []
     for datum in result:
@@ -2328,6 +2790,271 @@ def quota_destroy_all_by_project(context, project_id):
 ###################
 
 
+def _sync_instances(context, project_id, session):
+    return dict(zip(('instances', 'cores', 'ram'),
+                    instance_data_get_for_project(context, project_id,
+                                                  session=session)))
+
+
+def _sync_volumes(context, project_id, session):
+    return dict(zip(('volumes', 'gigabytes'),
+                    volume_data_get_for_project(context, project_id,
+                                                session=session)))
+
+
+def _sync_floating_ips(context, project_id, session):
+    return {'floating_ips': floating_ip_count_by_project(context, project_id,
+                                                         session=session)}
+
+
+# NOTE: what counts the rows of a project, by the resources whose usage
+#       is kept in quota_usages
+_QUOTA_USAGE_SYNCS = {
+    'instances': _sync_instances,
+    'cores': _sync_instances,
+    'ram': _sync_instances,
+    'volumes': _sync_volumes,
+    'gigabytes': _sync_volumes,
+    'floating_ips': _sync_floating_ips,
+}
+
+
+def _quota_usage_get_all_by_project(context, project_id, session,
+                                    lock=False):
+    query = model_query(context, models.QuotaUsage, session=session,
+                        read_deleted="no").\
+                    filter_by(project_id=project_id)
+    if lock:
+        query = query.with_lockmode('update')
+    return dict((usage.resource, usage) for usage in query.all())
+
+
+def _quota_usage_refresh(context, project_id, usages, resources, max_age,
+                         session):
+    """Recount the usages of resources which are missing or were not
+    updated for max_age seconds, all of them when max_age is 0.
+
+    Resources with pending reservations are not recounted: the rows of
+    a reservation may already exist, and committing it would then count
+    them twice.
+
+    usages is updated with the usages created.
+    """
+    now = utils.utcnow()
+    syncs = set()
+    for resource in resources:
+        usage = usages.get(resource)
+        if (usage is None or not max_age or
+            now - (usage.updated_at or usage.created_at) >
+                datetime.timedelta(seconds=max_age)):
+            syncs.add(_QUOTA_USAGE_SYNCS[resource])
+    if not syncs:
+        return
+
+    query = model_query(context, models.Reservation.resource,
+                        session=session, read_deleted="no").\
+                    filter_by(project_id=project_id).\
+                    distinct()
+    pending = set(row[0] for row in query)
+    for sync in syncs:
+        for resource, in_use in sync(context, project_id, session).items():
+            if resource in pending:
+                continue
+            usage = usages.get(resource)
+            if usage is None:
+                usage = models.QuotaUsage()
+                usage.project_id = project_id
+                usage.resource = resource
+                usage.reserved = 0
+                usages[resource] = usage
+            usage.in_use = in_use
+            usage.updated_at = now
+            session.add(usage)
+
+
+def _retry_on_duplicate_usage(f):
+    """Run f again when the usage it created for a resource was created
+    by a concurrent transaction first, f then finds and locks that one.
+    """
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        try:
+            return f(*args, **kwargs)
+        except exception.DBError, e:
+            if not isinstance(e.inner_exception, IntegrityError):
+                raise
+            return f(*args, **kwargs)
+    return wrapper
+
+
+def _quota_usage_release(context, project_id, deltas, session):
+    """Take what a row being deleted used off the usages of its project."""
+    usages = model_query(context, models.QuotaUsage, session=session,
+                         read_deleted="no").\
+                     filter_by(project_id=project_id).\
+                     filter(models.QuotaUsage.resource.in_(deltas.keys())).\
+                     with_lockmode('update').\
+                     all()
+    for usage in usages:
+        usage.in_use = max(0, usage.in_use - deltas[usage.resource])
+
+
+@require_admin_context
+@_retry_on_duplicate_usage
+def quota_usage_get_all_by_project(context, project_id, resources,
+                                   max_age=0):
+    """Return the in_use and reserved of each of the resources of a
+    project, recounting those not updated for max_age seconds.
+    """
+    session = get_session()
+    with session.begin():
+        usages = _quota_usage_get_all_by_project(context, project_id,
+                                                 session)
+        _quota_usage_refresh(context, project_id, usages, resources,
+                             max_age, session)
+    return dict((resource, {'in_use': usages[resource].in_use,
+                            'reserved': usages[resource].reserved})
+                for resource in resources)
+
+
+@require_admin_context
+def quota_usage_reconcile(context):
+    """Recount the usages of every project.
+
+    Returns a (project_id, resource, in_use, counted) tuple for each usage
+    which had drifted from what the rows of its project add up to.
+    """
+    project_ids = [row[0] for row in
+                   model_query(context, models.QuotaUsage.project_id,
+                               read_deleted="no").distinct()]
+    drifted = []
+    for project_id in project_ids:
+        session = get_session()
+        with session.begin():
+            usages = _quota_usage_get_all_by_project(context, project_id,
+                                                     session, lock=True)
+            in_use = dict((resource, usage.in_use)
+                          for resource, usage in usages.iteritems())
+            _quota_usage_refresh(context, project_id, usages, in_use.keys(),
+                                 0, session)
+            for resource in sorted(in_use):
+                counted = usages[resource].in_use
+                if counted != in_use[resource]:
+                    drifted.append((project_id, resource, in_use[resource],
+                                    counted))
+    return drifted
+
+
+@require_admin_context
+@_retry_on_duplicate_usage
+def quota_reserve(context, project_id, deltas, limits, expire, max_age=0):
+    """Reserve deltas of the resources of a project.
+
+    The usages of the resources are locked and those not updated for
+    max_age seconds recounted first.  Raises OverQuota when what the
+    project uses and has reserved plus a positive delta goes over its
+    limit, None being unlimited, otherwise returns the uuids of the
+    reservations, to be committed or rolled back by expire at the latest.
+    """
+    session = get_session()
+    with session.begin():
+        usages = _quota_usage_get_all_by_project(context, project_id,
+                                                 session, lock=True)
+        _quota_usage_refresh(context, project_id, usages, deltas.keys(),
+                             max_age, session)
+
+        overs = [resource for resource, delta in deltas.iteritems()
+                 if delta > 0 and limits.get(resource) is not None and
+                    usages[resource].in_use + usages[resource].reserved +
+                    delta > limits[resource]]
+        if overs:
+            raise exception.OverQuota(overs=sorted(overs))
+
+        reservations = []
+        for resource, delta in deltas.iteritems():
+            reservation = models.Reservation()
+            reservation.uuid = str(utils.gen_uuid())
+            reservation.usage = usages[resource]
+            reservation.project_id = project_id
+            reservation.resource = resource
+            reservation.delta = delta
+            reservation.expire = expire
+            session.add(reservation)
+            if delta > 0:
+                usages[resource].reserved += delta
+            reservations.append(reservation.uuid)
+    return reservations
+
+
+def _reservation_get_all(context, reservations, session):
+    if not reservations:
+        return []
+    return model_query(context, models.Reservation, session=session,
+                       read_deleted="no").\
+                   options(joinedload('usage')).\
+                   filter(models.Reservation.uuid.in_(reservations)).\
+                   with_lockmode('update').\
+                   all()
+
+
+def _reservation_release(context, reservations, session, commit=False):
+    """Take reservations off the reserved of their usages, adding them to
+    the in_use if committed, and delete them.  They are not soft deleted,
+    nothing reads them once released.
+    """
+    for reservation in reservations:
+        usage = reservation.usage
+        if reservation.delta > 0:
+            usage.reserved -= reservation.delta
+        if commit:
+            usage.in_use += reservation.delta
+    if reservations:
+        model_query(context, models.Reservation, session=session,
+                    read_deleted="no").\
+                filter(models.Reservation.id.in_(
+                        [reservation.id for reservation in reservations])).\
+                delete(synchronize_session=False)
+
+
+@require_admin_context
+def reservation_commit(context, reservations):
+    session = get_session()
+    with session.begin():
+        _reservation_release(context,
+                             _reservation_get_all(context, reservations,
+                                                  session),
+                             session, commit=True)
+
+
+@require_admin_context
+def reservation_rollback(context, reservations):
+    session = get_session()
+    with session.begin():
+        _reservation_release(context,
+                             _reservation_get_all(context, reservations,
+                                                  session),
+                             session)
+
+
+@require_admin_context
+def reservation_expire(context):
+    """Roll back the reservations past their expire, returns how many."""
+    session = get_session()
+    with session.begin():
+        reservations = model_query(context, models.Reservation,
+                                   session=session, read_deleted="no").\
+                               options(joinedload('usage')).\
+                               filter(models.Reservation.expire <
+                                      utils.utcnow()).\
+                               with_lockmode('update').\
+                               all()
+        _reservation_release(context, reservations, session)
+    return len(reservations)
+
+
+###################
+
+
 @require_admin_context
 def volume_allocate_iscsi_target(context, volume_id, host):
     session = get_session()
@@ -2377,11 +3104,12 @@ def volume_create(context, values):
 
 
 @require_admin_context
-def volume_data_get_for_project(context, project_id):
+def volume_data_get_for_project(context, project_id, session=None):
     result = model_query(context,
                          func.count(models.Volume.id),
                          func.sum(models.Volume.size),
-                         read_deleted="no").\
+                         read_deleted="no",
+                         session=session).\
                      filter_by(project_id=project_id).\
                      first()
 
@@ -2393,6 +3121,15 @@ def volume_data_get_for_project(context, project_id):
 def volume_destroy(context, volume_id):
     session = get_session()
     with session.begin():
+        volume_ref = model_query(context, models.Volume, session=session,
+                                 read_deleted="no").\
+                             filter_by(id=volume_id).\
+                             first()
+        if volume_ref:
+            _quota_usage_release(context, volume_ref['project_id'],
+                                 {'volumes': 1,
+                                  'gigabytes': volume_ref['size'] or 0},
+                                 session)
         session.query(models.Volume).\
                 filter_by(id=volume_id).\
                 update({'deleted': True,
@@ -2441,6 +3178,15 @@ def volume_get(context, volume_id, session=None):
     return result
 
 
+@require_context
+def volume_get_all_by_ids(context, volume_ids):
+    if not volume_ids:
+        return []
+    return _volume_get_query(context, project_only=True).\
+                    filter(models.Volume.id.in_(volume_ids)).\
+                    all()
+
+
 @require_admin_context
 def volume_get_all(context):
     return _volume_get_query(context).all()
@@ -2717,6 +3463,16 @@ def block_device_mapping_get_all_by_instance(context, instance_id):
                  all()
 
 
+@require_context
+def block_device_mapping_get_all_by_instances(context, instance_ids):
+    if not instance_ids:
+        return []
+    return _block_device_mapping_get_query(context).\
+                 filter(models.BlockDeviceMapping.instance_id.in_(
+                        instance_ids)).\
+                 all()
+
+
 @require_context
 def block_device_mapping_destroy(context, bdm_id):
     session = get_session()
@@ -3969,6 +4725,15 @@ def s3_image_get_by_uuid(context, image_uuid):
     return result
 
 
+def s3_image_get_all_by_uuids(context, image_uuids):
+    """Find the local s3 images represented by the provided uuids"""
+    if not image_uuids:
+        return []
+    return model_query(context, models.S3Image, read_deleted="yes").\
+                 filter(models.S3Image.uuid.in_(image_uuids)).\
+                 all()
+
+
 def s3_image_create(context, image_uuid):
     """Create local s3 image represented by provided uuid"""
     try:
@@ -0,0 +1,61 @@
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import base64
+
+from sqlalchemy import Column, Index, MetaData, String, Table
+
+
+CLASSES = ('cpu', 'io', 'mem')
+UNDEFINED = 'und'
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    instances = Table('instances', meta, autoload=True)
+    workload_class = Column('workload_class', String(16))
+    instances.create_column(workload_class)
+
+    # Classify existing instances the same way the scheduler used to do,
+    # by matching the base64 encoded user_data.
+    for name in CLASSES:
+        instances.update().\
+                where(instances.c.user_data == base64.b64encode(name)).\
+                values(workload_class=name).\
+                execute()
+    instances.update().\
+            where(instances.c.workload_class == None).\
+            values(workload_class=UNDEFINED).\
+            execute()
+
+    index = Index('instances_host_workload_class_idx',
+                  instances.c.host, instances.c.workload_class)
+    index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    instances = Table('instances', meta, autoload=True)
+    index = Index('instances_host_workload_class_idx',
+                  instances.c.host, instances.c.workload_class)
+    index.drop(migrate_engine)
+
+    # NOTE: reload the table without the index, sqlite drops the column
+    #       by recreating the table along with the indexes it knows of.
+    meta = MetaData()
+    meta.bind = migrate_engine
+    instances = Table('instances', meta, autoload=True)
+    instances.drop_column('workload_class')
@@ -0,0 +1,41 @@
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, Index, MetaData, String, Table
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    fixed_ips = Table('fixed_ips', meta, autoload=True)
+    pool_owner = Column('pool_owner', String(255))
+    fixed_ips.create_column(pool_owner)
+
+    index = Index('fixed_ips_pool_owner_idx', fixed_ips.c.pool_owner)
+    index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    fixed_ips = Table('fixed_ips', meta, autoload=True)
+    index = Index('fixed_ips_pool_owner_idx', fixed_ips.c.pool_owner)
+    index.drop(migrate_engine)
+
+    # NOTE: reload the table without the index, sqlite drops the column
+    #       by recreating the table along with the indexes it knows of.
+    meta = MetaData()
+    meta.bind = migrate_engine
+    fixed_ips = Table('fixed_ips', meta, autoload=True)
+    fixed_ips.drop_column('pool_owner')
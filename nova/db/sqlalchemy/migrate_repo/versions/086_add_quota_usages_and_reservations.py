@@ -0,0 +1,96 @@
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Index
+from sqlalchemy import Integer, MetaData, String, Table
+
+from nova import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    #
+    # New Tables
+    #
+    quota_usages = Table('quota_usages', meta,
+            Column('created_at', DateTime(timezone=False)),
+            Column('updated_at', DateTime(timezone=False)),
+            Column('deleted_at', DateTime(timezone=False)),
+            Column('deleted', Boolean(create_constraint=True, name=None)),
+            Column('id', Integer(), primary_key=True),
+            Column('project_id',
+                   String(length=255, convert_unicode=False,
+                          assert_unicode=None, unicode_error=None,
+                          _warn_on_bytestring=False),
+                   index=True),
+            Column('resource',
+                   String(length=255, convert_unicode=False,
+                          assert_unicode=None, unicode_error=None,
+                          _warn_on_bytestring=False)),
+            Column('in_use', Integer(), nullable=False),
+            Column('reserved', Integer(), nullable=False),
+            )
+
+    reservations = Table('reservations', meta,
+            Column('created_at', DateTime(timezone=False)),
+            Column('updated_at', DateTime(timezone=False)),
+            Column('deleted_at', DateTime(timezone=False)),
+            Column('deleted', Boolean(create_constraint=True, name=None)),
+            Column('id', Integer(), primary_key=True),
+            Column('uuid',
+                   String(length=36, convert_unicode=False,
+                          assert_unicode=None, unicode_error=None,
+                          _warn_on_bytestring=False),
+                   nullable=False, index=True),
+            Column('usage_id', Integer(), ForeignKey('quota_usages.id'),
+                   nullable=False),
+            Column('project_id',
+                   String(length=255, convert_unicode=False,
+                          assert_unicode=None, unicode_error=None,
+                          _warn_on_bytestring=False),
+                   index=True),
+            Column('resource',
+                   String(length=255, convert_unicode=False,
+                          assert_unicode=None, unicode_error=None,
+                          _warn_on_bytestring=False)),
+            Column('delta', Integer(), nullable=False),
+            Column('expire', DateTime(timezone=False)),
+            )
+
+    for table in (quota_usages, reservations):
+        try:
+            table.create()
+        except Exception:
+            LOG.exception(repr(table))
+            raise
+
+    # NOTE: one usage per resource of a project, concurrent first
+    #       reservations must not each create their own
+    index = Index('quota_usages_project_id_resource_idx',
+                  quota_usages.c.project_id, quota_usages.c.resource,
+                  unique=True)
+    index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+    quota_usages = Table('quota_usages', meta, autoload=True)
+    reservations = Table('reservations', meta, autoload=True)
+    # table order matters, don't change
+    for table in (reservations, quota_usages):
+        table.drop()
@@ -241,6 +241,10 @@ class Instance(BASE, NovaBase):
 
     user_data = Column(Text)
 
+    # One of nova.compute.workload_classes, indexed together with host so
+    # per-host class counters can be aggregated by the database.
+    workload_class = Column(String(16))
+
     reservation_id = Column(String(255))
 
     scheduled_at = Column(DateTime)
@@ -439,6 +443,46 @@ class Quota(BASE, NovaBase):
     hard_limit = Column(Integer, nullable=True)
 
 
+class QuotaUsage(BASE, NovaBase):
+    """Represents the usage of a resource by a project.
+
+    in_use is what the project's rows add up to, as of the last refresh
+    plus the committed reservations since, and reserved what the pending
+    reservations will add to it.
+    """
+
+    __tablename__ = 'quota_usages'
+    __table_args__ = (schema.UniqueConstraint("project_id", "resource"),
+                      {'mysql_engine': 'InnoDB'})
+    id = Column(Integer, primary_key=True)
+
+    project_id = Column(String(255), index=True)
+    resource = Column(String(255))
+
+    in_use = Column(Integer, nullable=False, default=0)
+    reserved = Column(Integer, nullable=False, default=0)
+
+
+class Reservation(BASE, NovaBase):
+    """Represents a pending change of the usage of a resource."""
+
+    __tablename__ = 'reservations'
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String(36), nullable=False, index=True)
+
+    usage_id = Column(Integer, ForeignKey('quota_usages.id'), nullable=False)
+
+    project_id = Column(String(255), index=True)
+    resource = Column(String(255))
+
+    delta = Column(Integer, nullable=False)
+    expire = Column(DateTime, nullable=True)
+
+    usage = relationship(QuotaUsage,
+                         foreign_keys=usage_id,
+                         primaryjoin=usage_id == QuotaUsage.id)
+
+
 class Snapshot(BASE, NovaBase):
     """Represents a block storage device that can be attached to a vm."""
     __tablename__ = 'snapshots'
@@ -686,6 +730,8 @@ class FixedIp(BASE, NovaBase):
     leased = Column(Boolean, default=False)
     reserved = Column(Boolean, default=False)
     host = Column(String(255))
+    # network host that reserved the free ip for its FixedIpPool
+    pool_owner = Column(String(255))
 
 
 class FloatingIp(BASE, NovaBase):
@@ -1012,6 +1058,9 @@ def register_models():
               Migration,
               Network,
               Project,
+              Quota,
+              QuotaUsage,
+              Reservation,
               SecurityGroup,
               SecurityGroupIngressRule,
               SecurityGroupInstanceAssociation,
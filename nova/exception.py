@@ -954,6 +954,10 @@ class QuotaError(NovaException):
     message = _("Quota exceeded") + ": code=%(code)s"
 
 
+class OverQuota(NovaException):
+    message = _("Quota exceeded for resources: %(overs)s")
+
+
 class AggregateError(NovaException):
     message = _("Aggregate %(aggregate_id)s: action '%(action)s' "
                 "caused an error: %(reason)s.")
@@ -1017,6 +1021,10 @@ class InstanceNotFound(NotFound):
     message = _("Instance %(instance_id)s could not be found.")
 
 
+class MarkerNotFound(NotFound):
+    message = _("Marker %(marker)s could not be found.")
+
+
 class InvalidInstanceIDMalformed(Invalid):
     message = _("Invalid id: %(val)s (expecting \"i-...\").")
 
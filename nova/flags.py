@@ -189,6 +189,16 @@ global_opts = [
     cfg.StrOpt('network_topic',
                default='network',
                help='the topic network nodes listen on'),
+    cfg.StrOpt('metadata_cache_topic',
+               default='metadata_cache',
+               help='the topic metadata api workers listen on for '
+                    'instances whose cached metadata is stale'),
+    cfg.BoolOpt('metadata_cache_invalidation',
+                default=False,
+                help='Announce the instances changed through the api on '
+                     'metadata_cache_topic, and have the metadata api '
+                     'workers drop the metadata they cached for the '
+                     'instances announced there'),
     cfg.StrOpt('rabbit_host',
                default='localhost',
                help='the RabbitMQ host'),
@@ -56,11 +56,22 @@ This module provides Manager, a base class for managers.
 from nova.db import base
 from nova import flags
 from nova import log as logging
+from nova.openstack.common import cfg
+from nova.rpc import dispatcher as rpc_dispatcher
 from nova.scheduler import api
 from nova import version
 
 
+manager_opts = [
+    cfg.IntOpt('capabilities_full_update_interval',
+               default=10,
+               help='Send the full capabilities to the schedulers every N '
+                    'updates and only the changed ones in between. 1 sends '
+                    'them in full every time'),
+    ]
+
 FLAGS = flags.FLAGS
+FLAGS.register_opts(manager_opts)
 
 
 LOG = logging.getLogger(__name__)
@@ -167,6 +178,14 @@ class Manager(base.Base):
         """
         pass
 
+    def cleanup_host(self):
+        """Handle cleanup when the standalone service stops.
+
+        Child classes should override this method.
+
+        """
+        pass
+
     def service_version(self, context):
         return version.version_string()
 
@@ -176,6 +195,12 @@ class Manager(base.Base):
             config[key] = FLAGS.get(key, None)
         return config
 
+    def get_rpc_stats(self, context, reset=False):
+        """Return the queue wait and run time histograms of the rpc
+        messages of this manager by method.
+        """
+        return rpc_dispatcher.get_stats(self, reset=reset)
+
 
 class SchedulerDependentManager(Manager):
     """Periodically send capability updates to the Scheduler services.
@@ -185,30 +210,66 @@ class SchedulerDependentManager(Manager):
     manager.Manager directly. Updates are only sent after
     update_service_capabilities is called with non-None values.
 
+    Updates are numbered.  Every capabilities_full_update_interval
+    updates the full capabilities are sent, in between only the keys that
+    changed since the previous update.  A scheduler that misses an update
+    calls request_full_capabilities() to get a full one.
+
     """
 
     def __init__(self, host=None, db_driver=None, service_name='undefined'):
         self.last_capabilities = None
         self.service_name = service_name
+        # Capabilities as of the last update sent, None to send the next
+        # update in full
+        self._published_capabilities = None
+        self._capabilities_seq = 0
+        self._updates_since_full = 0
         super(SchedulerDependentManager, self).__init__(host, db_driver)
 
     def update_service_capabilities(self, capabilities):
         """Remember these capabilities to send on next periodic update."""
-        #Eneabegin
-        LOG.debug(_("Enea: in nova.manager capabilities %(capabilities)s") % locals())
-        #Eneaend
         self.last_capabilities = capabilities
 
+    def request_full_capabilities(self, context):
+        """Send the full capabilities with the next periodic update."""
+        self._published_capabilities = None
+
     @periodic_task
     def _publish_service_capabilities(self, context):
         """Pass data back to the scheduler at a periodic interval."""
-        #Eneabegin
-        capabilities= self.last_capabilities
-        #Eneaend
-        if self.last_capabilities:
-            #Eneabegin
-            LOG.debug(_("Enea: in nova.manager capabilities %(capabilities)s") % locals())
-            #Eneaend
+        capabilities = self.last_capabilities
+        if not capabilities:
+            self._published_capabilities = None
+            return
+
+        self._capabilities_seq += 1
+        self._updates_since_full += 1
+        if (self._published_capabilities is None or
+            self._updates_since_full >=
+                FLAGS.capabilities_full_update_interval):
             LOG.debug(_('Notifying Schedulers of capabilities ...'))
             api.update_service_capabilities(context, self.service_name,
-                                self.host, self.last_capabilities)
+                    self.host, capabilities, seq=self._capabilities_seq)
+            self._updates_since_full = 0
+        else:
+            changed, removed = _capabilities_delta(
+                    self._published_capabilities, capabilities)
+            # Sent even if nothing changed, the schedulers rely on the
+            # updates to tell the service is alive.
+            LOG.debug(_('Notifying Schedulers of %d changed '
+                        'capabilities ...'), len(changed) + len(removed))
+            api.update_service_capabilities(context, self.service_name,
+                    self.host, changed, seq=self._capabilities_seq,
+                    full=False, removed=removed)
+        self._published_capabilities = dict(capabilities)
+
+
+def _capabilities_delta(old, new):
+    """Return the capabilities changed from old to new and the names of
+    the ones removed.
+    """
+    changed = dict((key, value) for key, value in new.iteritems()
+                   if key not in old or old[key] != value)
+    removed = [key for key in old if key not in new]
+    return changed, removed
@@ -0,0 +1,114 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Fixed ips reserved in blocks by a network host.
+
+fixed_ip_associate_pool() locks the first free fixed ip of the network,
+so every allocation on a network waits for the ones before it to commit.
+A FixedIpPool reserves a block of free ips of a network for its owner in
+one go and hands them out from memory, associating them to instances
+with an update that only matches ips the owner still holds.
+"""
+
+import collections
+
+from eventlet import semaphore
+
+from nova import db
+from nova import exception
+from nova import log as logging
+from nova import utils
+
+
+LOG = logging.getLogger(__name__)
+
+
+class FixedIpPool(object):
+    """Free fixed ips of networks reserved for one owner."""
+
+    def __init__(self, owner, size, db_api=None):
+        self.owner = owner
+        self.size = size
+        self.db = db_api or db
+        # free addresses reserved by network id
+        self._free = collections.defaultdict(list)
+        self._locks = collections.defaultdict(semaphore.Semaphore)
+
+    def allocate(self, context, network_id, instance_ids):
+        """Associate a free ip of the network to each of the instances.
+
+        Returns the addresses in the order of instance_ids.  Raises
+        NoMoreFixedIps if the network does not have enough free ips left,
+        once the ips it associated are disassociated again.
+        """
+        addresses = [None] * len(instance_ids)
+        pending = range(len(instance_ids))
+        while pending:
+            try:
+                taken = self._take(context, network_id, len(pending))
+            except exception.NoMoreFixedIps:
+                with utils.save_and_reraise_exception():
+                    for address in addresses:
+                        if address is not None:
+                            self.db.fixed_ip_disassociate(context, address)
+            pairs = [(address, instance_ids[i])
+                     for address, i in zip(taken, pending)]
+            associated = set(self.db.fixed_ip_associate_reserved(context,
+                    self.owner, pairs))
+            left = []
+            for address, i in zip(taken, pending):
+                if address in associated:
+                    addresses[i] = address
+                else:
+                    # NOTE: released or taken by address since we
+                    #       reserved it, try another one
+                    left.append(i)
+            pending = left
+        return addresses
+
+    def _take(self, context, network_id, count):
+        free = self._free[network_id]
+        while len(free) < count:
+            with self._locks[network_id]:
+                if len(free) >= count:
+                    break
+                reserved = self.db.fixed_ip_reserve_pool(context, network_id,
+                        self.owner, max(self.size, count - len(free)))
+                if not reserved:
+                    raise exception.NoMoreFixedIps()
+                LOG.debug(_('Reserved %(count)d fixed ips of network '
+                            '%(network_id)s'),
+                          {'count': len(reserved), 'network_id': network_id})
+                free.extend(reserved)
+        taken = free[:count]
+        del free[:count]
+        return taken
+
+    def release(self, context):
+        """Give back the reserved ips that were not handed out."""
+        addresses = []
+        for free in self._free.values():
+            addresses.extend(free)
+            del free[:]
+        if addresses:
+            self.db.fixed_ip_release_pool(context, self.owner, addresses)
+        return len(addresses)
+
+    def reset(self, context):
+        """Give back every ip reserved by the owner, by earlier runs too."""
+        self._free.clear()
+        return self.db.fixed_ip_release_pool(context, self.owner)
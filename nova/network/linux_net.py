@@ -24,6 +24,9 @@ import inspect
 import netaddr
 import os
 
+from eventlet import event
+from eventlet import greenthread
+
 from nova import db
 from nova import exception
 from nova import flags
@@ -79,6 +82,16 @@ linux_net_opts = [
                 default=False,
                 help='Use single default gateway. Only first nic of vm will '
                      'get default gateway from dhcp server'),
+    cfg.IntOpt('iptables_apply_delay_ms',
+               default=0,
+               help='Apply iptables changes in the background at most once '
+                    'every this many milliseconds, coalescing the changes '
+                    'made in between. 0 applies them on every change'),
+    cfg.IntOpt('dnsmasq_hup_delay_ms',
+               default=0,
+               help='Reload dnsmasq at most once every this many '
+                    'milliseconds per bridge, coalescing the host changes '
+                    'made in between. 0 reloads it on every change'),
     ]
 
 FLAGS = flags.FLAGS
@@ -115,6 +128,17 @@ class IptablesRule(object):
     def __ne__(self, other):
         return not self == other
 
+    def __hash__(self):
+        return hash((self.chain, self.rule, self.wrap, self.top))
+
+    def jump_target(self):
+        """The chain this rule jumps to, None if it doesn't."""
+        words = self.rule.split()
+        try:
+            return words[words.index('-j') + 1]
+        except (ValueError, IndexError):
+            return None
+
     def __str__(self):
         if self.wrap:
             chain = '%s-%s' % (binary_name, self.chain)
@@ -124,12 +148,66 @@ class IptablesRule(object):
 
 
 class IptablesTable(object):
-    """An iptables table."""
+    """An iptables table.
+
+    The rules are indexed by rule, by chain and by jump target so adding
+    and removing them doesn't need to go through all the rules of the
+    table.  Adding a rule that is already there moves it last.
+
+    """
 
     def __init__(self):
-        self.rules = []
+        # {IptablesRule: [insertion order, times added]}
+        self._rules = {}
+        self._next_order = 0
+        # {chain name: set of its IptablesRules}
+        self._chain_rules = {}
+        # {jump target: set of the IptablesRules jumping to it}
+        self._jump_rules = {}
         self.chains = set()
         self.unwrapped_chains = set()
+        # Whether the table changed since IptablesManager last applied it
+        self.dirty = True
+
+    @property
+    def rules(self):
+        """The rules of the table in the order they were added."""
+        entries = sorted(self._rules.iteritems(), key=lambda e: e[1][0])
+        rules = []
+        for rule, (_order, count) in entries:
+            rules.extend([rule] * count)
+        return rules
+
+    def _add(self, rule):
+        entry = self._rules.get(rule)
+        if entry is None:
+            self._rules[rule] = [self._next_order, 1]
+            self._chain_rules.setdefault(rule.chain, set()).add(rule)
+            target = rule.jump_target()
+            if target is not None:
+                self._jump_rules.setdefault(target, set()).add(rule)
+        else:
+            entry[0] = self._next_order
+            entry[1] += 1
+        self._next_order += 1
+
+    def _remove(self, rule, all_copies=False):
+        entry = self._rules[rule]
+        entry[1] -= 1
+        if entry[1] > 0 and not all_copies:
+            return
+        del self._rules[rule]
+        self._discard_index(self._chain_rules, rule.chain, rule)
+        target = rule.jump_target()
+        if target is not None:
+            self._discard_index(self._jump_rules, target, rule)
+
+    @staticmethod
+    def _discard_index(index, key, rule):
+        rules = index[key]
+        rules.discard(rule)
+        if not rules:
+            del index[key]
 
     def add_chain(self, name, wrap=True):
         """Adds a named chain to the table.
@@ -144,9 +222,12 @@ class IptablesTable(object):
 
         """
         if wrap:
-            self.chains.add(name)
+            chain_set = self.chains
         else:
-            self.unwrapped_chains.add(name)
+            chain_set = self.unwrapped_chains
+        if name not in chain_set:
+            chain_set.add(name)
+            self.dirty = True
 
     def remove_chain(self, name, wrap=True):
         """Remove named chain.
@@ -168,14 +249,17 @@ class IptablesTable(object):
             return
 
         chain_set.remove(name)
-        self.rules = filter(lambda r: r.chain != name, self.rules)
+        self.dirty = True
+        for rule in list(self._chain_rules.get(name, [])):
+            self._remove(rule, all_copies=True)
 
         if wrap:
-            jump_snippet = '-j %s-%s' % (binary_name, name)
+            jump_target = '%s-%s' % (binary_name, name)
         else:
-            jump_snippet = '-j %s' % (name,)
+            jump_target = name
 
-        self.rules = filter(lambda r: jump_snippet not in r.rule, self.rules)
+        for rule in list(self._jump_rules.get(jump_target, [])):
+            self._remove(rule, all_copies=True)
 
     def add_rule(self, chain, rule, wrap=True, top=False):
         """Add a rule to the table.
@@ -194,7 +278,8 @@ class IptablesTable(object):
         if '$' in rule:
             rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
 
-        self.rules.append(IptablesRule(chain, rule, wrap, top))
+        self._add(IptablesRule(chain, rule, wrap, top))
+        self.dirty = True
 
     def _wrap_target_chain(self, s):
         if s.startswith('$'):
@@ -210,8 +295,9 @@ class IptablesTable(object):
 
         """
         try:
-            self.rules.remove(IptablesRule(chain, rule, wrap, top))
-        except ValueError:
+            self._remove(IptablesRule(chain, rule, wrap, top))
+            self.dirty = True
+        except KeyError:
             LOG.debug(_('Tried to remove rule that was not there:'
                         ' %(chain)r %(rule)r %(wrap)r %(top)r'),
                       {'chain': chain, 'rule': rule,
@@ -219,10 +305,11 @@ class IptablesTable(object):
 
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
-        chained_rules = [rule for rule in self.rules
-                              if rule.chain == chain and rule.wrap == wrap]
+        chained_rules = [rule for rule in self._chain_rules.get(chain, [])
+                         if rule.wrap == wrap]
         for rule in chained_rules:
-            self.rules.remove(rule)
+            self._remove(rule, all_copies=True)
+            self.dirty = True
 
 
 class IptablesManager(object):
@@ -246,6 +333,12 @@ class IptablesManager(object):
     wrapped in the same was as the built-in filter chains. Additionally,
     there's a snat chain that is applied after the POSTROUTING chain.
 
+    Only the tables changed since they were last applied are written.
+    When iptables_apply_delay_ms is set, apply() only schedules a
+    background apply of the changes, so the changes of many callers are
+    written together.  Callers that need their changes in place before
+    going on use apply_and_wait().
+
     """
 
     def __init__(self, execute=None):
@@ -254,6 +347,9 @@ class IptablesManager(object):
         else:
             self.execute = execute
 
+        # Sent when the scheduled background apply is done
+        self._apply_done = None
+
         self.ipv4 = {'filter': IptablesTable(),
                      'nat': IptablesTable()}
         self.ipv6 = {'filter': IptablesTable()}
@@ -307,14 +403,53 @@ class IptablesManager(object):
         self.ipv4['nat'].add_chain('float-snat')
         self.ipv4['nat'].add_rule('snat', '-j $float-snat')
 
-    @utils.synchronized('iptables', external=True)
     def apply(self):
+        """Apply the current in-memory set of iptables rules, right away or
+        within iptables_apply_delay_ms.
+        """
+        if FLAGS.iptables_apply_delay_ms > 0:
+            self._schedule_apply()
+        else:
+            self._apply()
+
+    def apply_and_wait(self):
+        """Like apply(), but return only once the rules are in place.
+
+        Raises the error of the apply, if any.
+        """
+        if FLAGS.iptables_apply_delay_ms > 0:
+            self._schedule_apply().wait()
+        else:
+            self._apply()
+
+    def _schedule_apply(self):
+        if self._apply_done is None:
+            self._apply_done = event.Event()
+            greenthread.spawn_after(FLAGS.iptables_apply_delay_ms / 1000.0,
+                                    self._apply_scheduled)
+        return self._apply_done
+
+    def _apply_scheduled(self):
+        done, self._apply_done = self._apply_done, None
+        try:
+            self._apply()
+        except Exception as e:
+            LOG.exception(_("Failed to apply iptables rules"))
+            done.send_exception(e)
+        else:
+            done.send()
+
+    @utils.synchronized('iptables', external=True)
+    def _apply(self):
         """Apply the current in-memory set of iptables rules.
 
         This will blow away any rules left over from previous runs of the
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        Tables that did not change since they were last applied are
+        skipped.
+
         """
         s = [('iptables', self.ipv4)]
         if FLAGS.use_ipv6:
@@ -322,26 +457,38 @@ class IptablesManager(object):
 
         for cmd, tables in s:
             for table in tables:
-                current_table, _err = self.execute('%s-save' % (cmd,),
-                                                   '-t', '%s' % (table,),
-                                                   run_as_root=True,
-                                                   attempts=5)
-                current_lines = current_table.split('\n')
-                new_filter = self._modify_rules(current_lines,
-                                                tables[table])
-                self.execute('%s-restore' % (cmd,), run_as_root=True,
-                             process_input='\n'.join(new_filter),
-                             attempts=5)
+                if not tables[table].dirty:
+                    continue
+                # Cleared first so changes made while we run are kept
+                tables[table].dirty = False
+                try:
+                    current_table, _err = self.execute('%s-save' % (cmd,),
+                                                       '-t', '%s' % (table,),
+                                                       run_as_root=True,
+                                                       attempts=5)
+                    current_lines = current_table.split('\n')
+                    new_filter = self._modify_rules(current_lines,
+                                                    tables[table])
+                    self.execute('%s-restore' % (cmd,), run_as_root=True,
+                                 process_input='\n'.join(new_filter),
+                                 attempts=5)
+                except Exception:
+                    tables[table].dirty = True
+                    raise
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
     def _modify_rules(self, current_lines, table, binary=None):
+        """Return the iptables-save output current_lines with our rules
+        replaced by the ones of table.  Linear in the number of lines and
+        rules.
+        """
         unwrapped_chains = table.unwrapped_chains
         chains = table.chains
         rules = table.rules
 
         # Remove any trace of our rules
-        new_filter = filter(lambda line: binary_name not in line,
-                            current_lines)
+        new_filter = [line for line in current_lines
+                      if binary_name not in line]
 
         seen_chains = False
         rules_index = 0
@@ -354,40 +501,38 @@ class IptablesManager(object):
                     break
 
         our_rules = []
+        top_rules = set()
         for rule in rules:
             rule_str = str(rule)
             if rule.top:
                 # rule.top == True means we want this rule to be at the top.
                 # Further down, we weed out duplicates from the bottom of the
                 # list, so here we remove the dupes ahead of time.
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                                    new_filter)
-            our_rules += [rule_str]
+                top_rules.add(rule_str.strip())
+            our_rules.append(rule_str)
 
-        new_filter[rules_index:rules_index] = our_rules
+        our_lines = [':%s-%s - [0:0]' % (binary_name, name,)
+                     for name in chains]
+        our_lines += [':%s - [0:0]' % (name,) for name in unwrapped_chains]
+        our_lines += our_rules
 
-        new_filter[rules_index:rules_index] = [':%s - [0:0]' % (name,)
-                                               for name in unwrapped_chains]
-        new_filter[rules_index:rules_index] = [':%s-%s - [0:0]' %
-                                               (binary_name, name,)
-                                               for name in chains]
-
-        seen_lines = set()
-
-        def _weed_out_duplicates(line):
-            line = line.strip()
-            if line in seen_lines:
-                return False
-            else:
-                seen_lines.add(line)
-                return True
+        new_filter = ([line for line in new_filter[:rules_index]
+                       if line.strip() not in top_rules] +
+                      our_lines +
+                      [line for line in new_filter[rules_index:]
+                       if line.strip() not in top_rules])
 
         # We filter duplicates, letting the *last* occurrence take
         # precedence.
-        new_filter.reverse()
-        new_filter = filter(_weed_out_duplicates, new_filter)
-        new_filter.reverse()
-        return new_filter
+        seen_lines = set()
+        result = []
+        for line in reversed(new_filter):
+            stripped = line.strip()
+            if stripped not in seen_lines:
+                seen_lines.add(stripped)
+                result.append(line)
+        result.reverse()
+        return result
 
 
 # NOTE(jkoelker) This is just a nice little stub point since mocking
@@ -608,40 +753,140 @@ def _add_dnsmasq_accept_rules(dev):
 
 def get_dhcp_opts(context, network_ref):
     """Get network's hosts config in dhcp-opts format."""
-    hosts = []
     host = None
     if network_ref['multi_host']:
         host = FLAGS.host
     data = db.network_get_associated_fixed_ips(context,
                                                network_ref['id'],
                                                host=host)
+    default_gw_vif = db.virtual_interface_get_first_ids_by_instances(
+            context, set([datum['instance_id'] for datum in data]))
+    return _dhcp_opts_text(data, default_gw_vif)
+
+
+def _dhcp_opts_text(data, default_gw_vif):
+    """Return the dhcp-opts of the fixed ips in data.
 
-    if data:
-        #set of instance ids
-        instance_set = set([datum['instance_id'] for datum in data])
-        default_gw_vif = {}
-        for instance_id in instance_set:
-            vifs = db.virtual_interface_get_by_instance(context, instance_id)
-            if vifs:
-                #offer a default gateway to the first virtual interface
-                default_gw_vif[instance_id] = vifs[0]['id']
-
-        for datum in data:
-            if instance_id in default_gw_vif:
-                # we don't want default gateway for this fixed ip
-                if default_gw_vif[instance_id] != datum['vif_id']:
-                    hosts.append(_host_dhcp_opts(datum))
+    default_gw_vif maps the instances to their first virtual interface,
+    the only one that is offered a default gateway.
+    """
+    hosts = []
+    for datum in data:
+        instance_id = datum['instance_id']
+        if instance_id in default_gw_vif:
+            # we don't want default gateway for this fixed ip
+            if default_gw_vif[instance_id] != datum['vif_id']:
+                hosts.append(_host_dhcp_opts(datum))
     return '\n'.join(hosts)
 
 
+class DhcpHostTable(object):
+    """The fixed ips dnsmasq serves on a bridge.
+
+    Keeps the associated fixed ips of the network in memory so that an
+    allocation only looks up the fixed ips it changed, and remembers the
+    files last written so that they are only rewritten when they change.
+
+    """
+
+    def __init__(self):
+        self.fixed_ips = {}
+        self.default_gw_vif = {}
+        self.written = {}
+
+    def _query(self, context, network_ref, addresses=None):
+        host = None
+        if network_ref['multi_host']:
+            host = FLAGS.host
+        return db.network_get_associated_fixed_ips(context,
+                                                   network_ref['id'],
+                                                   host=host,
+                                                   addresses=addresses)
+
+    def load(self, context, network_ref):
+        """Load all the associated fixed ips of the network."""
+        data = self._query(context, network_ref)
+        self.fixed_ips = dict((datum['address'], datum) for datum in data)
+        self.default_gw_vif = db.virtual_interface_get_first_ids_by_instances(
+                context, set([datum['instance_id'] for datum in data]))
+
+    def update(self, context, network_ref, addresses):
+        """Look up the given fixed ips again.
+
+        Fixed ips that are no longer associated are removed.
+        """
+        instance_ids = set()
+        for address in addresses:
+            datum = self.fixed_ips.pop(address, None)
+            if datum:
+                instance_ids.add(datum['instance_id'])
+        for datum in self._query(context, network_ref, addresses):
+            self.fixed_ips[datum['address']] = datum
+            instance_ids.add(datum['instance_id'])
+        if not instance_ids:
+            return
+        for instance_id in instance_ids:
+            self.default_gw_vif.pop(instance_id, None)
+        self.default_gw_vif.update(
+                db.virtual_interface_get_first_ids_by_instances(
+                        context, instance_ids))
+
+    def _sorted_fixed_ips(self):
+        return sorted(self.fixed_ips.itervalues(),
+                      key=lambda datum: (datum['vif_id'], datum['address']))
+
+    def hosts_text(self):
+        return '\n'.join([_host_dhcp(datum)
+                          for datum in self._sorted_fixed_ips()])
+
+    def opts_text(self):
+        return _dhcp_opts_text(self._sorted_fixed_ips(), self.default_gw_vif)
+
+    def write(self, path, text):
+        """Atomically replace the file at path with text if it changed.
+
+        Returns True if the file was written.
+        """
+        if self.written.get(path) == text:
+            return False
+        tmp_path = '%s.tmp' % path
+        write_to_file(tmp_path, text)
+        # Make sure dnsmasq can actually read it (it setuid()s to "nobody")
+        os.chmod(tmp_path, 0644)
+        os.rename(tmp_path, path)
+        self.written[path] = text
+        return True
+
+
+# NOTE: host tables by bridge/device, see update_dhcp()
+_dhcp_host_tables = {}
+
+
 def release_dhcp(dev, address, mac_address):
     utils.execute('dhcp_release', dev, address, mac_address, run_as_root=True)
 
 
-def update_dhcp(context, dev, network_ref):
-    conffile = _dhcp_file(dev, 'conf')
-    write_to_file(conffile, get_dhcp_hosts(context, network_ref))
-    restart_dhcp(context, dev, network_ref)
+@utils.synchronized('dnsmasq_start')
+def update_dhcp(context, dev, network_ref, addresses=None):
+    """Update the hosts dnsmasq serves on a bridge and (re)start it.
+
+    Only the fixed ips in addresses are looked up again if they are given
+    and the hosts of the bridge are known, all of the network's fixed ips
+    otherwise.  dnsmasq is only reloaded if its files changed.
+
+    """
+    table = _dhcp_host_tables.get(dev)
+    if table is None or addresses is None:
+        table = _dhcp_host_tables.setdefault(dev, DhcpHostTable())
+        table.load(context, network_ref)
+    else:
+        table.update(context, network_ref, addresses)
+
+    changed = table.write(_dhcp_file(dev, 'conf'), table.hosts_text())
+    if FLAGS.use_single_default_gateway:
+        if table.write(_dhcp_file(dev, 'opts'), table.opts_text()):
+            changed = True
+    _restart_dhcp(context, dev, network_ref, hup=changed)
 
 
 def update_dhcp_hostfile_with_text(dev, hosts_text):
@@ -650,6 +895,7 @@ def update_dhcp_hostfile_with_text(dev, hosts_text):
 
 
 def kill_dhcp(dev):
+    _dhcp_host_tables.pop(dev, None)
     pid = _dnsmasq_pid_for(dev)
     if pid:
         _execute('kill', '-9', pid, run_as_root=True)
@@ -666,8 +912,6 @@ def restart_dhcp(context, dev, network_ref):
     signal causing it to reload, otherwise spawn a new instance.
 
     """
-    conffile = _dhcp_file(dev, 'conf')
-
     if FLAGS.use_single_default_gateway:
         # NOTE(vish): this will have serious performance implications if we
         #             are not in multi_host mode.
@@ -676,8 +920,14 @@ def restart_dhcp(context, dev, network_ref):
         os.chmod(optsfile, 0644)
 
     # Make sure dnsmasq can actually read it (it setuid()s to "nobody")
-    os.chmod(conffile, 0644)
+    os.chmod(_dhcp_file(dev, 'conf'), 0644)
+
+    _restart_dhcp(context, dev, network_ref)
+
 
+def _restart_dhcp(context, dev, network_ref, hup=True):
+    """Spawn dnsmasq for a bridge unless it is running, HUP it if hup."""
+    conffile = _dhcp_file(dev, 'conf')
     pid = _dnsmasq_pid_for(dev)
 
     # if dnsmasq is already running, then tell it to reload
@@ -687,11 +937,8 @@ def restart_dhcp(context, dev, network_ref):
         # Using symlinks can cause problems here so just compare the name
         # of the file itself
         if conffile.split("/")[-1] in out:
-            try:
-                _execute('kill', '-HUP', pid, run_as_root=True)
+            if not hup or _hup_dhcp(dev, pid):
                 return
-            except Exception as exc:  # pylint: disable=W0703
-                LOG.error(_('Hupping dnsmasq threw %s'), exc)
         else:
             LOG.debug(_('Pid %d is stale, relaunching dnsmasq'), pid)
 
@@ -722,6 +969,40 @@ def restart_dhcp(context, dev, network_ref):
     _add_dnsmasq_accept_rules(dev)
 
 
+# NOTE: bridges/devices with a dnsmasq reload pending
+_dhcp_hups_pending = set()
+
+
+def _hup_dhcp(dev, pid):
+    """HUP dnsmasq now or, with dnsmasq_hup_delay_ms, once per window.
+
+    Returns False if dnsmasq could not be HUPped.
+    """
+    if FLAGS.dnsmasq_hup_delay_ms <= 0:
+        return _send_hup(pid)
+    if dev not in _dhcp_hups_pending:
+        _dhcp_hups_pending.add(dev)
+        greenthread.spawn_after(FLAGS.dnsmasq_hup_delay_ms / 1000.0,
+                                _hup_dhcp_pending, dev)
+    return True
+
+
+def _hup_dhcp_pending(dev):
+    _dhcp_hups_pending.discard(dev)
+    pid = _dnsmasq_pid_for(dev)
+    if pid:
+        _send_hup(pid)
+
+
+def _send_hup(pid):
+    try:
+        _execute('kill', '-HUP', pid, run_as_root=True)
+        return True
+    except Exception as exc:  # pylint: disable=W0703
+        LOG.error(_('Hupping dnsmasq threw %s'), exc)
+        return False
+
+
 @utils.synchronized('radvd_start')
 def update_ra(context, dev, network_ref):
     conffile = _ra_file(dev, 'conf')
@@ -47,6 +47,7 @@ import datetime
 import functools
 import itertools
 import math
+import os
 import re
 import socket
 
@@ -61,6 +62,7 @@ from nova import ipv6
 from nova import log as logging
 from nova import manager
 from nova.network import api as network_api
+from nova.network import fixed_ip_pool
 from nova.network import model as network_model
 from nova.openstack.common import cfg
 import nova.policy
@@ -129,6 +131,11 @@ network_opts = [
     cfg.IntOpt('fixed_ip_disassociate_timeout',
                default=600,
                help='Seconds after which a deallocated ip is disassociated'),
+    cfg.IntOpt('fixed_ip_pool_size',
+               default=0,
+               help='Number of free fixed ips a network host reserves at '
+                    'once and hands out from memory, 0 to associate them '
+                    'one at a time'),
     cfg.IntOpt('create_unique_mac_address_attempts',
                default=5,
                help='Number of attempts to create unique mac address'),
@@ -162,6 +169,71 @@ class AddressAlreadyAllocated(exception.Error):
     pass
 
 
+class IPFilter(object):
+    """An ip filter of get_instance_uuids_by_ip_filter().
+
+    Either a CIDR the addresses must be in or a regular expression matched
+    against the start of the addresses.  prefix is the text every matching
+    IPv4 address starts with, to pre-filter the addresses in the database.
+
+    """
+
+    def __init__(self, value):
+        value = str(value)
+        self.network = None
+        if '/' in value:
+            try:
+                self.network = netaddr.IPNetwork(value)
+            except (netaddr.AddrFormatError, ValueError):
+                pass
+        if self.network is None:
+            self.regex = re.compile(value)
+            self.prefix = self._literal_prefix(value)
+        elif self.network.version == 4:
+            self.prefix = os.path.commonprefix([str(self.network[0]),
+                                                str(self.network[-1])])
+        else:
+            self.prefix = ''
+
+    @staticmethod
+    def _literal_prefix(pattern):
+        """Return the text every string pattern matches starts with.
+
+        Patterns are applied with re.match(), so a leading '^' changes
+        nothing.
+        """
+        if '|' in pattern:
+            return ''
+        prefix = []
+        i = 1 if pattern.startswith('^') else 0
+        while i < len(pattern):
+            char = pattern[i]
+            if char == '\\':
+                # an escaped punctuation character stands for itself, the
+                # others are classes like \d
+                if i + 1 == len(pattern) or pattern[i + 1].isalnum():
+                    break
+                literal, width = pattern[i + 1], 2
+            elif char in '.^$*+?{}[]()':
+                break
+            else:
+                literal, width = char, 1
+            if pattern[i + width:i + width + 1] in ('*', '+', '?', '{'):
+                # the character is optional or repeated
+                break
+            prefix.append(literal)
+            i += width
+        return ''.join(prefix)
+
+    def match(self, address):
+        if self.network is None:
+            return self.regex.match(address) is not None
+        try:
+            return netaddr.IPAddress(address) in self.network
+        except (netaddr.AddrFormatError, ValueError):
+            return False
+
+
 class RPCAllocateFixedIP(object):
     """Mixin class originally for FlatDCHP and VLAN network managers.
 
@@ -396,15 +468,22 @@ class FloatingIP(object):
     def allocate_floating_ip(self, context, project_id, pool=None):
         """Gets a floating ip from the pool."""
         # NOTE(tr3buchet): all network hosts in zone now use the same pool
-        LOG.debug("QUOTA: %s" % quota.allowed_floating_ips(context, 1))
-        if quota.allowed_floating_ips(context, 1) < 1:
+        try:
+            reservations = quota.reserve(context, floating_ips=1)
+        except exception.OverQuota:
             LOG.warn(_('Quota exceeded for %s, tried to allocate address'),
                      context.project_id)
             raise exception.QuotaError(code='AddressLimitExceeded')
         pool = pool or FLAGS.default_floating_pool
-        return self.db.floating_ip_allocate_address(context,
-                                                    project_id,
-                                                    pool)
+        try:
+            address = self.db.floating_ip_allocate_address(context,
+                                                           project_id,
+                                                           pool)
+        except Exception:
+            with utils.save_and_reraise_exception():
+                quota.rollback(context, reservations)
+        quota.commit(context, reservations)
+        return address
 
     @wrap_check_policy
     def deallocate_floating_ip(self, context, address,
@@ -714,6 +793,8 @@ class NetworkManager(manager.SchedulerDependentManager):
         self.floating_dns_manager = temp
         self.network_api = network_api.API()
         self.compute_api = compute_api.API()
+        # IPv6 addresses of the vifs by network, see _get_global_ipv6()
+        self._global_ipv6 = {}
         self.sgh = utils.import_object(FLAGS.security_group_handler)
 
         # NOTE(tr3buchet: unless manager subclassing NetworkManager has
@@ -726,6 +807,11 @@ class NetworkManager(manager.SchedulerDependentManager):
         super(NetworkManager, self).__init__(service_name='network',
                                                 *args, **kwargs)
 
+        self.fixed_ip_pool = None
+        if FLAGS.fixed_ip_pool_size:
+            self.fixed_ip_pool = fixed_ip_pool.FixedIpPool(
+                    self.host, FLAGS.fixed_ip_pool_size, self.db)
+
     def _import_ipam_lib(self, ipam_lib):
         self.ipam = utils.import_object(ipam_lib).get_ipam_lib(self)
 
@@ -761,9 +847,25 @@ class NetworkManager(manager.SchedulerDependentManager):
         # NOTE(vish): Set up networks for which this host already has
         #             an ip address.
         ctxt = context.get_admin_context()
+        if self.fixed_ip_pool:
+            # NOTE: ips reserved before a crash are still ours
+            self.fixed_ip_pool.reset(ctxt)
         for network in self.db.network_get_all_by_host(ctxt, self.host):
             self._setup_network_on_host(ctxt, network)
 
+    def cleanup_host(self):
+        """Give back the reserved fixed ips that were not handed out."""
+        if self.fixed_ip_pool:
+            self.fixed_ip_pool.release(context.get_admin_context())
+
+    def _associate_free_fixed_ip(self, context, network_id, instance_id):
+        """Associate a free fixed ip of the network to the instance."""
+        if self.fixed_ip_pool:
+            return self.fixed_ip_pool.allocate(context.elevated(), network_id,
+                                               [instance_id])[0]
+        return self.db.fixed_ip_associate_pool(context.elevated(),
+                                               network_id, instance_id)
+
     @manager.periodic_task
     def _disassociate_stale_fixed_ips(self, context):
         if self.timeout_fixed_ips:
@@ -805,60 +907,86 @@ class NetworkManager(manager.SchedulerDependentManager):
     @wrap_check_policy
     def get_instance_uuids_by_ip_filter(self, context, filters):
         fixed_ip_filter = filters.get('fixed_ip')
-        ip_filter = re.compile(str(filters.get('ip')))
-        ipv6_filter = re.compile(str(filters.get('ip6')))
-
-        # NOTE(jkoelker) Should probably figure out a better way to do
-        #                this. But for now it "works", this could suck on
-        #                large installs.
-
-        vifs = self.db.virtual_interface_get_all(context)
+        ip_filter = None
+        if 'ip' in filters:
+            ip_filter = IPFilter(filters['ip'])
+        ipv6_filter = None
+        if 'ip6' in filters:
+            ipv6_filter = IPFilter(filters['ip6'])
+
+        # NOTE: results are kept in the order of the vifs, the IPv6
+        #       address of a vif before its fixed and floating ips
         results = []
 
-        for vif in vifs:
-            if vif['instance_id'] is None:
-                continue
-
-            network = self._get_network_by_id(context, vif['network_id'])
-            fixed_ipv6 = None
-            if network['cidr_v6'] is not None:
-                fixed_ipv6 = ipv6.to_global(network['cidr_v6'],
-                                            vif['address'],
-                                            context.project_id)
-
-            if fixed_ipv6 and ipv6_filter.match(fixed_ipv6):
-                # NOTE(jkoelker) Will need to update for the UUID flip
-                results.append({'instance_id': vif['instance_id'],
-                                'ip': fixed_ipv6})
-
-            vif_id = vif['id']
-            fixed_ips = self.db.fixed_ips_by_virtual_interface(context,
-                                                               vif_id)
-            for fixed_ip in fixed_ips:
-                if not fixed_ip or not fixed_ip['address']:
+        if ipv6_filter:
+            vifs = self.db.virtual_interface_get_all_with_instance_uuid(
+                    context)
+            for vif, fixed_ipv6 in self._get_global_ipv6(context, vifs):
+                if fixed_ipv6 and ipv6_filter.match(fixed_ipv6):
+                    results.append((vif['id'], 0, vif, fixed_ipv6))
+
+        if fixed_ip_filter is not None or ip_filter:
+            address = fixed_ip_filter
+            prefix = None
+            if ip_filter:
+                prefix = ip_filter.prefix
+                if not prefix:
+                    # every address may match
+                    address = prefix = None
+            for fixed_ip in self.db.fixed_ip_get_all_with_instance_uuid(
+                    context, address=address, prefix=prefix):
+                if not fixed_ip['address']:
                     continue
-                if fixed_ip['address'] == fixed_ip_filter:
-                    results.append({'instance_id': vif['instance_id'],
-                                    'ip': fixed_ip['address']})
+                result = (fixed_ip['vif_id'], 1, fixed_ip)
+                if (fixed_ip['address'] == fixed_ip_filter or
+                    ip_filter and ip_filter.match(fixed_ip['address'])):
+                    results.append(result + (fixed_ip['address'],))
                     continue
-                if ip_filter.match(fixed_ip['address']):
-                    results.append({'instance_id': vif['instance_id'],
-                                    'ip': fixed_ip['address']})
+                if not ip_filter:
                     continue
-                for floating_ip in fixed_ip.get('floating_ips', []):
-                    if not floating_ip or not floating_ip['address']:
-                        continue
-                    if ip_filter.match(floating_ip['address']):
-                        results.append({'instance_id': vif['instance_id'],
-                                        'ip': floating_ip['address']})
-                        continue
-
-        # NOTE(jkoelker) Until we switch over to instance_uuid ;)
-        ids = [res['instance_id'] for res in results]
-        uuid_map = self.db.instance_get_id_to_uuid_mapping(context, ids)
-        for res in results:
-            res['instance_uuid'] = uuid_map.get(res['instance_id'])
-        return results
+                for floating_address in fixed_ip['floating_addresses']:
+                    if ip_filter.match(floating_address):
+                        results.append(result + (floating_address,))
+
+        results.sort(key=lambda result: result[:2])
+        return [{'instance_id': ip['instance_id'],
+                 'instance_uuid': ip['instance_uuid'],
+                 'ip': matched}
+                for _vif_id, _order, ip, matched in results]
+
+    def _get_global_ipv6(self, context, vifs):
+        """Return the vifs with their IPv6 address, None if they have none.
+
+        The addresses of the vifs that are still there are remembered per
+        network for the next call, unless the cidr_v6 of the network
+        changes.
+        """
+        networks = {}
+        result = []
+        for vif in vifs:
+            network_id = vif['network_id']
+            if network_id not in networks:
+                cidr_v6 = self._get_network_by_id(context,
+                                                  network_id)['cidr_v6']
+                known = {}
+                if network_id in self._global_ipv6:
+                    if self._global_ipv6[network_id][0] == cidr_v6:
+                        known = self._global_ipv6[network_id][1]
+                networks[network_id] = (cidr_v6, known, {})
+            cidr_v6, known, addresses = networks[network_id]
+            fixed_ipv6 = None
+            if cidr_v6 is not None:
+                key = (vif['address'], context.project_id)
+                fixed_ipv6 = known.get(key)
+                if fixed_ipv6 is None:
+                    fixed_ipv6 = ipv6.to_global(cidr_v6, vif['address'],
+                                                context.project_id)
+                addresses[key] = fixed_ipv6
+            result.append((vif, fixed_ipv6))
+        self._global_ipv6 = dict((network_id, (cidr_v6, addresses))
+                                 for network_id, (cidr_v6, _known, addresses)
+                                 in networks.iteritems())
+        return result
 
     def _get_networks_for_instance(self, context, instance_id, project_id,
                                    requested_networks=None):
@@ -1172,9 +1300,9 @@ class NetworkManager(manager.SchedulerDependentManager):
                                                      address, instance_id,
                                                      network['id'])
             else:
-                address = self.db.fixed_ip_associate_pool(context.elevated(),
-                                                          network['id'],
-                                                          instance_id)
+                address = self._associate_free_fixed_ip(context,
+                                                        network['id'],
+                                                        instance_id)
             self._do_trigger_security_group_members_refresh_for_instance(
                                                                    instance_id)
             get_vif = self.db.virtual_interface_get_by_instance_and_network
@@ -1194,7 +1322,7 @@ class NetworkManager(manager.SchedulerDependentManager):
             self.instance_dns_manager.create_entry(uuid, address,
                                                    "A",
                                                    self.instance_dns_domain)
-        self._setup_network_on_host(context, network)
+        self._setup_network_on_host(context, network, [address])
         return address
 
     def deallocate_fixed_ip(self, context, address, **kwargs):
@@ -1215,7 +1343,7 @@ class NetworkManager(manager.SchedulerDependentManager):
                                                       self.instance_dns_domain)
 
         network = self._get_network_by_id(context, fixed_ip_ref['network_id'])
-        self._teardown_network_on_host(context, network)
+        self._teardown_network_on_host(context, network, [address])
 
         if FLAGS.force_dhcp_release:
             dev = self.driver.get_dev(network)
@@ -1484,7 +1612,8 @@ class NetworkManager(manager.SchedulerDependentManager):
             if self.host == host or host is None:
                 # at this point i am the correct host, or host doesn't
                 # matter -> FlatManager
-                call_func(context, network)
+                call_func(context, network,
+                          [fixed_ip['address'] for fixed_ip in fixed_ips])
             else:
                 # i'm not the right host, run call on correct host
                 topic = self.db.queue_get_for(context, FLAGS.network_topic,
@@ -1508,12 +1637,19 @@ class NetworkManager(manager.SchedulerDependentManager):
         network = self.db.network_get(context, network_id)
         call_func(context, network)
 
-    def _setup_network_on_host(self, context, network):
-        """Sets up network on this host."""
+    def _setup_network_on_host(self, context, network, addresses=None):
+        """Sets up network on this host.
+
+        addresses are the fixed ips of the network that changed, if known.
+        """
         raise NotImplementedError()
 
-    def _teardown_network_on_host(self, context, network):
-        """Sets up network on this host."""
+    def _teardown_network_on_host(self, context, network,
+                                  addresses=None):
+        """Sets up network on this host.
+
+        addresses are the fixed ips of the network that changed, if known.
+        """
         raise NotImplementedError()
 
     @wrap_check_policy
@@ -1639,7 +1775,7 @@ class FlatManager(NetworkManager):
                                                      **kwargs)
         self.db.fixed_ip_disassociate(context, address)
 
-    def _setup_network_on_host(self, context, network):
+    def _setup_network_on_host(self, context, network, addresses=None):
         """Setup Network on this host."""
         # NOTE(tr3buchet): this does not need to happen on every ip
         # allocation, this functionality makes more sense in create_network
@@ -1648,7 +1784,8 @@ class FlatManager(NetworkManager):
         net['injected'] = FLAGS.flat_injected
         self.db.network_update(context, network['id'], net)
 
-    def _teardown_network_on_host(self, context, network):
+    def _teardown_network_on_host(self, context, network,
+                                  addresses=None):
         """Tear down network on this host."""
         pass
 
@@ -1702,7 +1839,7 @@ class FlatDHCPManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
         super(FlatDHCPManager, self).init_host()
         self.init_host_floating_ips()
 
-    def _setup_network_on_host(self, context, network):
+    def _setup_network_on_host(self, context, network, addresses=None):
         """Sets up network on this host."""
         network['dhcp_server'] = self._get_dhcp_ip(context, network)
 
@@ -1710,18 +1847,19 @@ class FlatDHCPManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
 
         if not FLAGS.fake_network:
             dev = self.driver.get_dev(network)
-            self.driver.update_dhcp(context, dev, network)
+            self.driver.update_dhcp(context, dev, network, addresses)
             if(FLAGS.use_ipv6):
                 self.driver.update_ra(context, dev, network)
                 gateway = utils.get_my_linklocal(dev)
                 self.db.network_update(context, network['id'],
                                        {'gateway_v6': gateway})
 
-    def _teardown_network_on_host(self, context, network):
+    def _teardown_network_on_host(self, context, network,
+                                  addresses=None):
         if not FLAGS.fake_network:
             network['dhcp_server'] = self._get_dhcp_ip(context, network)
             dev = self.driver.get_dev(network)
-            self.driver.update_dhcp(context, dev, network)
+            self.driver.update_dhcp(context, dev, network, addresses)
 
     def _get_network_by_id(self, context, network_id):
         return NetworkManager._get_network_by_id(self, context.elevated(),
@@ -1788,9 +1926,9 @@ class VlanManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
                                                      instance_id,
                                                      network['id'])
             else:
-                address = self.db.fixed_ip_associate_pool(context,
-                                                          network['id'],
-                                                          instance_id)
+                address = self._associate_free_fixed_ip(context,
+                                                        network['id'],
+                                                        instance_id)
             self._do_trigger_security_group_members_refresh_for_instance(
                                                                    instance_id)
         vif = self.db.virtual_interface_get_by_instance_and_network(context,
@@ -1799,7 +1937,7 @@ class VlanManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
         values = {'allocated': True,
                   'virtual_interface_id': vif['id']}
         self.db.fixed_ip_update(context, address, values)
-        self._setup_network_on_host(context, network)
+        self._setup_network_on_host(context, network, [address])
         return address
 
     @wrap_check_policy
@@ -1837,7 +1975,7 @@ class VlanManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
 
         NetworkManager.create_networks(self, context, vpn=True, **kwargs)
 
-    def _setup_network_on_host(self, context, network):
+    def _setup_network_on_host(self, context, network, addresses=None):
         """Sets up network on this host."""
         if not network['vpn_public_address']:
             net = {}
@@ -1859,18 +1997,19 @@ class VlanManager(RPCAllocateFixedIP, FloatingIP, NetworkManager):
                     network['vpn_private_address'])
         if not FLAGS.fake_network:
             dev = self.driver.get_dev(network)
-            self.driver.update_dhcp(context, dev, network)
+            self.driver.update_dhcp(context, dev, network, addresses)
             if(FLAGS.use_ipv6):
                 self.driver.update_ra(context, dev, network)
                 gateway = utils.get_my_linklocal(dev)
                 self.db.network_update(context, network['id'],
                                        {'gateway_v6': gateway})
 
-    def _teardown_network_on_host(self, context, network):
+    def _teardown_network_on_host(self, context, network,
+                                  addresses=None):
         if not FLAGS.fake_network:
             network['dhcp_server'] = self._get_dhcp_ip(context, network)
             dev = self.driver.get_dev(network)
-            self.driver.update_dhcp(context, dev, network)
+            self.driver.update_dhcp(context, dev, network, addresses)
 
     def _get_networks_by_uuids(self, context, network_uuids):
         return self.db.network_get_all_by_uuids(context, network_uuids,
@@ -270,5 +270,17 @@ class NetworkInfo(list):
             network_info = json.loads(network_info)
         return NetworkInfo([VIF.hydrate(vif) for vif in network_info])
 
+    @classmethod
+    def hydrate_from_instance(cls, instance):
+        """Returns the network info in the info cache loaded with an
+        instance, or None for an instance on a host whose cache was never
+        filled, which the network service has to be asked for.
+        """
+        info_cache = instance['info_cache'] or {}
+        cached_nwinfo = info_cache.get('network_info')
+        if cached_nwinfo is None and instance.get('host'):
+            return None
+        return cls.hydrate(cached_nwinfo or [])
+
     def as_cache(self):
         return json.dumps(self)
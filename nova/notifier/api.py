@@ -130,3 +130,10 @@ def notify(publisher_id, event_type, priority, payload):
         LOG.exception(_("Problem '%(e)s' attempting to "
                         "send to notification system. Payload=%(payload)s") %
                         locals())
+
+
+def flush():
+    """Send what the notification driver holds back, if it does."""
+    driver = utils.import_object(FLAGS.notification_driver)
+    if hasattr(driver, 'flush'):
+        driver.flush()
@@ -13,13 +13,104 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from eventlet import greenthread
+
 from nova import context
 from nova import db
+from nova import flags
 from nova import log as logging
+from nova.openstack.common import cfg
 
 
 LOG = logging.getLogger(__name__)
 
+capacity_notifier_opts = [
+    cfg.IntOpt('capacity_notifier_batch_interval_ms',
+               default=0,
+               help='Sum the utilization changes of the events per host and '
+                    'write them at most this many milliseconds later, '
+                    '0 writes every event as it comes'),
+    cfg.IntOpt('capacity_notifier_batch_max_events',
+               default=100,
+               help='Write the summed utilization changes as soon as this '
+                    'many events are pending'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(capacity_notifier_opts)
+
+
+class UtilizationBatch(object):
+    """Utilization deltas of the events not written to the database yet,
+    summed per host.  They are flushed with one UPDATE per host when
+    capacity_notifier_batch_max_events events are pending or
+    capacity_notifier_batch_interval_ms after the first one, whichever
+    comes first.  A failed write is retried by the timer, the deltas
+    are kept but not counted again towards the early flush.
+    """
+
+    def __init__(self):
+        self.deltas = {}  # {host: {delta name: summed delta}}
+        self.events = 0
+        self._timer = None
+
+    def _merge(self, host, deltas):
+        host_deltas = self.deltas.setdefault(host, {})
+        for name, delta in deltas.iteritems():
+            host_deltas[name] = host_deltas.get(name, 0) + delta
+
+    def _arm(self):
+        if self._timer is None:
+            self._timer = greenthread.spawn_after(
+                    FLAGS.capacity_notifier_batch_interval_ms / 1000.0,
+                    self.flush)
+
+    def add(self, host, deltas):
+        self._merge(host, deltas)
+        self.events += 1
+        if self.events >= FLAGS.capacity_notifier_batch_max_events:
+            self.flush()
+        else:
+            self._arm()
+
+    def flush(self):
+        """Write the pending deltas to the database."""
+        if self._timer is not None:
+            # Does nothing when called from the timer itself
+            self._timer.cancel()
+            self._timer = None
+        deltas, self.deltas = self.deltas, {}
+        events, self.events = self.events, 0
+        if not deltas:
+            return
+        try:
+            missing = db.api.compute_node_utilization_update_many(
+                    context.get_admin_context(), deltas)
+        except Exception:
+            LOG.exception(_("Failed to write the utilization changes of "
+                            "%(events)d events, retrying later"),
+                          {'events': events})
+            # The update is one transaction, nothing of it was written.
+            # Keep the deltas without their events, the next events
+            # would otherwise write them again one by one.
+            for host, host_deltas in deltas.iteritems():
+                self._merge(host, host_deltas)
+            self._arm()
+            return
+        for host in missing:
+            LOG.warn(_("No ComputeNode for %(host)s"), {'host': host})
+
+
+_BATCH = UtilizationBatch()
+
+
+def flush():
+    """Write the utilization changes of the pending events, if any.
+
+    Called by the service when it stops, see notifier.api.flush().
+    """
+    _BATCH.flush()
+
 
 def notify(message):
     """Look for specific compute manager events and interprete them
@@ -89,13 +180,18 @@ def notify(message):
         #Eneaend
     LOG.debug("EventType=%(event_type)s -> host %(host)s: "
               "ram %(free_ram_mb)d, disk %(free_disk_gb)d, "
-              "work %(work)d, vms%(vms)d, n_cpu_vms %(n_cpu_vms)d, " 
-              "n_io_vms %(n_io_vms)d, n_mem_vms %(n_mem_vms)d, " 
-              "n_und_vms %(n_und_vms)d" % locals())
+              "work %(work)d, vms%(vms)d, n_cpu_vms %(n_cpu_vms)d, "
+              "n_io_vms %(n_io_vms)d, n_mem_vms %(n_mem_vms)d, "
+              "n_und_vms %(n_und_vms)d", locals())
     #Eneabegin
-    db.api.compute_node_utilization_update(context.get_admin_context(), host,
-        free_ram_mb_delta=free_ram_mb, free_disk_gb_delta=free_disk_gb,
-        work_delta=work, vm_delta=vms, n_cpu_delta=n_cpu_vms, n_io_delta=n_io_vms,
-        n_mem_delta=n_mem_vms, n_und_delta=n_und_vms )
-        #Eneaend
+    deltas = dict(free_ram_mb_delta=free_ram_mb,
+                  free_disk_gb_delta=free_disk_gb, work_delta=work,
+                  vm_delta=vms, n_cpu_delta=n_cpu_vms, n_io_delta=n_io_vms,
+                  n_mem_delta=n_mem_vms, n_und_delta=n_und_vms)
+    if FLAGS.capacity_notifier_batch_interval_ms > 0:
+        _BATCH.add(host, deltas)
+    else:
+        db.api.compute_node_utilization_update(context.get_admin_context(),
+                                               host, **deltas)
+    #Eneaend
     return True
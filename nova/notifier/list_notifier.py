@@ -65,6 +65,18 @@ def notify(message):
                             "notification driver %(driver)s." % locals()))
 
 
+def flush():
+    """Flush the drivers which hold notifications back."""
+    for driver in _get_drivers():
+        if not hasattr(driver, 'flush'):
+            continue
+        try:
+            driver.flush()
+        except Exception as e:
+            LOG.exception(_("Problem '%(e)s' attempting to flush "
+                            "notification driver %(driver)s." % locals()))
+
+
 def _reset_drivers():
     """Used by unit tests to reset the drivers."""
     global drivers
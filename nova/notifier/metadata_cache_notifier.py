@@ -0,0 +1,45 @@
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova import context
+from nova import flags
+from nova import rpc
+
+
+FLAGS = flags.FLAGS
+
+
+def notify(message):
+    """Tell the metadata api workers about instances that changed, so they
+    drop the metadata they cached for them.  Used along with
+    metadata_cache_invalidation.
+
+    NOTE: the True/False return codes are only for testing.
+    """
+    event_type = message.get('event_type', None)
+    preamble = 'compute.instance.'
+    if not event_type or not event_type.startswith(preamble):
+        return False
+    # The instance only changes once the action is over
+    if event_type.endswith('.start') or event_type == preamble + 'exists':
+        return False
+
+    instance_uuid = message.get('payload', {}).get('instance_id', None)
+    if not instance_uuid:
+        return False
+    rpc.fanout_cast(context.get_admin_context(), FLAGS.metadata_cache_topic,
+                    {'method': 'invalidate_instance',
+                     'args': {'instance_uuid': instance_uuid}})
+    return True
@@ -18,9 +18,15 @@
 
 """Quotas for instances, volumes, and floating ips."""
 
+import datetime
+
+from nova.common import memorycache
 from nova import db
+from nova import exception
 from nova.openstack.common import cfg
 from nova import flags
+from nova import log as logging
+from nova import utils
 
 
 quota_opts = [
@@ -60,11 +66,38 @@ quota_opts = [
     cfg.IntOpt('quota_security_group_rules',
                default=20,
                help='number of security rules per security group'),
+    cfg.IntOpt('quota_cache_ttl',
+               default=5,
+               help='seconds the quotas of a project are cached in process, '
+                    '0 to read them from the database every time'),
+    cfg.IntOpt('quota_usage_max_age',
+               default=600,
+               help='seconds after which the usage of a resource not '
+                    'updated since is recounted, 0 to recount it every '
+                    'time'),
+    cfg.IntOpt('quota_reservation_expire',
+               default=86400,
+               help='seconds after which reservations neither committed '
+                    'nor rolled back are rolled back'),
+    cfg.IntOpt('quota_reconcile_interval',
+               default=10,
+               help='Number of periodic scheduler ticks to wait between '
+                    'recounts of the usages of every project'),
     ]
 
 FLAGS = flags.FLAGS
 FLAGS.register_opts(quota_opts)
 
+LOG = logging.getLogger(__name__)
+
+# the resources whose usage is kept in the quota_usages table
+USAGE_RESOURCES = ('instances', 'cores', 'ram', 'volumes', 'gigabytes',
+                   'floating_ips')
+
+# the quotas set for each project, by project id, which expire soon
+# enough not to need a bound on their number
+_QUOTA_CACHE = memorycache.Client(max_entries=0)
+
 
 def _get_default_quotas():
     defaults = {
@@ -88,9 +121,26 @@ def _get_default_quotas():
     return defaults
 
 
+def _get_project_quotas(context, project_id):
+    """Return the quotas set for a project, cached for quota_cache_ttl."""
+    if not FLAGS.quota_cache_ttl:
+        return db.quota_get_all_by_project(context, project_id)
+    key = str(project_id)
+    quota = _QUOTA_CACHE.get(key)
+    if quota is None:
+        quota = db.quota_get_all_by_project(context, project_id)
+        _QUOTA_CACHE.set(key, quota, FLAGS.quota_cache_ttl)
+    return quota
+
+
+def invalidate_project_quotas(project_id):
+    """Drop the cached quotas of a project after they were set."""
+    _QUOTA_CACHE.delete(str(project_id))
+
+
 def get_project_quotas(context, project_id):
     rval = _get_default_quotas()
-    quota = db.quota_get_all_by_project(context, project_id)
+    quota = _get_project_quotas(context, project_id)
     for key in rval.keys():
         if key in quota:
             rval[key] = quota[key]
@@ -103,14 +153,23 @@ def _get_request_allotment(requested, used, quota):
     return quota - used
 
 
+def _get_usages(context, project_id, resources):
+    """Return what a project uses and has reserved of each resource."""
+    usages = db.quota_usage_get_all_by_project(context, project_id,
+                                               resources,
+                                               FLAGS.quota_usage_max_age)
+    return [usages[resource]['in_use'] + usages[resource]['reserved']
+            for resource in resources]
+
+
 def allowed_instances(context, requested_instances, instance_type):
     """Check quota and return min(requested_instances, allowed_instances)."""
     project_id = context.project_id
     context = context.elevated()
     requested_cores = requested_instances * instance_type['vcpus']
     requested_ram = requested_instances * instance_type['memory_mb']
-    usage = db.instance_data_get_for_project(context, project_id)
-    used_instances, used_cores, used_ram = usage
+    used_instances, used_cores, used_ram = _get_usages(context, project_id,
+            ['instances', 'cores', 'ram'])
     quota = get_project_quotas(context, project_id)
     allowed_instances = _get_request_allotment(requested_instances,
                                                used_instances,
@@ -134,8 +193,8 @@ def allowed_volumes(context, requested_volumes, size):
     context = context.elevated()
     size = int(size)
     requested_gigabytes = requested_volumes * size
-    used_volumes, used_gigabytes = db.volume_data_get_for_project(context,
-                                                                  project_id)
+    used_volumes, used_gigabytes = _get_usages(context, project_id,
+                                               ['volumes', 'gigabytes'])
     quota = get_project_quotas(context, project_id)
     allowed_volumes = _get_request_allotment(requested_volumes, used_volumes,
                                              quota['volumes'])
@@ -152,7 +211,7 @@ def allowed_floating_ips(context, requested_floating_ips):
     """Check quota and return min(requested, allowed) floating ips."""
     project_id = context.project_id
     context = context.elevated()
-    used_floating_ips = db.floating_ip_count_by_project(context, project_id)
+    used_floating_ips, = _get_usages(context, project_id, ['floating_ips'])
     quota = get_project_quotas(context, project_id)
     allowed_floating_ips = _get_request_allotment(requested_floating_ips,
                                                   used_floating_ips,
@@ -160,6 +219,51 @@ def allowed_floating_ips(context, requested_floating_ips):
     return min(requested_floating_ips, allowed_floating_ips)
 
 
+def reserve(context, **deltas):
+    """Reserve deltas of the instances, cores, ram, volumes, gigabytes or
+    floating_ips of the project of the context.
+
+    Raises OverQuota when a delta does not fit in the quota left, which
+    accounts for the other reservations pending, otherwise returns the
+    reservations to commit once the resources are created, or to roll back
+    if they are not.
+    """
+    for resource in deltas:
+        if resource not in USAGE_RESOURCES:
+            raise exception.InvalidInput(
+                    reason=_("Unknown quota resource %s") % resource)
+    project_id = context.project_id
+    context = context.elevated()
+    quota = get_project_quotas(context, project_id)
+    expire = utils.utcnow() + datetime.timedelta(
+            seconds=FLAGS.quota_reservation_expire)
+    return db.quota_reserve(context, project_id, deltas, quota, expire,
+                            FLAGS.quota_usage_max_age)
+
+
+def commit(context, reservations):
+    """Add reservations to the usage of their resources."""
+    db.reservation_commit(context.elevated(), reservations)
+
+
+def rollback(context, reservations):
+    """Release reservations of resources which were not created."""
+    db.reservation_rollback(context.elevated(), reservations)
+
+
+def reconcile(context):
+    """Roll back the expired reservations and recount the usage of every
+    project, correcting those which drifted.
+    """
+    expired = db.reservation_expire(context)
+    if expired:
+        LOG.info(_("Rolled back %d expired quota reservations"), expired)
+    for project_id, resource, in_use, counted in \
+            db.quota_usage_reconcile(context):
+        LOG.warn(_("Corrected the %(resource)s usage of %(project_id)s "
+                   "from %(in_use)d to %(counted)d") % locals())
+
+
 def allowed_security_groups(context, requested_security_groups):
     """Check quota and return min(requested, allowed) security groups."""
     project_id = context.project_id
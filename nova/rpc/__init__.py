@@ -68,6 +68,31 @@ def call(context, topic, msg, timeout=None):
     return _get_impl().call(context, topic, msg, timeout)
 
 
+def call_many(context, calls, timeout=None):
+    """Invoke a number of remote methods at once and gather their returns.
+
+    All of the messages are sent before any response is waited for, so
+    asking every host of a fan-out takes as long as the slowest host
+    instead of the sum of them.  A host that fails or does not answer in
+    time does not fail the others.
+
+    :param context: Information that identifies the user that has made this
+                    request.
+    :param calls: A list of (topic, msg) tuples, where topic and msg are
+                  as described for call().
+    :param timeout: int, number of seconds all of the calls have to respond
+                    in.  If set, this overrides the rpc_response_timeout
+                    option.
+
+    :returns: A list with a (result, error) tuple per call, in the order of
+              calls.  result is what call() would have returned and error is
+              None, or result is None and error is the
+              nova.rpc.common.RemoteError or nova.rpc.common.Timeout that
+              call() would have raised.
+    """
+    return _get_impl().call_many(context, calls, timeout)
+
+
 def cast(context, topic, msg):
     """Invoke a remote method that does not return anything.
 
@@ -85,6 +110,26 @@ def cast(context, topic, msg):
     return _get_impl().cast(context, topic, msg)
 
 
+def cast_many(context, messages, confirm=False):
+    """Invoke a number of remote methods that do not return anything.
+
+    The messages are published in order over a single connection, which
+    is much cheaper than a cast() per message when notifying many hosts.
+
+    :param context: Information that identifies the user that has made this
+                    request.
+    :param messages: A list of (topic, msg) tuples, where topic and msg are
+                     as described for cast().
+    :param confirm: Wait for the broker to accept all of the messages
+                    before returning.  This costs a round trip, ask for it
+                    only when losing a message is worse than waiting.  The
+                    rpc_cast_many_confirm flag turns it on for every call.
+
+    :returns: None
+    """
+    return _get_impl().cast_many(context, messages, confirm)
+
+
 def fanout_cast(context, topic, msg):
     """Broadcast a remote method invocation with no return.
 
@@ -27,10 +27,10 @@ AMQP, but is deprecated and predates this code.
 
 import inspect
 import sys
+import time
 import traceback
 import uuid
 
-from eventlet import greenpool
 from eventlet import pools
 
 from nova import context
@@ -39,6 +39,7 @@ from nova import flags
 from nova import local
 from nova import log as logging
 import nova.rpc.common as rpc_common
+from nova.rpc import dispatcher as rpc_dispatcher
 from nova import utils
 
 LOG = logging.getLogger(__name__)
@@ -205,18 +206,23 @@ def pack_context(msg, context):
 
 
 class ProxyCallback(object):
-    """Calls methods on a proxy object based on method and args."""
+    """Calls methods on a proxy object based on method and args.
+
+    The calls are run by the rpc_dispatcher.Dispatcher shared by all of
+    the consumers of the proxy, which blocks the consumer while it is
+    full.
+    """
 
     def __init__(self, proxy, connection_pool):
         self.proxy = proxy
-        self.pool = greenpool.GreenPool(FLAGS.rpc_thread_pool_size)
+        self.dispatcher = rpc_dispatcher.get_dispatcher(proxy)
         self.connection_pool = connection_pool
 
     def __call__(self, message_data):
         """Consumer callback to call a method on a proxy object.
 
-        Parses the message for validity and fires off a thread to call the
-        proxy object method.
+        Parses the message for validity and hands the call of the proxy
+        object method to the dispatcher.
 
         Message data should be a dictionary with two keys:
             method: string representing the method to call
@@ -238,7 +244,8 @@ class ProxyCallback(object):
             ctxt.reply(_('No method for message: %s') % message_data,
                        connection_pool=self.connection_pool)
             return
-        self.pool.spawn_n(self._process_data, ctxt, method, args)
+        self.dispatcher.dispatch(method, self._process_data, ctxt, method,
+                                 args)
 
     @exception.wrap_exception()
     def _process_data(self, ctxt, method, args):
@@ -346,6 +353,60 @@ def call(context, topic, msg, timeout, connection_pool):
     return rv[-1]
 
 
+class CallManyWaiter(object):
+    """Gathers the replies of the calls made by call_many()."""
+
+    def __init__(self, count):
+        self.results = [None] * count
+        self.errors = [None] * count
+        self.pending = set(xrange(count))
+
+    def callback(self, index):
+        """Return the consume() callback for the index'th call."""
+        def _callback(data):
+            if index not in self.pending:
+                return
+            if data['failure']:
+                self.errors[index] = rpc_common.RemoteError(*data['failure'])
+                self.pending.discard(index)
+            elif data.get('ending', False):
+                self.pending.discard(index)
+            else:
+                self.results[index] = data['result']
+        return _callback
+
+
+def call_many(context, calls, timeout, connection_pool):
+    """Sends messages on a number of topics and gathers the responses.
+
+    Every call gets its own msg_id, as the services reply to it, but the
+    reply queues are all consumed on the one connection the messages are
+    published on, until every call has ended or the deadline has passed.
+    """
+    if not calls:
+        return []
+    LOG.debug(_('Making %d concurrent calls...'), len(calls))
+    deadline = time.time() + (timeout or FLAGS.rpc_response_timeout)
+    waiter = CallManyWaiter(len(calls))
+    with ConnectionContext(connection_pool) as conn:
+        for index, (_topic, msg) in enumerate(calls):
+            msg_id = uuid.uuid4().hex
+            msg.update({'_msg_id': msg_id})
+            pack_context(msg, context)
+            conn.declare_direct_consumer(msg_id, waiter.callback(index))
+        conn.topic_send_many(calls)
+        try:
+            for _x in conn.iterconsume(deadline=deadline):
+                if not waiter.pending:
+                    break
+        except rpc_common.Timeout:
+            LOG.warn(_('%(count)d of %(total)d calls timed out'),
+                     {'count': len(waiter.pending), 'total': len(calls)})
+    for index in waiter.pending:
+        waiter.errors[index] = rpc_common.Timeout()
+    return zip(waiter.results, waiter.errors)
+
+
 def cast(context, topic, msg, connection_pool):
     """Sends a message on a topic without waiting for a response."""
     LOG.debug(_('Making asynchronous cast on %s...'), topic)
@@ -354,6 +415,18 @@ def cast(context, topic, msg, connection_pool):
         conn.topic_send(topic, msg)
 
 
+def cast_many(context, messages, confirm, connection_pool):
+    """Sends messages on a number of topics over a single connection."""
+    if not messages:
+        return
+    LOG.debug(_('Making %d asynchronous casts...'), len(messages))
+    for _topic, msg in messages:
+        pack_context(msg, context)
+    with ConnectionContext(connection_pool) as conn:
+        conn.topic_send_many(messages,
+                confirm=confirm or FLAGS.rpc_cast_many_confirm)
+
+
 def fanout_cast(context, topic, msg, connection_pool):
     """Sends a message on a fanout exchange without waiting for a response."""
     LOG.debug(_('Making asynchronous fanout cast...'))
@@ -37,6 +37,11 @@ rpc_opts = [
     cfg.IntOpt('rpc_response_timeout',
                default=60,
                help='Seconds to wait for a response from call or multicall'),
+    cfg.BoolOpt('rpc_cast_many_confirm',
+                default=False,
+                help='Wait for the broker to accept the messages of every '
+                     'cast_many before returning, not only of those whose '
+                     'caller asks for it'),
     ]
 
 flags.FLAGS.register_opts(rpc_opts)
@@ -0,0 +1,245 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Bounded dispatch of the rpc messages consumed by a service.
+
+Every consumer of a proxy object, usually the manager of a service, hands
+its messages to the same Dispatcher.  It processes rpc_thread_pool_size
+messages at once and holds rpc_dispatch_backlog more; past that the
+consumer blocks, which leaves the messages with the broker.  Methods
+listed in rpc_method_concurrency are not processed more than the given
+number at a time, and a free thread only takes a message of the
+rpc_low_priority_methods when no other message is waiting, so a flood of
+cheap casts cannot hold up the expensive ones.  The time messages wait
+and run is recorded per method.
+"""
+
+import bisect
+import collections
+import itertools
+import time
+import weakref
+
+import eventlet
+from eventlet import semaphore
+
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
+
+
+LOG = logging.getLogger(__name__)
+
+dispatcher_opts = [
+    cfg.IntOpt('rpc_dispatch_backlog',
+               default=128,
+               help='Messages held waiting for one of the '
+                    'rpc_thread_pool_size threads before a service stops '
+                    'taking more from the broker'),
+    cfg.ListOpt('rpc_method_concurrency',
+                default=['update_service_capabilities:8'],
+                help='method:limit pairs, the most messages of each method '
+                     'a service processes at once'),
+    cfg.ListOpt('rpc_low_priority_methods',
+                default=['update_service_capabilities'],
+                help='Methods whose messages are only started when no '
+                     'message of another method is waiting'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(dispatcher_opts)
+flags.DECLARE('rpc_thread_pool_size', 'nova.rpc.common')
+
+# upper bounds, in milliseconds, of the histogram buckets
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000,
+           30000, 60000]
+
+_DISPATCHERS = weakref.WeakKeyDictionary()
+
+
+class Histogram(object):
+    """Counts of durations in buckets of BUCKETS milliseconds."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect.bisect_left(BUCKETS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, percent):
+        """Return the upper bound of the bucket holding the percentile,
+        the largest duration seen for the last bucket.
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(float(bound), self.max)
+        return self.max
+
+    def to_dict(self):
+        return dict(count=self.count, total_ms=self.total, max_ms=self.max,
+                    p50_ms=self.percentile(50), p99_ms=self.percentile(99),
+                    buckets=zip(BUCKETS + [None], self.counts))
+
+
+def _parse_limits(pairs):
+    limits = {}
+    for pair in pairs:
+        try:
+            method, limit = pair.rsplit(':', 1)
+            limits[method.strip()] = max(int(limit), 1)
+        except ValueError:
+            LOG.warn(_('Ignoring invalid rpc_method_concurrency entry '
+                       '%s'), pair)
+    return limits
+
+
+class Dispatcher(object):
+    """Runs the rpc messages of a proxy in green threads."""
+
+    def __init__(self, size=None, backlog=None, limits=None,
+                 low_priority=None):
+        self.size = size or FLAGS.rpc_thread_pool_size
+        if backlog is None:
+            backlog = FLAGS.rpc_dispatch_backlog
+        self.backlog = backlog
+        if limits is None:
+            limits = _parse_limits(FLAGS.rpc_method_concurrency)
+        self.limits = limits
+        if low_priority is None:
+            low_priority = FLAGS.rpc_low_priority_methods
+        self.low_priority = set(low_priority)
+        # messages waiting or running
+        self._admitted = semaphore.Semaphore(self.size + self.backlog)
+        # {method: deque of (seq, enqueued_at, fn, args)} by lane, the
+        # normal lane first
+        self._lanes = ({}, {})
+        self._seq = itertools.count()
+        self._running = collections.defaultdict(int)
+        self.running = 0
+        self.waiting = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        # {method: (wait Histogram, run Histogram)}
+        self.stats = collections.defaultdict(lambda: (Histogram(),
+                                                      Histogram()))
+
+    def get_stats(self):
+        result = {}
+        for method, (wait, run) in self.stats.iteritems():
+            result[method] = dict(wait=wait.to_dict(), run=run.to_dict())
+        return result
+
+    def free(self):
+        """Return how many more messages are accepted without blocking."""
+        return self._admitted.balance
+
+    def dispatch(self, method, fn, *args):
+        """Run fn(*args) in a green thread once a slot and the budget of
+        method allow it.  Blocks while size messages are running and
+        backlog more are waiting.
+        """
+        self._admitted.acquire()
+        lane = self._lanes[method in self.low_priority]
+        lane.setdefault(method, collections.deque()).append(
+                (self._seq.next(), time.time(), fn, args))
+        self.waiting += 1
+        item = self._next()
+        if item is not None:
+            eventlet.spawn_n(self._run, *item)
+
+    def _next(self):
+        """Take the oldest message that may start, from the normal lane
+        if it has one.
+        """
+        if self.running >= self.size:
+            return None
+        for lane in self._lanes:
+            oldest = None
+            for method, queue in lane.iteritems():
+                if self._running[method] >= self.limits.get(method,
+                                                            self.size):
+                    continue
+                if oldest is None or queue[0][0] < lane[oldest][0][0]:
+                    oldest = method
+            if oldest is not None:
+                queue = lane[oldest]
+                _seq, enqueued_at, fn, args = queue.popleft()
+                if not queue:
+                    del lane[oldest]
+                self.waiting -= 1
+                self.running += 1
+                self._running[oldest] += 1
+                return oldest, enqueued_at, fn, args
+        return None
+
+    def _run(self, method, enqueued_at, fn, args):
+        # NOTE: keep running the messages that may start next in this
+        #       green thread rather than spawning one for each
+        while True:
+            started_at = time.time()
+            wait, run = self.stats[method]
+            wait.add(started_at - enqueued_at)
+            try:
+                fn(*args)
+            except Exception:
+                LOG.exception(_('Exception processing a %s message'),
+                              method)
+            finally:
+                run.add(time.time() - started_at)
+                self.running -= 1
+                self._running[method] -= 1
+                self._admitted.release()
+            # let the consumer and the other threads run in between
+            eventlet.sleep(0)
+            item = self._next()
+            if item is None:
+                return
+            method, enqueued_at, fn, args = item
+
+
+def get_dispatcher(proxy):
+    """Return the Dispatcher shared by the consumers of proxy."""
+    dispatcher = _DISPATCHERS.get(proxy)
+    if dispatcher is None:
+        dispatcher = _DISPATCHERS[proxy] = Dispatcher()
+    return dispatcher
+
+
+def get_stats(proxy, reset=False):
+    """Return the wait and run time histograms of the messages of proxy
+    by method, optionally resetting them.
+    """
+    dispatcher = _DISPATCHERS.get(proxy)
+    if dispatcher is None:
+        return {}
+    stats = dispatcher.get_stats()
+    if reset:
+        dispatcher.reset_stats()
+    return stats
@@ -606,6 +606,20 @@ def call(context, topic, msg, timeout=None):
     return rv[-1]
 
 
+def call_many(context, calls, timeout=None):
+    """Sends messages on a number of topics and gathers the responses."""
+    # NOTE: carrot doesn't support timeouts, and every call holds a
+    # pooled connection, so up to rpc_conn_pool_size calls are made at once
+    def _call(topic_msg):
+        try:
+            return call(context, topic_msg[0], topic_msg[1]), None
+        except rpc_common.RemoteError, e:
+            return None, e
+
+    pool = greenpool.GreenPool(FLAGS.rpc_conn_pool_size)
+    return list(pool.imap(_call, calls))
+
+
 def cast(context, topic, msg):
     """Sends a message on a topic without waiting for a response."""
     LOG.debug(_('Making asynchronous cast on %s...'), topic)
@@ -616,6 +630,23 @@ def cast(context, topic, msg):
         publisher.close()
 
 
+def cast_many(context, messages, confirm=False):
+    """Sends messages on a number of topics over a single connection.
+
+    carrot has no publisher confirms, confirm is ignored.
+    """
+    if not messages:
+        return
+    LOG.debug(_('Making %d asynchronous casts...'), len(messages))
+    for _topic, msg in messages:
+        _pack_context(msg, context)
+    with ConnectionPool.item() as conn:
+        publisher = TopicPublisher(connection=conn, topic=messages[0][0])
+        for topic, msg in messages:
+            publisher.send(msg, routing_key=topic)
+        publisher.close()
+
+
 def fanout_cast(context, topic, msg):
     """Sends a message on a fanout exchange without waiting for a response."""
     LOG.debug(_('Making asynchronous fanout cast...'))
@@ -25,6 +25,7 @@ import time
 import traceback
 
 import eventlet
+from eventlet import greenpool
 
 from nova import context
 from nova import flags
@@ -158,6 +159,18 @@ def call(context, topic, msg, timeout=None):
     return rv[-1]
 
 
+def call_many(context, calls, timeout=None):
+    """Sends messages on a number of topics and gathers the responses."""
+    def _call(topic_msg):
+        try:
+            return call(context, topic_msg[0], topic_msg[1], timeout), None
+        except (rpc_common.RemoteError, rpc_common.Timeout), e:
+            return None, e
+
+    pool = greenpool.GreenPool()
+    return list(pool.imap(_call, calls))
+
+
 def cast(context, topic, msg):
     try:
         call(context, topic, msg)
@@ -165,6 +178,11 @@ def cast(context, topic, msg):
         pass
 
 
+def cast_many(context, messages, confirm=False):
+    for topic, msg in messages:
+        cast(context, topic, msg)
+
+
 def notify(context, topic, msg):
     check_serialize(msg)
 
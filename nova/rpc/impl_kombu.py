@@ -371,6 +371,7 @@ class Connection(object):
             self.params['ssl'] = self._fetch_ssl_params()
 
         self.connection = None
+        self.prefetch_count = 0
         self.reconnect()
 
     def _fetch_ssl_params(self):
@@ -425,6 +426,7 @@ class Connection(object):
         # work around 'memory' transport bug in 1.1.3
         if self.memory_transport:
             self.channel._new_queue('ae.undeliver')
+        self._set_qos()
         for consumer in self.consumers:
             consumer.reconnect(self.channel)
         LOG.info(_('Connected to AMQP server on '
@@ -522,6 +524,12 @@ class Connection(object):
         if self.memory_transport:
             self.channel._new_queue('ae.undeliver')
         self.consumers = []
+        self.prefetch_count = 0
+
+    def _set_qos(self):
+        """Limit the unacknowledged messages the broker sends us"""
+        if self.prefetch_count:
+            self.channel.basic_qos(0, self.prefetch_count, False)
 
     def declare_consumer(self, consumer_cls, topic, callback):
         """Create a Consumer using the class that was passed in and
@@ -541,8 +549,12 @@ class Connection(object):
 
         return self.ensure(_connect_error, _declare_consumer)
 
-    def iterconsume(self, limit=None, timeout=None):
-        """Return an iterator that will consume from all queues/consumers"""
+    def iterconsume(self, limit=None, timeout=None, deadline=None):
+        """Return an iterator that will consume from all queues/consumers
+
+        With a deadline, a time.time() value, every wait is cut short so
+        that rpc_common.Timeout is raised once the deadline has passed.
+        """
 
         info = {'do_consume': True}
 
@@ -564,7 +576,14 @@ class Connection(object):
                     queue.consume(nowait=True)
                 queues_tail.consume(nowait=False)
                 info['do_consume'] = False
-            return self.connection.drain_events(timeout=timeout)
+            wait = timeout
+            if deadline is not None:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    raise socket.timeout(_('deadline reached'))
+                if timeout:
+                    wait = min(wait, timeout)
+            return self.connection.drain_events(timeout=wait)
 
         for iteration in itertools.count(0):
             if limit and iteration >= limit:
@@ -618,6 +637,44 @@ class Connection(object):
         """Send a 'topic' message"""
         self.publisher_send(TopicPublisher, topic, msg)
 
+    def topic_send_many(self, messages, confirm=False):
+        """Send 'topic' messages, a list of (topic, msg), in one go.
+
+        Every topic is a routing key of the control exchange, so a single
+        publisher sends them all.  With confirm the messages are published
+        in a transaction on a channel of their own and the commit waits
+        for the broker to have accepted all of them.
+        """
+        progress = {'sent': 0}
+
+        def _error_callback(exc):
+            log_info = {'count': len(messages) - progress['sent'],
+                        'err_str': str(exc)}
+            LOG.exception(_("Failed to publish %(count)d messages: "
+                "%(err_str)s") % log_info)
+
+        def _publish():
+            channel = self.channel
+            transactional = confirm and hasattr(channel, 'tx_select')
+            if transactional:
+                # NOTE: the messages not committed are dropped by the
+                #       broker, so start over after a reconnection
+                progress['sent'] = 0
+                channel = self.connection.channel()
+                channel.tx_select()
+            try:
+                publisher = TopicPublisher(channel, messages[0][0])
+                for topic, msg in messages[progress['sent']:]:
+                    publisher.producer.publish(msg, routing_key=topic)
+                    progress['sent'] += 1
+                if transactional:
+                    channel.tx_commit()
+            finally:
+                if transactional:
+                    channel.close()
+
+        self.ensure(_error_callback, _publish)
+
     def fanout_send(self, topic, msg):
         """Send a 'fanout' message"""
         self.publisher_send(FanoutPublisher, topic, msg)
@@ -648,6 +705,12 @@ class Connection(object):
 
     def create_consumer(self, topic, proxy, fanout=False):
         """Create a consumer that calls a method in a proxy object"""
+        # NOTE: the dispatcher of the proxy blocks the consumer, leaving
+        #       the messages unacknowledged, once its slots are taken,
+        #       so the broker stops sending more than a pool's worth
+        if self.prefetch_count != FLAGS.rpc_thread_pool_size:
+            self.prefetch_count = FLAGS.rpc_thread_pool_size
+            self._set_qos()
         if fanout:
             self.declare_fanout_consumer(topic,
                     rpc_amqp.ProxyCallback(proxy, Connection.pool))
@@ -674,11 +737,21 @@ def call(context, topic, msg, timeout=None):
     return rpc_amqp.call(context, topic, msg, timeout, Connection.pool)
 
 
+def call_many(context, calls, timeout=None):
+    """Sends messages on a number of topics and gathers the responses."""
+    return rpc_amqp.call_many(context, calls, timeout, Connection.pool)
+
+
 def cast(context, topic, msg):
     """Sends a message on a topic without waiting for a response."""
     return rpc_amqp.cast(context, topic, msg, Connection.pool)
 
 
+def cast_many(context, messages, confirm=False):
+    """Sends messages on a number of topics over a single connection."""
+    return rpc_amqp.cast_many(context, messages, confirm, Connection.pool)
+
+
 def fanout_cast(context, topic, msg):
     """Sends a message on a fanout exchange without waiting for a response."""
     return rpc_amqp.fanout_cast(context, topic, msg, Connection.pool)
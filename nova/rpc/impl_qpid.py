@@ -392,8 +392,12 @@ class Connection(object):
 
         return self.ensure(_connect_error, _declare_consumer)
 
-    def iterconsume(self, limit=None, timeout=None):
-        """Return an iterator that will consume from all queues/consumers"""
+    def iterconsume(self, limit=None, timeout=None, deadline=None):
+        """Return an iterator that will consume from all queues/consumers
+
+        With a deadline, a time.time() value, every wait is cut short so
+        that rpc_common.Timeout is raised once the deadline has passed.
+        """
 
         def _error_callback(exc):
             if isinstance(exc, qpid.messaging.exceptions.Empty):
@@ -405,7 +409,14 @@ class Connection(object):
                         str(exc))
 
         def _consume():
-            nxt_receiver = self.session.next_receiver(timeout=timeout)
+            wait = timeout
+            if deadline is not None:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    raise qpid.messaging.exceptions.Empty()
+                if timeout:
+                    wait = min(wait, timeout)
+            nxt_receiver = self.session.next_receiver(timeout=wait)
             try:
                 self._lookup_consumer(nxt_receiver).consume()
             except Exception:
@@ -463,6 +474,37 @@ class Connection(object):
         """Send a 'topic' message"""
         self.publisher_send(TopicPublisher, topic, msg)
 
+    def topic_send_many(self, messages, confirm=False):
+        """Send 'topic' messages, a list of (topic, msg), in one go.
+
+        The messages are sent without waiting for each of them to be
+        acknowledged.  With confirm the session is synced once at the
+        end, which waits for all of the acknowledgements.
+        """
+        progress = {'sent': 0}
+
+        def _connect_error(exc):
+            log_info = {'count': len(messages) - progress['sent'],
+                        'err_str': str(exc)}
+            LOG.exception(_("Failed to publish %(count)d messages: "
+                "%(err_str)s") % log_info)
+
+        def _publisher_send():
+            if confirm:
+                # NOTE: the messages sent before a reconnection may not
+                #       have been acknowledged, send all of them again
+                progress['sent'] = 0
+            publishers = {}
+            for topic, msg in messages[progress['sent']:]:
+                if topic not in publishers:
+                    publishers[topic] = TopicPublisher(self.session, topic)
+                publishers[topic].sender.send(msg, sync=False)
+                progress['sent'] += 1
+            if confirm:
+                self.session.sync()
+
+        return self.ensure(_connect_error, _publisher_send)
+
     def fanout_send(self, topic, msg):
         """Send a 'fanout' message"""
         self.publisher_send(FanoutPublisher, topic, msg)
@@ -521,11 +563,21 @@ def call(context, topic, msg, timeout=None):
     return rpc_amqp.call(context, topic, msg, timeout, Connection.pool)
 
 
+def call_many(context, calls, timeout=None):
+    """Sends messages on a number of topics and gathers the responses."""
+    return rpc_amqp.call_many(context, calls, timeout, Connection.pool)
+
+
 def cast(context, topic, msg):
     """Sends a message on a topic without waiting for a response."""
     return rpc_amqp.cast(context, topic, msg, Connection.pool)
 
 
+def cast_many(context, messages, confirm=False):
+    """Sends messages on a number of topics over a single connection."""
+    return rpc_amqp.cast_many(context, messages, confirm, Connection.pool)
+
+
 def fanout_cast(context, topic, msg):
     """Sends a message on a fanout exchange without waiting for a response."""
     return rpc_amqp.fanout_cast(context, topic, msg, Connection.pool)
@@ -20,6 +20,7 @@ Handles all requests relating to schedulers.
 from nova import flags
 from nova import log as logging
 from nova import rpc
+from nova.rpc import common as rpc_common
 
 FLAGS = flags.FLAGS
 LOG = logging.getLogger(__name__)
@@ -50,12 +51,41 @@ def get_service_capabilities(context):
     return _call_scheduler('get_service_capabilities', context)
 
 
-def update_service_capabilities(context, service_name, host, capabilities):
+def show_host_resources(context, hosts):
+    """Return the resources and usage of a number of hosts.
+
+    The scheduler answers from the database, so the hosts are asked for
+    one after the other.  Returns a dict of host -> (resources, error),
+    where error is the exception the call for that host failed with or
+    None.
+    """
+    results = {}
+    for host in hosts:
+        try:
+            results[host] = (_call_scheduler('show_host_resources', context,
+                                             params={'host': host}), None)
+        except (rpc_common.RemoteError, rpc_common.Timeout) as e:
+            results[host] = (None, e)
+    return results
+
+
+def get_scheduler_stats(context, reset=False):
+    """Return the timing counters of a scheduler's requests."""
+    return _call_scheduler('get_scheduler_stats', context,
+                           params={'reset': reset})
+
+
+def update_service_capabilities(context, service_name, host, capabilities,
+                                seq=None, full=True, removed=None):
     """Send an update to all the scheduler services informing them
-       of the capabilities of this service."""
+       of the capabilities of this service.  When full is False only the
+       changed capabilities and the names of the removed ones are sent,
+       and seq numbers the updates so the schedulers can tell if they
+       missed one."""
     kwargs = dict(method='update_service_capabilities',
                   args=dict(service_name=service_name, host=host,
-                            capabilities=capabilities))
+                            capabilities=capabilities, seq=seq, full=full,
+                            removed=removed))
     return rpc.fanout_cast(context, 'scheduler', kwargs)
 
 
@@ -31,6 +31,7 @@ from nova import log as logging
 from nova.openstack.common import cfg
 from nova import rpc
 from nova.rpc import common as rpc_common
+from nova.scheduler import tracing
 from nova import utils
 
 
@@ -80,6 +81,21 @@ def cast_to_compute_host(context, host, method, update_db=True, **kwargs):
     LOG.debug(_("Casted '%(method)s' to compute '%(host)s'") % locals())
 
 
+def cast_to_compute_hosts(context, casts):
+    """Cast requests to a number of compute host queues in one go.
+
+    casts is a list of (host, method, kwargs).  The hosts of the instances
+    are expected to be set already, so a lost message would leave them
+    building forever: wait for the broker to accept the messages.
+    """
+    rpc.cast_many(context,
+            [(db.queue_get_for(context, 'compute', host),
+              {"method": method, "args": kwargs})
+             for host, method, kwargs in casts], confirm=True)
+    LOG.debug(_("Casted %(count)d requests to compute hosts"),
+              {'count': len(casts)})
+
+
 def cast_to_network_host(context, host, method, update_db=False, **kwargs):
     """Cast request to a network host queue"""
 
@@ -133,6 +149,7 @@ class Scheduler(object):
         self.host_manager = utils.import_object(
                 FLAGS.scheduler_host_manager)
         self.compute_api = compute_api.API()
+        self.stats = tracing.SchedulerStats()
 
     def get_host_list(self):
         """Get a list of hosts from the HostManager."""
@@ -143,10 +160,22 @@ class Scheduler(object):
         """
         return self.host_manager.get_service_capabilities()
 
-    def update_service_capabilities(self, service_name, host, capabilities):
-        """Process a capability update from a service node."""
-        self.host_manager.update_service_capabilities(service_name,
-                host, capabilities)
+    def update_service_capabilities(self, service_name, host, capabilities,
+                                    seq=None, full=True, removed=None):
+        """Process a capability update from a service node.  Returns True
+        if it could not be applied because an earlier update was missed.
+        """
+        return self.host_manager.update_service_capabilities(service_name,
+                host, capabilities, seq=seq, full=full, removed=removed)
+
+    def get_scheduler_stats(self, reset=False):
+        """Return the timing counters of the traced requests, optionally
+        resetting them.
+        """
+        stats = self.stats.to_dict()
+        if reset:
+            self.stats.reset()
+        return stats
 
     def hosts_up(self, context, topic):
         """Return the list of hosts that have a running service for topic."""
@@ -176,6 +205,22 @@ class Scheduler(object):
         base_options['uuid'] = instance['uuid']
         return instance
 
+    def create_instance_db_entries(self, context, request_spec,
+                                   instances_values):
+        """Create the DB entries of several instances based on
+        request_spec, in one transaction.  instances_values holds the
+        per instance values, such as launch_index and host.
+        """
+        base_options = request_spec['instance_properties']
+        image = request_spec['image']
+        instance_type = request_spec.get('instance_type')
+        security_group = request_spec.get('security_group', 'default')
+        block_device_mapping = request_spec.get('block_device_mapping', [])
+
+        return self.compute_api.create_db_entries_for_new_instances(
+                context, instance_type, image, base_options,
+                security_group, block_device_mapping, instances_values)
+
     def schedule(self, context, topic, method, *_args, **_kwargs):
         """Must override schedule method for scheduler to work."""
         raise NotImplementedError(_("Must implement a fallback schedule"))
@@ -25,14 +25,27 @@ from nova import exception
 from nova import flags
 from nova import log as logging
 from nova.notifier import api as notifier
+from nova.openstack.common import cfg
 from nova.scheduler import driver
+from nova.scheduler import host_table
 from nova.scheduler import least_cost
 from nova.scheduler import scheduler_options
+from nova.scheduler import tracing
 from nova.scheduler import api
 from nova import utils
 
 
+filter_scheduler_opts = [
+    cfg.BoolOpt('scheduler_batch_run_instances',
+                default=False,
+                help='Send the instances of a request placed on the same '
+                     'compute host in one run_instances message.  Only '
+                     'enable once every compute host has run_instances'),
+    ]
+
 FLAGS = flags.FLAGS
+FLAGS.register_opts(filter_scheduler_opts)
+
 LOG = logging.getLogger(__name__)
 
 
@@ -79,18 +92,23 @@ class FilterScheduler(driver.Scheduler):
         # contains an instance of RpcContext that cannot be serialized.
         kwargs.pop('filter_properties', None)
 
-        instances = []
-        for num in xrange(num_instances):
-            if not weighted_hosts:
-                break
-            weighted_host = weighted_hosts.pop(0)
+        if (num_instances > 1 and
+            not request_spec['instance_properties'].get('uuid')):
+            instances = self._provision_resources(elevated,
+                    weighted_hosts[:num_instances], request_spec, kwargs)
+        else:
+            instances = []
+            for num in xrange(num_instances):
+                if not weighted_hosts:
+                    break
+                weighted_host = weighted_hosts.pop(0)
 
-            request_spec['instance_properties']['launch_index'] = num
-            instance = self._provision_resource(elevated, weighted_host,
-                                                request_spec, kwargs)
+                request_spec['instance_properties']['launch_index'] = num
+                instance = self._provision_resource(elevated, weighted_host,
+                                                    request_spec, kwargs)
 
-            if instance:
-                instances.append(instance)
+                if instance:
+                    instances.append(instance)
 
         notifier.notify(notifier.publisher_id("scheduler"),
                         'scheduler.run_instance.end', notifier.INFO, payload)
@@ -139,6 +157,59 @@ class FilterScheduler(driver.Scheduler):
         del request_spec['instance_properties']['uuid']
         return inst
 
+    def _provision_resources(self, context, weighted_hosts, request_spec,
+            kwargs):
+        """Create one instance on each of weighted_hosts.
+
+        The instance DB entries are created in one transaction, a single
+        scheduled notification is sent for the batch and the messages to
+        all of the hosts are published in one go.  With
+        scheduler_batch_run_instances, the instances going to the same host
+        are sent to it in one message.
+        """
+        instances_values = []
+        for num, weighted_host in enumerate(weighted_hosts):
+            instances_values.append({'launch_index': num,
+                                     'host': weighted_host.host_state.host,
+                                     'scheduled_at': utils.utcnow()})
+        instances = self.create_instance_db_entries(context, request_spec,
+                                                    instances_values)
+
+        payload = dict(request_spec=request_spec,
+                       instances=[dict(instance_id=instance['uuid'],
+                                       weighted_host=weighted_host.to_dict())
+                                  for instance, weighted_host
+                                  in zip(instances, weighted_hosts)])
+        notifier.notify(notifier.publisher_id("scheduler"),
+                        'scheduler.run_instance.scheduled', notifier.INFO,
+                        payload)
+
+        if not FLAGS.scheduler_batch_run_instances:
+            # Compute hosts older than run_instances would drop the batch
+            driver.cast_to_compute_hosts(context,
+                    [(instance['host'], 'run_instance',
+                      dict(kwargs, instance_uuid=instance['uuid']))
+                     for instance in instances])
+            return [driver.encode_instance(instance, local=True)
+                    for instance in instances]
+
+        instance_uuids_by_host = {}
+        for instance in instances:
+            instance_uuids_by_host.setdefault(instance['host'],
+                                              []).append(instance['uuid'])
+        casts = []
+        for host, instance_uuids in instance_uuids_by_host.iteritems():
+            # The host was set when the instances were created
+            if len(instance_uuids) == 1:
+                casts.append((host, 'run_instance',
+                              dict(kwargs, instance_uuid=instance_uuids[0])))
+            else:
+                casts.append((host, 'run_instances',
+                              dict(kwargs, instance_uuids=instance_uuids)))
+        driver.cast_to_compute_hosts(context, casts)
+        return [driver.encode_instance(instance, local=True)
+                for instance in instances]
+
     def _get_configuration_options(self):
         """Fetch options dictionary. Broken out for testing."""
         return self.options.get_configuration()
@@ -168,38 +239,56 @@ class FilterScheduler(driver.Scheduler):
                                   'request_spec': request_spec,
                                   'config_options': config_options,
                                   'instance_type': instance_type})
-        #Eneabegin
-        LOG.debug(_('Enea: attributi in _schedule di filter_properties %(attributi)s in '),
-                        {'attributi': filter_properties.__getattribute__})
-        #Eneaend
         self.populate_filter_properties(request_spec,
                                         filter_properties)
 
+        trace = tracing.RequestTrace(topic)
+        try:
+            return self._select_hosts(elevated, topic, cost_functions,
+                    filter_properties, instance_properties,
+                    request_spec.get('num_instances', 1), trace)
+        finally:
+            trace.finish()
+            self.stats.add(trace)
+
+    def _select_hosts(self, elevated, topic, cost_functions,
+                      filter_properties, instance_properties, num_instances,
+                      trace):
+        """Filter and weigh the hosts for num_instances instances,
+        recording the time spent in each step in trace.
+        """
         # Find our local list of acceptable hosts by repeatedly
         # filtering and weighing our options. Each time we choose a
         # host, we virtually consume resources on it so subsequent
         # selections can adjust accordingly.
 
         # unfiltered_hosts_dict is {host : ZoneManager.HostInfo()}
-        unfiltered_hosts_dict = self.host_manager.get_all_host_states(
-                elevated, topic)
+        with trace.timed(tracing.GET_HOST_STATES, topic):
+            unfiltered_hosts_dict = self.host_manager.get_all_host_states(
+                    elevated, topic)
+
+        if host_table.enabled():
+            selected_hosts = self._schedule_host_table(cost_functions,
+                    unfiltered_hosts_dict.values(), filter_properties,
+                    instance_properties, num_instances, trace)
+            selected_hosts.sort(key=operator.attrgetter('weight'))
+            return selected_hosts[:num_instances]
 
         # Note: remember, we are using an iterator here. So only
         # traverse this list once. This can bite you if the hosts
         # are being scanned in a filter or weighing function.
         hosts = unfiltered_hosts_dict.itervalues()
 
-        num_instances = request_spec.get('num_instances', 1)
         selected_hosts = []
         for num in xrange(num_instances):
             # Filter local hosts based on requirements ...
             hosts = self.host_manager.filter_hosts(hosts,
-                    filter_properties)
+                    filter_properties, trace=trace)
             if not hosts:
                 # Can't get any more locally.
                 break
 
-            LOG.debug(_("Filtered %(hosts)s") % locals())
+            LOG.debug(_("Filtered %(hosts)s"), {'hosts': hosts})
 
             # weighted_host = WeightedHost() ... the best
             # host for the job.
@@ -207,12 +296,10 @@ class FilterScheduler(driver.Scheduler):
             # weighing and I plan fold weighing into the host manager
             # in a future patch.  I'll address the naming of this
             # variable at that time.
-            #Eneabegin
-            LOG.debug(_("Enea: property of host %(hosts)s") % locals())
-            #Eneaend
             weighted_host = least_cost.weighted_sum(cost_functions,
-                    hosts, filter_properties)
-            LOG.debug(_("Weighted %(weighted_host)s") % locals()) 
+                    hosts, filter_properties, trace=trace)
+            LOG.debug(_("Weighted %(weighted_host)s"),
+                      {'weighted_host': weighted_host})
             selected_hosts.append(weighted_host)
 
             # Now consume the resources so the filter/weights
@@ -222,14 +309,35 @@ class FilterScheduler(driver.Scheduler):
         
         selected_hosts.sort(key=operator.attrgetter('weight'))
         #Enea_begin
-        if len(selected_hosts)>0:
-                LOG.debug(_('Enea: First weight host: %(weight)s and selected hosts: %(selected_hosts)s and host_state[0]: %(attribute)s'),
-                                {'selected_hosts': selected_hosts,
-                                'attribute': selected_hosts[0].__getattribute__,
-                                'weight': selected_hosts[0].weight})
+        if selected_hosts:
+            LOG.debug(_('Enea: First weight host: %(weight)s and selected '
+                        'hosts: %(selected_hosts)s'),
+                      {'selected_hosts': selected_hosts,
+                       'weight': selected_hosts[0].weight})
         #Enea_end
         return selected_hosts[:num_instances]
 
+    def _schedule_host_table(self, cost_functions, host_states,
+                             filter_properties, instance_properties,
+                             num_instances, trace=None):
+        """Same selection as _schedule() done over a HostTable: filters
+        and cost functions are evaluated on all the hosts at once and only
+        the row of the chosen host is updated between instances.
+        """
+        table = host_table.HostTable(host_states)
+        selected_hosts = []
+        for num in xrange(num_instances):
+            mask = self.host_manager.filter_host_table(table,
+                    filter_properties, trace=trace)
+            if not mask.any():
+                # Can't get any more locally.
+                break
+            index, weighted_host = host_table.weighted_sum(cost_functions,
+                    table, mask, filter_properties, trace=trace)
+            selected_hosts.append(weighted_host)
+            table.consume_from_instance(index, instance_properties)
+        return selected_hosts
+
     def get_cost_functions(self, topic=None):
         """Returns a list of tuples containing weights and cost functions to
         use for weighing hosts
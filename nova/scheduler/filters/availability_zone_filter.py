@@ -28,3 +28,13 @@ class AvailabilityZoneFilter(filters.BaseHostFilter):
         if availability_zone:
             return availability_zone == host_state.service['availability_zone']
         return True
+
+    def host_passes_array(self, host_table, filter_properties):
+        """Vector version of host_passes() over a HostTable."""
+        spec = filter_properties.get('request_spec', {})
+        props = spec.get('instance_properties', {})
+        availability_zone = props.get('availability_zone')
+
+        if availability_zone:
+            return host_table.availability_zone == availability_zone
+        return host_table.all_hosts()
@@ -53,3 +53,16 @@ class ComputeFilter(filters.BaseHostFilter):
         if not self._satisfies_extra_specs(capabilities, instance_type):
             return False
         return True
+
+    def host_passes_array(self, host_table, filter_properties):
+        """Vector version of host_passes() over a HostTable."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return host_table.all_hosts()
+        passes = host_table.service_usable.copy()
+        if instance_type.get('extra_specs'):
+            for index, host_state in enumerate(host_table.host_states):
+                if passes[index]:
+                    passes[index] = self._satisfies_extra_specs(
+                            host_state.capabilities, instance_type)
+        return passes
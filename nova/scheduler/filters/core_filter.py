@@ -48,3 +48,15 @@ class CoreFilter(filters.BaseHostFilter):
         instance_vcpus = instance_type['vcpus']
         vcpus_total = host_state.vcpus_total * FLAGS.cpu_allocation_ratio
         return (vcpus_total - host_state.vcpus_used) >= instance_vcpus
+
+    def host_passes_array(self, host_table, filter_properties):
+        """Vector version of host_passes() over a HostTable."""
+        instance_type = filter_properties.get('instance_type')
+        if not instance_type:
+            return host_table.all_hosts()
+
+        instance_vcpus = instance_type['vcpus']
+        vcpus_total = host_table.vcpus_total * FLAGS.cpu_allocation_ratio
+        # Hosts without VCPUs set pass, see host_passes()
+        return ((host_table.vcpus_total == 0) |
+                ((vcpus_total - host_table.vcpus_used) >= instance_vcpus))
@@ -18,12 +18,65 @@ import json
 import operator
 from nova import utils
 
+from nova import flags
 from nova import log as logging
+from nova.openstack.common import cfg
 
 from nova.scheduler import filters
 
 LOG = logging.getLogger(__name__)
 
+json_filter_opts = [
+    cfg.IntOpt('json_filter_plan_cache_size',
+               default=64,
+               help='Number of compiled JsonFilter queries to keep'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(json_filter_opts)
+
+
+class PlanCache(object):
+    """Least recently used cache of compiled query plans."""
+
+    def __init__(self):
+        self._plans = {}
+        self._tick = 0
+
+    def __len__(self):
+        return len(self._plans)
+
+    def get(self, key):
+        entry = self._plans.get(key)
+        if entry is None:
+            return None
+        self._tick += 1
+        entry[1] = self._tick
+        return entry[0]
+
+    def set(self, key, plan):
+        size = FLAGS.json_filter_plan_cache_size
+        if size <= 0:
+            return
+        while len(self._plans) >= size:
+            oldest = min(self._plans, key=lambda k: self._plans[k][1])
+            del self._plans[oldest]
+        self._tick += 1
+        self._plans[key] = [plan, self._tick]
+
+    def clear(self):
+        self._plans.clear()
+
+
+# Filters are instantiated for every request, so the plans are shared
+# at module level and keyed by filter class and query text.
+_PLAN_CACHE = PlanCache()
+
+
+def _constant(value):
+    return lambda host_state: value
+
+
 class JsonFilter(filters.BaseHostFilter):
     """Host Filter to allow simple JSON-based grammar for
     selecting hosts.
@@ -90,56 +143,87 @@ class JsonFilter(filters.BaseHostFilter):
         'and': _and,
     }
 
-    def _parse_string(self, string, host_state):
+    def _compile_string(self, string):
         """Strings prefixed with $ are capability lookups in the
         form '$variable' where 'variable' is an attribute in the
         HostState class.  If $variable is a dictionary, you may
         use: $variable.dictkey
+
+        Returns a function of the host state giving the value.
         """
-        #Eneabegin
-        LOG.debug(_("Enea: in JsonFilter _parse_string") % locals())
-        #Eneaend
         if not string:
-            return None
+            return _constant(None)
         if not string.startswith("$"):
-            return string
+            return _constant(string)
 
         path = string[1:].split(".")
-        obj = getattr(host_state, path[0], None)
-        if obj is None:
-            return None
-        for item in path[1:]:
-            obj = obj.get(item, None)
+        attr = path[0]
+        keys = path[1:]
+
+        def lookup(host_state):
+            obj = getattr(host_state, attr, None)
             if obj is None:
                 return None
-        return obj
-
-    def _process_filter(self, query, host_state):
-        """Recursively parse the query structure."""
-        #Eneabegin
-        LOG.debug(_("Enea: in JsonFilter _process_filter") % locals())
-        #Eneaend
+            for item in keys:
+                obj = obj.get(item, None)
+                if obj is None:
+                    return None
+            return obj
+        return lookup
+
+    def _compile(self, query):
+        """Recursively turn the query structure into a function of
+        the host state giving the query result.
+        """
         if not query:
-            return True
+            return _constant(True)
         cmd = query[0]
         method = self.commands[cmd]
-        cooked_args = []
+        getters = []
         for arg in query[1:]:
-            if isinstance(arg, list):   #Eneabegin if it is a list
-                arg = self._process_filter(arg, host_state)
-            elif isinstance(arg, basestring):    #Eneaend if it is a basestring
-                arg = self._parse_string(arg, host_state)
-            if arg is not None:
-                cooked_args.append(arg)
-        result = method(self, cooked_args)
-        return result
+            if isinstance(arg, list):
+                getters.append(self._compile(arg))
+            elif isinstance(arg, basestring):
+                getters.append(self._compile_string(arg))
+            elif arg is not None:
+                getters.append(_constant(arg))
+
+        def plan(host_state):
+            cooked_args = []
+            for getter in getters:
+                arg = getter(host_state)
+                if arg is not None:
+                    cooked_args.append(arg)
+            return method(self, cooked_args)
+        return plan
+
+    def _get_plan(self, query):
+        """Return the compiled plan for the query text, parsing and
+        compiling it only when it is not cached.
+        """
+        key = (self.__class__, query)
+        plan = _PLAN_CACHE.get(key)
+        if plan is None:
+            LOG.debug(_("Compiling JsonFilter query: %(query)s") % locals())
+            plan = self._compile(json.loads(query))
+            _PLAN_CACHE.set(key, plan)
+        return plan
+
+    def _parse_string(self, string, host_state):
+        """Return the value of string for host_state, see
+        _compile_string().
+        """
+        return self._compile_string(string)(host_state)
+
+    def _process_filter(self, query, host_state):
+        """Evaluate the query structure for host_state."""
+        return self._compile(query)(host_state)
 
     def host_passes(self, host_state, filter_properties):
         """Return a list of hosts that can fulfill the requirements
         specified in the query.
         """
         #Eneabegin
-        LOG.debug(_("Enea: in JsonFilter _host_passes") % locals())
         #Verify if the host is up
         service = host_state.service
         if not utils.service_is_up(service) or service['disabled']:
@@ -155,7 +239,7 @@ class JsonFilter(filters.BaseHostFilter):
         # NOTE(comstud): Not checking capabilities or service for
         # enabled/disabled so that a provided json filter can decide
 
-        result = self._process_filter(json.loads(query), host_state)
+        result = self._get_plan(query)(host_state)
         if isinstance(result, list):
             # If any succeeded, include the host
             result = any(result)
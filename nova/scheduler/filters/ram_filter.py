@@ -38,3 +38,10 @@ class RamFilter(filters.BaseHostFilter):
         requested_ram = instance_type['memory_mb']
         free_ram_mb = host_state.free_ram_mb
         return free_ram_mb * FLAGS.ram_allocation_ratio >= requested_ram
+
+    def host_passes_array(self, host_table, filter_properties):
+        """Vector version of host_passes() over a HostTable."""
+        instance_type = filter_properties.get('instance_type')
+        requested_ram = instance_type['memory_mb']
+        free_ram_mb = host_table.free_ram_mb
+        return free_ram_mb * FLAGS.ram_allocation_ratio >= requested_ram
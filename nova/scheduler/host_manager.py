@@ -18,15 +18,17 @@ Manage hosts in the current zone.
 """
 
 import datetime
+import time
 import UserDict
-import base64
 
+from nova.compute import workload_classes
 from nova import db
 from nova import exception
 from nova import flags
 from nova import log as logging
 from nova.openstack.common import cfg
 from nova.scheduler import filters
+from nova.scheduler import tracing
 from nova import utils
 
 
@@ -52,6 +54,11 @@ host_manager_opts = [
                   ],
                 help='Which filter class names to use for filtering hosts '
                       'when not specified in the request.'),
+    cfg.IntOpt('host_state_reconcile_interval',
+               default=45,
+               help='Number of seconds the scheduler keeps its cached host '
+                    'states before rebuilding them from the database. '
+                    'Set to 0 to rebuild them on every request.'),
     ]
 
 FLAGS = flags.FLAGS
@@ -107,6 +114,7 @@ class HostState(object):
         if capabilities is None:
             capabilities = {}
         self.capabilities = ReadOnlyDict(capabilities.get(topic, None))
+        self._update_betas()
         if service is None:
             service = {}
         self.service = ReadOnlyDict(service)
@@ -122,7 +130,32 @@ class HostState(object):
         self.n_mem_vms = 0
         self.n_und_vms = 0
         #Eneaend
-        
+        # HostManager cache generation this state was built in.
+        self.generation = 0
+
+    def _update_betas(self):
+        """Workload class mix advertised by the host through
+        additional_compute_capabilities, e.g. beta_cpu=0.3.  Kept as
+        attributes so cost functions don't have to ask for them.
+        """
+        self.beta_cpu = self._float_capability('beta_cpu')
+        self.beta_io = self._float_capability('beta_io')
+        self.beta_mem = self._float_capability('beta_mem')
+        self.beta_und = self._float_capability('beta_und')
+
+    def update_capabilities(self, capabilities):
+        """Replace the capabilities with a newer report from the host."""
+        self.capabilities = ReadOnlyDict(capabilities)
+        self._update_betas()
+
+    def _float_capability(self, name):
+        """Return a numeric capability, 0.0 if missing or malformed."""
+        try:
+            return float(self.capabilities.get(name, 0.0))
+        except (TypeError, ValueError):
+            LOG.warn(_("Invalid %(name)s capability for host %(host)s") %
+                     {'name': name, 'host': self.host})
+            return 0.0
 
     def update_from_compute_node(self, compute):
         """Update information about a host from its compute_node info."""
@@ -130,10 +163,14 @@ class HostState(object):
         all_ram_mb = compute['memory_mb']
         vcpus_total = compute['vcpus']
         #Eneabegin
-        running_cpu_vms = compute['n_cpu_vms']
-        running_io_vms = compute['n_io_vms']
-        running_mem_vms = compute['n_mem_vms']
-        running_und_vms = compute['n_und_vms']
+        # NOTE: compute nodes created before the counters were added
+        # have NULL in these columns.  The columns are Float but count
+        # instances; keep them integral so the cost functions divide
+        # them the same way whether they come from here or from usage.
+        running_cpu_vms = int(compute.get('n_cpu_vms') or 0)
+        running_io_vms = int(compute.get('n_io_vms') or 0)
+        running_mem_vms = int(compute.get('n_mem_vms') or 0)
+        running_und_vms = int(compute.get('n_und_vms') or 0)
         #Eneaend
         if FLAGS.reserved_host_disk_mb > 0:
             all_disk_mb -= FLAGS.reserved_host_disk_mb
@@ -160,16 +197,23 @@ class HostState(object):
         #Eneabegin
         LOG.debug(_('Enea: consume_from_instance capabilities: %(instance information)s'),
                       {'instance information': instance})
-        if base64.b64decode(instance['user_data']) == 'cpu': 
-            self.n_cpu_vms += 1
-        if base64.b64decode(instance['user_data']) == 'io':    
-            self.n_io_vms += 1
-        if base64.b64decode(instance['user_data']) == 'mem':
-            self.n_mem_vms += 1
-        if base64.b64decode(instance['user_data']) == 'und': #da verificare, aggiungere con stringhe diverse
-            self.n_und_vms += 1
+        counter = workload_classes.counter_name(
+                workload_classes.get_workload_class(instance))
+        setattr(self, counter, getattr(self, counter) + 1)
         #Eneaend
 
+    def consume_from_usage(self, usage):
+        """Update information about a host from the aggregated usage of
+        its instances, as returned by db.instance_utilization_get_by_host.
+        """
+        self.free_ram_mb -= usage['memory_mb']
+        self.free_disk_mb -= usage['disk_gb'] * 1024
+        self.vcpus_used += usage['vcpus']
+        self.n_cpu_vms += usage['n_cpu_vms']
+        self.n_io_vms += usage['n_io_vms']
+        self.n_mem_vms += usage['n_mem_vms']
+        self.n_und_vms += usage['n_und_vms']
+
     def passes_filters(self, filter_fns, filter_properties):
         """Return whether or not this host passes filters."""
 
@@ -194,12 +238,6 @@ class HostState(object):
                 return False
 
         LOG.debug(_('Host filter passes for %(host)s'), {'host': self.host})
-        #Eneabegin
-        LOG.debug(_('Enea: Host filter function %(func)s worked for '
-                            '%(host)s'),
-                          {'func': repr(filter_fn),
-                           'host': self.host})
-        #Eneaend
         return True
 
     def __repr__(self):
@@ -215,6 +253,12 @@ class HostManager(object):
 
     def __init__(self):
         self.service_states = {}  # { <host> : { <service> : { cap k : v }}}
+        # { (<host>, <service>) : seq of the last capability update }
+        self.service_seqs = {}
+        # Cached compute HostStates, see get_all_host_states()
+        self.host_state_map = {}
+        self.host_state_generation = 0
+        self.host_state_reconciled_at = None
         self.filter_classes = filters.get_filter_classes(
                 FLAGS.scheduler_available_filters)
 
@@ -249,15 +293,75 @@ class HostManager(object):
             raise exception.SchedulerHostFilterNotFound(filter_name=msg)
         return good_filters
 
-    def filter_hosts(self, hosts, filter_properties, filters=None):
-        """Filter hosts and return only ones passing all filters"""
-        filtered_hosts = []
+    def filter_hosts(self, hosts, filter_properties, filters=None,
+                     trace=None):
+        """Filter hosts and return only ones passing all filters.
+
+        When a tracing.RequestTrace is given, each filter is run over all
+        the remaining hosts in turn so its time and the number of hosts it
+        eliminated can be recorded.
+        """
         filter_fns = self._choose_host_filters(filters)
+        if trace is not None:
+            return self._filter_hosts_traced(hosts, filter_properties,
+                                             filter_fns, trace)
+        filtered_hosts = []
         for host in hosts:
             if host.passes_filters(filter_fns, filter_properties):
                 filtered_hosts.append(host)
         return filtered_hosts
 
+    def _filter_hosts_traced(self, hosts, filter_properties, filter_fns,
+                             trace):
+        # Ignored and forced hosts first, as passes_filters() does
+        hosts = [host for host in hosts
+                 if host.passes_filters([], filter_properties)]
+        for filter_fn in filter_fns:
+            start = time.time()
+            passing = [host for host in hosts
+                       if host.passes_filters([filter_fn], filter_properties)]
+            trace.add(tracing.FILTER, tracing.fn_name(filter_fn),
+                      time.time() - start, len(hosts),
+                      len(hosts) - len(passing))
+            hosts = passing
+        return hosts
+
+    def filter_host_table(self, host_table, filter_properties, filters=None,
+                          trace=None):
+        """Filter the hosts of a HostTable, returning a boolean mask of
+        the hosts passing all filters.  Filters providing
+        host_passes_array() are evaluated on the whole table at once, the
+        others host by host.  The time spent in each filter is recorded in
+        trace when one is given.
+        """
+        ignore_hosts = filter_properties.get('ignore_hosts', [])
+        force_hosts = filter_properties.get('force_hosts', [])
+        if force_hosts:
+            return (host_table.mask_from_hosts(force_hosts) &
+                    ~host_table.mask_from_hosts(ignore_hosts))
+
+        mask = host_table.all_hosts()
+        if ignore_hosts:
+            mask &= ~host_table.mask_from_hosts(ignore_hosts)
+        for filter_fn in self._choose_host_filters(filters):
+            if not mask.any():
+                break
+            if trace is not None:
+                start = time.time()
+                hosts_in = mask.sum()
+            filter_obj = getattr(filter_fn, 'im_self', None)
+            array_fn = getattr(filter_obj, 'host_passes_array', None)
+            if array_fn is not None:
+                mask &= array_fn(host_table, filter_properties)
+            else:
+                mask &= host_table.host_passes(filter_fn, filter_properties,
+                                               mask)
+            if trace is not None:
+                trace.add(tracing.FILTER, tracing.fn_name(filter_fn),
+                          time.time() - start, int(hosts_in),
+                          int(hosts_in - mask.sum()))
+        return mask
+
     def get_host_list(self):
         """Returns a list of dicts for each host that the Zone Manager
         knows about. Each dict contains the host_name and the service
@@ -310,24 +414,42 @@ class HostManager(object):
         return combined"""
         return hosts_dict
         #Eneaend
-    def update_service_capabilities(self, service_name, host, capabilities):
-        """Update the per-service capabilities based on this notification."""
-        LOG.debug(_("Received %(service_name)s service update from "
-                    "%(host)s.") % locals())
-        #Eneabegin
-        LOG.debug(_("Enea: Received %(service_name)s service update from "
-                    "%(host)s, capabilities: %(capabilities)s") % locals())
-        #Eneaend
-        service_caps = self.service_states.get(host, {})
-        # Copy the capabilities, so we don't modify the original dict
-        capab_copy = dict(capabilities)
-        capab_copy["timestamp"] = utils.utcnow()  # Reported time
-        service_caps[service_name] = capab_copy
-        self.service_states[host] = service_caps
-        #Eneabegin
-        LOG.debug(_("Enea: Capabilities from host %(host)s: %(capabilities)s") % locals())
-        #LOG.debug(_("Enea: Host_state_cls from host %(host)s: %s")  % self.service_states[host][service_name])
-        #Eneaend
+    def update_service_capabilities(self, service_name, host, capabilities,
+                                    seq=None, full=True, removed=None):
+        """Update the per-service capabilities based on this notification.
+
+        A full update replaces the capabilities of the service.  A partial
+        one holds the changed capabilities and the names of the removed
+        ones, and is applied in place if its seq directly follows the last
+        update applied.  Otherwise it is dropped and True is returned so a
+        full update can be requested from the service.
+        """
+        LOG.debug(_("Received %(service_name)s service update %(seq)s from "
+                    "%(host)s: %(capabilities)s"),
+                  {'service_name': service_name, 'seq': seq, 'host': host,
+                   'capabilities': capabilities})
+        key = (host, service_name)
+        if full:
+            # Copy the capabilities, so we don't modify the original dict
+            caps = dict(capabilities)
+            self.service_states.setdefault(host, {})[service_name] = caps
+        else:
+            last_seq = self.service_seqs.get(key)
+            caps = self.service_states.get(host, {}).get(service_name)
+            if caps is None or last_seq is None or seq != last_seq + 1:
+                LOG.debug(_("Dropped %(service_name)s service update %(seq)s "
+                            "from %(host)s, last applied was %(last_seq)s"),
+                          locals())
+                return True
+            caps.update(capabilities)
+            for name in removed or []:
+                caps.pop(name, None)
+        caps["timestamp"] = utils.utcnow()  # Reported time
+        self.service_seqs[key] = seq
+        host_state = self.host_state_map.get(host)
+        if host_state and host_state.topic == service_name:
+            host_state.update_capabilities(caps)
+        return False
 
     def host_service_caps_stale(self, host, service):
         """Check if host service capabilites are not recent enough."""
@@ -344,9 +466,25 @@ class HostManager(object):
             service_caps = self.service_states[host]
             for service in services:
                 del service_caps[service]
+                self.service_seqs.pop((host, service), None)
                 if len(service_caps) == 0:  # Delete host if no services
                     del self.service_states[host]
 
+    def host_states_stale(self):
+        """Check if the cached host states must be rebuilt."""
+        if self.host_state_reconciled_at is None:
+            return True
+        interval = FLAGS.host_state_reconcile_interval
+        # Never keep a host state longer than a compute node may go
+        # without reporting in, or dead hosts would linger.
+        max_interval = FLAGS.service_down_time - FLAGS.report_interval
+        if max_interval > 0:
+            interval = min(interval, max_interval)
+        if interval <= 0:
+            return True
+        return ((utils.utcnow() - self.host_state_reconciled_at) >
+                datetime.timedelta(seconds=interval))
+
     def get_all_host_states(self, context, topic):
         """Returns a dict of all the hosts the HostManager
         knows about. Also, each of the consumable resources in HostState
@@ -355,15 +493,44 @@ class HostManager(object):
         For example:
         {'192.168.1.100': HostState(), ...}
 
-        Note: this can be very slow with a lot of instances.
-        InstanceType table isn't required since a copy is stored
-        with the instance (in case the InstanceType changed since the
-        instance was created)."""
+        The host states are cached between requests: resources consumed
+        by the scheduler stay claimed and capability updates are applied
+        to them in place.  The cache is rebuilt from the database every
+        host_state_reconcile_interval seconds, which bumps
+        host_state_generation.  Service liveness is re-read on every
+        request.
+        """
 
         if topic != 'compute':
             raise NotImplementedError(_(
                 "host_manager only implemented for 'compute'"))
 
+        if self.host_states_stale():
+            self.reconcile_host_states(context, topic)
+        else:
+            self.refresh_host_services(context, topic)
+        return self.host_state_map
+
+    def refresh_host_services(self, context, topic):
+        """Refresh the service record of the cached host states.
+
+        Filters check updated_at and disabled on every request, so they
+        must not come from the snapshot taken at the last reconcile.
+        """
+        for service in db.service_get_all(context):
+            if service['topic'] != topic:
+                continue
+            host_state = self.host_state_map.get(service['host'])
+            if host_state:
+                host_state.service = ReadOnlyDict(dict(service.iteritems()))
+
+    def reconcile_host_states(self, context, topic):
+        """Rebuild the cached host states from the database.
+
+        Only compute nodes and a per-host aggregate of the instances are
+        read, so the cost is O(hosts) rather than O(instances).
+        """
+        generation = self.host_state_generation + 1
         host_state_map = {}
 
         # Make a compute node dict with the bare essential metrics.
@@ -382,16 +549,21 @@ class HostManager(object):
                     capabilities=capabilities,
                     service=dict(service.iteritems()))
             host_state.update_from_compute_node(compute)
+            host_state.generation = generation
             host_state_map[host] = host_state
 
-        # "Consume" resources from the host the instance resides on.
-        instances = db.instance_get_all(context)
-        for instance in instances:
-            host = instance['host']
-            if not host:
-                continue
+        # "Consume" resources from the host the instances reside on.
+        usage_by_host = db.instance_utilization_get_by_host(context)
+        for host, usage in usage_by_host.iteritems():
             host_state = host_state_map.get(host, None)
             if not host_state:
                 continue
-            host_state.consume_from_instance(instance)
+            host_state.consume_from_usage(usage)
+
+        self.host_state_map = host_state_map
+        self.host_state_generation = generation
+        self.host_state_reconciled_at = utils.utcnow()
+        LOG.debug(_("Rebuilt %(count)d host states, generation "
+                    "%(generation)d") %
+                  {'count': len(host_state_map), 'generation': generation})
         return host_state_map
@@ -0,0 +1,207 @@
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Array backed view of the host states, used to filter and weigh all the
+hosts of a request at once.
+
+Each consumable resource of the HostStates is copied into a NumPy column.
+Filters providing host_passes_array() and cost functions registered in
+VECTOR_COST_FUNCTIONS operate on whole columns; any other filter or cost
+function is evaluated host by host.  NumPy is optional: when it is not
+installed the FilterScheduler keeps using the per host code path.
+"""
+
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from nova.compute import workload_classes
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
+from nova.scheduler import least_cost
+from nova.scheduler import tracing
+from nova import utils
+
+
+host_table_opts = [
+    cfg.BoolOpt('scheduler_use_host_table',
+                default=False,
+                help='Filter and weigh hosts with the NumPy backed host '
+                     'table (requires numpy)'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(host_table_opts)
+
+LOG = logging.getLogger(__name__)
+
+
+def enabled():
+    """Return whether the host table should be used."""
+    if not FLAGS.scheduler_use_host_table:
+        return False
+    if numpy is None:
+        LOG.warn(_("scheduler_use_host_table is set but numpy is not "
+                   "installed, using per host filtering"))
+        return False
+    return True
+
+
+class HostTable(object):
+    """Columns of host state values, one row per host."""
+
+    def __init__(self, host_states):
+        self.host_states = list(host_states)
+        count = len(self.host_states)
+
+        self.free_ram_mb = numpy.empty(count, dtype=float)
+        self.free_disk_mb = numpy.empty(count, dtype=float)
+        self.vcpus_total = numpy.empty(count, dtype=float)
+        self.vcpus_used = numpy.empty(count, dtype=float)
+        for name in workload_classes.ALL:
+            setattr(self, 'n_%s_vms' % name, numpy.empty(count, dtype=int))
+            setattr(self, 'beta_%s' % name, numpy.empty(count, dtype=float))
+        self.hosts = numpy.empty(count, dtype=object)
+        self.availability_zone = numpy.empty(count, dtype=object)
+        # Whether the compute service is up, enabled and not disabled.
+        # These don't change while a request is scheduled.
+        self.service_usable = numpy.empty(count, dtype=bool)
+
+        for index, host_state in enumerate(self.host_states):
+            self._load_row(index, host_state)
+            service = host_state.service
+            self.hosts[index] = host_state.host
+            self.availability_zone[index] = service.get('availability_zone')
+            self.service_usable[index] = (
+                    bool(service) and
+                    utils.service_is_up(service) and
+                    not service['disabled'] and
+                    host_state.capabilities.get('enabled', True))
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def _load_row(self, index, host_state):
+        self.free_ram_mb[index] = host_state.free_ram_mb
+        self.free_disk_mb[index] = host_state.free_disk_mb
+        self.vcpus_total[index] = host_state.vcpus_total
+        self.vcpus_used[index] = host_state.vcpus_used
+        for name in workload_classes.ALL:
+            attr = 'n_%s_vms' % name
+            getattr(self, attr)[index] = getattr(host_state, attr)
+            attr = 'beta_%s' % name
+            getattr(self, attr)[index] = getattr(host_state, attr, 0.0)
+
+    def all_hosts(self):
+        """Return a mask selecting every host."""
+        return numpy.ones(len(self), dtype=bool)
+
+    def no_hosts(self):
+        """Return a mask selecting no host."""
+        return numpy.zeros(len(self), dtype=bool)
+
+    def mask_from_hosts(self, hosts):
+        """Return a mask selecting the hosts named in hosts."""
+        hosts = set(hosts)
+        return numpy.fromiter((h in hosts for h in self.hosts), dtype=bool,
+                              count=len(self))
+
+    def host_passes(self, filter_fn, filter_properties, mask):
+        """Evaluate a per host filter function on the hosts in mask."""
+        result = self.no_hosts()
+        for index in numpy.flatnonzero(mask):
+            result[index] = bool(filter_fn(self.host_states[index],
+                                           filter_properties))
+        return result
+
+    def consume_from_instance(self, index, instance):
+        """Consume resources on a host and refresh its row."""
+        host_state = self.host_states[index]
+        host_state.consume_from_instance(instance)
+        self._load_row(index, host_state)
+
+
+def _noop_cost_fn_array(host_table, weighing_properties):
+    return numpy.ones(len(host_table))
+
+
+def _compute_fill_first_cost_fn_array(host_table, weighing_properties):
+    return host_table.free_ram_mb
+
+
+def _compute_fill_first_cost_Enea_fn_array(host_table, weighing_properties):
+    workload_class = least_cost.requested_workload_class(weighing_properties)
+    if workload_class not in workload_classes.ALL:
+        return numpy.zeros(len(host_table))
+    class_vms = getattr(host_table, 'n_%s_vms' % workload_class)
+    beta_host = getattr(host_table, 'beta_%s' % workload_class)
+    running_vms = (host_table.n_cpu_vms + host_table.n_io_vms +
+                   host_table.n_mem_vms + host_table.n_und_vms)
+    # The instance counters are integer columns and floor_divide keeps
+    # the integer division of the scalar least_cost function.
+    halve = running_vms != 0
+    class_vms = numpy.where(halve, numpy.floor_divide(class_vms, 2),
+                            class_vms)
+    running_vms = numpy.where(halve, numpy.floor_divide(running_vms, 2),
+                              running_vms)
+    new_beta = numpy.floor_divide(class_vms + 1, running_vms + 1)
+    return class_vms * 1000 - running_vms + (new_beta - beta_host)
+
+
+# Vector versions of the cost functions in least_cost.  They take the
+# HostTable instead of a HostState and return one cost per host.
+VECTOR_COST_FUNCTIONS = {
+    least_cost.noop_cost_fn: _noop_cost_fn_array,
+    least_cost.compute_fill_first_cost_fn: _compute_fill_first_cost_fn_array,
+    least_cost.compute_fill_first_cost_Enea_fn:
+            _compute_fill_first_cost_Enea_fn_array,
+}
+
+
+def weighted_sum(weighted_fns, host_table, mask, weighing_properties,
+                 trace=None):
+    """Vector version of least_cost.weighted_sum() over the hosts selected
+    by mask.  Returns the index of the host with the lowest score and a
+    WeightedHost for it.
+    """
+    indexes = numpy.flatnonzero(mask)
+    final_scores = numpy.zeros(len(indexes))
+    for weight, fn in weighted_fns:
+        if trace is not None:
+            start = time.time()
+        array_fn = VECTOR_COST_FUNCTIONS.get(fn)
+        if array_fn is not None:
+            scores = numpy.asarray(array_fn(host_table, weighing_properties),
+                                   dtype=float)[indexes]
+        else:
+            scores = numpy.fromiter(
+                    (fn(host_table.host_states[index], weighing_properties)
+                     for index in indexes),
+                    dtype=float, count=len(indexes))
+        final_scores += weight * scores
+        if trace is not None:
+            trace.add(tracing.COST_FUNCTION, tracing.fn_name(fn),
+                      time.time() - start, len(indexes))
+
+    # Lowest score is the winner!
+    best = indexes[numpy.argmin(final_scores)]
+    weight = final_scores.min()
+    return best, least_cost.WeightedHost(weight,
+            host_state=host_table.host_states[best])
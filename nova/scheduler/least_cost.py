@@ -22,16 +22,13 @@ The cost-function and weights are tabulated, and the host with the least cost
 is then selected for provisioning.
 """
 
+import time
+
+from nova.compute import workload_classes
 from nova import flags
 from nova import log as logging
 from nova.openstack.common import cfg
-import base64
-from nova.db import api as apidb
-from nova.scheduler import api
-from nova.scheduler import host_manager
-from nova.compute import manager
-from nova.compute import api as apicompute
-from nova import rpc
+from nova.scheduler import tracing
 
 
 LOG = logging.getLogger(__name__)
@@ -50,6 +47,10 @@ least_cost_opts = [
                help='How much weight to give the fill-first cost function. '
                     'A negative value will reverse behavior: '
                     'e.g. spread-first'),
+    cfg.FloatOpt('compute_fill_first_cost_Enea_fn_weight',
+             default=1.0,
+               help='How much weight to give the workload class cost '
+                    'function'),
     ]
 
 FLAGS = flags.FLAGS
@@ -85,99 +86,48 @@ def compute_fill_first_cost_fn(host_state, weighing_properties):
     ram will be preferred."""
     return host_state.free_ram_mb
 
+
+def requested_workload_class(weighing_properties):
+    """Return the workload class of the instance being scheduled."""
+    instance_properties = weighing_properties['request_spec'][
+            'instance_properties']
+    return workload_classes.get_workload_class(instance_properties)
+
+
 def compute_fill_first_cost_Enea_fn(host_state, weighing_properties):
-    #Ricordarsi di cambiare il flag in Nova per usare questa funzione al posto di quella originale
-    #Eneabegin
-    """Select host with ...."""
-    #Proprieta' dell'istanza richiesta, user_data indica la classe dell'istanza...
-    user_data_encode = weighing_properties['request_spec']['instance_properties']['user_data']
-    user_data=base64.b64decode(user_data_encode)
-    pesoA=1000;
-    pesoB=-1;
-    pesoC=1;
-    cost=0;
-    #host_state.capabilities
-    #capabilities is a dictionary?
-    #BetaCpuHost = host_state.capabilities
-    #capabilities = host_manager.HostManager.get_all_host_states(weighing_properties['context'], 'compute')
-    context=weighing_properties['context']
-    remote_address = context.remote_address
-    #capabilities=apicompute._cast_or_call_compute_message(rpc.call, '_get_additional_capabilities', context, host) 
-
-    #prende sempre lo stesso host
-    #capabilities=manager._get_additional_capabilities()
-    host=host_state.host
-    service_schedulers = apidb.service_get_all_by_topic(context, 'scheduler')
-    #choice the correct scheduler, it could be with the zone, now it choices the first
-    scheduler_host= service_schedulers[0]['host']
-    service='scheduler.'
-    service=service+scheduler_host
-    LOG.debug(_('Enea: scheduler host in scheduler-least_cost is %s') % service)
-    #da togliere rpc.call, blocca lo scheduler in attesa della risposta
-    #preferibile usare host_state del corretto host guardando i dizionari
-    caps = rpc.call(context, service, {"method": "get_service_capabilities","arg":{"host":host_state.host}})
-    #ricordarsi di cambiare essex1 con il nome variabile dell'host
-    #caps = rpc.call(context, 'scheduler.essex1', {"method": "get_service_capabilities","arg":{"host":host_state.host}})
-    #caps['compute_beta_cpu'][0]
-    LOG.debug(_('Enea: host_name in scheduler-least_cost is %s') % host_state.host)
-    LOG.debug(_('Enea: beta_cpu in scheduler-least_cost is %s') % caps[host]['compute']['beta_cpu'])
-    #BetaCpuHost = float(capabilities['beta_cpu'])
-    #BetaIoHost = float(capabilities['beta_io'])
-    #BetaMemHost = float(capabilities['beta_mem']) 
-    #BetaUndHost = float(capabilities['beta_und'])
-    #capabilities=api.get_service_capabilities(context)
-    BetaCpuHost = float(caps[host]['compute']['beta_cpu'])
-    BetaIoHost = float(caps[host]['compute']['beta_io'])
-    BetaMemHost = float(caps[host]['compute']['beta_mem'])
-    BetaUndHost = float(caps[host]['compute']['beta_und'])
-    #LOG.debug(_('Enea: capabilities: %s') % capabilities)
-    #LOG.debug(_('Enea: Host_state in scheduler-least_cost is %(host_state)s') % locals())
-    #LOG.debug(_('Enea: weighing_properties in scheduler-least_cost for host %(host_state.host)s is %(weighing_properties)s') % locals())
-    #LOG.debug(_('Enea: host_state_capabilities %(capabilities)s in '
-    #                    '%(host_name)s'),
-    #                    {'host_state_capabilities': capabilities,
-    #                    'host_name': host_state.host})
-    #Calcolo beta cappuccio, devo trovare il modo di passare la classe di istanza richiesta...
-    running_vms = host_state.n_cpu_vms + host_state.n_io_vms + host_state.n_mem_vms + host_state.n_und_vms
-    #LOG.debug(_('Enea: Running_vms in scheduler-least_cost is %(running_vms)s') % locals())
-    #LOG.debug(_('Enea: n_cpu_vms in scheduler-least_cost is %s') % host_state.n_cpu_vms/2)
-    #LOG.debug(_('Enea: Running_vms in scheduler-least_cost is %s') % running_vms/2)
-    if user_data == 'cpu':
-        if running_vms==0:
-                newBetaCpu = (host_state.n_cpu_vms+1)/(running_vms+1)
-                cost=(host_state.n_cpu_vms)*pesoA+pesoB*(running_vms)+pesoC*(newBetaCpu-BetaCpuHost)
-        else:
-                newBetaCpu = ((host_state.n_cpu_vms/2)+1)/((running_vms/2)+1)
-                cost=(host_state.n_cpu_vms/2)*pesoA+pesoB*(running_vms/2)+pesoC*(newBetaCpu-BetaCpuHost)
-    if user_data == 'io':
-        if running_vms==0:
-                newBetaIo = (host_state.n_io_vms+1)/(running_vms+1)
-                cost=(host_state.n_io_vms)*pesoA+pesoB*(running_vms)+pesoC*(newBetaIo-BetaIoHost)
-        else:
-                newBetaIo = ((host_state.n_io_vms/2)+1)/((running_vms/2)+1)
-                cost=(host_state.n_io_vms/2)*pesoA+pesoB*(running_vms/2)+pesoC*(newBetaIo-BetaIoHost)
-    if user_data == 'mem':
-        if running_vms==0:
-                newBetaMem = (host_state.n_mem_vms+1)/(running_vms+1)
-                cost=(host_state.n_mem_vms)*pesoA+pesoB*(running_vms)+pesoC*(newBetaMem-BetaMemHost)
-        else:
-                newBetaMem = ((host_state.n_mem_vms/2)+1)/((running_vms/2)+1)
-                cost=(host_state.n_mem_vms/2)*pesoA+pesoB*(running_vms/2)+pesoC*(newBetaMem-BetaMemHost)
-    if user_data == 'und':
-        if running_vms==0:
-                newBetaUnd = (host_state.n_und_vms+1)/(running_vms+1)
-                cost=(host_state.n_und_vms)*pesoA+pesoB*(running_vms)+pesoC*(newBetaUnd-BetaUndHost)
-        else:
-                newBetaUnd = ((host_state.n_und_vms/2)+1)/((running_vms/2)+1)
-                cost=(host_state.n_und_vms/2)*pesoA+pesoB*(running_vms/2)+pesoC*(newBetaUnd-BetaUndHost)
-
-    LOG.debug(_('Enea: Cost in scheduler least_cost is %(cost)s') % locals())
-    return cost
-#Eneaend
+    """Prefer hosts running few instances of the requested workload class,
+    then hosts running many instances, then hosts whose advertised class
+    mix (beta_<class> capabilities) is closest to the one resulting from
+    the placement.
 
+    The host capabilities are read from the HostState built by the
+    HostManager, so weighing doesn't do any DB or RPC call.
+    """
+    workload_class = requested_workload_class(weighing_properties)
+    if workload_class not in workload_classes.ALL:
+        return 0
+
+    pesoA = 1000
+    pesoB = -1
+    pesoC = 1
+
+    class_vms = getattr(host_state, 'n_%s_vms' % workload_class)
+    beta_host = getattr(host_state, 'beta_%s' % workload_class)
+    running_vms = (host_state.n_cpu_vms + host_state.n_io_vms +
+                   host_state.n_mem_vms + host_state.n_und_vms)
+    # NOTE: the counters read from the compute node already include the
+    # instances consumed again by the HostManager, hence the halving.
+    if running_vms != 0:
+        class_vms = class_vms / 2
+        running_vms = running_vms / 2
+    new_beta = (class_vms + 1) / (running_vms + 1)
+    return (class_vms * pesoA + pesoB * running_vms +
+            pesoC * (new_beta - beta_host))
+#Eneaend
 
 
-def weighted_sum(weighted_fns, host_states, weighing_properties):
+def weighted_sum(weighted_fns, host_states, weighing_properties,
+                 trace=None):
     """Use the weighted-sum method to compute a score for an array of objects.
 
     Normalize the results of the objective-functions so that the weights are
@@ -191,6 +141,9 @@ def weighted_sum(weighted_fns, host_states, weighing_properties):
     :param weighing_properties: an arbitrary dict of values that can
         influence weights.
 
+    :param trace: optional tracing.RequestTrace recording the time spent
+        in each function.
+
     :returns: a single WeightedHost object which represents the best
               candidate.
     """
@@ -199,8 +152,13 @@ def weighted_sum(weighted_fns, host_states, weighing_properties):
     # One row per host. One column per function.
     scores = []
     for weight, fn in weighted_fns:
+        if trace is not None:
+            start = time.time()
         scores.append([fn(host_state, weighing_properties)  #Enea: calcola tutte le funzioni fn
                 for host_state in host_states])
+        if trace is not None:
+            trace.add(tracing.COST_FUNCTION, tracing.fn_name(fn),
+                      time.time() - start, len(host_states))
 
     # Adjust the weights in the grid by the functions weight adjustment
     # and sum them up to get a final list of weights.
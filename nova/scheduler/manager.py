@@ -31,6 +31,8 @@ from nova import log as logging
 from nova import manager
 from nova.notifier import api as notifier
 from nova.openstack.common import cfg
+from nova import quota
+from nova import rpc
 from nova import utils
 
 
@@ -65,13 +67,27 @@ class SchedulerManager(manager.Manager):
         """Get the normalized set of capabilities for this zone."""
         return self.driver.get_service_capabilities()
 
+    def get_scheduler_stats(self, context, reset=False):
+        """Get the timing counters of the scheduling requests."""
+        return self.driver.get_scheduler_stats(reset=reset)
+
     def update_service_capabilities(self, context, service_name=None,
-            host=None, capabilities=None, **kwargs):
-        """Process a capability update from a service node."""
+            host=None, capabilities=None, seq=None, full=True, removed=None,
+            **kwargs):
+        """Process a capability update from a service node.  If it is a
+        partial update following one we missed, ask the service for its
+        full capabilities.
+        """
         if capabilities is None:
             capabilities = {}
-        self.driver.update_service_capabilities(service_name, host,
-                capabilities)
+        missed = self.driver.update_service_capabilities(service_name, host,
+                capabilities, seq=seq, full=full, removed=removed)
+        if missed:
+            LOG.info(_("Missed a capability update from %(service_name)s "
+                       "on %(host)s, requesting full capabilities") %
+                     locals())
+            rpc.cast(context, db.queue_get_for(context, service_name, host),
+                     {'method': 'request_full_capabilities', 'args': {}})
 
     def _schedule(self, method, context, topic, *args, **kwargs):
         """Tries to call schedule_* method on the driver to retrieve host.
@@ -170,6 +186,13 @@ class SchedulerManager(manager.Manager):
         notifier.notify(notifier.publisher_id("scheduler"),
                         'scheduler.' + method, notifier.ERROR, payload)
 
+    @manager.periodic_task(ticks_between_runs=FLAGS.quota_reconcile_interval)
+    def _reconcile_quota_usages(self, context):
+        """Roll back the expired quota reservations and correct the quota
+        usages which drifted from what the projects use.
+        """
+        quota.reconcile(context)
+
     # NOTE (masumotok) : This method should be moved to nova.api.ec2.admin.
     # Based on bexar design summit discussion,
     # just put this here for bexar release.
@@ -74,6 +74,9 @@ class MultiScheduler(driver.Scheduler):
         return self.drivers[topic].schedule(context, topic,
                 method, *_args, **_kwargs)
 
+    def get_scheduler_stats(self, reset=False):
+        return self.drivers['compute'].get_scheduler_stats(reset=reset)
+
     def schedule_run_instance(self, *args, **kwargs):
         return self.drivers['compute'].schedule_run_instance(*args, **kwargs)
 
@@ -0,0 +1,131 @@
+# Copyright (c) 2012 OpenStack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Timing of the steps of scheduling requests.
+
+A RequestTrace records, for one request, the wall time spent getting the
+host states, in each filter and in each cost function, and how many hosts
+each filter eliminated.  The scheduler driver adds every trace to its
+SchedulerStats, which `nova-manage scheduler stats` reads through the
+scheduler API.  Traces can also be sent as notifications.
+"""
+
+import contextlib
+import time
+
+from nova import flags
+from nova.notifier import api as notifier
+from nova.openstack.common import cfg
+
+
+tracing_opts = [
+    cfg.BoolOpt('scheduler_trace_notifications',
+                default=False,
+                help='Send a scheduler.trace notification with the timings '
+                     'of every scheduling request'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(tracing_opts)
+
+GET_HOST_STATES = 'get_all_host_states'
+FILTER = 'filter'
+COST_FUNCTION = 'cost_function'
+
+
+def fn_name(fn):
+    """Name under which the timings of a filter or cost function are
+    recorded: the filter class name for host_passes methods, the function
+    name otherwise.
+    """
+    filter_obj = getattr(fn, 'im_self', None)
+    if filter_obj is not None:
+        return filter_obj.__class__.__name__
+    return getattr(fn, '__name__', repr(fn))
+
+
+def _steps_to_list(steps):
+    result = []
+    for (kind, name), values in sorted(steps.iteritems()):
+        calls, seconds, hosts_in, hosts_eliminated = values
+        result.append(dict(kind=kind, name=name, calls=calls,
+                           seconds=seconds, hosts_in=hosts_in,
+                           hosts_eliminated=hosts_eliminated))
+    return result
+
+
+class RequestTrace(object):
+    """Timings of a single scheduling request."""
+
+    def __init__(self, topic):
+        self.topic = topic
+        self.started_at = time.time()
+        self.elapsed = 0.0
+        # {(kind, name): [calls, seconds, hosts_in, hosts_eliminated]}
+        self.steps = {}
+
+    def add(self, kind, name, elapsed, hosts_in=0, hosts_eliminated=0):
+        step = self.steps.setdefault((kind, name), [0, 0.0, 0, 0])
+        step[0] += 1
+        step[1] += elapsed
+        step[2] += hosts_in
+        step[3] += hosts_eliminated
+
+    @contextlib.contextmanager
+    def timed(self, kind, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(kind, name, time.time() - start)
+
+    def finish(self):
+        self.elapsed = time.time() - self.started_at
+
+    def to_dict(self):
+        return dict(topic=self.topic, elapsed=self.elapsed,
+                    steps=_steps_to_list(self.steps))
+
+
+class SchedulerStats(object):
+    """Counters summed over all the traced requests of a scheduler."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.requests = 0
+        self.elapsed = 0.0
+        self.steps = {}
+
+    def add(self, trace):
+        """Add a finished RequestTrace to the counters and send it as a
+        notification if scheduler_trace_notifications is set.
+        """
+        self.requests += 1
+        self.elapsed += trace.elapsed
+        for key, values in trace.steps.iteritems():
+            step = self.steps.setdefault(key, [0, 0.0, 0, 0])
+            for i, value in enumerate(values):
+                step[i] += value
+        if FLAGS.scheduler_trace_notifications:
+            notifier.notify(notifier.publisher_id('scheduler'),
+                            'scheduler.trace', notifier.INFO,
+                            trace.to_dict())
+
+    def to_dict(self):
+        return dict(requests=self.requests, elapsed=self.elapsed,
+                    steps=_steps_to_list(self.steps))
@@ -30,6 +30,7 @@ from nova import db
 from nova import exception
 from nova import flags
 from nova import log as logging
+from nova.notifier import api as notifier_api
 from nova.openstack.common import cfg
 from nova import rpc
 from nova import utils
@@ -263,6 +264,15 @@ class Service(object):
             except Exception:
                 pass
         self.timers = []
+        try:
+            self.manager.cleanup_host()
+        except Exception:
+            LOG.exception(_('Error during cleanup of %s'), self.topic)
+        try:
+            notifier_api.flush()
+        except Exception:
+            LOG.exception(_('Error flushing the notifications of %s'),
+                          self.topic)
 
     def wait(self):
         for x in self.timers:
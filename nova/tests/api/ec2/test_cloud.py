@@ -1061,6 +1061,54 @@ class CloudTestCase(test.TestCase):
 
         self._tearDownBlockDeviceMapping(inst1, inst2, volumes)
 
+    def test_describe_instances_prefetches(self):
+        """Make sure describe_instances reads what the instances refer to
+        for all of them at once
+        """
+        (inst1, inst2, volumes) = self._setUpBlockDeviceMapping()
+        kernel_uuid = 'f0cf55a0-33b1-4ba4-8ba5-e5a4d3e1e1a3'
+        db.instance_update(self.context, inst1['id'], {'vm_state': 'active'})
+        db.instance_update(self.context, inst2['id'],
+                           {'kernel_id': kernel_uuid, 'host': 'host2',
+                            'vm_state': 'active'})
+        comp = db.service_create(self.context, {'host': 'host2',
+                                                'availability_zone': 'zone2',
+                                                'topic': 'compute'})
+
+        def fail(*args, **kwargs):
+            raise test.TestingException()
+
+        self.stubs.Set(db, 'block_device_mapping_get_all_by_instance', fail)
+        self.stubs.Set(db, 's3_image_get_by_uuid', fail)
+        self.stubs.Set(db, 'service_get_all_by_host', fail)
+        self.stubs.Set(self.cloud.volume_api, 'get', fail)
+
+        result = self.cloud.describe_instances(self.context)
+        instances = {}
+        for reservation in result['reservationSet']:
+            for instance in reservation['instancesSet']:
+                instances[instance['instanceId']] = instance
+        self.assertEqual(len(instances), 2)
+        result = instances[self._expected_instance_bdm1['instanceId']]
+        self.assertSubDictMatch(self._expected_instance_bdm1, result)
+        self._assertEqualBlockDeviceMapping(
+            self._expected_block_device_mapping0, result['blockDeviceMapping'])
+        self.assertEqual(result['placement']['availabilityZone'],
+                         'unknown zone')
+        result = instances[self._expected_instance_bdm2['instanceId']]
+        self.assertSubDictMatch(self._expected_instance_bdm2, result)
+        self.assertEqual(result['placement']['availabilityZone'], 'zone2')
+        image_ids = ec2utils.glance_ids_to_ids(self.context,
+                ['cedef40a-ed67-4d10-800e-17455edce175', kernel_uuid])
+        self.assertEqual(result['imageId'], ec2utils.image_ec2_id(
+                image_ids['cedef40a-ed67-4d10-800e-17455edce175']))
+        self.assertEqual(result['kernelId'], ec2utils.image_ec2_id(
+                image_ids[kernel_uuid], 'aki'))
+
+        self.stubs.UnsetAll()
+        db.service_destroy(self.context, comp['id'])
+        self._tearDownBlockDeviceMapping(inst1, inst2, volumes)
+
     def test_describe_images(self):
         describe_images = self.cloud.describe_images
 
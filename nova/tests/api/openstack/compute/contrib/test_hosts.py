@@ -25,6 +25,7 @@ from nova import test
 from nova.api.openstack.compute.contrib import hosts as os_hosts
 from nova.compute import power_state
 from nova.compute import vm_states
+from nova.rpc import common as rpc_common
 from nova.scheduler import api as scheduler_api
 
 
@@ -64,6 +65,17 @@ def stub_host_power_action(context, host, action):
     return action
 
 
+def stub_set_hosts_enabled(context, hosts, enabled):
+    # 'host_c2' never answers
+    return dict((host, (None, rpc_common.Timeout()) if host == "host_c2"
+                 else ("enabled" if enabled else "disabled", None))
+                for host in hosts)
+
+
+def stub_hosts_power_action(context, hosts, action):
+    return dict((host, (action, None)) for host in hosts)
+
+
 def _create_instance(**kwargs):
     """Create a test instance"""
     ctxt = context.get_admin_context()
@@ -111,6 +123,10 @@ class HostTestCase(test.TestCase):
                        stub_set_host_maintenance)
         self.stubs.Set(self.controller.api, 'host_power_action',
                        stub_host_power_action)
+        self.stubs.Set(self.controller.api, 'set_hosts_enabled',
+                       stub_set_hosts_enabled)
+        self.stubs.Set(self.controller.api, 'hosts_power_action',
+                       stub_hosts_power_action)
 
     def _test_host_update(self, host, key, val, expected_value):
         body = {key: val}
@@ -155,6 +171,35 @@ class HostTestCase(test.TestCase):
         result = self.controller.reboot(self.req, "host_c1")
         self.assertEqual(result["power_action"], "reboot")
 
+    def test_update_many(self):
+        body = {"hosts": ["host_c1", "host_c2", "host_v1"],
+                "status": "Disable"}
+        result = self.controller.update_many(self.req, body=body)
+        hosts = result["hosts"]
+        self.assertEqual(hosts[0], {"host": "host_c1", "status": "disabled"})
+        self.assertEqual(hosts[1]["host"], "host_c2")
+        self.assertTrue("error" in hosts[1])
+        self.assertEqual(hosts[2], {"host": "host_v1",
+                                    "error": "Host not found"})
+
+    def test_update_many_bad_body(self):
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                self.controller.update_many, self.req,
+                body={"hosts": ["host_c1"], "status": "bad"})
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                self.controller.update_many, self.req,
+                body={"hosts": [], "status": "enable"})
+
+    def test_power_action_many(self):
+        body = {"hosts": ["host_c1", "host_c2"], "action": "reboot"}
+        result = self.controller.power_action(self.req, body=body)
+        self.assertEqual(result["hosts"],
+                         [{"host": "host_c1", "power_action": "reboot"},
+                          {"host": "host_c2", "power_action": "reboot"}])
+        self.assertRaises(webob.exc.HTTPBadRequest,
+                self.controller.power_action, self.req,
+                body={"hosts": ["host_c1"], "action": "explode"})
+
     def test_bad_status_value(self):
         bad_body = {"status": "bad"}
         self.assertRaises(webob.exc.HTTPBadRequest, self.controller.update,
@@ -327,3 +372,28 @@ class HostSerializerTest(test.TestCase):
         result = self.deserializer.deserialize(intext)
 
         self.assertEqual(dict(body=exemplar), result)
+
+    def test_hosts_action_serializer(self):
+        exemplar = {"hosts": [dict(host='host_c1', status='enabled'),
+                              dict(host='host_c2', error='Timeout')]}
+        serializer = os_hosts.HostsActionTemplate()
+        text = serializer.serialize(exemplar)
+
+        tree = etree.fromstring(text)
+
+        self.assertEqual('hosts', tree.tag)
+        self.assertEqual(len(tree), 2)
+        for i, host in enumerate(exemplar['hosts']):
+            self.assertEqual('host', tree[i].tag)
+            for key, value in host.items():
+                self.assertEqual(value, tree[i].get(key))
+
+    def test_hosts_deserializer(self):
+        deserializer = os_hosts.HostsDeserializer()
+        intext = ("<?xml version='1.0' encoding='UTF-8'?>\n"
+                  '<hosts><host>host_c1</host><host>host_c2</host>'
+                  '<status>disable</status></hosts>')
+        result = deserializer.deserialize(intext)
+
+        self.assertEqual(dict(body={'hosts': ['host_c1', 'host_c2'],
+                                    'status': 'disable'}), result)
@@ -154,9 +154,18 @@ def stub_out_rate_limiting(stubs):
 
 
 def stub_out_instance_quota(stubs, allowed):
+    orig_reserve = nova.quota.reserve
+
     def fake_allowed_instances(context, max_count, instance_type):
         return allowed
+
+    def fake_reserve(context, **deltas):
+        if deltas.get('instances', 0) > allowed:
+            raise exc.OverQuota(overs=['instances'])
+        return orig_reserve(context, **deltas)
+
     stubs.Set(nova.quota, 'allowed_instances', fake_allowed_instances)
+    stubs.Set(nova.quota, 'reserve', fake_reserve)
 
 
 def stub_out_networking(stubs):
@@ -495,12 +504,22 @@ def fake_instance_get(**kwargs):
 
 
 def fake_instance_get_all_by_filters(num_servers=5, **kwargs):
-    def _return_servers(context, *args, **kwargs):
+    def _return_servers(context, *args, **_kwargs):
         servers_list = []
+        marker = _kwargs.get('marker')
+        limit = _kwargs.get('limit')
+        found_marker = marker is None
         for i in xrange(num_servers):
-            server = stub_instance(id=i + 1, uuid=get_fake_uuid(i),
-                    **kwargs)
-            servers_list.append(server)
+            uuid = get_fake_uuid(i)
+            server = stub_instance(id=i + 1, uuid=uuid, **kwargs)
+            if found_marker:
+                servers_list.append(server)
+            elif uuid == marker:
+                found_marker = True
+        if not found_marker:
+            raise exc.MarkerNotFound(marker=marker)
+        if limit is not None:
+            servers_list = servers_list[:limit]
         return servers_list
     return _return_servers
 
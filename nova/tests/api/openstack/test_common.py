@@ -25,6 +25,9 @@ import webob.exc
 import xml.dom.minidom as minidom
 
 from nova import exception
+from nova import network
+from nova.network import model as network_model
+from nova.rpc import common as rpc_common
 from nova import test
 from nova.api.openstack import common
 from nova.api.openstack import xmlutil
@@ -195,6 +198,16 @@ class PaginationParamsTest(test.TestCase):
         self.assertEqual(common.get_pagination_params(req),
                          {'marker': marker, 'limit': 20})
 
+    def test_limit_and_marker(self):
+        """ Test the limit is capped and defaults to the maximum. """
+        marker = '263abb28-1de6-412f-b00b-f0ee0c4333c2'
+        req = webob.Request.blank('/?limit=2000&marker=%s' % marker)
+        self.assertEqual(common.get_limit_and_marker(req, max_limit=1000),
+                         (1000, marker))
+        req = webob.Request.blank('/')
+        self.assertEqual(common.get_limit_and_marker(req, max_limit=1000),
+                         (1000, None))
+
 
 class MiscFunctionsTest(test.TestCase):
 
@@ -328,6 +341,72 @@ class MiscFunctionsTest(test.TestCase):
         else:
             self.fail("webob.exc.HTTPConflict was not raised")
 
+    def _fake_instance(self, network_info, host='host1'):
+        return {'uuid': 'aaaa-bbbb', 'host': host,
+                'info_cache': {'network_info': network_info}}
+
+    def _fake_nw_info(self, address):
+        ip = network_model.FixedIP(address=address)
+        subnet = network_model.Subnet(cidr='10.0.0.0/24', ips=[ip])
+        network = network_model.Network(label='private', subnets=[subnet])
+        return network_model.NetworkInfo([network_model.VIF(id='vif1',
+                                                            network=network)])
+
+    def test_get_networks_for_instance_in_request(self):
+        instance = self._fake_instance(
+                self._fake_nw_info('10.0.0.2').as_cache())
+        request = webob.Request.blank('/')
+        request.environ['nova.context'] = None
+        hydrated = []
+        orig_hydrate = network_model.NetworkInfo.hydrate
+
+        def fake_hydrate(network_info):
+            hydrated.append(network_info)
+            return orig_hydrate(network_info)
+
+        self.stubs.Set(network_model.NetworkInfo, 'hydrate',
+                       staticmethod(fake_hydrate))
+        for _i in xrange(3):
+            networks = common.get_networks_for_instance_in_request(request,
+                                                                   instance)
+            self.assertEqual([ip['address']
+                              for ip in networks['private']['ips']],
+                             ['10.0.0.2'])
+        self.assertEqual(len(hydrated), 1)
+
+    def test_get_nw_info_for_instance_empty_cache(self):
+        asked = []
+
+        def fake_get_instance_nw_info(api, context, instance):
+            asked.append(instance['uuid'])
+            return self._fake_nw_info('10.0.0.3')
+
+        self.stubs.Set(network.API, 'get_instance_nw_info',
+                       fake_get_instance_nw_info)
+        nw_info = common.get_nw_info_for_instance(None,
+                self._fake_instance('[]'))
+        self.assertEqual(nw_info, [])
+        nw_info = common.get_nw_info_for_instance(None,
+                self._fake_instance(None, host=None))
+        self.assertEqual(nw_info, [])
+        self.assertEqual(asked, [])
+
+        # Never filled, the network service is asked for it
+        nw_info = common.get_nw_info_for_instance(None,
+                self._fake_instance(None))
+        self.assertEqual(nw_info.fixed_ips()[0]['address'], '10.0.0.3')
+        self.assertEqual(asked, ['aaaa-bbbb'])
+
+    def test_get_nw_info_for_instance_network_error(self):
+        def fake_get_instance_nw_info(api, context, instance):
+            raise rpc_common.Timeout()
+
+        self.stubs.Set(network.API, 'get_instance_nw_info',
+                       fake_get_instance_nw_info)
+        nw_info = common.get_nw_info_for_instance(None,
+                self._fake_instance(None))
+        self.assertEqual(nw_info, [])
+
 
 class MetadataXMLDeserializationTest(test.TestCase):
 
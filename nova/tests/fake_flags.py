@@ -44,3 +44,7 @@ FLAGS.set_default('sqlite_synchronous', False)
 flags.DECLARE('policy_file', 'nova.policy')
 flags.DECLARE('compute_scheduler_driver', 'nova.scheduler.multi')
 FLAGS.set_default('policy_file', 'nova/tests/policy.json')
+flags.DECLARE('quota_cache_ttl', 'nova.quota')
+flags.DECLARE('quota_usage_max_age', 'nova.quota')
+FLAGS.set_default('quota_cache_ttl', 0)
+FLAGS.set_default('quota_usage_max_age', 0)
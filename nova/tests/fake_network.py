@@ -146,9 +146,43 @@ class FakeNetworkManager(network_manager.NetworkManager):
             return [ip for ip in self.fixed_ips
                     if ip['virtual_interface_id'] == vif_id]
 
+        def fixed_ip_get_all_with_instance_uuid(self, context, address=None,
+                                                prefix=None):
+            result = []
+            for vif in self.vifs:
+                for fixed_ip in self.fixed_ips_by_virtual_interface(
+                        context, vif['id']):
+                    floating_addresses = [ip['address']
+                                          for ip in self.floating_ips
+                                          if ip['fixed_ip_id'] ==
+                                             fixed_ip['id']]
+                    addresses = [fixed_ip['address']] + floating_addresses
+                    if (address is None and prefix is None or
+                        fixed_ip['address'] == address or
+                        prefix is not None and
+                        [a for a in addresses if a.startswith(prefix)]):
+                        result.append(dict(
+                                address=fixed_ip['address'],
+                                floating_addresses=floating_addresses,
+                                vif_id=vif['id'],
+                                instance_id=vif['instance_id']))
+            return self._add_instance_uuids(context, result)
+
+        def virtual_interface_get_all_with_instance_uuid(self, context):
+            return self._add_instance_uuids(context,
+                                            [dict(vif) for vif in self.vifs])
+
+        def _add_instance_uuids(self, context, result):
+            uuid_map = self.instance_get_id_to_uuid_mapping(context,
+                    [datum['instance_id'] for datum in result])
+            for datum in result:
+                datum['instance_uuid'] = uuid_map.get(datum['instance_id'])
+            return result
+
     def __init__(self):
         self.db = self.FakeDB()
         self.deallocate_called = None
+        self._global_ipv6 = {}
 
     def deallocate_fixed_ip(self, context, address=None, host=None):
         self.deallocate_called = address
@@ -22,13 +22,16 @@ import tempfile
 
 from nova import context
 from nova import db
+from nova.db.sqlalchemy import api as sqlalchemy_api
 from nova import exception
 from nova import flags
+from nova import ipv6
 from nova import log as logging
 import nova.policy
 from nova import rpc
 from nova import test
 from nova import utils
+from nova.network import fixed_ip_pool
 from nova.network import linux_net
 from nova.network import manager as network_manager
 from nova.tests import fake_network
@@ -446,6 +449,58 @@ class VlanNetworkTestCase(test.TestCase):
         network['vpn_private_address'] = '192.168.0.2'
         self.network.allocate_fixed_ip(self.context, 0, network)
 
+    def test_allocate_fixed_ip_from_pool(self):
+        self.flags(fixed_ip_pool_size=3)
+        self.network = network_manager.VlanManager(host=HOST)
+        self.network.db = db
+        self.mox.StubOutWithMock(db, 'fixed_ip_reserve_pool')
+        self.mox.StubOutWithMock(db, 'fixed_ip_associate_reserved')
+        self.mox.StubOutWithMock(db, 'fixed_ip_update')
+        self.mox.StubOutWithMock(db,
+                              'virtual_interface_get_by_instance_and_network')
+        self.mox.StubOutWithMock(db, 'instance_get')
+
+        db.fixed_ip_reserve_pool(mox.IgnoreArg(), 0, HOST, 3).AndReturn(
+                ['192.168.0.3', '192.168.0.4', '192.168.0.5'])
+        # 192.168.0.3 was taken by address since it was reserved
+        db.fixed_ip_associate_reserved(mox.IgnoreArg(), HOST,
+                [('192.168.0.3', 0)]).AndReturn([])
+        db.fixed_ip_associate_reserved(mox.IgnoreArg(), HOST,
+                [('192.168.0.4', 0)]).AndReturn(['192.168.0.4'])
+        db.instance_get(mox.IgnoreArg(),
+                        mox.IgnoreArg()).AndReturn({'security_groups':
+                                                             [{'id': 0}]})
+        db.virtual_interface_get_by_instance_and_network(mox.IgnoreArg(),
+                mox.IgnoreArg(), mox.IgnoreArg()).AndReturn({'id': 0})
+        db.fixed_ip_update(mox.IgnoreArg(), '192.168.0.4', mox.IgnoreArg())
+        self.mox.ReplayAll()
+
+        network = dict(networks[0])
+        network['vpn_private_address'] = '192.168.0.2'
+        address = self.network.allocate_fixed_ip(self.context, 0, network)
+        self.assertEqual(address, '192.168.0.4')
+        self.assertEqual(self.network.fixed_ip_pool._free[0],
+                         ['192.168.0.5'])
+
+    def test_fixed_ip_pool_disassociates_when_out_of_ips(self):
+        pool = fixed_ip_pool.FixedIpPool(HOST, 2, db)
+        self.mox.StubOutWithMock(db, 'fixed_ip_reserve_pool')
+        self.mox.StubOutWithMock(db, 'fixed_ip_associate_reserved')
+        self.mox.StubOutWithMock(db, 'fixed_ip_disassociate')
+
+        db.fixed_ip_reserve_pool(mox.IgnoreArg(), 0, HOST, 2).AndReturn(
+                ['192.168.0.3', '192.168.0.4'])
+        # 192.168.0.4 was taken by address since it was reserved
+        db.fixed_ip_associate_reserved(mox.IgnoreArg(), HOST,
+                [('192.168.0.3', 1), ('192.168.0.4', 2)]).AndReturn(
+                        ['192.168.0.3'])
+        db.fixed_ip_reserve_pool(mox.IgnoreArg(), 0, HOST, 2).AndReturn([])
+        db.fixed_ip_disassociate(mox.IgnoreArg(), '192.168.0.3')
+        self.mox.ReplayAll()
+
+        self.assertRaises(exception.NoMoreFixedIps, pool.allocate,
+                          self.context, 0, [1, 2])
+
     def test_create_networks_too_big(self):
         self.assertRaises(ValueError, self.network.create_networks, None,
                           num_networks=4094, vlan_start=1)
@@ -561,15 +616,16 @@ class VlanNetworkTestCase(test.TestCase):
 
         self.stubs.Set(self.network.db, 'floating_ip_allocate_address', fake1)
 
-        # this time should raise
-        self.stubs.Set(self.network.db, 'floating_ip_count_by_project', fake2)
+        # this time should raise, the usage being recounted as
+        # quota_usage_max_age is 0
+        self.stubs.Set(sqlalchemy_api, 'floating_ip_count_by_project', fake2)
         self.assertRaises(exception.QuotaError,
                           self.network.allocate_floating_ip,
                           ctxt,
                           ctxt.project_id)
 
         # this time should not
-        self.stubs.Set(self.network.db, 'floating_ip_count_by_project', fake3)
+        self.stubs.Set(sqlalchemy_api, 'floating_ip_count_by_project', fake3)
         self.network.allocate_floating_ip(ctxt, ctxt.project_id)
 
     def test_deallocate_floating_ip(self):
@@ -1263,6 +1319,55 @@ class CommonNetworkTestCase(test.TestCase):
         self.assertEqual(len(res), 1)
         self.assertEqual(res[0]['instance_id'], _vifs[2]['instance_id'])
 
+    def test_get_instance_uuids_by_ip_cidr_and_floating(self):
+        manager = fake_network.FakeNetworkManager()
+        _vifs = manager.db.virtual_interface_get_all(None)
+        fake_context = context.RequestContext('user', 'project')
+
+        res = manager.get_instance_uuids_by_ip_filter(fake_context,
+                                                      {'ip': '172.16.0.0/24'})
+        self.assertEqual([(r['instance_id'], r['ip']) for r in res],
+                         [(_vifs[0]['instance_id'], '172.16.0.1'),
+                          (_vifs[1]['instance_id'], '172.16.0.2')])
+
+        res = manager.get_instance_uuids_by_ip_filter(fake_context,
+                                                      {'ip': '173.16.1.2'})
+        self.assertEqual([(r['instance_id'], r['ip']) for r in res],
+                         [(_vifs[2]['instance_id'], '173.16.1.2')])
+
+        res = manager.get_instance_uuids_by_ip_filter(fake_context,
+                                                      {'ip': '10.0.0.0/8'})
+        self.assertFalse(res)
+
+    def test_ip_filter_prefix(self):
+        for value, prefix in [('10.0.0.1', '10'),
+                              ('10\\.0\\.0\\.1', '10.0.0.1'),
+                              ('^10\\.0', '10.0'),
+                              ('^10\\.0\\.\\d+', '10.0.'),
+                              ('10\\.?1', '10'),
+                              ('172.16.0.*', '172'),
+                              ('172?', '17'),
+                              ('.*', ''),
+                              ('10|172', ''),
+                              ('10.1.0.0/16', '10.1.'),
+                              ('10.1.2.0/23', '10.1.'),
+                              ('fd00::/64', '')]:
+            self.assertEqual(network_manager.IPFilter(value).prefix, prefix)
+
+    def test_get_global_ipv6_remembered(self):
+        manager = fake_network.FakeNetworkManager()
+        fake_context = context.RequestContext('user', 'project')
+        vifs = manager.db.virtual_interface_get_all(None)
+        expected = manager._get_global_ipv6(fake_context, vifs)
+
+        self.mox.StubOutWithMock(ipv6, 'to_global')
+        self.mox.ReplayAll()
+        self.assertEqual(manager._get_global_ipv6(fake_context, vifs),
+                         expected)
+        # forgotten once the vif is gone
+        manager._get_global_ipv6(fake_context, vifs[1:])
+        self.assertEqual(sorted(manager._global_ipv6), [21, 31])
+
     def test_get_network(self):
         manager = fake_network.FakeNetworkManager()
         fake_context = context.RequestContext('user', 'project')
@@ -1399,6 +1504,38 @@ class AllocateTestCase(test.TestCase):
                                              host=self.network.host,
                                              project_id=project_id)
 
+    def test_allocate_for_instance_from_pool(self):
+        self.flags(fixed_ip_pool_size=4)
+        self.compute = self.start_service('compute')
+        self.network = self.start_service('network')
+        self.context = context.get_admin_context()
+
+        inst = db.instance_create(self.context, {'host': self.compute.host,
+                                                 'instance_type_id': 1})
+        networks = db.network_get_all(self.context)
+        for network in networks:
+            db.network_update(self.context, network['id'],
+                              {'host': self.network.host})
+        nw_info = self.network.allocate_for_instance(self.context,
+                                                 instance_id=inst['id'],
+                                                 instance_uuid='',
+                                                 host=inst['host'],
+                                                 vpn=None,
+                                                 rxtx_factor=3,
+                                                 project_id='fake')
+        fixed_ip = nw_info.fixed_ips()[0]['address']
+        fixed_ip_ref = db.fixed_ip_get_by_address(self.context, fixed_ip)
+        self.assertEqual(fixed_ip_ref['instance_id'], inst['id'])
+        self.assertEqual(fixed_ip_ref['pool_owner'], None)
+
+        def reserved():
+            return [ip for ip in db.fixed_ip_get_all(self.context)
+                    if ip['pool_owner'] == self.network.host]
+
+        self.assertEqual(len(reserved()), 3)
+        self.network.manager.cleanup_host()
+        self.assertEqual(reserved(), [])
+
 
 class FloatingIPTestCase(test.TestCase):
     """Tests nova.network.manager.FloatingIP"""
@@ -14,6 +14,8 @@
 #    under the License.
 
 import nova.db.api
+from nova import exception
+from nova.notifier import api as notifier_api
 from nova.notifier import capacity_notifier as cn
 from nova import test
 from nova import utils
@@ -47,7 +49,8 @@ class CapacityNotifierTestCase(test.TestCase):
 
     def test_update_called(self):
         def _verify_called(host, context, free_ram_mb_delta,
-                           free_disk_gb_delta, work_delta, vm_delta):
+                           free_disk_gb_delta, work_delta, vm_delta,
+                           **kwargs):
             self.assertEquals(free_ram_mb_delta, 123)
             self.assertEquals(free_disk_gb_delta, 456)
             self.assertEquals(vm_delta, -1)
@@ -57,3 +60,76 @@ class CapacityNotifierTestCase(test.TestCase):
                        _verify_called)
         msg = self._make_msg("myhost", "delete.end")
         self.assertTrue(cn.notify(msg))
+
+    def test_batched_updates(self):
+        self.flags(capacity_notifier_batch_interval_ms=60000,
+                   capacity_notifier_batch_max_events=3)
+        self.stubs.Set(cn, '_BATCH', cn.UtilizationBatch())
+        self.stubs.Set(nova.db.api, "compute_node_utilization_update",
+                       self.fail)
+        updates = []
+
+        def _update_many(context, deltas_by_host):
+            updates.append(deltas_by_host)
+            return []
+
+        self.stubs.Set(nova.db.api, "compute_node_utilization_update_many",
+                       _update_many)
+
+        self.assertTrue(cn.notify(self._make_msg("host1", "delete.end")))
+        self.assertTrue(cn.notify(self._make_msg("host2", "reboot.start")))
+        self.assertEquals(updates, [])
+        self.assertTrue(cn.notify(self._make_msg("host1", "delete.end")))
+        self.assertEquals(len(updates), 1)
+        self.assertEquals(updates[0]['host1']['free_ram_mb_delta'], 246)
+        self.assertEquals(updates[0]['host1']['free_disk_gb_delta'], 912)
+        self.assertEquals(updates[0]['host1']['vm_delta'], -2)
+        self.assertEquals(updates[0]['host1']['work_delta'], -2)
+        self.assertEquals(updates[0]['host2']['work_delta'], 1)
+
+        # Pending events are written on flush, e.g. when the service stops
+        self.assertTrue(cn.notify(self._make_msg("host2", "reboot.end")))
+        self.flags(notification_driver='nova.notifier.capacity_notifier')
+        notifier_api.flush()
+        self.assertEquals(len(updates), 2)
+        self.assertEquals(updates[1], {'host2': dict(
+                free_ram_mb_delta=0, free_disk_gb_delta=0, work_delta=-1,
+                vm_delta=0, n_cpu_delta=0, n_io_delta=0, n_mem_delta=0,
+                n_und_delta=0)})
+        cn.flush()
+        self.assertEquals(len(updates), 2)
+
+    def test_batched_updates_kept_on_failure(self):
+        self.flags(capacity_notifier_batch_interval_ms=60000,
+                   capacity_notifier_batch_max_events=2)
+        self.stubs.Set(cn, '_BATCH', cn.UtilizationBatch())
+        updates = []
+        failures = []
+
+        def _failing_update_many(context, deltas_by_host):
+            failures.append(deltas_by_host)
+            raise exception.DBError()
+
+        def _update_many(context, deltas_by_host):
+            updates.append(deltas_by_host)
+            return []
+
+        self.stubs.Set(nova.db.api, "compute_node_utilization_update_many",
+                       _failing_update_many)
+        self.assertTrue(cn.notify(self._make_msg("host1", "delete.end")))
+        self.assertTrue(cn.notify(self._make_msg("host1", "delete.end")))
+        self.assertEquals(len(failures), 1)
+        # Kept, and retried by the timer rather than by the next event
+        self.assertEquals(cn._BATCH.events, 0)
+        self.assertNotEqual(cn._BATCH._timer, None)
+        self.assertTrue(cn.notify(self._make_msg("host1", "delete.end")))
+        self.assertEquals(len(failures), 1)
+
+        self.stubs.Set(nova.db.api, "compute_node_utilization_update_many",
+                       _update_many)
+        cn.flush()
+        self.assertEquals(len(updates), 1)
+        self.assertEquals(updates[0]['host1']['vm_delta'], -3)
+        self.assertEquals(updates[0]['host1']['free_ram_mb_delta'], 369)
+        self.assertEquals(cn._BATCH.events, 0)
+        self.assertEquals(cn._BATCH._timer, None)
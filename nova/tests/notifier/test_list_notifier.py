@@ -16,6 +16,7 @@
 import nova
 from nova import log as logging
 import nova.notifier.api
+import nova.notifier.capacity_notifier
 import nova.notifier.log_notifier
 import nova.notifier.no_op_notifier
 from nova.notifier import list_notifier
@@ -82,3 +83,17 @@ class NotifierListTestCase(test.TestCase):
                 'event_type', nova.notifier.api.WARN, dict(a=3))
         self.assertEqual(self.exception_count, 2)
         self.assertEqual(self.notify_count, 1)
+
+    def test_flush(self):
+        self.flags(notification_driver='nova.notifier.list_notifier',
+                   list_notifier_drivers=['nova.notifier.no_op_notifier',
+                                          'nova.notifier.capacity_notifier'])
+        flushed = []
+
+        def mock_flush():
+            flushed.append(None)
+
+        self.stubs.Set(nova.notifier.capacity_notifier, 'flush', mock_flush)
+        nova.notifier.api.flush()
+        self.assertEqual(len(flushed), 1)
+        self.assertEqual(self.exception_count, 0)
@@ -0,0 +1,51 @@
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from nova.notifier import metadata_cache_notifier as mcn
+from nova import rpc
+from nova import test
+
+
+class MetadataCacheNotifierTestCase(test.TestCase):
+    """Test case for the metadata cache invalidating notifier."""
+
+    def setUp(self):
+        super(MetadataCacheNotifierTestCase, self).setUp()
+        self.casts = []
+
+        def fake_fanout_cast(context, topic, msg):
+            self.casts.append((topic, msg))
+
+        self.stubs.Set(rpc, 'fanout_cast', fake_fanout_cast)
+
+    def _make_msg(self, event):
+        return dict(publisher_id='compute.myhost',
+                    event_type='compute.instance.%s' % event,
+                    payload=dict(instance_id='fake-uuid'))
+
+    def test_event_type(self):
+        msg = self._make_msg('delete.end')
+        msg['event_type'] = 'random'
+        self.assertFalse(mcn.notify(msg))
+        self.assertFalse(mcn.notify(self._make_msg('delete.start')))
+        self.assertFalse(mcn.notify(self._make_msg('exists')))
+        self.assertEqual(self.casts, [])
+
+    def test_invalidate_cast(self):
+        self.assertTrue(mcn.notify(self._make_msg('delete.end')))
+        self.assertTrue(mcn.notify(self._make_msg('resize.end')))
+        msg = {'method': 'invalidate_instance',
+               'args': {'instance_uuid': 'fake-uuid'}}
+        self.assertEqual(self.casts, [('metadata_cache', msg)] * 2)
@@ -92,6 +92,69 @@ class BaseRpcTestCase(test.TestCase):
         for i, x in enumerate(result):
             self.assertEqual(value + i, x)
 
+    def test_cast_many(self):
+        """Make sure every message of a cast_many gets consumed"""
+        values = []
+
+        def fake_echo(context, value):
+            values.append(value)
+            return value
+
+        self.stubs.Set(TestReceiver, 'echo', staticmethod(fake_echo))
+        self.rpc.cast_many(self.context,
+                           [('test', {"method": "echo",
+                                      "args": {"value": value}})
+                            for value in xrange(3)])
+        self.rpc.cast_many(self.context,
+                           [('test', {"method": "echo",
+                                      "args": {"value": value}})
+                            for value in xrange(3, 5)], confirm=True)
+
+        # Wait for the casts to complete.
+        for x in xrange(50):
+            if len(values) == 5:
+                break
+            greenthread.sleep(0.1)
+        self.assertEqual(sorted(values), [0, 1, 2, 3, 4])
+
+    def test_call_many(self):
+        value = 42
+        results = self.rpc.call_many(self.context,
+                                     [('test', {"method": "echo",
+                                                "args": {"value": value}}),
+                                      ('test', {"method": "fail",
+                                                "args": {"value": value}}),
+                                      ('test', {"method":
+                                                    "echo_three_times_yield",
+                                                "args": {"value": value}})])
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0], (value, None))
+        self.assertEqual(results[1][0], None)
+        self.assertTrue(isinstance(results[1][1], rpc_common.RemoteError))
+        self.assertEqual(int(results[1][1].value), value)
+        self.assertEqual(results[2], (value + 2, None))
+
+    def test_call_many_timeout(self):
+        """Make sure call_many returns what answered before the deadline"""
+        if not self.supports_timeouts:
+            raise nose.SkipTest(_("RPC backend does not support timeouts"))
+
+        def fake_block(context, value):
+            # let the other call be answered meanwhile
+            greenthread.sleep(3)
+
+        self.stubs.Set(TestReceiver, 'block', staticmethod(fake_block))
+        value = 42
+        results = self.rpc.call_many(self.context,
+                                     [('test', {"method": "block",
+                                                "args": {"value": value}}),
+                                      ('test', {"method": "echo",
+                                                "args": {"value": value}})],
+                                     timeout=2)
+        self.assertEqual(results[0][0], None)
+        self.assertTrue(isinstance(results[0][1], rpc_common.Timeout))
+        self.assertEqual(results[1], (value, None))
+
     def test_context_passed(self):
         """Makes sure a context is passed through rpc call."""
         value = 42
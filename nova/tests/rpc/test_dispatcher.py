@@ -0,0 +1,156 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Unit Tests for the dispatch of the rpc messages consumed by a service
+"""
+
+import eventlet
+from eventlet import event
+
+from nova.rpc import dispatcher
+from nova import test
+
+
+class FakeProxy(object):
+    pass
+
+
+class HistogramTestCase(test.TestCase):
+    def test_percentiles(self):
+        histogram = dispatcher.Histogram()
+        for ms in range(1, 101):
+            histogram.add(ms / 1000.0)
+        self.assertEqual(histogram.count, 100)
+        self.assertEqual(histogram.percentile(50), 50.0)
+        self.assertEqual(histogram.percentile(99), 100.0)
+        self.assertAlmostEqual(histogram.max, 100.0)
+
+    def test_empty(self):
+        histogram = dispatcher.Histogram()
+        self.assertEqual(histogram.percentile(99), 0.0)
+        self.assertEqual(histogram.to_dict()['count'], 0)
+
+    def test_overflow_bucket(self):
+        histogram = dispatcher.Histogram()
+        histogram.add(90)
+        self.assertEqual(histogram.percentile(50), 90000.0)
+        self.assertEqual(histogram.to_dict()['buckets'][-1], (None, 1))
+
+
+class DispatcherTestCase(test.TestCase):
+    def setUp(self):
+        super(DispatcherTestCase, self).setUp()
+        self.started = []
+        self.events = {}
+
+    def tearDown(self):
+        # let the messages still waiting or running finish
+        for _i in xrange(10):
+            for waiter in self.events.values():
+                if not waiter.ready():
+                    waiter.send()
+            self._yield()
+        super(DispatcherTestCase, self).tearDown()
+
+    def _yield(self):
+        # the dispatcher yields between two messages
+        for _i in xrange(3):
+            eventlet.sleep(0)
+
+    def _work(self, name):
+        self.started.append(name)
+        self.events[name] = event.Event()
+        self.events[name].wait()
+
+    def _finish(self, name):
+        self.events[name].send()
+        self._yield()
+
+    def test_method_concurrency(self):
+        disp = dispatcher.Dispatcher(size=10, backlog=10,
+                                     limits={'slow': 2}, low_priority=[])
+        for i in xrange(4):
+            disp.dispatch('slow', self._work, i)
+        disp.dispatch('fast', self._work, 'fast')
+        eventlet.sleep(0)
+        self.assertEqual(self.started, [0, 1, 'fast'])
+        self.assertEqual(disp.waiting, 2)
+
+        self._finish(0)
+        self.assertEqual(self.started, [0, 1, 'fast', 2])
+
+    def test_low_priority_lane(self):
+        disp = dispatcher.Dispatcher(size=1, backlog=10, limits={},
+                                     low_priority=['caps'])
+        disp.dispatch('run', self._work, 'first')
+        disp.dispatch('caps', self._work, 'caps1')
+        disp.dispatch('caps', self._work, 'caps2')
+        disp.dispatch('run', self._work, 'second')
+        eventlet.sleep(0)
+        self.assertEqual(self.started, ['first'])
+
+        self._finish('first')
+        self._finish('second')
+        self._finish('caps1')
+        self.assertEqual(self.started, ['first', 'second', 'caps1', 'caps2'])
+
+    def test_backlog_blocks_consumer(self):
+        disp = dispatcher.Dispatcher(size=1, backlog=1, limits={},
+                                     low_priority=[])
+        disp.dispatch('run', self._work, 1)
+        disp.dispatch('run', self._work, 2)
+        self.assertEqual(disp.free(), 0)
+
+        consumer = eventlet.spawn(disp.dispatch, 'run', self._work, 3)
+        eventlet.sleep(0)
+        self.assertEqual(self.started, [1])
+        self.assertFalse(consumer.dead)
+
+        self._finish(1)
+        consumer.wait()
+        self.assertEqual(self.started, [1, 2])
+        self.assertEqual(disp.waiting, 1)
+
+    def test_exception_does_not_stop_dispatch(self):
+        disp = dispatcher.Dispatcher(size=1, backlog=10, limits={},
+                                     low_priority=[])
+        disp.dispatch('run', self._work, 'first')
+
+        def fail():
+            raise test.TestingException()
+
+        disp.dispatch('run', fail)
+        disp.dispatch('run', self._work, 'last')
+        eventlet.sleep(0)
+        self._finish('first')
+        self.assertEqual(self.started, ['first', 'last'])
+        self.assertEqual(disp.running, 1)
+
+    def test_stats(self):
+        proxy = FakeProxy()
+        disp = dispatcher.get_dispatcher(proxy)
+        self.assertTrue(dispatcher.get_dispatcher(proxy) is disp)
+        disp.dispatch('run', lambda: None)
+        disp.dispatch('run', lambda: None)
+        eventlet.sleep(0)
+
+        stats = dispatcher.get_stats(proxy, reset=True)
+        self.assertEqual(stats.keys(), ['run'])
+        self.assertEqual(stats['run']['wait']['count'], 2)
+        self.assertEqual(stats['run']['run']['count'], 2)
+        self.assertEqual(dispatcher.get_stats(proxy), {})
+        self.assertEqual(dispatcher.get_stats(FakeProxy()), {})
@@ -19,6 +19,8 @@
 Unit Tests for remote procedure calls using kombu
 """
 
+import kombu.messaging
+
 from nova import context
 from nova import flags
 from nova import log as logging
@@ -86,6 +88,45 @@ class RpcKombuTestCase(common.BaseRpcAMQPTestCase):
 
         self.assertEqual(self.received_message, message)
 
+    def test_topic_send_many_receive(self):
+        """Test sending to several topics in one go"""
+
+        conn = self.rpc.create_connection()
+        received = []
+
+        conn.declare_topic_consumer('a_topic', received.append)
+        conn.declare_topic_consumer('b_topic', received.append)
+        conn.topic_send_many([('a_topic', 'a message'),
+                              ('b_topic', 'b message')])
+        conn.consume(limit=2)
+        conn.close()
+
+        self.assertEqual(sorted(received), ['a message', 'b message'])
+
+    def test_topic_send_many_resumes_after_reconnect(self):
+        """Test that messages already published are not sent again"""
+
+        conn = self.rpc.create_connection()
+        received = []
+        info = {'failed': False}
+        orig_publish = kombu.messaging.Producer.publish
+
+        def fake_publish(producer, msg, **kwargs):
+            if msg == 'b message' and not info['failed']:
+                info['failed'] = True
+                raise MyException('foo timeout foo')
+            return orig_publish(producer, msg, **kwargs)
+
+        self.stubs.Set(kombu.messaging.Producer, 'publish', fake_publish)
+        conn.declare_topic_consumer('a_topic', received.append)
+        conn.topic_send_many([('a_topic', 'a message'),
+                              ('a_topic', 'b message')])
+        conn.consume(limit=2)
+        conn.close()
+
+        self.assertTrue(info['failed'])
+        self.assertEqual(received, ['a message', 'b message'])
+
     def test_direct_send_receive(self):
         """Test sending to a direct exchange/queue"""
         conn = self.rpc.create_connection()
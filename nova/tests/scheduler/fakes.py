@@ -38,22 +38,21 @@ COMPUTE_NODES = [
         dict(id=5, local_gb=1024, memory_mb=1024, vcpus=1, service=None),
 ]
 
-INSTANCES = [
-        dict(root_gb=512, ephemeral_gb=0, memory_mb=512, vcpus=1,
-             host='host1'),
-        dict(root_gb=512, ephemeral_gb=0, memory_mb=512, vcpus=1,
-             host='host2'),
-        dict(root_gb=512, ephemeral_gb=0, memory_mb=512, vcpus=1,
-             host='host2'),
-        dict(root_gb=1024, ephemeral_gb=0, memory_mb=1024, vcpus=1,
-             host='host3'),
-        # Broken host
-        dict(root_gb=1024, ephemeral_gb=0, memory_mb=1024, vcpus=1,
-             host=None),
+
+def _instance_usage(vms, vcpus, memory_mb, disk_gb):
+    return dict(running_vms=vms, vcpus=vcpus, memory_mb=memory_mb,
+                disk_gb=disk_gb, current_workload=0, n_cpu_vms=0,
+                n_io_vms=0, n_mem_vms=0, n_und_vms=vms)
+
+
+# As returned by db.instance_utilization_get_by_host
+INSTANCE_USAGE = {
+        'host1': _instance_usage(1, 1, 512, 512),
+        'host2': _instance_usage(2, 2, 1024, 1024),
+        'host3': _instance_usage(1, 1, 1024, 1024),
         # No matching host
-        dict(root_gb=1024, ephemeral_gb=0, memory_mb=1024, vcpus=1,
-             host='host5'),
-]
+        'host5': _instance_usage(1, 1, 1024, 1024),
+}
 
 
 class FakeFilterScheduler(filter_scheduler.FilterScheduler):
@@ -136,7 +135,8 @@ class FakeComputeAPI(object):
 
 def mox_host_manager_db_calls(mock, context):
     mock.StubOutWithMock(db, 'compute_node_get_all')
-    mock.StubOutWithMock(db, 'instance_get_all')
+    mock.StubOutWithMock(db, 'instance_utilization_get_by_host')
 
     db.compute_node_get_all(mox.IgnoreArg()).AndReturn(COMPUTE_NODES)
-    db.instance_get_all(mox.IgnoreArg()).AndReturn(INSTANCES)
+    db.instance_utilization_get_by_host(mox.IgnoreArg()).AndReturn(
+            INSTANCE_USAGE)
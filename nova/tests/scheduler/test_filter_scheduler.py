@@ -20,15 +20,18 @@ import mox
 
 from nova import context
 from nova import exception
+from nova.notifier import api as notifier
+from nova.scheduler import driver
 from nova.scheduler import least_cost
 from nova.scheduler import host_manager
 from nova.scheduler import filter_scheduler
+from nova.scheduler import tracing
 from nova import test
 from nova.tests.scheduler import fakes
 from nova.tests.scheduler import test_scheduler
 
 
-def fake_filter_hosts(hosts, filter_properties):
+def fake_filter_hosts(hosts, filter_properties, trace=None):
     return list(hosts)
 
 
@@ -89,19 +92,17 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         instance_opts = {'fake_opt1': 'meow'}
         request_spec = {'num_instances': 2,
                         'instance_properties': instance_opts}
-        instance1 = {'uuid': 'fake-uuid1'}
-        instance2 = {'uuid': 'fake-uuid2'}
-
-        def _has_launch_index(expected_index):
-            """Return a function that verifies the expected index."""
-            def _check_launch_index(value):
-                if 'instance_properties' in value:
-                    if 'launch_index' in value['instance_properties']:
-                        index = value['instance_properties']['launch_index']
-                        if index == expected_index:
-                            return True
-                return False
-            return _check_launch_index
+        instance1 = {'uuid': 'fake-uuid1', 'id': 1, 'host': 'host1'}
+        instance2 = {'uuid': 'fake-uuid2', 'id': 2, 'host': 'host2'}
+        weighted_hosts = [
+            least_cost.WeightedHost(1.0,
+                host_state=fakes.FakeHostState('host1', 'compute', {})),
+            least_cost.WeightedHost(2.0,
+                host_state=fakes.FakeHostState('host2', 'compute', {}))]
+
+        def _has_launch_indexes(values):
+            return ([v['launch_index'] for v in values] == [0, 1] and
+                    [v['host'] for v in values] == ['host1', 'host2'])
 
         class ContextFake(object):
             def elevated(self):
@@ -109,23 +110,100 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         context_fake = ContextFake()
 
         self.mox.StubOutWithMock(self.driver, '_schedule')
-        self.mox.StubOutWithMock(self.driver, '_provision_resource')
+        self.mox.StubOutWithMock(self.driver, 'create_instance_db_entries')
+        self.mox.StubOutWithMock(driver, 'cast_to_compute_hosts')
+
+        def _has_casts(casts):
+            return sorted(casts) == [
+                    ('host1', 'run_instance',
+                     dict(fake_kwargs, instance_uuid='fake-uuid1')),
+                    ('host2', 'run_instance',
+                     dict(fake_kwargs, instance_uuid='fake-uuid2'))]
 
         self.driver._schedule(context_fake, 'compute',
                               request_spec, **fake_kwargs
-                              ).AndReturn(['host1', 'host2'])
-        # instance 1
-        self.driver._provision_resource(
-            ctxt, 'host1',
-            mox.Func(_has_launch_index(0)), fake_kwargs).AndReturn(instance1)
-        # instance 2
-        self.driver._provision_resource(
-            ctxt, 'host2',
-            mox.Func(_has_launch_index(1)), fake_kwargs).AndReturn(instance2)
+                              ).AndReturn(weighted_hosts)
+        self.driver.create_instance_db_entries(ctxt, request_spec,
+                mox.Func(_has_launch_indexes)).AndReturn(
+                        [instance1, instance2])
+        driver.cast_to_compute_hosts(ctxt, mox.Func(_has_casts))
         self.mox.ReplayAll()
 
-        self.driver.schedule_run_instance(context_fake, request_spec,
-                                          **fake_kwargs)
+        instances = self.driver.schedule_run_instance(context_fake,
+                request_spec, **fake_kwargs)
+        self.assertEqual([i['id'] for i in instances], [1, 2])
+
+    def test_provision_resources_batches_per_host(self):
+        self.flags(scheduler_batch_run_instances=True)
+        ctxt = context.RequestContext('user', 'project')
+        request_spec = {'num_instances': 3, 'instance_properties': {}}
+        fake_kwargs = {'fake_kwarg1': 'fake_value1'}
+        weighted_hosts = [
+            least_cost.WeightedHost(1.0,
+                host_state=fakes.FakeHostState(host, 'compute', {}))
+            for host in ('host1', 'host2', 'host1')]
+        instances = [{'uuid': 'fake-uuid%d' % i, 'id': i, 'host': host}
+                     for i, host in enumerate(('host1', 'host2', 'host1'))]
+
+        notifications = []
+
+        def fake_notify(publisher_id, event_type, priority, payload):
+            notifications.append((event_type, payload))
+
+        self.stubs.Set(notifier, 'notify', fake_notify)
+        self.mox.StubOutWithMock(self.driver, 'create_instance_db_entries')
+        self.mox.StubOutWithMock(driver, 'cast_to_compute_hosts')
+
+        def _has_casts(casts):
+            return sorted(casts) == [
+                    ('host1', 'run_instances',
+                     dict(fake_kwargs,
+                          instance_uuids=['fake-uuid0', 'fake-uuid2'])),
+                    ('host2', 'run_instance',
+                     dict(fake_kwargs, instance_uuid='fake-uuid1'))]
+
+        self.driver.create_instance_db_entries(ctxt, request_spec,
+                mox.IgnoreArg()).AndReturn(instances)
+        driver.cast_to_compute_hosts(ctxt, mox.Func(_has_casts))
+        self.mox.ReplayAll()
+
+        self.driver._provision_resources(ctxt, weighted_hosts, request_spec,
+                                         fake_kwargs)
+        self.assertEqual(len(notifications), 1)
+        event_type, payload = notifications[0]
+        self.assertEqual(event_type, 'scheduler.run_instance.scheduled')
+        self.assertEqual([i['instance_id'] for i in payload['instances']],
+                         ['fake-uuid0', 'fake-uuid1', 'fake-uuid2'])
+
+    def test_provision_resources_casts_run_instance_by_default(self):
+        ctxt = context.RequestContext('user', 'project')
+        request_spec = {'num_instances': 2, 'instance_properties': {}}
+        fake_kwargs = {'fake_kwarg1': 'fake_value1'}
+        weighted_hosts = [
+            least_cost.WeightedHost(1.0,
+                host_state=fakes.FakeHostState('host1', 'compute', {}))
+            for i in xrange(2)]
+        instances = [{'uuid': 'fake-uuid%d' % i, 'id': i, 'host': 'host1'}
+                     for i in xrange(2)]
+
+        self.stubs.Set(notifier, 'notify', lambda *args: None)
+        self.mox.StubOutWithMock(self.driver, 'create_instance_db_entries')
+        self.mox.StubOutWithMock(driver, 'cast_to_compute_hosts')
+
+        def _has_casts(casts):
+            return casts == [
+                    ('host1', 'run_instance',
+                     dict(fake_kwargs, instance_uuid='fake-uuid0')),
+                    ('host1', 'run_instance',
+                     dict(fake_kwargs, instance_uuid='fake-uuid1'))]
+
+        self.driver.create_instance_db_entries(ctxt, request_spec,
+                mox.IgnoreArg()).AndReturn(instances)
+        driver.cast_to_compute_hosts(ctxt, mox.Func(_has_casts))
+        self.mox.ReplayAll()
+
+        self.driver._provision_resources(ctxt, weighted_hosts, request_spec,
+                                         fake_kwargs)
 
     def test_schedule_happy_day(self):
         """Make sure there's nothing glaringly wrong with _schedule()
@@ -133,7 +211,7 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
 
         self.next_weight = 1.0
 
-        def _fake_weighted_sum(functions, hosts, options):
+        def _fake_weighted_sum(functions, hosts, options, trace=None):
             self.next_weight += 2.0
             host_state = hosts[0]
             return least_cost.WeightedHost(self.next_weight,
@@ -164,6 +242,12 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
         for weighted_host in weighted_hosts:
             self.assertTrue(weighted_host.host_state is not None)
 
+        stats = sched.get_scheduler_stats()
+        self.assertEquals(stats['requests'], 1)
+        self.assertEquals(stats['steps'][0]['kind'],
+                          tracing.GET_HOST_STATES)
+        self.assertEquals(stats['steps'][0]['calls'], 1)
+
     def test_get_cost_functions(self):
         self.flags(reserved_host_memory_mb=128)
         fixture = fakes.FakeFilterScheduler()
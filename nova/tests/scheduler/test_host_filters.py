@@ -21,6 +21,7 @@ from nova import context
 from nova import exception
 from nova import flags
 from nova.scheduler import filters
+from nova.scheduler.filters import json_filter
 from nova import test
 from nova.tests.scheduler import fakes
 from nova import utils
@@ -559,6 +560,44 @@ class HostFiltersTestCase(test.TestCase):
         filter_properties = {'query': json.dumps(raw)}
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    def test_json_filter_caches_compiled_query(self):
+        self.stubs.Set(utils, 'service_is_up', lambda service: True)
+        self.stubs.Set(json_filter, '_PLAN_CACHE', json_filter.PlanCache())
+        filt_cls = self.class_map['JsonFilter']()
+        compiled = []
+        real_compile = filt_cls._compile
+
+        def fake_compile(query):
+            compiled.append(query)
+            return real_compile(query)
+
+        self.stubs.Set(filt_cls, '_compile', fake_compile)
+        filter_properties = {'query': self.json_query}
+        service = {'disabled': False}
+        for free_ram_mb in (512, 1024, 2048):
+            host = fakes.FakeHostState('host1', 'compute',
+                    {'free_ram_mb': free_ram_mb,
+                     'free_disk_mb': 200 * 1024,
+                     'service': service})
+            self.assertEqual(free_ram_mb >= 1024,
+                    filt_cls.host_passes(host, filter_properties))
+        # The query and its two sub queries are compiled for the first
+        # host only
+        self.assertEqual(len(compiled), 3)
+        self.assertEqual(compiled[0], json.loads(self.json_query))
+
+    def test_json_filter_plan_cache_evicts_least_recently_used(self):
+        self.flags(json_filter_plan_cache_size=2)
+        cache = json_filter.PlanCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
     def test_core_filter_passes(self):
         filt_cls = self.class_map['CoreFilter']()
         filter_properties = {'instance_type': {'vcpus': 1}}
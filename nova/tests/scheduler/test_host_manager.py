@@ -20,7 +20,9 @@ import datetime
 
 from nova import db
 from nova import exception
+from nova.scheduler.filters import compute_filter
 from nova.scheduler import host_manager
+from nova.scheduler import tracing
 from nova import test
 from nova.tests.scheduler import fakes
 from nova import utils
@@ -87,6 +89,31 @@ class HostManagerTestCase(test.TestCase):
         self.assertEqual(len(filtered_hosts), 1)
         self.assertEqual(filtered_hosts[0], fake_host2)
 
+    def test_filter_hosts_traced(self):
+        class FakeFilter(object):
+            def __init__(self, passing):
+                self.passing = passing
+
+            def host_passes(self, host_state, filter_properties):
+                return host_state.host in self.passing
+
+        topic = 'fake_topic'
+        hosts = [host_manager.HostState('host%d' % i, topic)
+                 for i in xrange(4)]
+        filter_fns = [FakeFilter(['host0', 'host1', 'host2']).host_passes,
+                      FakeFilter(['host1']).host_passes]
+        self.stubs.Set(self.host_manager, '_choose_host_filters',
+                       lambda filters: filter_fns)
+
+        trace = tracing.RequestTrace(topic)
+        filtered_hosts = self.host_manager.filter_hosts(hosts,
+                {'ignore_hosts': ['host2']}, trace=trace)
+        self.assertEqual(filtered_hosts, [hosts[1]])
+        # host2 is ignored before the filters run
+        self.assertEqual(trace.steps[(tracing.FILTER, 'FakeFilter')][0], 2)
+        self.assertEqual(trace.steps[(tracing.FILTER, 'FakeFilter')][2:],
+                         [3 + 2, 1 + 1])
+
     def test_update_service_capabilities(self):
         service_states = self.host_manager.service_states
         self.assertDictMatch(service_states, {})
@@ -122,6 +149,49 @@ class HostManagerTestCase(test.TestCase):
                     'host2': {'compute': host2_compute_capabs}}
         self.assertDictMatch(service_states, expected)
 
+    def test_update_service_capabilities_partial(self):
+        self.host_manager.update_service_capabilities('compute', 'host1',
+                dict(free_memory=1234, host_memory=5678, beta_cpu=0.5),
+                seq=1)
+        host_state = host_manager.HostState('host1', 'compute',
+                capabilities=self.host_manager.service_states['host1'])
+        self.host_manager.host_state_map = {'host1': host_state}
+
+        missed = self.host_manager.update_service_capabilities('compute',
+                'host1', dict(free_memory=1000, beta_cpu=0.25), seq=2,
+                full=False, removed=['host_memory'])
+        self.assertFalse(missed)
+        caps = self.host_manager.service_states['host1']['compute']
+        self.assertEqual(caps['free_memory'], 1000)
+        self.assertFalse('host_memory' in caps)
+        self.assertEqual(host_state.capabilities['free_memory'], 1000)
+        self.assertEqual(host_state.beta_cpu, 0.25)
+
+    def test_update_service_capabilities_missed(self):
+        # Partial update before any full one
+        self.assertTrue(self.host_manager.update_service_capabilities(
+                'compute', 'host1', dict(free_memory=1000), seq=2,
+                full=False, removed=[]))
+        self.assertFalse('host1' in self.host_manager.service_states)
+
+        self.host_manager.update_service_capabilities('compute', 'host1',
+                dict(free_memory=1234), seq=1)
+        # Update 2 was lost
+        self.assertTrue(self.host_manager.update_service_capabilities(
+                'compute', 'host1', dict(free_memory=1000), seq=3,
+                full=False, removed=[]))
+        caps = self.host_manager.service_states['host1']['compute']
+        self.assertEqual(caps['free_memory'], 1234)
+
+        # A full update gets the host back in sync
+        self.host_manager.update_service_capabilities('compute', 'host1',
+                dict(free_memory=800), seq=4)
+        self.assertFalse(self.host_manager.update_service_capabilities(
+                'compute', 'host1', dict(free_memory=700), seq=5,
+                full=False, removed=[]))
+        caps = self.host_manager.service_states['host1']['compute']
+        self.assertEqual(caps['free_memory'], 700)
+
     def test_host_service_caps_stale(self):
         self.flags(periodic_interval=5)
 
@@ -245,12 +315,13 @@ class HostManagerTestCase(test.TestCase):
 
         self.mox.StubOutWithMock(db, 'compute_node_get_all')
         self.mox.StubOutWithMock(host_manager.LOG, 'warn')
-        self.mox.StubOutWithMock(db, 'instance_get_all')
+        self.mox.StubOutWithMock(db, 'instance_utilization_get_by_host')
 
         db.compute_node_get_all(context).AndReturn(fakes.COMPUTE_NODES)
         # Invalid service
         host_manager.LOG.warn("No service for compute ID 5")
-        db.instance_get_all(context).AndReturn(fakes.INSTANCES)
+        db.instance_utilization_get_by_host(context).AndReturn(
+                fakes.INSTANCE_USAGE)
 
         self.mox.ReplayAll()
         host_states = self.host_manager.get_all_host_states(context, topic)
@@ -274,6 +345,124 @@ class HostManagerTestCase(test.TestCase):
         self.assertEqual(host_states['host4'].free_ram_mb, 7680)
         # 8191GB
         self.assertEqual(host_states['host4'].free_disk_mb, 8387584)
+        self.assertEqual(host_states['host2'].vcpus_used, 2)
+        self.assertEqual(host_states['host2'].n_und_vms, 2)
+        self.assertEqual(self.host_manager.host_state_generation, 1)
+
+    def _stub_reconcile(self, context, times=1):
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'instance_utilization_get_by_host')
+        for i in xrange(times):
+            db.compute_node_get_all(context).AndReturn(
+                    fakes.COMPUTE_NODES[:4])
+            db.instance_utilization_get_by_host(context).AndReturn(
+                    fakes.INSTANCE_USAGE)
+
+    def test_get_all_host_states_cached(self):
+        self.flags(reserved_host_memory_mb=0, reserved_host_disk_mb=0,
+                   host_state_reconcile_interval=60)
+        context = 'fake_context'
+        self._stub_reconcile(context)
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        db.service_get_all(context).AndReturn([])
+        self.mox.ReplayAll()
+
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        # Claims made by the scheduler are kept until the next reconcile
+        host_states['host4'].consume_from_instance(dict(
+                root_gb=1, ephemeral_gb=0, memory_mb=1024, vcpus=1,
+                workload_class='und'))
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertEqual(host_states['host4'].free_ram_mb, 8192 - 1024)
+        self.assertEqual(self.host_manager.host_state_generation, 1)
+
+        # Capability updates are applied to the cached states
+        self.host_manager.update_service_capabilities('compute', 'host4',
+                                                      {'beta_io': '0.4'})
+        self.assertEqual(host_states['host4'].beta_io, 0.4)
+        self.assertEqual(host_states['host4'].capabilities['beta_io'],
+                         '0.4')
+
+    def test_get_all_host_states_reconcile(self):
+        self.flags(reserved_host_memory_mb=0, reserved_host_disk_mb=0,
+                   host_state_reconcile_interval=60)
+        context = 'fake_context'
+        self._stub_reconcile(context, times=2)
+        self.mox.ReplayAll()
+
+        self.stubs.Set(utils, 'utcnow',
+                       lambda: datetime.datetime(2012, 1, 1, 0, 0, 0))
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        host_states['host4'].consume_from_instance(dict(
+                root_gb=1, ephemeral_gb=0, memory_mb=1024, vcpus=1,
+                workload_class='und'))
+
+        self.stubs.Set(utils, 'utcnow',
+                       lambda: datetime.datetime(2012, 1, 1, 0, 1, 1))
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertEqual(host_states['host4'].free_ram_mb, 8192)
+        self.assertEqual(host_states['host4'].generation, 2)
+        self.assertEqual(self.host_manager.host_state_generation, 2)
+
+    def test_get_all_host_states_reconcile_interval_bounded(self):
+        self.flags(host_state_reconcile_interval=600, service_down_time=60,
+                   report_interval=10)
+        self.stubs.Set(utils, 'utcnow',
+                       lambda: datetime.datetime(2012, 1, 1, 0, 0, 0))
+        self.host_manager.host_state_reconciled_at = utils.utcnow()
+        self.assertFalse(self.host_manager.host_states_stale())
+
+        self.stubs.Set(utils, 'utcnow',
+                       lambda: datetime.datetime(2012, 1, 1, 0, 0, 51))
+        self.assertTrue(self.host_manager.host_states_stale())
+
+    def test_get_all_host_states_refreshes_service(self):
+        self.flags(host_state_reconcile_interval=45, service_down_time=60,
+                   report_interval=10)
+        context = 'fake_context'
+        start = datetime.datetime(2012, 1, 1, 0, 0, 0)
+        reported = start - datetime.timedelta(seconds=40)
+        compute_nodes = [dict(id=4, local_gb=8192, memory_mb=8192, vcpus=8,
+                              service=dict(host='host4', topic='compute',
+                                           disabled=False,
+                                           created_at=reported,
+                                           updated_at=reported))]
+        later = start + datetime.timedelta(seconds=30)
+        services = [dict(host='host4', topic='compute', disabled=False,
+                         created_at=reported,
+                         updated_at=later - datetime.timedelta(seconds=5)),
+                    dict(host='host4', topic='volume', disabled=True,
+                         created_at=reported, updated_at=reported)]
+
+        self.mox.StubOutWithMock(db, 'compute_node_get_all')
+        self.mox.StubOutWithMock(db, 'instance_utilization_get_by_host')
+        self.mox.StubOutWithMock(db, 'service_get_all')
+        db.compute_node_get_all(context).AndReturn(compute_nodes)
+        db.instance_utilization_get_by_host(context).AndReturn({})
+        db.service_get_all(context).AndReturn(services)
+        self.mox.ReplayAll()
+
+        host_filter = compute_filter.ComputeFilter()
+        filter_properties = {'instance_type': {'memory_mb': 1024}}
+
+        self.stubs.Set(utils, 'utcnow', lambda: start)
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertTrue(host_filter.host_passes(host_states['host4'],
+                                                   filter_properties))
+
+        # The snapshot from the reconcile is now older than
+        # service_down_time, but the host kept reporting in.
+        self.stubs.Set(utils, 'utcnow', lambda: later)
+        host_states = self.host_manager.get_all_host_states(context,
+                                                            'compute')
+        self.assertEqual(self.host_manager.host_state_generation, 1)
+        self.assertTrue(host_filter.host_passes(host_states['host4'],
+                                                   filter_properties))
 
 
 class HostStateTestCase(test.TestCase):
@@ -366,3 +555,13 @@ class HostStateTestCase(test.TestCase):
         self.mox.ReplayAll()
         result = fake_host.passes_filters(filter_fns, filter_properties)
         self.assertTrue(result)
+
+    def test_host_state_workload_betas(self):
+        capabilities = {'compute': {'beta_cpu': '0.3', 'beta_io': 0.7,
+                                    'beta_mem': 'bogus'}}
+        fake_host = host_manager.HostState('host1', 'compute',
+                                           capabilities=capabilities)
+        self.assertEqual(fake_host.beta_cpu, 0.3)
+        self.assertEqual(fake_host.beta_io, 0.7)
+        self.assertEqual(fake_host.beta_mem, 0.0)
+        self.assertEqual(fake_host.beta_und, 0.0)
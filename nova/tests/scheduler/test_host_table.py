@@ -0,0 +1,157 @@
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For the array backed HostTable.
+"""
+
+from nova.scheduler import filters
+from nova.scheduler import host_manager
+from nova.scheduler import host_table
+from nova.scheduler import least_cost
+from nova import test
+from nova import utils
+
+
+class TestFilter(filters.BaseHostFilter):
+    """Filter without a vector version, evaluated host by host."""
+    def host_passes(self, host_state, filter_properties):
+        return host_state.host != 'host5'
+
+
+class HostTableTestCase(test.TestCase):
+    """Test case for HostTable, checked against the per host code."""
+
+    def setUp(self):
+        super(HostTableTestCase, self).setUp()
+        self.flags(reserved_host_memory_mb=0, reserved_host_disk_mb=0,
+                   ram_allocation_ratio=1.0, cpu_allocation_ratio=1.0,
+                   scheduler_available_filters=[
+                       'nova.scheduler.filters.standard_filters',
+                       'nova.tests.scheduler.test_host_table.TestFilter'],
+                   scheduler_default_filters=[
+                       'AvailabilityZoneFilter', 'RamFilter', 'CoreFilter',
+                       'ComputeFilter', 'TestFilter'])
+        self.stubs.Set(utils, 'service_is_up', lambda service: True)
+        self.host_manager = host_manager.HostManager()
+        self.host_states = []
+        for i in xrange(8):
+            caps = {'compute': {'beta_cpu': str(i / 10.0), 'enabled': True}}
+            service = {'disabled': i == 2,
+                       'availability_zone': i == 3 and 'other' or 'nova'}
+            host_state = host_manager.HostState('host%d' % i, 'compute',
+                    capabilities=caps, service=service)
+            host_state.update_from_compute_node(dict(
+                    local_gb=100, memory_mb=512 * (i + 1), vcpus=i % 4,
+                    n_cpu_vms=float(i), n_io_vms=1.0, n_mem_vms=0.0,
+                    n_und_vms=float(i % 2)))
+            self.host_states.append(host_state)
+        self.filter_properties = {
+                'instance_type': {'memory_mb': 1024, 'vcpus': 1},
+                'request_spec': {'instance_properties': {
+                    'availability_zone': 'nova',
+                    'workload_class': 'cpu'}}}
+
+    def _passing_hosts(self, table, mask):
+        return [table.host_states[i].host for i in xrange(len(table))
+                if mask[i]]
+
+    @test.skip_if(host_table.numpy is None, "Test requires numpy")
+    def test_filter_host_table_matches_filter_hosts(self):
+        table = host_table.HostTable(self.host_states)
+        mask = self.host_manager.filter_host_table(table,
+                                                   self.filter_properties)
+        expected = self.host_manager.filter_hosts(self.host_states,
+                                                  self.filter_properties)
+        self.assertEqual(self._passing_hosts(table, mask),
+                         [h.host for h in expected])
+        self.assertEqual(self._passing_hosts(table, mask),
+                         ['host1', 'host4', 'host6', 'host7'])
+
+    @test.skip_if(host_table.numpy is None, "Test requires numpy")
+    def test_filter_host_table_force_and_ignore(self):
+        table = host_table.HostTable(self.host_states)
+        props = dict(self.filter_properties,
+                     ignore_hosts=['host3'],
+                     force_hosts=['host2', 'host3'])
+        mask = self.host_manager.filter_host_table(table, props)
+        self.assertEqual(self._passing_hosts(table, mask), ['host2'])
+
+        props = dict(self.filter_properties, ignore_hosts=['host4'])
+        mask = self.host_manager.filter_host_table(table, props)
+        self.assertEqual(self._passing_hosts(table, mask),
+                         ['host1', 'host6', 'host7'])
+
+    @test.skip_if(host_table.numpy is None, "Test requires numpy")
+    def test_weighted_sum_matches_least_cost(self):
+        fns = [(1.0, least_cost.compute_fill_first_cost_Enea_fn),
+               (-1.0, least_cost.compute_fill_first_cost_fn),
+               (1.0, least_cost.noop_cost_fn),
+               # Not vectorized, evaluated host by host
+               (0.5, lambda host_state, props: host_state.vcpus_total)]
+        table = host_table.HostTable(self.host_states)
+        mask = table.all_hosts()
+        index, weighted_host = host_table.weighted_sum(fns, table, mask,
+                self.filter_properties)
+        expected = least_cost.weighted_sum(fns, self.host_states,
+                                           self.filter_properties)
+        self.assertEqual(weighted_host.host_state.host,
+                         expected.host_state.host)
+        self.assertAlmostEqual(weighted_host.weight, expected.weight)
+        self.assertEqual(table.host_states[index].host,
+                         expected.host_state.host)
+
+    @test.skip_if(host_table.numpy is None, "Test requires numpy")
+    def test_fill_first_cost_Enea_matches_least_cost(self):
+        host_states = []
+        # Odd and even counters, idle hosts, NULL columns and counters
+        # added from the instance usage.
+        for i, counts in enumerate([(3.0, 1.0, 0.0, 1.0),
+                                    (0.0, 0.0, 0.0, 0.0),
+                                    (None, None, None, None),
+                                    (5.0, 2.0, 2.0, 0.0),
+                                    (1.0, 0.0, 0.0, 0.0),
+                                    (2.0, 7.0, 1.0, 3.0)]):
+            host_state = host_manager.HostState('host%d' % i, 'compute',
+                    capabilities={'compute': {'beta_cpu': str(i / 7.0)}},
+                    service={'disabled': False})
+            compute = dict(local_gb=100, memory_mb=4096, vcpus=4)
+            for name, count in zip(['cpu', 'io', 'mem', 'und'], counts):
+                compute['n_%s_vms' % name] = count
+            host_state.update_from_compute_node(compute)
+            if i % 2:
+                host_state.consume_from_usage(dict(
+                        memory_mb=512, disk_gb=1, vcpus=1, n_cpu_vms=i,
+                        n_io_vms=1, n_mem_vms=0, n_und_vms=0))
+            host_states.append(host_state)
+
+        table = host_table.HostTable(host_states)
+        table.consume_from_instance(4, dict(root_gb=1, ephemeral_gb=0,
+                memory_mb=512, vcpus=1, workload_class='cpu'))
+        costs = host_table._compute_fill_first_cost_Enea_fn_array(table,
+                self.filter_properties)
+        for index, host_state in enumerate(host_states):
+            self.assertAlmostEqual(costs[index],
+                    least_cost.compute_fill_first_cost_Enea_fn(host_state,
+                            self.filter_properties))
+
+    @test.skip_if(host_table.numpy is None, "Test requires numpy")
+    def test_consume_from_instance(self):
+        table = host_table.HostTable(self.host_states)
+        table.consume_from_instance(7, dict(root_gb=1, ephemeral_gb=0,
+                memory_mb=1024, vcpus=1, workload_class='cpu'))
+        self.assertEqual(table.free_ram_mb[7], 4096 - 1024)
+        self.assertEqual(table.vcpus_used[7], 1)
+        self.assertEqual(table.n_cpu_vms[7], 8)
+        self.assertEqual(self.host_states[7].free_ram_mb, 4096 - 1024)
@@ -16,6 +16,7 @@
 Tests For Least Cost functions.
 """
 from nova import context
+from nova import rpc
 from nova.scheduler import host_manager
 from nova.scheduler import least_cost
 from nova import test
@@ -88,6 +89,34 @@ class LeastCostTestCase(test.TestCase):
         self.assertEqual(weighted_host.weight, 10512)
         self.assertEqual(weighted_host.host_state.host, 'host1')
 
+    def test_compute_fill_first_cost_Enea_fn(self):
+        # No rpc call is needed, capabilities come from the HostState.
+        self.mox.StubOutWithMock(rpc, 'call')
+        self.mox.ReplayAll()
+
+        props = {'request_spec': {'instance_properties': {
+                    'workload_class': 'cpu'}}}
+        empty = fakes.FakeHostState('host1', 'compute',
+                dict(n_cpu_vms=0, n_io_vms=0, n_mem_vms=0, n_und_vms=0,
+                     beta_cpu=0.5))
+        busy = fakes.FakeHostState('host2', 'compute',
+                dict(n_cpu_vms=4.0, n_io_vms=2.0, n_mem_vms=0.0,
+                     n_und_vms=0.0, beta_cpu=0.5))
+
+        # (0 + 1) / (0 + 1) - 0.5
+        self.assertEqual(
+                least_cost.compute_fill_first_cost_Enea_fn(empty, props),
+                0.5)
+        # 2 * 1000 - 3 + ((2 + 1) / (3 + 1) - 0.5)
+        self.assertEqual(
+                least_cost.compute_fill_first_cost_Enea_fn(busy, props),
+                1997.25)
+
+        weighted_host = least_cost.weighted_sum(
+                [(1.0, least_cost.compute_fill_first_cost_Enea_fn)],
+                [busy, empty], props)
+        self.assertEqual(weighted_host.host_state.host, 'host1')
+
 
 class TestWeightedHost(test.TestCase):
     def test_dict_conversion_without_host_state(self):
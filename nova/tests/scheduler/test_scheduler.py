@@ -97,7 +97,7 @@ class SchedulerManagerTestCase(test.TestCase):
 
         # Test no capabilities passes empty dictionary
         self.manager.driver.update_service_capabilities(service_name,
-                host, {})
+                host, {}, seq=None, full=True, removed=None)
         self.mox.ReplayAll()
         result = self.manager.update_service_capabilities(self.context,
                 service_name=service_name, host=host)
@@ -107,11 +107,34 @@ class SchedulerManagerTestCase(test.TestCase):
         # Test capabilities passes correctly
         capabilities = {'fake_capability': 'fake_value'}
         self.manager.driver.update_service_capabilities(
-                service_name, host, capabilities)
+                service_name, host, capabilities, seq=3, full=False,
+                removed=['other_capability'])
         self.mox.ReplayAll()
         result = self.manager.update_service_capabilities(self.context,
                 service_name=service_name, host=host,
-                capabilities=capabilities)
+                capabilities=capabilities, seq=3, full=False,
+                removed=['other_capability'])
+
+    def test_update_service_capabilities_missed(self):
+        service_name = 'fake_service'
+        host = 'fake_host'
+        capabilities = {'fake_capability': 'fake_value'}
+
+        self.mox.StubOutWithMock(self.manager.driver,
+                'update_service_capabilities')
+        self.mox.StubOutWithMock(rpc, 'cast')
+
+        self.manager.driver.update_service_capabilities(
+                service_name, host, capabilities, seq=3, full=False,
+                removed=[]).AndReturn(True)
+        rpc.cast(self.context,
+                 db.queue_get_for(self.context, service_name, host),
+                 {'method': 'request_full_capabilities', 'args': {}})
+
+        self.mox.ReplayAll()
+        self.manager.update_service_capabilities(self.context,
+                service_name=service_name, host=host,
+                capabilities=capabilities, seq=3, full=False, removed=[])
 
     def test_existing_method(self):
         def stub_method(self, *args, **kwargs):
@@ -348,7 +371,8 @@ class SchedulerTestCase(test.TestCase):
 
         capabilities = {'fake_capability': 'fake_value'}
         self.driver.host_manager.update_service_capabilities(
-                service_name, host, capabilities)
+                service_name, host, capabilities, seq=None, full=True,
+                removed=None)
         self.mox.ReplayAll()
         result = self.driver.update_service_capabilities(service_name,
                 host, capabilities)
@@ -1164,6 +1188,28 @@ class SchedulerDriverModuleTestCase(test.TestCase):
         driver.cast_to_compute_host(self.context, host, method,
                 update_db=False, **fake_kwargs)
 
+    def test_cast_to_compute_hosts(self):
+        fake_kwargs = {'extra_arg': 'meow'}
+
+        self.mox.StubOutWithMock(db, 'queue_get_for')
+        self.mox.StubOutWithMock(rpc, 'cast_many')
+
+        db.queue_get_for(self.context, 'compute',
+                         'fake_host1').AndReturn('fake_queue1')
+        db.queue_get_for(self.context, 'compute',
+                         'fake_host2').AndReturn('fake_queue2')
+        rpc.cast_many(self.context,
+                [('fake_queue1', {'method': 'fake_method1',
+                                  'args': fake_kwargs}),
+                 ('fake_queue2', {'method': 'fake_method2',
+                                  'args': fake_kwargs})],
+                confirm=True)
+
+        self.mox.ReplayAll()
+        driver.cast_to_compute_hosts(self.context,
+                [('fake_host1', 'fake_method1', fake_kwargs),
+                 ('fake_host2', 'fake_method2', fake_kwargs)])
+
     def test_cast_to_network_host(self):
         host = 'fake_host1'
         method = 'fake_method'
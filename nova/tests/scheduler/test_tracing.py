@@ -0,0 +1,86 @@
+# Copyright (c) 2012 OpenStack, LLC
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Tests For scheduler request tracing
+"""
+
+from nova.notifier import api as notifier
+from nova.scheduler import least_cost
+from nova.scheduler import tracing
+from nova import test
+
+
+class TracingTestCase(test.TestCase):
+    """Test case for RequestTrace and SchedulerStats"""
+
+    def _make_trace(self):
+        trace = tracing.RequestTrace('compute')
+        trace.add(tracing.FILTER, 'RamFilter', 0.5, 10, 4)
+        trace.add(tracing.FILTER, 'RamFilter', 0.25, 6, 1)
+        with trace.timed(tracing.GET_HOST_STATES, 'compute'):
+            pass
+        trace.finish()
+        return trace
+
+    def test_fn_name(self):
+        class FakeFilter(object):
+            def host_passes(self, host_state, filter_properties):
+                return True
+
+        self.assertEqual(tracing.fn_name(FakeFilter().host_passes),
+                         'FakeFilter')
+        self.assertEqual(
+                tracing.fn_name(least_cost.compute_fill_first_cost_fn),
+                'compute_fill_first_cost_fn')
+
+    def test_request_trace(self):
+        trace = self._make_trace()
+        self.assertEqual(trace.steps[(tracing.FILTER, 'RamFilter')],
+                         [2, 0.75, 16, 5])
+        self.assertEqual(
+                trace.steps[(tracing.GET_HOST_STATES, 'compute')][0], 1)
+        result = trace.to_dict()
+        self.assertEqual(result['topic'], 'compute')
+        self.assertEqual([step['kind'] for step in result['steps']],
+                         [tracing.FILTER, tracing.GET_HOST_STATES])
+
+    def test_scheduler_stats(self):
+        self.flags(scheduler_trace_notifications=False)
+        self.stubs.Set(notifier, 'notify', self.fail)
+        stats = tracing.SchedulerStats()
+        stats.add(self._make_trace())
+        stats.add(self._make_trace())
+        result = stats.to_dict()
+        self.assertEqual(result['requests'], 2)
+        self.assertEqual(result['steps'][0],
+                         dict(kind=tracing.FILTER, name='RamFilter',
+                              calls=4, seconds=1.5, hosts_in=32,
+                              hosts_eliminated=10))
+        stats.reset()
+        self.assertEqual(stats.to_dict(),
+                         dict(requests=0, elapsed=0.0, steps=[]))
+
+    def test_scheduler_stats_notifies(self):
+        self.flags(scheduler_trace_notifications=True)
+        notifications = []
+
+        def fake_notify(publisher_id, event_type, priority, payload):
+            notifications.append((event_type, payload))
+
+        self.stubs.Set(notifier, 'notify', fake_notify)
+        trace = self._make_trace()
+        tracing.SchedulerStats().add(trace)
+        self.assertEqual(notifications,
+                         [('scheduler.trace', trace.to_dict())])
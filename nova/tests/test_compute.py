@@ -18,6 +18,7 @@
 #    under the License.
 """Tests for compute service"""
 
+import base64
 import copy
 import datetime
 import sys
@@ -1782,6 +1783,18 @@ class ComputeAPITestCase(BaseTestCase):
             finally:
                 db.instance_destroy(self.context, ref[0]['id'])
 
+    def test_create_instance_sets_workload_class(self):
+        cases = [(None, 'und'), (base64.b64encode('io'), 'io'),
+                 (base64.b64encode('not-a-class'), 'und')]
+        for user_data, workload_class in cases:
+            (ref, resv_id) = self.compute_api.create(self.context,
+                instance_types.get_default_instance_type(), None,
+                user_data=user_data)
+            try:
+                self.assertEqual(ref[0]['workload_class'], workload_class)
+            finally:
+                db.instance_destroy(self.context, ref[0]['id'])
+
     def test_create_instance_associates_security_groups(self):
         """Make sure create associates security groups"""
         group = self._create_group()
@@ -1812,6 +1825,25 @@ class ComputeAPITestCase(BaseTestCase):
         self.assertEqual(pre_build_len,
                          len(db.instance_get_all(context.get_admin_context())))
 
+    def test_create_failure_destroys_instance(self):
+        instance_type = instance_types.get_default_instance_type()
+        ctxt = context.get_admin_context()
+        pre_build_len = len(db.instance_get_all(ctxt))
+
+        def fake_cast(*args, **kwargs):
+            raise rpc_common.Timeout()
+
+        self.stubs.Set(rpc, 'cast', fake_cast)
+        self.assertRaises(rpc_common.Timeout, self.compute_api.create,
+                          self.context, instance_type=instance_type,
+                          image_href=None, max_count=1)
+        self.assertEqual(pre_build_len, len(db.instance_get_all(ctxt)))
+        usages = db.quota_usage_get_all_by_project(ctxt,
+                self.context.project_id, ['instances', 'cores', 'ram'],
+                3600)
+        for resource in usages:
+            self.assertEqual(usages[resource], {'in_use': 0, 'reserved': 0})
+
     def test_default_hostname_generator(self):
         cases = [(None, 'server-1'), ('Hello, Server!', 'hello-server'),
                  ('<}\x1fh\x10e\x08l\x02l\x05o\x12!{>', 'hello'),
@@ -3231,6 +3263,24 @@ class ComputeAPITestCase(BaseTestCase):
                                                instance,
                                                security_group_name)
 
+    def test_update_invalidates_metadata_cache(self):
+        instance = self._create_fake_instance()
+        casts = []
+
+        def fake_fanout_cast(context, topic, msg):
+            casts.append((topic, msg))
+
+        self.stubs.Set(rpc, 'fanout_cast', fake_fanout_cast)
+        self.compute_api.update(self.context, instance, display_name='a')
+        self.assertEqual(casts, [])
+
+        self.flags(metadata_cache_invalidation=True)
+        self.compute_api.update(self.context, instance, display_name='b')
+        self.assertEqual(casts, [('metadata_cache',
+                                  {'method': 'invalidate_instance',
+                                   'args': {'instance_uuid':
+                                            instance['uuid']}})])
+
     def test_get_diagnostics(self):
         instance = self._create_fake_instance()
         self.compute_api.get_diagnostics(self.context, instance)
@@ -3712,6 +3762,26 @@ class ComputeHostAPITestCase(BaseTestCase):
                 {'method': 'host_power_action',
                  'args': {'action': 'fake_action'}})
 
+    def test_set_hosts_enabled(self):
+        ctxt = context.RequestContext('fake', 'fake')
+        call_info = {}
+
+        def fake_rpc_call_many(context, calls, timeout=None):
+            call_info['context'] = context
+            call_info['calls'] = calls
+            return [(None, None), (None, rpc_common.Timeout())]
+
+        self.stubs.Set(rpc, 'call_many', fake_rpc_call_many)
+        results = self.host_api.set_hosts_enabled(ctxt, ['host1', 'host2'],
+                                                  'fake_enabled')
+        self.assertEqual(call_info['context'], ctxt)
+        msg = {'method': 'set_host_enabled',
+               'args': {'enabled': 'fake_enabled'}}
+        self.assertEqual(call_info['calls'],
+                         [('compute.host1', msg), ('compute.host2', msg)])
+        self.assertEqual(results['host1'], (None, None))
+        self.assertTrue(isinstance(results['host2'][1], rpc_common.Timeout))
+
     def test_set_host_maintenance(self):
         ctxt = context.RequestContext('fake', 'fake')
         call_info = {}
@@ -18,14 +18,18 @@
 
 """Unit tests for the DB API"""
 
+import base64
 import datetime
+import re
 
 from nova import test
 from nova import context
 from nova import db
+from nova.db.sqlalchemy import api as db_api
 from nova import exception
 from nova import flags
 from nova import utils
+from nova.compute import vm_states
 
 FLAGS = flags.FLAGS
 
@@ -80,6 +84,113 @@ class DbApiTestCase(test.TestCase):
         else:
             self.assertTrue(result[1].deleted)
 
+    def test_instance_get_all_by_filters_paginated(self):
+        created_at = datetime.datetime(2012, 1, 1)
+        uuids = []
+        for i in xrange(6):
+            # two instances share each created_at, id breaks the tie
+            args = {'created_at': created_at +
+                                  datetime.timedelta(seconds=i / 2),
+                    'host': 'host%d' % (i % 2),
+                    'project_id': self.project_id}
+            uuids.append(db.instance_create(self.context, args)['uuid'])
+        uuids.reverse()
+
+        def _page(filters, limit, marker=None):
+            return [inst['uuid'] for inst in db.instance_get_all_by_filters(
+                    self.context, filters, limit=limit, marker=marker)]
+
+        self.assertEqual(_page({}, 4), uuids[:4])
+        self.assertEqual(_page({}, 3, uuids[2]), uuids[3:])
+        self.assertEqual(_page({}, 0), [])
+        # host is matched outside of SQL, the page is read in batches
+        self.assertEqual(_page({'host': 'host1'}, 2), uuids[0:3:2])
+        self.assertEqual(_page({'host': 'host1'}, 2, uuids[2]), uuids[4:5])
+        self.assertRaises(exception.MarkerNotFound, _page, {}, 2, 'nope')
+
+    def test_instance_get_all_by_filters_regexp_matrix(self):
+        names = ['web-1', 'web-2', 'Web-3', 'web_4', 'webby', 'web-1\n',
+                 'db-1', 'db.1', 'a%b', 'a\\b', '', None]
+        for i, name in enumerate(names):
+            db.instance_create(self.context,
+                    {'display_name': name, 'host': 'host%d' % (i % 3),
+                     'project_id': self.project_id,
+                     'metadata': {'role': 'web' if i % 2 else 'db',
+                                  'index': str(i)}})
+        instances = db.instance_get_all_by_filters(self.context, {})
+
+        def _old_path(filters):
+            # what the filters did when they were all checked in python
+            matched = []
+            for instance in instances:
+                for name, value in filters.iteritems():
+                    if name == 'metadata':
+                        metadata = dict((m['key'], m['value'])
+                                        for m in instance['metadata'])
+                        if any(metadata.get(k) != v
+                               for k, v in value.iteritems()):
+                            break
+                    else:
+                        v = instance[name]
+                        if not v or not re.match(value, str(v)):
+                            break
+                else:
+                    matched.append(instance['uuid'])
+            return sorted(matched)
+
+        patterns = ['web', '^web-', '^web-1$', 'web-1$', 'web.', '^Web',
+                    'web_', 'web\\-', 'webb?', 'web+', 'db\\.1', 'db.1',
+                    'a%b', 'a\\\\b', '.*eb', 'web|db', '(?i)web', '^$',
+                    'nothing']
+        matrix = [{'display_name': p} for p in patterns]
+        matrix += [{'host': 'host1'}, {'host': '^host[12]$'},
+                   {'display_name': '^web', 'host': 'host0'},
+                   {'metadata': {'role': 'web'}},
+                   {'metadata': {'role': 'web', 'index': '3'}},
+                   {'metadata': {'role': 'web'}, 'display_name': 'web-'}]
+        for filters in matrix:
+            result = db.instance_get_all_by_filters(self.context,
+                                                    filters.copy())
+            self.assertEqual(sorted(i['uuid'] for i in result),
+                             _old_path(filters), filters)
+
+    def test_regexp_prefix(self):
+        self.assertEqual(db_api._regexp_prefix('^web-'), ('web-', False))
+        self.assertEqual(db_api._regexp_prefix('web-1$'), ('web-1', True))
+        self.assertEqual(db_api._regexp_prefix('10\\.0\\.0\\.1$'),
+                         ('10.0.0.1', True))
+        self.assertEqual(db_api._regexp_prefix('webs?'), ('web', False))
+        self.assertEqual(db_api._regexp_prefix('web\\d'), ('web', False))
+        self.assertEqual(db_api._regexp_prefix('.*web'), ('', False))
+        self.assertEqual(db_api._regexp_prefix('web|db'), ('', False))
+
+    def test_instance_create_many(self):
+        group = db.security_group_create(self.context,
+                {'name': 'group1', 'user_id': self.user_id,
+                 'project_id': self.project_id})
+        values_list = [{'host': 'host1', 'launch_index': 0,
+                        'project_id': self.project_id},
+                       {'host': 'host2', 'launch_index': 1,
+                        'project_id': self.project_id,
+                        'display_name': 'named', 'hostname': 'named'}]
+        instances = db.instance_create_many(self.context, values_list,
+                                            [group['id']])
+        self.assertEqual(len(instances), 2)
+        self.assertEqual(instances[0]['display_name'],
+                         'Server %s' % instances[0]['id'])
+        self.assertEqual(instances[0]['hostname'],
+                         'server-%s' % instances[0]['id'])
+        self.assertEqual(instances[1]['display_name'], 'named')
+        for instance, values in zip(instances, values_list):
+            instance = db.instance_get_by_uuid(self.context,
+                                               instance['uuid'])
+            self.assertEqual(instance['host'], values['host'])
+            self.assertEqual(instance['launch_index'], values['launch_index'])
+            self.assertEqual([g['id'] for g in instance['security_groups']],
+                             [group['id']])
+            self.assertNotEqual(db.instance_info_cache_get(self.context,
+                    instance['uuid']), None)
+
     def test_migration_get_all_unconfirmed(self):
         ctxt = context.get_admin_context()
 
@@ -325,6 +436,95 @@ class DbApiTestCase(test.TestCase):
         self.assertEqual(record['vif_address'], vif['address'])
         data = db.network_get_associated_fixed_ips(ctxt, 1, 'nothing')
         self.assertEqual(len(data), 0)
+        data = db.network_get_associated_fixed_ips(ctxt, 1,
+                                                   addresses=['baz'])
+        self.assertEqual(len(data), 1)
+        data = db.network_get_associated_fixed_ips(ctxt, 1,
+                                                   addresses=['qux'])
+        self.assertEqual(len(data), 0)
+
+    def test_fixed_ip_get_all_with_instance_uuid(self):
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {})
+        vif = db.virtual_interface_create(ctxt,
+                                          {'address': 'bar',
+                                           'network_id': 1,
+                                           'instance_id': instance['id']})
+        for address in ['10.0.0.1', '10.0.1.1']:
+            db.fixed_ip_create(ctxt, {'address': address,
+                                      'network_id': 1,
+                                      'virtual_interface_id': vif['id'],
+                                      'instance_id': instance['id']})
+        fixed_ip = db.fixed_ip_get_by_address(ctxt, '10.0.1.1')
+        for address in ['172.16.0.1', '173.16.0.1']:
+            db.floating_ip_create(ctxt, {'address': address,
+                                         'fixed_ip_id': fixed_ip['id']})
+
+        data = db.fixed_ip_get_all_with_instance_uuid(ctxt)
+        self.assertEqual([datum['address'] for datum in data],
+                         ['10.0.0.1', '10.0.1.1'])
+        self.assertEqual(data[1]['instance_uuid'], instance['uuid'])
+        self.assertEqual(data[1]['vif_id'], vif['id'])
+        self.assertEqual(sorted(data[1]['floating_addresses']),
+                         ['172.16.0.1', '173.16.0.1'])
+        data = db.fixed_ip_get_all_with_instance_uuid(ctxt,
+                                                      address='10.0.0.1')
+        self.assertEqual([datum['address'] for datum in data], ['10.0.0.1'])
+        data = db.fixed_ip_get_all_with_instance_uuid(ctxt, prefix='172.')
+        self.assertEqual([(datum['address'], datum['floating_addresses'])
+                          for datum in data],
+                         [('10.0.1.1', ['172.16.0.1'])])
+
+        data = db.virtual_interface_get_all_with_instance_uuid(ctxt)
+        self.assertEqual(data, [dict(id=vif['id'], address='bar',
+                                     network_id=1,
+                                     instance_id=instance['id'],
+                                     instance_uuid=instance['uuid'])])
+
+    def test_fixed_ip_reserve_pool(self):
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {})
+        for i in xrange(5):
+            db.fixed_ip_create(ctxt, {'address': '10.9.0.%d' % i,
+                                      'network_id': 9,
+                                      'reserved': i == 0})
+        self.assertEqual(db.fixed_ip_reserve_pool(ctxt, 9, 'host1', 2),
+                         ['10.9.0.1', '10.9.0.2'])
+        self.assertEqual(db.fixed_ip_reserve_pool(ctxt, 9, 'host2', 5),
+                         ['10.9.0.3', '10.9.0.4'])
+        self.assertRaises(exception.NoMoreFixedIps,
+                          db.fixed_ip_associate_pool, ctxt, 9,
+                          instance['id'])
+
+        pairs = [('10.9.0.1', instance['id']), ('10.9.0.3', instance['id'])]
+        self.assertEqual(db.fixed_ip_associate_reserved(ctxt, 'host1', pairs),
+                         ['10.9.0.1'])
+        fixed_ip = db.fixed_ip_get_by_address(ctxt, '10.9.0.1')
+        self.assertEqual(fixed_ip['instance_id'], instance['id'])
+        self.assertEqual(fixed_ip['pool_owner'], None)
+
+        self.assertEqual(db.fixed_ip_release_pool(ctxt, 'host2',
+                                                  ['10.9.0.3']), 1)
+        self.assertEqual(db.fixed_ip_associate_pool(ctxt, 9, instance['id']),
+                         '10.9.0.3')
+        self.assertEqual(db.fixed_ip_release_pool(ctxt, 'host1'), 1)
+        self.assertEqual(db.fixed_ip_reserve_pool(ctxt, 9, 'host1', 5),
+                         ['10.9.0.2'])
+
+    def test_virtual_interface_get_first_ids_by_instances(self):
+        ctxt = context.get_admin_context()
+        instance1 = db.instance_create(ctxt, {})
+        instance2 = db.instance_create(ctxt, {})
+        instance3 = db.instance_create(ctxt, {})
+        vifs = [db.virtual_interface_create(ctxt, {'address': address,
+                                                   'instance_id': instance})
+                for address, instance in [('a', instance1['id']),
+                                          ('b', instance2['id']),
+                                          ('c', instance1['id'])]]
+        result = db.virtual_interface_get_first_ids_by_instances(ctxt,
+                [instance1['id'], instance2['id'], instance3['id']])
+        self.assertEqual(result, {instance1['id']: vifs[0]['id'],
+                                  instance2['id']: vifs[1]['id']})
 
     def _timeout_test(self, ctxt, timeout, multi_host):
         values = {'host': 'foo'}
@@ -778,6 +978,75 @@ class CapacityTestCase(test.TestCase):
         self.assertEquals(x.current_workload, 2)
         self.assertEquals(x.running_vms, 5)
 
+    def test_compute_node_utilization_update_many(self):
+        self._create_helper('host1')
+        missing = db.compute_node_utilization_update_many(self.ctxt,
+                {'host1': dict(free_ram_mb_delta=-24, free_disk_gb_delta=0,
+                               work_delta=2, vm_delta=-1, n_cpu_delta=-1),
+                 'host2': dict(free_ram_mb_delta=-24)})
+        self.assertEquals(missing, ['host2'])
+        x = db.compute_node_get_by_host(self.ctxt, 'host1')
+        self.assertEquals(x.free_ram_mb, 1000)
+        self.assertEquals(x.free_disk_gb, 2048)
+        self.assertEquals(x.current_workload, 2)
+        self.assertEquals(x.running_vms, -1)
+        self.assertEquals(x.n_cpu_vms, -1)
+
+    def _create_instance(self, host, user_data=None, **kwargs):
+        values = dict(host=host, memory_mb=256, vcpus=2, root_gb=10,
+                      ephemeral_gb=5, vm_state=vm_states.ACTIVE)
+        if user_data is not None:
+            values['user_data'] = base64.b64encode(user_data)
+        values.update(kwargs)
+        return db.instance_create(self.ctxt, values)
+
+    def test_instance_create_sets_workload_class(self):
+        inst = self._create_instance('host1', user_data='io')
+        self.assertEquals(inst['workload_class'], 'io')
+        inst = self._create_instance('host1', user_data='something else')
+        self.assertEquals(inst['workload_class'], 'und')
+        inst = self._create_instance('host1')
+        self.assertEquals(inst['workload_class'], 'und')
+
+    def test_instance_utilization_get_by_host(self):
+        self._create_instance('host1', user_data='cpu')
+        self._create_instance('host1', user_data='cpu',
+                              vm_state=vm_states.BUILDING)
+        self._create_instance('host1', user_data='mem')
+        self._create_instance('host2', user_data='io')
+        deleted = self._create_instance('host1', user_data='io')
+        db.instance_destroy(self.ctxt, deleted['uuid'])
+
+        usage = db.instance_utilization_get_by_host(self.ctxt)
+        self.assertEquals(sorted(usage.keys()), ['host1', 'host2'])
+        host1 = usage['host1']
+        self.assertEquals(host1['running_vms'], 3)
+        self.assertEquals(host1['vcpus'], 6)
+        self.assertEquals(host1['memory_mb'], 768)
+        self.assertEquals(host1['disk_gb'], 45)
+        self.assertEquals(host1['current_workload'], 1)
+        self.assertEquals(host1['n_cpu_vms'], 2)
+        self.assertEquals(host1['n_io_vms'], 0)
+        self.assertEquals(host1['n_mem_vms'], 1)
+        self.assertEquals(host1['n_und_vms'], 0)
+
+        usage = db.instance_utilization_get_by_host(self.ctxt, host='host2')
+        self.assertEquals(usage.keys(), ['host2'])
+        self.assertEquals(usage['host2']['n_io_vms'], 1)
+
+    def test_compute_node_create_counts_workload_classes(self):
+        self._create_instance('host1', user_data='cpu')
+        self._create_instance('host1', user_data='io')
+        self._create_instance('host1')
+        item = self._create_helper('host1')
+        self.assertEquals(item.free_ram_mb, 1024 - 768)
+        self.assertEquals(item.free_disk_gb, 2048 - 45)
+        self.assertEquals(item.running_vms, 3)
+        self.assertEquals(item.n_cpu_vms, 1)
+        self.assertEquals(item.n_io_vms, 1)
+        self.assertEquals(item.n_mem_vms, 0)
+        self.assertEquals(item.n_und_vms, 1)
+
 
 class TestIpAllocation(test.TestCase):
 
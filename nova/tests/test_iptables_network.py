@@ -160,3 +160,91 @@ class IptablesManagerTestCase(test.TestCase):
             self.assertTrue('-A %s -j runner.py-%s' %
                             (chain, chain) in new_lines,
                             "Built-in chain %s not wrapped" % (chain,))
+
+    def _make_manager(self):
+        self.executed = []
+
+        def fake_execute(*cmd, **kwargs):
+            self.executed.append(cmd[0])
+            if cmd[0] == 'iptables-save':
+                if cmd[2] == 'nat':
+                    return '\n'.join(self.sample_nat), ''
+                return '\n'.join(self.sample_filter), ''
+            return '', ''
+
+        self.flags(use_ipv6=False)
+        return linux_net.IptablesManager(execute=fake_execute)
+
+    def test_apply_only_dirty_tables(self):
+        manager = self._make_manager()
+        manager.apply()
+        self.assertEqual(self.executed, ['iptables-save', 'iptables-restore',
+                                         'iptables-save', 'iptables-restore'])
+
+        self.executed = []
+        manager.apply()
+        self.assertEqual(self.executed, [])
+
+        manager.ipv4['nat'].add_rule('PREROUTING', '-j ACCEPT')
+        manager.apply()
+        self.assertEqual(self.executed, ['iptables-save', 'iptables-restore'])
+        self.assertFalse(manager.ipv4['nat'].dirty)
+
+        self.executed = []
+        manager.ipv4['filter'].remove_rule('FORWARD', '-j NOT-THERE')
+        manager.ipv4['filter'].add_chain('local')
+        manager.apply()
+        self.assertEqual(self.executed, [])
+
+    def test_deferred_apply(self):
+        self.flags(iptables_apply_delay_ms=10)
+        manager = self._make_manager()
+        manager.apply()
+        manager.ipv4['filter'].add_rule('FORWARD', '-j ACCEPT')
+        manager.apply()
+        self.assertEqual(self.executed, [])
+
+        manager.apply_and_wait()
+        self.assertEqual(self.executed, ['iptables-save', 'iptables-restore',
+                                         'iptables-save', 'iptables-restore'])
+
+    def test_table_rule_index(self):
+        table = self.manager.ipv4['filter']
+        table.add_chain('inst-1')
+        table.add_chain('inst-10')
+        table.add_rule('local', '-d 10.0.0.1 -j $inst-1')
+        table.add_rule('local', '-d 10.0.0.10 -j $inst-10')
+        table.add_rule('inst-1', '-j ACCEPT')
+        table.add_rule('inst-10', '-j ACCEPT')
+        table.add_rule('inst-10', '-j DROP')
+
+        table.remove_chain('inst-1')
+        rules = [(r.chain, r.rule) for r in table.rules
+                 if r.chain in ('local', 'inst-1', 'inst-10')]
+        self.assertEqual(rules,
+                         [('local', '-d 10.0.0.10 -j %s-inst-10' %
+                           linux_net.binary_name),
+                          ('inst-10', '-j ACCEPT'),
+                          ('inst-10', '-j DROP')])
+
+        table.empty_chain('inst-10')
+        self.assertEqual([r for r in table.rules if r.chain == 'inst-10'],
+                         [])
+
+    def test_table_duplicate_rules(self):
+        table = self.manager.ipv4['filter']
+        count = len(table.rules)
+        table.add_rule('INPUT', '-j ACCEPT')
+        table.add_rule('INPUT', '-j DROP')
+        table.add_rule('INPUT', '-j ACCEPT')
+        self.assertEqual([r.rule for r in table.rules[count:]],
+                         ['-j DROP', '-j ACCEPT', '-j ACCEPT'])
+
+        # Added twice, so it takes two removals
+        table.remove_rule('INPUT', '-j ACCEPT')
+        self.assertEqual([r.rule for r in table.rules[count:]],
+                         ['-j DROP', '-j ACCEPT'])
+        table.remove_rule('INPUT', '-j ACCEPT')
+        table.remove_rule('INPUT', '-j ACCEPT')
+        self.assertEqual([r.rule for r in table.rules[count:]],
+                         ['-j DROP'])
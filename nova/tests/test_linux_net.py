@@ -17,6 +17,7 @@
 
 import os
 
+from eventlet import greenthread
 import mox
 
 from nova import context
@@ -183,7 +184,7 @@ vifs = [{'id': 0,
          'instance_id': 1}]
 
 
-def get_associated(context, network_id, host=None):
+def get_associated(context, network_id, host=None, addresses=None):
     result = []
     for datum in fixed_ips:
         if (datum['network_id'] == network_id and datum['allocated']
@@ -192,6 +193,8 @@ def get_associated(context, network_id, host=None):
             instance = instances[datum['instance_id']]
             if host and host != instance['host']:
                 continue
+            if addresses is not None and datum['address'] not in addresses:
+                continue
             cleaned = {}
             cleaned['address'] = datum['address']
             cleaned['instance_id'] = datum['instance_id']
@@ -216,61 +219,96 @@ class LinuxNetworkTestCase(test.TestCase):
         self.context = context.RequestContext('testuser', 'testproject',
                                               is_admin=True)
 
-        def get_vifs(_context, instance_id):
-            return [vif for vif in vifs if vif['instance_id'] == instance_id]
+        def get_first_vif_ids(_context, instance_ids):
+            result = {}
+            for vif in vifs:
+                if vif['instance_id'] in instance_ids:
+                    result.setdefault(vif['instance_id'], vif['id'])
+            return result
 
         def get_instance(_context, instance_id):
             return instances[instance_id]
 
-        self.stubs.Set(db, 'virtual_interface_get_by_instance', get_vifs)
+        self.stubs.Set(db, 'virtual_interface_get_first_ids_by_instances',
+                       get_first_vif_ids)
         self.stubs.Set(db, 'instance_get', get_instance)
         self.stubs.Set(db, 'network_get_associated_fixed_ips', get_associated)
 
-    def test_update_dhcp_for_nw00(self):
+    def _stub_dhcp_files(self):
         self.flags(use_single_default_gateway=True)
-
+        self.stubs.Set(linux_net, '_dhcp_host_tables', {})
         self.mox.StubOutWithMock(self.driver, 'write_to_file')
         self.mox.StubOutWithMock(self.driver, 'ensure_path')
+        self.mox.StubOutWithMock(self.driver, '_dnsmasq_pid_for')
         self.mox.StubOutWithMock(os, 'chmod')
+        self.mox.StubOutWithMock(os, 'rename')
+        self.driver.ensure_path(mox.IgnoreArg()).MultipleTimes()
 
-        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
-        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
-        os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
+    def _expect_write(self, kind, text):
+        path = '%s/nova-eth0.%s' % (FLAGS.networks_path, kind)
+        self.driver.write_to_file(path + '.tmp', text)
+        os.chmod(path + '.tmp', 0644)
+        os.rename(path + '.tmp', path)
+
+    def test_update_dhcp_for_nw00(self):
+        self._stub_dhcp_files()
+        self._expect_write('conf', self.driver.get_dhcp_hosts(self.context,
+                                                              networks[0]))
+        self._expect_write('opts', 'NW-3,3\nNW-4,3')
+        self.driver._dnsmasq_pid_for('eth0').MultipleTimes()
 
         self.mox.ReplayAll()
 
         self.driver.update_dhcp(self.context, "eth0", networks[0])
 
     def test_update_dhcp_for_nw01(self):
-        self.flags(use_single_default_gateway=True)
+        self._stub_dhcp_files()
+        self.flags(host='fake_instance01')
+        self._expect_write('conf', self.driver.get_dhcp_hosts(self.context,
+                                                              networks[1]))
+        self._expect_write('opts', 'NW-5,3')
+        self.driver._dnsmasq_pid_for('eth0').MultipleTimes()
 
-        self.mox.StubOutWithMock(self.driver, 'write_to_file')
-        self.mox.StubOutWithMock(self.driver, 'ensure_path')
-        self.mox.StubOutWithMock(os, 'chmod')
+        self.mox.ReplayAll()
+
+        self.driver.update_dhcp(self.context, "eth0", networks[1])
 
-        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
-        self.driver.write_to_file(mox.IgnoreArg(), mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        self.driver.ensure_path(mox.IgnoreArg())
-        os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
-        os.chmod(mox.IgnoreArg(), mox.IgnoreArg())
+    def test_update_dhcp_with_addresses(self):
+        self._stub_dhcp_files()
+        self.stubs.Set(self.driver, '_restart_dhcp',
+                       lambda *args, **kwargs: None)
+        nw00_hosts = self.driver.get_dhcp_hosts(self.context, networks[0])
+        self._expect_write('conf', nw00_hosts)
+        self._expect_write('opts', 'NW-3,3\nNW-4,3')
+        self._expect_write('conf', nw00_hosts.split('\n')[1])
+        self._expect_write('opts', 'NW-3,3')
 
         self.mox.ReplayAll()
 
         self.driver.update_dhcp(self.context, "eth0", networks[0])
+        # unchanged fixed ips are not written again
+        self.driver.update_dhcp(self.context, "eth0", networks[0],
+                                ['192.168.0.100', '192.168.0.102'])
+        self.stubs.Set(self.driver.db, 'network_get_associated_fixed_ips',
+                       lambda *args, **kwargs: [])
+        self.driver.update_dhcp(self.context, "eth0", networks[0],
+                                ['192.168.0.100', '192.168.0.102'])
+
+    def test_deferred_dhcp_hup(self):
+        self.flags(dnsmasq_hup_delay_ms=10)
+        self.stubs.Set(linux_net, '_dhcp_hups_pending', set())
+        self.stubs.Set(self.driver, '_dnsmasq_pid_for', lambda dev: 42)
+        hups = []
+
+        def fake_execute(*cmd, **kwargs):
+            hups.append(cmd)
+
+        self.stubs.Set(self.driver, '_execute', fake_execute)
+        for i in xrange(3):
+            self.assertTrue(self.driver._hup_dhcp('eth0', 42))
+        self.assertEqual(hups, [])
+        greenthread.sleep(0.05)
+        self.assertEqual(hups, [('kill', '-HUP', 42)])
 
     def test_get_dhcp_hosts_for_nw00(self):
         self.flags(use_single_default_gateway=True)
@@ -302,7 +340,7 @@ class LinuxNetworkTestCase(test.TestCase):
         self.assertEquals(actual_hosts, expected)
 
     def test_get_dhcp_opts_for_nw00(self):
-        expected_opts = 'NW-0,3\nNW-3,3\nNW-4,3'
+        expected_opts = 'NW-3,3\nNW-4,3'
         actual_opts = self.driver.get_dhcp_opts(self.context, networks[0])
 
         self.assertEquals(actual_opts, expected_opts)
@@ -0,0 +1,116 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the in process fake memcache client."""
+
+from nova.common import memorycache
+from nova import test
+from nova import utils
+
+
+class MemoryCacheTestCase(test.TestCase):
+    def setUp(self):
+        super(MemoryCacheTestCase, self).setUp()
+        utils.set_time_override()
+        self.client = memorycache.Client([], debug=0)
+
+    def tearDown(self):
+        utils.clear_time_override()
+        super(MemoryCacheTestCase, self).tearDown()
+
+    def test_expiry(self):
+        self.client.set('short', 'a', time=10)
+        self.client.set('long', 'b', time=20)
+        self.client.set('forever', 'c')
+        utils.advance_time_seconds(9)
+        self.assertEqual(self.client.get('short'), 'a')
+        utils.advance_time_seconds(1)
+        self.assertEqual(self.client.get('short'), None)
+        self.assertEqual(sorted(self.client.cache), ['forever', 'long'])
+        utils.advance_time_seconds(100)
+        self.assertEqual(self.client.get('long'), None)
+        self.assertEqual(self.client.get('forever'), 'c')
+
+    def test_set_replaces_timeout(self):
+        self.client.set('key', 'a', time=10)
+        self.client.set('key', 'b', time=30)
+        utils.advance_time_seconds(20)
+        self.assertEqual(self.client.get('key'), 'b')
+        self.client.set('key', 'c')
+        utils.advance_time_seconds(20)
+        self.assertEqual(self.client.get('key'), 'c')
+
+    def test_timeouts_compacted(self):
+        for i in xrange(1000):
+            self.client.set('key', str(i), time=60)
+        self.assertTrue(len(self.client._timeouts) <= 66)
+        self.assertEqual(self.client.get('key'), '999')
+
+    def test_lru_eviction(self):
+        client = memorycache.Client(max_entries=2)
+        client.set('a', 1)
+        client.set('b', 2)
+        self.assertEqual(client.get('a'), 1)
+        client.set('c', 3)
+        self.assertEqual(client.get('b'), None)
+        self.assertEqual(client.get('a'), 1)
+        self.assertEqual(client.get('c'), 3)
+        self.assertEqual(client.evictions, 1)
+
+    def test_add(self):
+        self.assertTrue(self.client.add('key', 'a', time=10))
+        self.assertFalse(self.client.add('key', 'b'))
+        self.assertEqual(self.client.get('key'), 'a')
+        utils.advance_time_seconds(10)
+        self.assertTrue(self.client.add('key', 'c'))
+        self.assertEqual(self.client.get('key'), 'c')
+
+    def test_incr(self):
+        self.assertEqual(self.client.incr('key'), None)
+        self.client.set('key', '1', time=10)
+        self.assertEqual(self.client.incr('key'), 2)
+        self.assertEqual(self.client.incr('key', 3), 5)
+        self.assertEqual(self.client.get('key'), '5')
+        # incr keeps the timeout
+        utils.advance_time_seconds(10)
+        self.assertEqual(self.client.incr('key'), None)
+
+    def test_delete(self):
+        self.client.set('key', 'a', time=10)
+        self.client.delete('key')
+        self.assertEqual(self.client.get('key'), None)
+        self.client.set('key', 'b')
+        utils.advance_time_seconds(10)
+        self.assertEqual(self.client.get('key'), 'b')
+
+    def test_counters(self):
+        self.client.set('key', 'a')
+        self.client.get('key')
+        self.client.get('key')
+        self.client.get('other')
+        self.assertEqual((self.client.hits, self.client.misses), (2, 1))
+
+    def test_cache_reset(self):
+        client = memorycache.Client(max_entries=2)
+        client.set('a', 1, time=10)
+        client.set('b', 2)
+        client.cache = {}
+        client.set('a', 3)
+        client.set('c', 4)
+        client.set('d', 5)
+        utils.advance_time_seconds(10)
+        self.assertEqual(sorted(client.cache), ['c', 'd'])
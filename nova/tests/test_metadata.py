@@ -19,16 +19,22 @@
 """Tests for metadata service."""
 
 import base64
+
+import eventlet
 import webob
 
+from nova.api.metadata import cache
 from nova.api.metadata import handler
+from nova import context
 from nova.db.sqlalchemy import api
 from nova import db
 from nova import exception
 from nova import flags
 from nova import network
+from nova import rpc
 from nova import test
 from nova.tests import fake_network
+from nova import utils
 
 
 FLAGS = flags.FLAGS
@@ -47,6 +53,7 @@ class MetadataTestCase(test.TestCase):
     def setUp(self):
         super(MetadataTestCase, self).setUp()
         self.instance = ({'id': 1,
+                         'uuid': 'fake-uuid',
                          'name': 'fake',
                          'project_id': 'test',
                          'key_name': None,
@@ -71,7 +78,10 @@ class MetadataTestCase(test.TestCase):
         def instance_get_list(*args, **kwargs):
             return [self.instance]
 
+        self.fixed_ip_lookups = 0
+
         def get_fixed_ip_by_address(*args, **kwargs):
+            self.fixed_ip_lookups += 1
             return {'instance_id': self.instance['id']}
 
         fake_network.stub_out_nw_api_get_instance_nw_info(self.stubs,
@@ -183,3 +193,139 @@ class MetadataTestCase(test.TestCase):
         self.assertEqual(self.app._format_instance_mapping(ctxt,
                                                            instance_ref1),
                          expected)
+
+    def test_metadata_cached(self):
+        self.instance['user_data'] = base64.b64encode('happy')
+        self.assertEqual(self.request('/user-data'), 'happy')
+        self.instance['user_data'] = base64.b64encode('sad')
+        self.assertEqual(self.request('/user-data'), 'happy')
+        self.assertEqual(self.request('/meta-data/instance-type'), 'm1.tiny')
+        self.assertEqual(self.fixed_ip_lookups, 1)
+
+        self.app.invalidate_instance(None, 'other-uuid')
+        self.assertEqual(self.request('/user-data'), 'happy')
+        self.app.invalidate_instance(None, 'fake-uuid')
+        self.assertEqual(self.request('/user-data'), 'sad')
+        self.assertEqual(self.fixed_ip_lookups, 2)
+
+    def test_metadata_cache_disabled(self):
+        self.flags(metadata_cache_expiration=0)
+        self.app = handler.MetadataRequestHandler()
+        self.request('/user-data')
+        self.request('/user-data')
+        self.assertEqual(self.fixed_ip_lookups, 2)
+
+    def test_metadata_memcached_invalidated(self):
+        self.flags(memcached_servers=['localhost:11211'])
+        self.app = handler.MetadataRequestHandler()
+        self.instance['user_data'] = base64.b64encode('happy')
+        self.assertEqual(self.request('/user-data'), 'happy')
+        data, instance_uuid = self.app._memcache.get('metadata-127.0.0.1')
+        self.assertEqual(instance_uuid, 'fake-uuid')
+        self.instance['user_data'] = base64.b64encode('sad')
+        self.assertEqual(self.request('/user-data'), 'happy')
+        self.assertEqual(self.fixed_ip_lookups, 1)
+
+        self.app.invalidate_instance(None, 'other-uuid')
+        self.assertEqual(self.request('/user-data'), 'happy')
+        self.app.invalidate_instance(None, 'fake-uuid')
+        self.assertEqual(self.app._memcache.get('metadata-127.0.0.1'), None)
+        self.assertEqual(self.request('/user-data'), 'sad')
+        self.assertEqual(self.fixed_ip_lookups, 2)
+
+    def test_metadata_cache_invalidation_consumer(self):
+        self.flags(metadata_cache_invalidation=True)
+        self.app = handler.MetadataRequestHandler()
+        self.assertEqual(self.app._cache.ttl,
+                         FLAGS.metadata_cache_invalidated_expiration)
+        self.request('/user-data')
+        rpc.fanout_cast(context.get_admin_context(),
+                        FLAGS.metadata_cache_topic,
+                        {'method': 'invalidate_instance',
+                         'args': {'instance_uuid': 'fake-uuid'}})
+        self.app._conn.close()
+        self.request('/user-data')
+        self.assertEqual(self.fixed_ip_lookups, 2)
+
+    def test_concurrent_misses_coalesced(self):
+        instance_get = api.instance_get
+
+        def slow_instance_get(*args, **kwargs):
+            eventlet.sleep(0.01)
+            return instance_get(*args, **kwargs)
+
+        self.stubs.Set(api, 'instance_get', slow_instance_get)
+        pool = eventlet.GreenPool()
+        bodies = list(pool.imap(self.request, ['/user-data'] * 5))
+        self.assertEqual(bodies, [''] * 5)
+        self.assertEqual(self.fixed_ip_lookups, 1)
+        self.assertEqual(self.app._cache.misses, 1)
+
+
+class MetadataCacheTestCase(test.TestCase):
+    """Test the LRU cache of the metadata handler."""
+
+    def setUp(self):
+        super(MetadataCacheTestCase, self).setUp()
+        utils.set_time_override()
+
+    def tearDown(self):
+        utils.clear_time_override()
+        super(MetadataCacheTestCase, self).tearDown()
+
+    def test_lru_eviction(self):
+        metadata_cache = cache.MetadataCache(2, 60)
+        metadata_cache.set('10.0.0.1', 'a', 'uuid1')
+        metadata_cache.set('10.0.0.2', 'b', 'uuid2')
+        self.assertEqual(metadata_cache.get('10.0.0.1'), 'a')
+        metadata_cache.set('10.0.0.3', 'c', 'uuid3')
+        self.assertEqual(metadata_cache.get('10.0.0.2'), None)
+        self.assertEqual(metadata_cache.get('10.0.0.1'), 'a')
+        self.assertEqual(metadata_cache.get('10.0.0.3'), 'c')
+        self.assertEqual(metadata_cache.evictions, 1)
+        metadata_cache.invalidate('uuid1')
+        self.assertEqual(metadata_cache.get('10.0.0.1'), None)
+        self.assertEqual(metadata_cache.get('10.0.0.3'), 'c')
+
+    def test_invalidate_skips_key_reused_by_other_instance(self):
+        metadata_cache = cache.MetadataCache(2, 60)
+        metadata_cache.set('10.0.0.1', 'a', 'uuid1')
+        metadata_cache.set('10.0.0.1', 'b', 'uuid2')
+        metadata_cache.invalidate('uuid1')
+        self.assertEqual(metadata_cache.get('10.0.0.1'), 'b')
+        metadata_cache.invalidate('uuid2')
+        self.assertEqual(metadata_cache.get('10.0.0.1'), None)
+
+    def test_expiry(self):
+        metadata_cache = cache.MetadataCache(2, 60)
+        metadata_cache.set('10.0.0.1', 'a', 'uuid1')
+        utils.advance_time_seconds(59)
+        self.assertEqual(metadata_cache.get('10.0.0.1'), 'a')
+        utils.advance_time_seconds(1)
+        self.assertEqual(metadata_cache.get('10.0.0.1'), None)
+        self.assertEqual(len(metadata_cache), 0)
+
+    def test_invalidate_while_loading(self):
+        metadata_cache = cache.MetadataCache(2, 60)
+
+        def load():
+            metadata_cache.invalidate('uuid1')
+            return 'a', 'uuid1'
+
+        self.assertEqual(metadata_cache.get_or_load('10.0.0.1', load), 'a')
+        self.assertEqual(metadata_cache.get('10.0.0.1'), None)
+
+    def test_load_error_raised_to_waiters(self):
+        metadata_cache = cache.MetadataCache(2, 60)
+
+        def load():
+            eventlet.sleep(0.01)
+            raise exception.NotFound()
+
+        pool = eventlet.GreenPool()
+        threads = [pool.spawn(metadata_cache.get_or_load, '10.0.0.1', load)
+                   for _i in xrange(3)]
+        for thread in threads:
+            self.assertRaises(exception.NotFound, thread.wait)
+        self.assertEqual(metadata_cache.misses, 1)
+        self.assertEqual(metadata_cache._loading, {})
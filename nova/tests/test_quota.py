@@ -26,6 +26,8 @@ from nova import rpc
 from nova import test
 from nova import volume
 from nova.compute import instance_types
+from nova.db.sqlalchemy import api as sqlalchemy_api
+from nova.db.sqlalchemy import models
 from nova.scheduler import driver as scheduler_driver
 
 
@@ -456,3 +458,142 @@ class QuotaTestCase(test.TestCase):
         files = [(path, 'config = quotatest')]
         self.assertRaises(exception.QuotaError,
                           self._create_with_injected_files, files)
+
+    def _get_usages(self, *resources):
+        return db.quota_usage_get_all_by_project(self.context,
+                                                 self.project_id, resources,
+                                                 FLAGS.quota_usage_max_age)
+
+    def test_reserve_commit(self):
+        reservations = quota.reserve(self.context, instances=1, cores=2)
+        usages = self._get_usages('instances', 'cores')
+        self.assertEqual(usages['instances'], {'in_use': 0, 'reserved': 1})
+        self.assertEqual(usages['cores'], {'in_use': 0, 'reserved': 2})
+        self.assertEqual(quota.allowed_instances(self.context, 100,
+            self._get_instance_type('m1.tiny')), 1)
+        self.flags(quota_usage_max_age=3600)
+        quota.commit(self.context, reservations)
+        usages = self._get_usages('instances', 'cores')
+        self.assertEqual(usages['instances'], {'in_use': 1, 'reserved': 0})
+        self.assertEqual(usages['cores'], {'in_use': 2, 'reserved': 0})
+
+    def test_reserve_rollback(self):
+        reservations = quota.reserve(self.context, volumes=1, gigabytes=10)
+        quota.rollback(self.context, reservations)
+        usages = self._get_usages('volumes', 'gigabytes')
+        self.assertEqual(usages['volumes'], {'in_use': 0, 'reserved': 0})
+        self.assertEqual(usages['gigabytes'], {'in_use': 0, 'reserved': 0})
+
+    def test_reserve_counts_pending_reservations(self):
+        quota.reserve(self.context, instances=1)
+        quota.reserve(self.context, instances=1)
+        self.assertRaises(exception.OverQuota, quota.reserve, self.context,
+                          instances=1)
+        quota.reserve(self.context, floating_ips=1)
+        self.assertRaises(exception.OverQuota, quota.reserve, self.context,
+                          floating_ips=1)
+
+    def test_released_reservations_deleted(self):
+        quota.commit(self.context, quota.reserve(self.context, instances=1))
+        quota.rollback(self.context, quota.reserve(self.context, volumes=1))
+        reservations = sqlalchemy_api.model_query(
+                context.get_admin_context(), models.Reservation,
+                read_deleted="yes")
+        self.assertEqual(reservations.count(), 0)
+
+    def test_reserve_usage_created_concurrently(self):
+        self._get_usages('instances')
+        orig_get_all = sqlalchemy_api._quota_usage_get_all_by_project
+        calls = []
+
+        def fake_get_all(*args, **kwargs):
+            calls.append(None)
+            if len(calls) == 1:
+                # as if created since by another transaction
+                return {}
+            return orig_get_all(*args, **kwargs)
+
+        self.stubs.Set(sqlalchemy_api, '_quota_usage_get_all_by_project',
+                       fake_get_all)
+        quota.reserve(self.context, instances=1)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self._get_usages('instances')['instances'],
+                         {'in_use': 0, 'reserved': 1})
+
+    def test_reserve_unknown_resource(self):
+        self.assertRaises(exception.InvalidInput, quota.reserve,
+                          self.context, security_groups=1)
+
+    def test_reservation_expire(self):
+        self.flags(quota_reservation_expire=-1)
+        quota.reserve(self.context, instances=2)
+        self.assertRaises(exception.OverQuota, quota.reserve, self.context,
+                          instances=1)
+        quota.reconcile(context.get_admin_context())
+        self.assertEqual(self._get_usages('instances')['instances'],
+                         {'in_use': 0, 'reserved': 0})
+
+    def test_usage_kept_without_recount(self):
+        self.flags(quota_usage_max_age=3600)
+        instance_id = self._create_instance(cores=1)
+        volume_id = self._create_volume(size=5)
+        usages = self._get_usages('instances', 'cores', 'volumes',
+                                  'gigabytes')
+        self.assertEqual(usages['instances']['in_use'], 1)
+        self.assertEqual(usages['gigabytes']['in_use'], 5)
+
+        self.mox.StubOutWithMock(db, 'instance_data_get_for_project')
+        self.mox.StubOutWithMock(db, 'volume_data_get_for_project')
+        self.mox.ReplayAll()
+        db.instance_destroy(self.context, instance_id)
+        db.volume_destroy(self.context, volume_id)
+        usages = self._get_usages('instances', 'cores', 'volumes',
+                                  'gigabytes')
+        for resource in usages:
+            self.assertEqual(usages[resource], {'in_use': 0, 'reserved': 0})
+
+    def test_reconcile_corrects_drift(self):
+        self.flags(quota_usage_max_age=3600)
+        self._create_instance(cores=1)
+        self.assertEqual(self._get_usages('instances')['instances'],
+                         {'in_use': 1, 'reserved': 0})
+        # an instance made without reservation, to be recounted
+        self._create_instance(cores=1)
+        quota.commit(self.context, quota.reserve(self.context, cores=1))
+        self.assertEqual(self._get_usages('instances', 'cores'),
+                         {'instances': {'in_use': 1, 'reserved': 0},
+                          'cores': {'in_use': 2, 'reserved': 0}})
+        self.assertEqual(db.quota_usage_reconcile(self.context),
+                         [(self.project_id, 'instances', 1, 2)])
+        self.assertEqual(db.quota_usage_reconcile(self.context), [])
+
+    def test_recount_skips_pending_reservations(self):
+        self.flags(quota_usage_max_age=0)
+        reservations = quota.reserve(self.context, instances=1, cores=1)
+        # the row of the reservation is made before it is committed
+        self._create_instance(cores=1)
+        self.assertEqual(self._get_usages('instances', 'cores'),
+                         {'instances': {'in_use': 0, 'reserved': 1},
+                          'cores': {'in_use': 0, 'reserved': 1}})
+        self.assertEqual(db.quota_usage_reconcile(self.context), [])
+        quota.commit(self.context, reservations)
+        self.assertEqual(self._get_usages('instances', 'cores'),
+                         {'instances': {'in_use': 1, 'reserved': 0},
+                          'cores': {'in_use': 1, 'reserved': 0}})
+        self.assertEqual(db.quota_usage_reconcile(self.context), [])
+
+    def test_project_quotas_cached(self):
+        self.flags(quota_cache_ttl=60)
+        quota.invalidate_project_quotas(self.project_id)
+        self.assertEqual(quota.get_project_quotas(self.context,
+                                                  self.project_id)['ram'],
+                         FLAGS.quota_ram)
+        db.quota_create(self.context, self.project_id, 'ram', 2048)
+        self.assertEqual(quota.get_project_quotas(self.context,
+                                                  self.project_id)['ram'],
+                         FLAGS.quota_ram)
+        quota.invalidate_project_quotas(self.project_id)
+        self.assertEqual(quota.get_project_quotas(self.context,
+                                                  self.project_id)['ram'],
+                         2048)
+        quota.invalidate_project_quotas(self.project_id)
@@ -30,6 +30,8 @@ from nova.openstack.common import cfg
 from nova import test
 from nova import service
 from nova import manager
+from nova.notifier import capacity_notifier
+from nova.scheduler import api as scheduler_api
 from nova import wsgi
 
 
@@ -102,6 +104,16 @@ class ServiceFlagsTestCase(test.TestCase):
         db.service_destroy(context.get_admin_context(), app.service_id)
         self.assert_(ref['disabled'])
 
+    def test_stop_flushes_notifications(self):
+        self.flags(notification_driver='nova.notifier.capacity_notifier')
+        self.mox.StubOutWithMock(capacity_notifier, 'flush')
+        capacity_notifier.flush()
+        self.mox.ReplayAll()
+        app = service.Service.create(host='foo', binary='nova-fake')
+        app.start()
+        app.stop()
+        db.service_destroy(context.get_admin_context(), app.service_id)
+
 
 class ServiceTestCase(test.TestCase):
     """Test cases for Services"""
@@ -192,6 +204,54 @@ class ServiceTestCase(test.TestCase):
         self.assert_(not serv.model_disconnected)
 
 
+class SchedulerDependentManagerTestCase(test.TestCase):
+    """Test case for the capability updates sent to the schedulers"""
+
+    def setUp(self):
+        super(SchedulerDependentManagerTestCase, self).setUp()
+        self.flags(capabilities_full_update_interval=3)
+        self.context = context.get_admin_context()
+        self.manager = manager.SchedulerDependentManager(
+                host='fake_host', service_name='fake_service')
+        self.updates = []
+
+        def fake_update(context, service_name, host, capabilities,
+                        seq=None, full=True, removed=None):
+            self.updates.append((seq, full, capabilities, removed))
+
+        self.stubs.Set(scheduler_api, 'update_service_capabilities',
+                       fake_update)
+
+    def _publish(self, capabilities):
+        self.manager.update_service_capabilities(capabilities)
+        self.manager._publish_service_capabilities(self.context)
+
+    def test_publish_nothing(self):
+        self._publish(None)
+        self.assertEqual(self.updates, [])
+
+    def test_publish_changes_and_full_updates(self):
+        self._publish(dict(a=1, b=2))
+        self._publish(dict(a=1, b=3))
+        self._publish(dict(a=1, c=4))
+        self._publish(dict(a=1, c=4))
+        self._publish(dict(a=1, c=4))
+        self.assertEqual(self.updates,
+                         [(1, True, dict(a=1, b=2), None),
+                          (2, False, dict(b=3), []),
+                          (3, False, dict(c=4), ['b']),
+                          (4, True, dict(a=1, c=4), None),
+                          (5, False, {}, [])])
+
+    def test_request_full_capabilities(self):
+        self._publish(dict(a=1))
+        self.manager.request_full_capabilities(self.context)
+        self._publish(dict(a=2))
+        self.assertEqual(self.updates,
+                         [(1, True, dict(a=1), None),
+                          (2, True, dict(a=2), None)])
+
+
 class TestWSGIService(test.TestCase):
 
     def setUp(self):
@@ -0,0 +1,68 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the workload class classifier."""
+
+import base64
+
+from nova.compute import workload_classes
+from nova import test
+
+
+def fake_classifier(instance_properties):
+    return instance_properties['memory_mb'] > 4096 and 'mem' or 'cpu'
+
+
+def bogus_classifier(instance_properties):
+    return 'gpu'
+
+
+class WorkloadClassesTestCase(test.TestCase):
+
+    def test_from_user_data(self):
+        self.assertEqual(workload_classes.from_user_data(None), 'und')
+        self.assertEqual(workload_classes.from_user_data('!!'), 'und')
+        self.assertEqual(workload_classes.from_user_data(
+                base64.b64encode('cpu')), 'cpu')
+        self.assertEqual(workload_classes.from_user_data(
+                base64.b64encode('cpu and more')), 'und')
+
+    def test_classify_with_default_classifier(self):
+        self.assertEqual(workload_classes.classify(
+                {'user_data': base64.b64encode('mem')}), 'mem')
+        self.assertEqual(workload_classes.classify({}), 'und')
+
+    def test_classify_with_custom_classifier(self):
+        self.flags(workload_classifier='nova.tests.test_workload_classes.'
+                                       'fake_classifier')
+        self.assertEqual(workload_classes.classify({'memory_mb': 8192}),
+                         'mem')
+        self.assertEqual(workload_classes.classify({'memory_mb': 512}),
+                         'cpu')
+
+    def test_classify_unknown_class_is_und(self):
+        self.flags(workload_classifier='nova.tests.test_workload_classes.'
+                                       'bogus_classifier')
+        self.assertEqual(workload_classes.classify({}), 'und')
+
+    def test_get_workload_class(self):
+        self.assertEqual(workload_classes.get_workload_class(
+                {'workload_class': 'io',
+                 'user_data': base64.b64encode('cpu')}), 'io')
+        # Requests made before the attribute existed are classified
+        self.assertEqual(workload_classes.get_workload_class(
+                {'user_data': base64.b64encode('cpu')}), 'cpu')
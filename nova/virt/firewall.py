@@ -137,7 +137,8 @@ class IptablesFirewallDriver(FirewallDriver):
         LOG.debug(_('Filters added to instance %s'), instance['uuid'])
         self.refresh_provider_fw_rules()
         LOG.debug(_('Provider Firewall Rules refreshed'))
-        self.iptables.apply()
+        # The instance must not start unfiltered
+        self.iptables.apply_and_wait()
 
     def _create_filter(self, ips, chain_name):
         return ['-d %s -j $%s' % (ip, chain_name) for ip in ips]
@@ -80,7 +80,10 @@ class API(base.Base):
         else:
             snapshot_id = None
 
-        if quota.allowed_volumes(context, 1, size) < 1:
+        try:
+            reservations = quota.reserve(context, volumes=1,
+                                         gigabytes=int(size))
+        except exception.OverQuota:
             pid = context.project_id
             LOG.warn(_("Quota exceeded for %(pid)s, tried to create"
                     " %(size)sG volume") % locals())
@@ -108,7 +111,12 @@ class API(base.Base):
             'metadata': metadata,
             }
 
-        volume = self.db.volume_create(context, options)
+        try:
+            volume = self.db.volume_create(context, options)
+        except Exception:
+            with utils.save_and_reraise_exception():
+                quota.rollback(context, reservations)
+        quota.commit(context, reservations)
         rpc.cast(context,
                  FLAGS.scheduler_topic,
                  {"method": "create_volume",
@@ -161,6 +169,15 @@ class API(base.Base):
         check_policy(context, 'get', volume)
         return volume
 
+    def get_all_by_ids(self, context, volume_ids):
+        """Return the volumes of volume_ids that exist, read at once."""
+        volumes = [dict(rv.iteritems())
+                   for rv in self.db.volume_get_all_by_ids(context,
+                                                           volume_ids)]
+        for volume in volumes:
+            check_policy(context, 'get', volume)
+        return volumes
+
     def get_all(self, context, search_opts={}):
         check_policy(context, 'get_all')
         if context.is_admin:
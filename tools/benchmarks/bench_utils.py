@@ -0,0 +1,78 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Helpers shared by the scripts in tools/benchmarks.
+
+The benchmark scripts add the top of the source tree to sys.path before
+importing this module, so nova is importable from here.
+"""
+
+import os
+import tempfile
+import time
+
+from nova import flags
+
+
+FLAGS = flags.FLAGS
+
+
+def setup_database(path=None):
+    """Point nova at a fresh sqlite database and migrate it.
+
+    Returns the path of the database file, the caller removes it.
+    """
+    from nova.db import migration
+    from nova.db.sqlalchemy import session
+
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix='nova-bench-', suffix='.sqlite')
+        os.close(fd)
+        os.unlink(path)
+    FLAGS.set_override('sql_connection', 'sqlite:///%s' % path)
+    # Drop the cached engine so the new database is picked up.
+    session._ENGINE = None
+    session._MAKER = None
+    migration.db_sync()
+    return path
+
+
+def timeit(fn, repeat=3):
+    """Return the best wall time in seconds of repeat calls of fn()."""
+    best = None
+    for _i in xrange(repeat):
+        start = time.time()
+        fn()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def report(title, rows, headers):
+    """Print a simple fixed width table."""
+    print title
+    widths = [max(len(str(h)), 12) for h in headers]
+    print '  '.join(str(h).rjust(w) for h, w in zip(headers, widths))
+    for row in rows:
+        cells = []
+        for value, width in zip(row, widths):
+            if isinstance(value, float):
+                value = '%.4f' % value
+            cells.append(str(value).rjust(width))
+        print '  '.join(cells)
+    print
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""capability_updates.py - Size and cost of compute capability updates
+
+Publishes the capabilities of N compute hosts for a number of periodic
+ticks, with a few capabilities changing on every tick, and applies the
+updates in a scheduler HostManager.  Compares sending the full
+capabilities every time (capabilities_full_update_interval=1) with the
+partial updates.  Reports the bytes sent per tick and the scheduler time
+spent applying them.
+
+"""
+
+import gettext
+import json
+import optparse
+import os
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import flags
+from nova import manager
+from nova.scheduler import api as scheduler_api
+from nova.scheduler import host_manager
+
+import bench_utils
+
+
+FLAGS = flags.FLAGS
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--hosts', default='100,1000',
+                      help='Comma separated numbers of compute hosts')
+    parser.add_option('--ticks', type='int', default=20,
+                      help='Number of periodic updates per host')
+    parser.add_option('--full-update-interval', type='int', default=10,
+                      help='capabilities_full_update_interval of the '
+                           'partial updates')
+    return parser.parse_args()
+
+
+def host_capabilities(i, tick):
+    """Capabilities shaped like the ones of a libvirt compute host."""
+    return {'vcpus': 64, 'vcpus_used': tick % 64,
+            'memory_mb': 262144, 'memory_mb_used': 1024 * tick,
+            'local_gb': 8192, 'local_gb_used': 10 * tick,
+            'disk_total': 8192, 'disk_used': 10 * tick,
+            'disk_available': 8192 - 10 * tick,
+            'host_memory_total': 262144,
+            'host_memory_free': 262144 - 1024 * tick,
+            'hypervisor_type': 'QEMU', 'hypervisor_version': 1000000,
+            'hypervisor_hostname': 'host%d' % i,
+            'cpu_info': json.dumps({'arch': 'x86_64', 'model': 'Westmere',
+                                    'vendor': 'Intel',
+                                    'topology': {'cores': 8, 'threads': 2,
+                                                 'sockets': 4},
+                                    'features': ['sse%d' % n
+                                                 for n in xrange(40)]}),
+            'beta_cpu': 0.3, 'beta_io': 0.2, 'beta_mem': 0.3,
+            'beta_und': 0.2}
+
+
+def run(hosts, ticks, full_update_interval):
+    """Return the bytes sent per tick and the seconds the scheduler spent
+    applying the updates.
+    """
+    FLAGS.set_override('capabilities_full_update_interval',
+                       full_update_interval)
+    ctxt = context.get_admin_context()
+    messages = []
+
+    def fake_update(context, service_name, host, capabilities, **kwargs):
+        messages.append(dict(service_name=service_name, host=host,
+                             capabilities=capabilities, **kwargs))
+
+    scheduler_api.update_service_capabilities = fake_update
+    managers = [manager.SchedulerDependentManager(host='host%d' % i,
+                                                  service_name='compute')
+                for i in xrange(hosts)]
+    for tick in xrange(ticks):
+        for i, mgr in enumerate(managers):
+            mgr.update_service_capabilities(host_capabilities(i, tick))
+            mgr._publish_service_capabilities(ctxt)
+
+    size = sum(len(json.dumps(message)) for message in messages)
+    hm = host_manager.HostManager()
+    seconds = bench_utils.timeit(lambda: [
+            hm.update_service_capabilities(**message)
+            for message in messages], 1)
+    return size / ticks, seconds
+
+
+def main():
+    options, _args = parse_options()
+    rows = []
+    for hosts in [int(s) for s in options.hosts.split(',')]:
+        full_size, full_time = run(hosts, options.ticks, 1)
+        delta_size, delta_time = run(hosts, options.ticks,
+                                     options.full_update_interval)
+        rows.append((hosts, full_size, delta_size, full_time, delta_time,
+                     full_time / delta_time))
+    bench_utils.report('Capability updates over %d ticks' % options.ticks,
+                       rows, ['hosts', 'full B/tick', 'delta B/tick',
+                              'full apply s', 'delta apply s', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
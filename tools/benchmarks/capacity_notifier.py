@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""capacity_notifier.py - Events per second of the capacity notifier
+
+Feeds a burst of compute.instance.delete.end events for a number of
+hosts, as seen during a mass delete, to the capacity notifier.  Compares
+the locked per event compute_node_utilization_update() with the batched
+updates of capacity_notifier_batch_interval_ms.
+
+"""
+
+import gettext
+import optparse
+import os
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import db
+from nova import flags
+from nova.notifier import capacity_notifier
+
+import bench_utils
+
+
+FLAGS = flags.FLAGS
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--events', default='1000,5000',
+                      help='Comma separated numbers of events')
+    parser.add_option('--hosts', type='int', default=20,
+                      help='Number of compute hosts')
+    parser.add_option('--max-events', type='int', default=100,
+                      help='capacity_notifier_batch_max_events')
+    return parser.parse_args()
+
+
+def populate(ctxt, hosts):
+    for i in xrange(hosts):
+        service = db.service_create(ctxt, dict(host='host%d' % i,
+                binary='nova-compute', topic='compute', report_count=0,
+                disabled=False))
+        db.compute_node_create(ctxt, dict(service_id=service['id'],
+                vcpus=64, memory_mb=262144, local_gb=8192, vcpus_used=0,
+                memory_mb_used=0, local_gb_used=0, hypervisor_type='qemu',
+                hypervisor_version=1, cpu_info=''))
+
+
+def make_events(count, hosts):
+    return [dict(publisher_id='compute.host%d' % (i % hosts),
+                 event_type='compute.instance.delete.end',
+                 payload=dict(memory_mb=512, disk_gb=10))
+            for i in xrange(count)]
+
+
+def feed(events):
+    for event in events:
+        capacity_notifier.notify(event)
+    capacity_notifier.flush()
+
+
+def main():
+    options, _args = parse_options()
+    ctxt = context.get_admin_context()
+    FLAGS.set_override('capacity_notifier_batch_max_events',
+                       options.max_events)
+    rows = []
+    for count in [int(s) for s in options.events.split(',')]:
+        path = bench_utils.setup_database()
+        try:
+            populate(ctxt, options.hosts)
+            events = make_events(count, options.hosts)
+
+            FLAGS.set_override('capacity_notifier_batch_interval_ms', 0)
+            per_event = bench_utils.timeit(lambda: feed(events), 1)
+            FLAGS.set_override('capacity_notifier_batch_interval_ms', 1000)
+            batched = bench_utils.timeit(lambda: feed(events), 1)
+            rows.append((count, count / per_event, count / batched,
+                         per_event / batched))
+        finally:
+            os.unlink(path)
+    bench_utils.report('Capacity notifier events/sec on %d hosts' %
+                       options.hosts, rows,
+                       ['events', 'per event', 'batched', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""dnsmasq_hosts.py - Cost of the dnsmasq updates of fixed ip allocations
+
+Boots a batch of instances on a flat network that already has a number
+of allocated fixed ips, calling linux_net.update_dhcp() for every fixed
+ip allocated the way FlatDHCPManager does, with
+use_single_default_gateway.  dnsmasq is not run, HUPs are counted.
+Compares rebuilding the hosts and opts files from the database on every
+allocation (the old behaviour) with the incremental host table, with and
+without dnsmasq_hup_delay_ms.
+
+"""
+
+import gettext
+import optparse
+import os
+import shutil
+import sys
+import tempfile
+
+import eventlet
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import db
+from nova import flags
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy.session import get_session
+from nova.network import linux_net
+
+import bench_utils
+
+
+FLAGS = flags.FLAGS
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--sizes', default='200,1000',
+                      help='Comma separated numbers of allocated fixed ips')
+    parser.add_option('--boots', type='int', default=5,
+                      help='Number of instances booted')
+    parser.add_option('--delay-ms', type='int', default=500,
+                      help='dnsmasq_hup_delay_ms of the deferred run')
+    return parser.parse_args()
+
+
+def address(i):
+    return '10.%d.%d.%d' % (i / 65536, i / 256 % 256, i % 256 + 1)
+
+
+def populate(count, boots):
+    session = get_session()
+    network_id = session.execute(models.Network.__table__.insert(),
+            dict(cidr='10.0.0.0/8', bridge='br100', multi_host=False,
+                 deleted=False)).inserted_primary_key[0]
+    for table, rows in [
+            (models.Instance,
+             [dict(id=i + 1, hostname='server-%d' % i, deleted=False)
+              for i in xrange(count + boots)]),
+            (models.VirtualInterface,
+             [dict(id=i + 1, instance_id=i + 1, network_id=network_id,
+                   address='02:16:3e:%02x:%02x:%02x' %
+                           (i / 65536, i / 256 % 256, i % 256),
+                   deleted=False)
+              for i in xrange(count + boots)]),
+            (models.FixedIp,
+             [dict(address=address(i), network_id=network_id,
+                   instance_id=i + 1, virtual_interface_id=i + 1,
+                   allocated=i < count, deleted=False)
+              for i in xrange(count + boots)])]:
+        session.execute(table.__table__.insert(), rows)
+    return db.network_get(context.get_admin_context(), network_id)
+
+
+def legacy_get_dhcp_opts(ctxt, network_ref):
+    """get_dhcp_opts() as it was, one vif query per instance."""
+    data = db.network_get_associated_fixed_ips(ctxt, network_ref['id'])
+    default_gw_vif = {}
+    for instance_id in set([datum['instance_id'] for datum in data]):
+        vifs = db.virtual_interface_get_by_instance(ctxt, instance_id)
+        if vifs:
+            default_gw_vif[instance_id] = vifs[0]['id']
+    return linux_net._dhcp_opts_text(data, default_gw_vif)
+
+
+def legacy_update_dhcp(ctxt, dev, network_ref, addresses=None):
+    """update_dhcp() as it was, rewriting the files on every call."""
+    linux_net.write_to_file(linux_net._dhcp_file(dev, 'conf'),
+                            linux_net.get_dhcp_hosts(ctxt, network_ref))
+    linux_net.write_to_file(linux_net._dhcp_file(dev, 'opts'),
+                            legacy_get_dhcp_opts(ctxt, network_ref))
+    linux_net._restart_dhcp(ctxt, dev, network_ref)
+
+
+def run(update_dhcp, count, boots, network_ref, delay_ms):
+    """Return the HUPs sent and the seconds taken by the boots."""
+    FLAGS.set_override('dnsmasq_hup_delay_ms', delay_ms)
+    ctxt = context.get_admin_context()
+    hups = []
+
+    def fake_execute(*cmd, **kwargs):
+        if cmd[:2] == ('kill', '-HUP'):
+            hups.append(cmd)
+        return 'nova-br100.conf', ''
+
+    linux_net._execute = fake_execute
+    linux_net._dnsmasq_pid_for = lambda dev: 1
+    linux_net._dhcp_host_tables.clear()
+    update_dhcp(ctxt, 'br100', network_ref)
+    del hups[:]
+
+    def boot():
+        for i in xrange(count, count + boots):
+            db.fixed_ip_update(ctxt, address(i), {'allocated': True})
+            update_dhcp(ctxt, 'br100', network_ref, [address(i)])
+
+    def release():
+        for i in xrange(count, count + boots):
+            db.fixed_ip_update(ctxt, address(i), {'allocated': False})
+
+    seconds = bench_utils.timeit(boot, 1)
+    # let the deferred HUPs run
+    eventlet.sleep(delay_ms / 1000.0)
+    release()
+    return len(hups), seconds
+
+
+def main():
+    options, _args = parse_options()
+    FLAGS.set_override('lock_path', '/tmp')
+    FLAGS.set_override('use_single_default_gateway', True)
+    networks_path = tempfile.mkdtemp(prefix='nova-bench-')
+    FLAGS.set_override('networks_path', networks_path)
+    runs = [(legacy_update_dhcp, 0),
+            (linux_net.update_dhcp, 0),
+            (linux_net.update_dhcp, options.delay_ms)]
+    rows = []
+    try:
+        for count in [int(s) for s in options.sizes.split(',')]:
+            path = bench_utils.setup_database()
+            try:
+                network_ref = populate(count, options.boots)
+                hups = []
+                rates = []
+                for update_dhcp, delay_ms in runs:
+                    hup_count, seconds = run(update_dhcp, count,
+                                             options.boots, network_ref,
+                                             delay_ms)
+                    hups.append(hup_count)
+                    rates.append(options.boots / seconds)
+                rows.append(tuple([count] + hups + rates))
+            finally:
+                os.unlink(path)
+    finally:
+        shutil.rmtree(networks_path)
+    bench_utils.report('dnsmasq HUPs and boots/sec for %d boots' %
+                       options.boots, rows,
+                       ['fixed ips', 'HUPs old', 'HUPs table',
+                        'HUPs deferred', 'boots/s old', 'boots/s table',
+                        'boots/s deferred'])
+
+
+if __name__ == '__main__':
+    main()
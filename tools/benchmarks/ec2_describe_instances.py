@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""ec2_describe_instances.py - Queries and latency of DescribeInstances
+
+Runs an admin DescribeInstances against a sqlite database of a number of
+instances booted from --images images with a kernel and a ramdisk, spread
+over --hosts hosts, one in --volume-every of them with a volume attached.
+Compares the formatter reading the images, block device mappings,
+volumes and services one instance at a time, as it did, with it reading
+them for all the instances at once, and counts the SQL statements of
+each.  The old lookups of the services are made once per host rather than
+once per instance, so the old counts are a lower bound.
+
+Fails when the batched formatter issues more than --max-queries
+statements or is not faster.
+
+"""
+
+import datetime
+import gettext
+import optparse
+import os
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from sqlalchemy import event
+
+from nova.api.ec2 import cloud
+from nova.api.ec2 import ec2utils
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy import session
+from nova import utils
+
+import bench_utils
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--instances', default='100,1000',
+                      help='Comma separated numbers of instances')
+    parser.add_option('--hosts', type='int', default=50,
+                      help='Number of compute hosts')
+    parser.add_option('--images', type='int', default=10,
+                      help='Number of images the instances were booted from')
+    parser.add_option('--volume-every', type='int', default=4,
+                      help='One instance in this many has a volume')
+    parser.add_option('--max-queries', type='int', default=10,
+                      help='Most statements the batched formatter may issue')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='Best of this many calls')
+    return parser.parse_args()
+
+
+def populate(count, options):
+    sess = session.get_session()
+    sess.execute(models.Service.__table__.insert(),
+            [dict(id=i + 1, host='host%d' % i, binary='nova-compute',
+                  topic='compute', report_count=0,
+                  availability_zone='zone%d' % (i % 3), deleted=False)
+             for i in xrange(options.hosts)])
+    images = [(str(utils.gen_uuid()), str(utils.gen_uuid()),
+               str(utils.gen_uuid())) for i in xrange(options.images)]
+    start = datetime.datetime(2012, 1, 1)
+    sess.execute(models.Instance.__table__.insert(),
+            [dict(id=i + 1, uuid=str(utils.gen_uuid()),
+                  host='host%d' % (i % options.hosts),
+                  hostname='server-%d' % i, reservation_id='r-%d' % i,
+                  project_id='project', user_id='user', instance_type_id=1,
+                  image_ref=images[i % options.images][0],
+                  kernel_id=images[i % options.images][1],
+                  ramdisk_id=images[i % options.images][2],
+                  launch_index=0, vm_state='active',
+                  created_at=start + datetime.timedelta(seconds=i),
+                  deleted=False)
+             for i in xrange(count)])
+    attached = range(0, count, options.volume_every)
+    if attached:
+        sess.execute(models.Volume.__table__.insert(),
+                [dict(id=n + 1, instance_id=i + 1, size=1,
+                      mountpoint='/dev/vdb', attach_status='attached',
+                      status='in-use', project_id='project', user_id='user',
+                      deleted=False)
+                 for n, i in enumerate(attached)])
+        sess.execute(models.BlockDeviceMapping.__table__.insert(),
+                [dict(instance_id=i + 1, device_name='/dev/vdb',
+                      volume_id=n + 1, delete_on_termination=False,
+                      deleted=False)
+                 for n, i in enumerate(attached)])
+
+
+def stub_one_at_a_time(controller):
+    """Make the bulk lookups the formatter uses read one row at a time,
+    the way it read them, and return a function undoing it.
+    """
+    saved = [(ec2utils, 'glance_ids_to_ids', ec2utils.glance_ids_to_ids),
+             (db, 'block_device_mapping_get_all_by_instances',
+              db.block_device_mapping_get_all_by_instances),
+             (db, 'service_get_all_by_hosts', db.service_get_all_by_hosts)]
+
+    def glance_ids_to_ids(ctxt, glance_ids):
+        return dict((glance_id, ec2utils.glance_id_to_id(ctxt, glance_id))
+                    for glance_id in glance_ids)
+
+    def block_device_mapping_get_all_by_instances(ctxt, instance_ids):
+        bdms = []
+        for instance_id in instance_ids:
+            bdms.extend(db.block_device_mapping_get_all_by_instance(
+                    ctxt, instance_id))
+        return bdms
+
+    def service_get_all_by_hosts(ctxt, hosts):
+        services = []
+        for host in hosts:
+            services.extend(db.service_get_all_by_host(ctxt, host))
+        return services
+
+    ec2utils.glance_ids_to_ids = glance_ids_to_ids
+    db.block_device_mapping_get_all_by_instances = \
+            block_device_mapping_get_all_by_instances
+    db.service_get_all_by_hosts = service_get_all_by_hosts
+    # the volumes given are only used when they are all there
+    controller.volume_api.get_all_by_ids = lambda ctxt, volume_ids: []
+
+    def restore():
+        for module, name, fn in saved:
+            setattr(module, name, fn)
+        del controller.volume_api.get_all_by_ids
+
+    return restore
+
+
+def main():
+    options, _args = parse_options()
+    ctxt = context.get_admin_context()
+    statements = []
+    rows = []
+    for count in [int(s) for s in options.instances.split(',')]:
+        path = bench_utils.setup_database()
+        try:
+            event.listen(session.get_engine(), 'before_cursor_execute',
+                         lambda *args: statements.append(None))
+            populate(count, options)
+            controller = cloud.CloudController()
+
+            def _describe():
+                return controller.describe_instances(ctxt)
+
+            # create the s3 images the first call would
+            expected = _describe()
+            restore = stub_one_at_a_time(controller)
+            try:
+                assert _describe() == expected
+                del statements[:]
+                _describe()
+                old_queries = len(statements)
+                old = bench_utils.timeit(_describe, options.repeat)
+            finally:
+                restore()
+            assert _describe() == expected
+            del statements[:]
+            _describe()
+            new_queries = len(statements)
+            new = bench_utils.timeit(_describe, options.repeat)
+            assert new_queries <= options.max_queries, new_queries
+            assert new < old
+            rows.append((count, old_queries, new_queries, old * 1000,
+                         new * 1000, old / new))
+        finally:
+            os.unlink(path)
+    bench_utils.report('admin DescribeInstances, %d hosts, %d images, a '
+                       'volume on 1 in %d instances' %
+                       (options.hosts, options.images, options.volume_every),
+                       rows,
+                       ['instances', 'old queries', 'new queries', 'old ms',
+                        'new ms', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""fixed_ip_pool.py - Fixed ip allocations per second of concurrent callers
+
+Allocates fixed ips of one network from a number of concurrent green
+callers, one instance at a time through fixed_ip_associate_pool() and
+through a FixedIpPool, and --bulk instances per call through
+FixedIpPool.allocate().  sqlite cannot run concurrent writers, so the
+database is simulated: every statement and commit costs a green sleep of
+--rtt-ms, and fixed_ip_associate_pool() holds the lock of the first free
+row, which every caller selects, until it commits.
+
+"""
+
+import collections
+import gettext
+import optparse
+import os
+import sys
+import time
+
+import eventlet
+from eventlet import semaphore
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import exception
+from nova.network import fixed_ip_pool
+
+import bench_utils
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--callers', default='1,8,32',
+                      help='Comma separated numbers of concurrent callers')
+    parser.add_option('--allocations', type='int', default=2000,
+                      help='Number of fixed ips allocated per run')
+    parser.add_option('--pool-size', type='int', default=64,
+                      help='fixed_ip_pool_size')
+    parser.add_option('--bulk', type='int', default=8,
+                      help='Instances per FixedIpPool.allocate() call')
+    parser.add_option('--rtt-ms', type='float', default=0.5,
+                      help='Simulated cost of one statement or commit')
+    return parser.parse_args()
+
+
+class SimulatedDB(object):
+    """The fixed ips of one network, with round trips and row locks."""
+
+    def __init__(self, count, rtt_ms):
+        self.rtt = rtt_ms / 1000.0
+        self.free = collections.deque('10.%d.%d.%d' % (i / 65536,
+                                                      i / 256 % 256,
+                                                      i % 256)
+                                      for i in xrange(count))
+        self.owners = {}
+        self.instances = {}
+        self.row_lock = semaphore.Semaphore()
+        self.statements = 0
+
+    def _execute(self, statements=1):
+        self.statements += statements
+        eventlet.sleep(self.rtt * statements)
+
+    def fixed_ip_associate_pool(self, context, network_id, instance_id=None,
+                                host=None):
+        with self.row_lock:
+            # select ... for update, update, commit
+            self._execute(3)
+            if not self.free:
+                raise exception.NoMoreFixedIps()
+            address = self.free.popleft()
+            self.instances[address] = instance_id
+        return address
+
+    def fixed_ip_reserve_pool(self, context, network_id, owner, count):
+        # select, update, select, commit
+        self._execute(4)
+        addresses = [self.free.popleft()
+                     for _i in xrange(min(count, len(self.free)))]
+        for address in addresses:
+            self.owners[address] = owner
+        return addresses
+
+    def fixed_ip_associate_reserved(self, context, owner,
+                                    instance_ids_by_address):
+        # an update per address, commit
+        self._execute(len(instance_ids_by_address) + 1)
+        associated = []
+        for address, instance_id in instance_ids_by_address:
+            if self.owners.pop(address, None) == owner:
+                self.instances[address] = instance_id
+                associated.append(address)
+        return associated
+
+    def fixed_ip_release_pool(self, context, owner, addresses=None):
+        self._execute(2)
+        for address in addresses:
+            del self.owners[address]
+            self.free.append(address)
+        return len(addresses)
+
+
+def run(callers, allocations, rtt_ms, pool_size=None, bulk=1):
+    """Return the allocations/sec and the statements per allocation."""
+    ctxt = context.get_admin_context()
+    sim = SimulatedDB(allocations, rtt_ms)
+    pool = None
+    if pool_size:
+        pool = fixed_ip_pool.FixedIpPool('host1', pool_size, sim)
+    instance_ids = range(allocations)
+    batches = [instance_ids[i:i + bulk]
+               for i in xrange(0, allocations, bulk)]
+
+    def caller(index):
+        for batch in batches[index::callers]:
+            if pool:
+                pool.allocate(ctxt, 1, batch)
+            else:
+                sim.fixed_ip_associate_pool(ctxt, 1, batch[0])
+
+    greenpool = eventlet.GreenPool(callers)
+    start = time.time()
+    for index in xrange(callers):
+        greenpool.spawn_n(caller, index)
+    greenpool.waitall()
+    seconds = time.time() - start
+    if pool:
+        pool.release(ctxt)
+    assert len(set(sim.instances)) == allocations
+    return allocations / seconds, float(sim.statements) / allocations
+
+
+def main():
+    options, _args = parse_options()
+    rows = []
+    for callers in [int(s) for s in options.callers.split(',')]:
+        locked, locked_statements = run(callers, options.allocations,
+                                        options.rtt_ms)
+        pooled, pooled_statements = run(callers, options.allocations,
+                                        options.rtt_ms, options.pool_size)
+        bulk, bulk_statements = run(callers, options.allocations,
+                                    options.rtt_ms, options.pool_size,
+                                    options.bulk)
+        rows.append((callers, locked, pooled, bulk, locked_statements,
+                     pooled_statements, bulk_statements))
+    bench_utils.report('fixed ip allocations/sec and statements per '
+                       'allocation, %.1f ms per statement, pool of %d, %d '
+                       'per bulk call' % (options.rtt_ms, options.pool_size,
+                                          options.bulk), rows,
+                       ['callers', 'locked', 'pool', 'pool bulk',
+                        'stmts locked', 'stmts pool', 'stmts bulk'])
+
+
+if __name__ == '__main__':
+    main()
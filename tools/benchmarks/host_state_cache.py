@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""host_state_cache.py - Time HostManager.get_all_host_states
+
+Compares rebuilding host states from instance_get_all on every request
+(the old behaviour) with the cached HostManager, both when it has to
+reconcile against the database and when it serves from its cache.
+
+"""
+
+import gettext
+import optparse
+import os
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import db
+from nova import utils
+from nova.compute import vm_states
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy.session import get_session
+from nova.scheduler import host_manager
+
+import bench_utils
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--sizes', default='1000,10000,50000',
+                      help='Comma separated instance counts')
+    parser.add_option('--hosts', type='int', default=200,
+                      help='Number of compute hosts')
+    parser.add_option('--repeat', type='int', default=3)
+    return parser.parse_args()
+
+
+def populate(count, hosts):
+    session = get_session()
+    for i in xrange(hosts):
+        result = session.execute(models.Service.__table__.insert(),
+                dict(host='host%d' % i, binary='nova-compute',
+                     topic='compute', report_count=0, disabled=False,
+                     deleted=False))
+        service_id = result.inserted_primary_key[0]
+        session.execute(models.ComputeNode.__table__.insert(),
+                dict(service_id=service_id, vcpus=64, memory_mb=262144,
+                     local_gb=8192, vcpus_used=0, memory_mb_used=0,
+                     local_gb_used=0, hypervisor_type='qemu',
+                     hypervisor_version=1, cpu_info='', n_cpu_vms=0,
+                     n_io_vms=0, n_mem_vms=0, n_und_vms=0, deleted=False))
+    rows = []
+    for i in xrange(count):
+        rows.append(dict(uuid=str(utils.gen_uuid()),
+                         host='host%d' % (i % hosts), vcpus=1,
+                         memory_mb=512, root_gb=10, ephemeral_gb=0,
+                         vm_state=vm_states.ACTIVE, user_data='',
+                         workload_class='und', deleted=False))
+    session.execute(models.Instance.__table__.insert(), rows)
+
+
+def legacy_host_states(ctxt):
+    """get_all_host_states as done before the host state cache."""
+    host_state_map = {}
+    for compute in db.compute_node_get_all(ctxt):
+        host = compute['service']['host']
+        host_state = host_manager.HostState(host, 'compute',
+                service=dict(compute['service'].iteritems()))
+        host_state.update_from_compute_node(compute)
+        host_state_map[host] = host_state
+    for instance in db.instance_get_all(ctxt):
+        host_state = host_state_map.get(instance['host'])
+        if host_state:
+            host_state.consume_from_instance(instance)
+    return host_state_map
+
+
+def main():
+    options, _args = parse_options()
+    ctxt = context.get_admin_context()
+    rows = []
+    for size in [int(s) for s in options.sizes.split(',')]:
+        path = bench_utils.setup_database()
+        try:
+            populate(size, options.hosts)
+            manager = host_manager.HostManager()
+            legacy = bench_utils.timeit(lambda: legacy_host_states(ctxt),
+                                        options.repeat)
+            reconcile = bench_utils.timeit(
+                    lambda: manager.reconcile_host_states(ctxt, 'compute'),
+                    options.repeat)
+            cached = bench_utils.timeit(
+                    lambda: manager.get_all_host_states(ctxt, 'compute'),
+                    options.repeat)
+            rows.append((size, legacy, reconcile, cached))
+        finally:
+            os.unlink(path)
+    bench_utils.report('get_all_host_states with %d hosts (seconds, best '
+                       'of %d)' % (options.hosts, options.repeat), rows,
+                       ['instances', 'legacy', 'reconcile', 'cached'])
+
+
+if __name__ == '__main__':
+    main()
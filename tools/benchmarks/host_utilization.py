@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""host_utilization.py - Compare ways of computing host utilization
+
+Times the per-host utilization used by compute_node_update(auto_adjust=True)
+computed with the old instance scans (one instance_get_all_by_host plus
+three regexp instance_get_all_by_filters calls) against the grouped
+instance_utilization_get_by_host query.
+
+"""
+
+import base64
+import gettext
+import optparse
+import os
+import random
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import db
+from nova import utils
+from nova.compute import vm_states
+from nova.compute import workload_classes
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy.session import get_session
+
+import bench_utils
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--sizes', default='1000,10000,50000',
+                      help='Comma separated instance counts')
+    parser.add_option('--hosts', type='int', default=100,
+                      help='Number of compute hosts')
+    parser.add_option('--repeat', type='int', default=3)
+    return parser.parse_args()
+
+
+def populate(count, hosts):
+    """Bulk insert count instances spread over hosts."""
+    states = [vm_states.ACTIVE] * 9 + [vm_states.BUILDING]
+    rows = []
+    for i in xrange(count):
+        user_data = random.choice(['cpu', 'io', 'mem', 'other'])
+        encoded = base64.b64encode(user_data)
+        rows.append(dict(uuid=str(utils.gen_uuid()),
+                         host='host%d' % (i % hosts),
+                         memory_mb=512, root_gb=10, ephemeral_gb=0,
+                         vm_state=random.choice(states),
+                         user_data=encoded,
+                         workload_class=workload_classes.from_user_data(
+                             encoded),
+                         deleted=False))
+    session = get_session()
+    session.execute(models.Instance.__table__.insert(), rows)
+
+
+def legacy_utilization(ctxt, host):
+    """The per-host computation as done before the workload_class column."""
+    instances = db.instance_get_all_by_host(ctxt, host)
+    counts = {}
+    for name in ('cpu', 'io', 'mem'):
+        counts[name] = len(db.instance_get_all_by_filters(ctxt,
+                {'user_data': base64.b64encode(name), 'deleted': 0,
+                 'host': host}, 'host', 'desc'))
+    work = 0
+    ram = 0
+    for instance in instances:
+        ram += instance.memory_mb
+        if instance.vm_state in [vm_states.BUILDING, vm_states.REBUILDING,
+                                 vm_states.MIGRATING, vm_states.RESIZING]:
+            work += 1
+    return len(instances), ram, work, counts
+
+
+def main():
+    options, _args = parse_options()
+    ctxt = context.get_admin_context()
+    rows = []
+    for size in [int(s) for s in options.sizes.split(',')]:
+        path = bench_utils.setup_database()
+        try:
+            populate(size, options.hosts)
+            host = 'host0'
+            legacy = bench_utils.timeit(
+                    lambda: legacy_utilization(ctxt, host), options.repeat)
+            grouped = bench_utils.timeit(
+                    lambda: db.instance_utilization_get_by_host(ctxt,
+                                                                host=host),
+                    options.repeat)
+            all_hosts = bench_utils.timeit(
+                    lambda: db.instance_utilization_get_by_host(ctxt),
+                    options.repeat)
+            rows.append((size, legacy, grouped, all_hosts,
+                         legacy / max(grouped, 1e-9)))
+        finally:
+            os.unlink(path)
+    bench_utils.report('Host utilization (seconds, best of %d)' %
+                       options.repeat, rows,
+                       ['instances', 'legacy/host', 'grouped/host',
+                        'grouped/all', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
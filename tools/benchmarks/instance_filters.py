@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""instance_filters.py - Latency of filtered instance listings
+
+Runs the listings our tooling polls, GET /servers?name=^web- and
+?host=..., against a sqlite database of a number of instances spread
+over --hosts hosts, one in --match-every of them named web-*.  Compares
+instance_get_all_by_filters() checking every filter but the exact ones
+in python, as it did, with the regexps narrowed in SQL first.
+
+"""
+
+import datetime
+import gettext
+import optparse
+import os
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import api as db_api
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy.session import get_session
+from nova import utils
+
+import bench_utils
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--instances', default='10000,50000',
+                      help='Comma separated numbers of instances')
+    parser.add_option('--hosts', type='int', default=100,
+                      help='Number of compute hosts')
+    parser.add_option('--match-every', type='int', default=50,
+                      help='One instance in this many is named web-*')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='Best of this many listings')
+    return parser.parse_args()
+
+
+def populate(count, hosts, match_every):
+    session = get_session()
+    start = datetime.datetime(2012, 1, 1)
+    for first in xrange(0, count, 10000):
+        session.execute(models.Instance.__table__.insert(),
+                [dict(id=i + 1, uuid=str(utils.gen_uuid()),
+                      host='host%d' % (i % hosts),
+                      display_name=('web-%d' if i % match_every == 0
+                                    else 'db-%d') % i,
+                      project_id='project', user_id='user',
+                      instance_type_id=1, image_ref='1', launch_index=0,
+                      vm_state='active',
+                      created_at=start + datetime.timedelta(seconds=i),
+                      deleted=False)
+                 for i in xrange(first, min(first + 10000, count))])
+
+
+def main():
+    options, _args = parse_options()
+    ctxt = context.get_admin_context()
+    listings = [('name=^web-', {'display_name': '^web-'}),
+                ('host=host7', {'host': 'host7'})]
+    orig_regexp_filter = db_api.regexp_filter
+    rows = []
+    for count in [int(s) for s in options.instances.split(',')]:
+        path = bench_utils.setup_database()
+        try:
+            populate(count, options.hosts, options.match_every)
+            for name, filters in listings:
+                def _list():
+                    return db.instance_get_all_by_filters(ctxt,
+                            dict(filters, deleted=False))
+
+                db_api.regexp_filter = lambda query, model, filters: query
+                expected = len(_list())
+                old = bench_utils.timeit(_list, options.repeat)
+                db_api.regexp_filter = orig_regexp_filter
+                assert len(_list()) == expected
+                new = bench_utils.timeit(_list, options.repeat)
+                rows.append((count, name, expected, old * 1000, new * 1000,
+                             old / new))
+        finally:
+            db_api.regexp_filter = orig_regexp_filter
+            os.unlink(path)
+    bench_utils.report('ms per filtered listing of every instance, %d '
+                       'hosts' % options.hosts, rows,
+                       ['instances', 'filter', 'matches', 'python ms',
+                        'sql ms', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
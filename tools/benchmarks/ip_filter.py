@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""ip_filter.py - Latency of get_instance_uuids_by_ip_filter
+
+Fills the database with instances that have one vif and fixed ip each,
+spread over a number of networks with an IPv6 range, a tenth of them
+with a floating ip, and times the filters GET /servers?ip= and ?ip6=
+hand to NetworkManager.get_instance_uuids_by_ip_filter().  Compares the
+joined queries with the old walk over every vif, which is only run up
+to --legacy-max vifs.
+
+"""
+
+import gettext
+import optparse
+import os
+import re
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import ipv6
+from nova import utils
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy.session import get_session
+from nova.network import manager as network_manager
+
+import bench_utils
+
+
+FILTERS = [('fixed_ip', {'fixed_ip': '10.0.3.7'}),
+           ('ip prefix', {'ip': '10.0.3.'}),
+           ('ip cidr', {'ip': '10.0.3.0/24'}),
+           ('ip floating', {'ip': '172.16.0.10'}),
+           ('ip suffix', {'ip': '.*\.77$'}),
+           ('ip6', {'ip6': '2001:db8:0:1:.*:fe00:7'})]
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--vifs', default='10000,100000',
+                      help='Comma separated numbers of vifs')
+    parser.add_option('--networks', type='int', default=10,
+                      help='Number of networks')
+    parser.add_option('--legacy-max', type='int', default=10000,
+                      help='Largest number of vifs the old code is run on')
+    parser.add_option('--repeat', type='int', default=3)
+    return parser.parse_args()
+
+
+def populate(count, networks):
+    session = get_session()
+    session.execute(models.Network.__table__.insert(),
+            [dict(id=i + 1, cidr='10.%d.0.0/16' % i,
+                  cidr_v6='2001:db8:0:%x::/64' % i, deleted=False)
+             for i in xrange(networks)])
+    session.execute(models.Instance.__table__.insert(),
+            [dict(id=i + 1, uuid=str(utils.gen_uuid()), deleted=False)
+             for i in xrange(count)])
+    session.execute(models.VirtualInterface.__table__.insert(),
+            [dict(id=i + 1, instance_id=i + 1,
+                  network_id=i % networks + 1,
+                  address='02:16:3e:%02x:%02x:%02x' %
+                          (i / 65536, i / 256 % 256, i % 256),
+                  deleted=False)
+             for i in xrange(count)])
+    session.execute(models.FixedIp.__table__.insert(),
+            [dict(id=i + 1, network_id=i % networks + 1,
+                  address='10.%d.%d.%d' % (i % networks,
+                                           i / networks / 256 % 256,
+                                           i / networks % 256),
+                  instance_id=i + 1, virtual_interface_id=i + 1,
+                  allocated=True, deleted=False)
+             for i in xrange(count)])
+    session.execute(models.FloatingIp.__table__.insert(),
+            [dict(fixed_ip_id=i + 1,
+                  address='172.16.%d.%d' % (i / 10 / 256, i / 10 % 256),
+                  deleted=False)
+             for i in xrange(0, count, 10)])
+
+
+def legacy_get_instance_uuids_by_ip_filter(manager, context, filters):
+    """get_instance_uuids_by_ip_filter() as it was."""
+    fixed_ip_filter = filters.get('fixed_ip')
+    ip_filter = re.compile(str(filters.get('ip')))
+    ipv6_filter = re.compile(str(filters.get('ip6')))
+    vifs = manager.db.virtual_interface_get_all(context)
+    results = []
+    for vif in vifs:
+        if vif['instance_id'] is None:
+            continue
+        network = manager._get_network_by_id(context, vif['network_id'])
+        fixed_ipv6 = None
+        if network['cidr_v6'] is not None:
+            fixed_ipv6 = ipv6.to_global(network['cidr_v6'],
+                                        vif['address'],
+                                        context.project_id)
+        if fixed_ipv6 and ipv6_filter.match(fixed_ipv6):
+            results.append({'instance_id': vif['instance_id'],
+                            'ip': fixed_ipv6})
+        fixed_ips = manager.db.fixed_ips_by_virtual_interface(context,
+                                                              vif['id'])
+        for fixed_ip in fixed_ips:
+            if not fixed_ip or not fixed_ip['address']:
+                continue
+            if fixed_ip['address'] == fixed_ip_filter:
+                results.append({'instance_id': vif['instance_id'],
+                                'ip': fixed_ip['address']})
+                continue
+            if ip_filter.match(fixed_ip['address']):
+                results.append({'instance_id': vif['instance_id'],
+                                'ip': fixed_ip['address']})
+                continue
+    ids = [res['instance_id'] for res in results]
+    uuid_map = manager.db.instance_get_id_to_uuid_mapping(context, ids)
+    for res in results:
+        res['instance_uuid'] = uuid_map.get(res['instance_id'])
+    return results
+
+
+def main():
+    options, _args = parse_options()
+    ctxt = context.get_admin_context()
+    rows = []
+    for count in [int(s) for s in options.vifs.split(',')]:
+        path = bench_utils.setup_database()
+        try:
+            populate(count, options.networks)
+            manager = network_manager.FlatManager()
+            # fill the remembered IPv6 addresses
+            manager.get_instance_uuids_by_ip_filter(ctxt, {'ip6': '.*'})
+            for name, filters in FILTERS:
+                new = bench_utils.timeit(
+                        lambda: manager.get_instance_uuids_by_ip_filter(
+                                ctxt, dict(filters)),
+                        options.repeat)
+                matches = len(manager.get_instance_uuids_by_ip_filter(
+                        ctxt, dict(filters)))
+                old = '-'
+                if count <= options.legacy_max:
+                    old = bench_utils.timeit(
+                            lambda: legacy_get_instance_uuids_by_ip_filter(
+                                    manager, ctxt, dict(filters)), 1)
+                rows.append((count, name, matches, old, new))
+        finally:
+            os.unlink(path)
+    bench_utils.report('get_instance_uuids_by_ip_filter seconds, %d '
+                       'networks' % options.networks, rows,
+                       ['vifs', 'filter', 'matches', 'old', 'new'])
+
+
+if __name__ == '__main__':
+    main()
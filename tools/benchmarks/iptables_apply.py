@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""iptables_apply.py - iptables processes forked for a batch of boots
+
+Boots a batch of instances on one compute host as far as IptablesManager
+is concerned, one every --arrival-ms: each boot adds its instance chain
+and rules and applies them the way
+IptablesFirewallDriver.prepare_instance_filter() does.
+iptables-save/restore are replaced by a green sleep of --fork-ms per
+process.  Compares applying every table on every change (the old
+behaviour), applying the changed tables on every change and
+iptables_apply_delay_ms.
+
+"""
+
+import gettext
+import optparse
+import os
+import sys
+import time
+
+import eventlet
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import flags
+from nova.network import linux_net
+
+import bench_utils
+
+
+FLAGS = flags.FLAGS
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--boots', default='10,50',
+                      help='Comma separated numbers of concurrent boots')
+    parser.add_option('--rules', type='int', default=10,
+                      help='Security group rules per instance')
+    parser.add_option('--fork-ms', type='float', default=20.0,
+                      help='Simulated cost of one iptables process')
+    parser.add_option('--arrival-ms', type='float', default=50.0,
+                      help='Time between two boots')
+    parser.add_option('--delay-ms', type='int', default=50,
+                      help='iptables_apply_delay_ms of the deferred run')
+    return parser.parse_args()
+
+
+class LegacyIptablesManager(linux_net.IptablesManager):
+    """Applies all the tables every time, as before dirty tracking."""
+
+    def _apply(self):
+        for tables in [self.ipv4, self.ipv6]:
+            for table in tables.values():
+                table.dirty = True
+        super(LegacyIptablesManager, self)._apply()
+
+
+def boot(manager, i, rules, arrival_ms):
+    eventlet.sleep(i * arrival_ms / 1000.0)
+    table = manager.ipv4['filter']
+    chain = 'inst-%d' % i
+    table.add_chain(chain)
+    table.add_rule('local', '-d 10.0.%d.%d -j $%s' % (i / 250, i % 250,
+                                                         chain))
+    for port in xrange(rules):
+        table.add_rule(chain, '-p tcp --dport %d -j ACCEPT' % (port + 1))
+    # refresh_provider_fw_rules()
+    manager.apply()
+    manager.apply_and_wait()
+
+
+def run(manager_cls, boots, rules, fork_ms, arrival_ms, delay_ms):
+    """Return the processes forked and the seconds taken by the batch."""
+    FLAGS.set_override('iptables_apply_delay_ms', delay_ms)
+    forks = []
+
+    def fake_execute(*cmd, **kwargs):
+        forks.append(cmd[0])
+        eventlet.sleep(fork_ms / 1000.0)
+        return '', ''
+
+    manager = manager_cls(execute=fake_execute)
+    manager.apply_and_wait()
+    del forks[:]
+
+    pool = eventlet.GreenPool()
+    start = time.time()
+    for i in xrange(boots):
+        pool.spawn_n(boot, manager, i, rules, arrival_ms)
+    pool.waitall()
+    return len(forks), time.time() - start
+
+
+def main():
+    options, _args = parse_options()
+    FLAGS.set_override('lock_path', '/tmp')
+    runs = [(LegacyIptablesManager, 0),
+            (linux_net.IptablesManager, 0),
+            (linux_net.IptablesManager, options.delay_ms)]
+    rows = []
+    for boots in [int(s) for s in options.boots.split(',')]:
+        total_rules = boots * (options.rules + 1)
+        forks = []
+        rates = []
+        for manager_cls, delay_ms in runs:
+            count, seconds = run(manager_cls, boots, options.rules,
+                                 options.fork_ms, options.arrival_ms,
+                                 delay_ms)
+            forks.append(count)
+            rates.append(total_rules / seconds)
+        rows.append(tuple([boots] + forks + rates))
+    bench_utils.report('iptables processes and rules/sec per boot batch, '
+                       'one boot every %.0f ms, %.0f ms per process' %
+                       (options.arrival_ms, options.fork_ms), rows,
+                       ['boots', 'forks old', 'forks dirty',
+                        'forks deferred', 'rules/s old', 'rules/s dirty',
+                        'rules/s deferred'])
+
+
+if __name__ == '__main__':
+    main()
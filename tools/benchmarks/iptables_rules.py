@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""iptables_rules.py - Cost of IptablesTable updates with many rules
+
+Fills a filter table with per instance chains the way
+IptablesFirewallDriver does, refreshes the rules of a tenth of the
+instances (remove_chain, add_chain, add_rule), removes single rules and
+rebuilds the iptables-restore input with _modify_rules() from an
+iptables-save output holding as many rules of other components.
+Compares the indexed IptablesTable with the flat rule list it replaced.
+
+"""
+
+import gettext
+import optparse
+import os
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova.network import linux_net
+
+import bench_utils
+
+
+RULES_PER_INSTANCE = 10
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--rules', default='10000,50000',
+                      help='Comma separated numbers of rules')
+    parser.add_option('--top-rules', type='int', default=100,
+                      help='Number of rules added with top=True')
+    return parser.parse_args()
+
+
+class ListIptablesTable(linux_net.IptablesTable):
+    """IptablesTable storing its rules in a flat list, as it used to."""
+
+    def __init__(self):
+        super(ListIptablesTable, self).__init__()
+        self.rule_list = []
+
+    @property
+    def rules(self):
+        return self.rule_list
+
+    def _add(self, rule):
+        self.rule_list.append(rule)
+
+    def remove_chain(self, name, wrap=True):
+        self.chains.discard(name)
+        self.rule_list = [r for r in self.rule_list if r.chain != name]
+        jump_snippet = '-j %s-%s' % (linux_net.binary_name, name)
+        self.rule_list = [r for r in self.rule_list
+                          if jump_snippet not in r.rule]
+
+    def remove_rule(self, chain, rule, wrap=True, top=False):
+        self.rule_list.remove(linux_net.IptablesRule(chain, rule, wrap, top))
+
+
+def list_modify_rules(current_lines, table):
+    """_modify_rules() as it was, filtering the lines once per top rule."""
+    new_filter = filter(lambda line: linux_net.binary_name not in line,
+                        current_lines)
+    seen_chains = False
+    rules_index = 0
+    for rules_index, rule in enumerate(new_filter):
+        if not seen_chains:
+            if rule.startswith(':'):
+                seen_chains = True
+        else:
+            if not rule.startswith(':'):
+                break
+    our_rules = []
+    for rule in table.rules:
+        rule_str = str(rule)
+        if rule.top:
+            new_filter = filter(lambda s: s.strip() != rule_str.strip(),
+                                new_filter)
+        our_rules += [rule_str]
+    new_filter[rules_index:rules_index] = our_rules
+    new_filter[rules_index:rules_index] = [':%s - [0:0]' % (name,)
+                                           for name in table.unwrapped_chains]
+    new_filter[rules_index:rules_index] = [':%s-%s - [0:0]' %
+                                           (linux_net.binary_name, name,)
+                                           for name in table.chains]
+    seen_lines = set()
+
+    def _weed_out_duplicates(line):
+        line = line.strip()
+        if line in seen_lines:
+            return False
+        seen_lines.add(line)
+        return True
+
+    new_filter.reverse()
+    new_filter = filter(_weed_out_duplicates, new_filter)
+    new_filter.reverse()
+    return new_filter
+
+
+def add_instance(table, i):
+    chain = 'inst-%d' % i
+    table.add_chain(chain)
+    table.add_rule('local', '-d 10.%d.%d.%d -j $%s' %
+                   (i / 65536, i / 256 % 256, i % 256, chain))
+    for port in xrange(RULES_PER_INSTANCE - 1):
+        table.add_rule(chain, '-p tcp --dport %d -j ACCEPT' % (port + 1))
+
+
+def run(table_cls, modify_rules, rule_count, top_rules):
+    """Return the seconds taken to fill, refresh and apply the table."""
+    instances = rule_count / RULES_PER_INSTANCE
+    table = table_cls()
+    table.add_chain('local')
+    for i in xrange(top_rules):
+        table.add_rule('local', '-s 172.16.%d.%d -j DROP' %
+                       (i / 256, i % 256), top=True)
+
+    def fill():
+        for i in xrange(instances):
+            add_instance(table, i)
+
+    def refresh():
+        for i in xrange(0, instances, 10):
+            table.remove_chain('inst-%d' % i)
+            add_instance(table, i)
+        for i in xrange(1, instances, 10):
+            table.remove_rule('inst-%d' % i, '-p tcp --dport 1 -j ACCEPT')
+
+    fill_time = bench_utils.timeit(fill, 1)
+    # iptables-save output with as many rules of other components
+    current_lines = ['*filter', ':INPUT ACCEPT [0:0]',
+                     ':FORWARD ACCEPT [0:0]', ':OUTPUT ACCEPT [0:0]']
+    current_lines += [str(r).replace(linux_net.binary_name, 'other')
+                      for r in table.rules]
+    current_lines += ['COMMIT']
+    refresh_time = bench_utils.timeit(refresh, 1)
+    modify_time = bench_utils.timeit(
+            lambda: modify_rules(current_lines, table), 1)
+    return fill_time, refresh_time, modify_time
+
+
+def main():
+    options, _args = parse_options()
+    manager = linux_net.IptablesManager(execute=lambda *a, **kw: ('', ''))
+    rows = []
+    for rule_count in [int(s) for s in options.rules.split(',')]:
+        old = run(ListIptablesTable, list_modify_rules, rule_count,
+                  options.top_rules)
+        new = run(linux_net.IptablesTable, manager._modify_rules,
+                  rule_count, options.top_rules)
+        rows.append((rule_count,) + old + new)
+    bench_utils.report('IptablesTable seconds, list vs indexed, %d top '
+                       'rules' % options.top_rules, rows,
+                       ['rules', 'list fill', 'list refresh', 'list modify',
+                        'index fill', 'index refresh', 'index modify'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""json_filter.py - Time JsonFilter over all hosts of a request
+
+Compares parsing and evaluating the query for every host, as done
+before plans were cached, with JsonFilter.host_passes() using the cached
+query plan.
+
+"""
+
+import gettext
+import json
+import optparse
+import os
+import random
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import utils
+from nova.scheduler.filters import json_filter
+from nova.scheduler import host_manager
+
+import bench_utils
+
+
+QUERY = json.dumps(
+        ['and', ['>=', '$free_ram_mb', 1024],
+                ['>=', '$free_disk_mb', 200 * 1024],
+                ['or', ['=', '$capabilities.hypervisor_type', 'qemu'],
+                       ['=', '$capabilities.hypervisor_type', 'kvm']],
+                ['not', '$service.disabled']])
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--hosts', default='100,500,1000',
+                      help='Comma separated host counts')
+    parser.add_option('--repeat', type='int', default=5)
+    return parser.parse_args()
+
+
+def make_host_states(count):
+    now = utils.utcnow()
+    host_states = []
+    for i in xrange(count):
+        caps = {'compute': {'hypervisor_type': random.choice(['qemu', 'xen']),
+                            'enabled': True}}
+        service = {'disabled': False, 'updated_at': now, 'created_at': now}
+        host_state = host_manager.HostState('host%d' % i, 'compute',
+                capabilities=caps, service=service)
+        host_state.update_from_compute_node(dict(
+                local_gb=1024, memory_mb=random.choice([512, 32768]),
+                vcpus=16))
+        host_states.append(host_state)
+    return host_states
+
+
+def interpreted(filt, host_states):
+    """Parse and evaluate the query for every host."""
+    for host_state in host_states:
+        filt._process_filter(json.loads(QUERY), host_state)
+
+
+def compiled(filt, host_states):
+    props = {'query': QUERY}
+    for host_state in host_states:
+        filt.host_passes(host_state, props)
+
+
+def main():
+    options, _args = parse_options()
+    filt = json_filter.JsonFilter()
+    rows = []
+    for count in [int(h) for h in options.hosts.split(',')]:
+        host_states = make_host_states(count)
+        old = bench_utils.timeit(lambda: interpreted(filt, host_states),
+                                 options.repeat)
+        new = bench_utils.timeit(lambda: compiled(filt, host_states),
+                                 options.repeat)
+        rows.append((count, old * 1000.0, new * 1000.0, old / new))
+    bench_utils.report('JsonFilter ms per request (best of %d)' %
+                       options.repeat, rows,
+                       ['hosts', 'interpreted', 'compiled', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
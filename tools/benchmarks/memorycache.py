@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""memorycache.py - Cost of the operations of the in process memcache
+
+Fills nova.common.memorycache.Client with keys that expire, as the ec2
+lockout counters and metadata entries do, and times get, set, add and
+incr of random keys.  Compares the heap ordered client with the one that
+walked every key on every get, which is only run for --legacy-ops
+operations.
+
+"""
+
+import gettext
+import optparse
+import os
+import random
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova.common import memorycache
+from nova import utils
+
+import bench_utils
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--keys', default='1000,100000',
+                      help='Comma separated numbers of keys')
+    parser.add_option('--ops', type='int', default=20000,
+                      help='Number of operations timed per run')
+    parser.add_option('--legacy-ops', type='int', default=100,
+                      help='Number of operations timed on the old client')
+    return parser.parse_args()
+
+
+class LegacyClient(object):
+    """memorycache.Client as it was."""
+
+    def __init__(self, *args, **kwargs):
+        self.cache = {}
+
+    def get(self, key):
+        for k in self.cache.keys():
+            (timeout, _value) = self.cache[k]
+            if timeout and utils.utcnow_ts() >= timeout:
+                del self.cache[k]
+
+        return self.cache.get(key, (0, None))[1]
+
+    def set(self, key, value, time=0, min_compress_len=0):
+        timeout = 0
+        if time != 0:
+            timeout = utils.utcnow_ts() + time
+        self.cache[key] = (timeout, value)
+        return True
+
+    def add(self, key, value, time=0, min_compress_len=0):
+        if not self.get(key) is None:
+            return False
+        return self.set(key, value, time, min_compress_len)
+
+    def incr(self, key, delta=1):
+        value = self.get(key)
+        if value is None:
+            return None
+        new_value = int(value) + delta
+        self.cache[key] = (self.cache[key][0], str(new_value))
+        return new_value
+
+
+def run(client, count, ops):
+    """Return the microseconds per get, set, add and incr."""
+    for i in xrange(count):
+        client.set('key-%d' % i, '0', time=random.randint(60, 3600))
+    keys = ['key-%d' % random.randrange(count) for _i in xrange(ops)]
+    new_keys = ['new-%d' % i for i in xrange(ops)]
+
+    def loop(fn, keys):
+        for key in keys:
+            fn(key)
+
+    results = []
+    for fn, fn_keys in [(client.get, keys),
+                        (lambda key: client.set(key, '0', time=600), keys),
+                        (lambda key: client.add(key, '0', time=600),
+                         new_keys),
+                        (client.incr, keys)]:
+        seconds = bench_utils.timeit(lambda: loop(fn, fn_keys), 1)
+        results.append(seconds * 1000000 / ops)
+    return results
+
+
+def main():
+    options, _args = parse_options()
+    rows = []
+    for count in [int(s) for s in options.keys.split(',')]:
+        old = run(LegacyClient(), count, options.legacy_ops)
+        new = run(memorycache.Client(max_entries=0), count, options.ops)
+        rows.append(tuple([count] + old + new))
+    bench_utils.report('memorycache microseconds per operation', rows,
+                       ['keys', 'old get', 'old set', 'old add', 'old incr',
+                        'heap get', 'heap set', 'heap add', 'heap incr'])
+
+
+if __name__ == '__main__':
+    main()
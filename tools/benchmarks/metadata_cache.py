@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""metadata_cache.py - Requests per second of one metadata api worker
+
+Boots a batch of instances at once as far as the metadata api is
+concerned: every instance fetches the paths cloud-init reads, several at
+a time, from one MetadataRequestHandler.  The fixed ip lookup, an rpc
+call to nova-network, is replaced by a database query and a green sleep
+of --rpc-ms.  Compares the 15 second memorycache entries of the old
+handler, loaded by every concurrent miss, with the LRU cache.
+
+"""
+
+import base64
+import gettext
+import optparse
+import os
+import sys
+import time
+
+import eventlet
+import webob
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova.api.metadata import handler
+from nova.common import memorycache
+from nova import db
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy.session import get_session
+from nova import network
+from nova import utils
+
+import bench_utils
+
+
+PATHS = ['/', '/meta-data/', '/user-data', '/meta-data/instance-id',
+         '/meta-data/ami-id', '/meta-data/ami-launch-index',
+         '/meta-data/ami-manifest-path', '/meta-data/block-device-mapping/',
+         '/meta-data/block-device-mapping/ami',
+         '/meta-data/block-device-mapping/root', '/meta-data/hostname',
+         '/meta-data/instance-action', '/meta-data/instance-type',
+         '/meta-data/local-hostname', '/meta-data/local-ipv4',
+         '/meta-data/placement/', '/meta-data/placement/availability-zone',
+         '/meta-data/public-hostname', '/meta-data/public-ipv4',
+         '/meta-data/reservation-id', '/meta-data/security-groups']
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--instances', default='50,200',
+                      help='Comma separated numbers of instances booting')
+    parser.add_option('--parallel', type='int', default=4,
+                      help='Concurrent requests of each instance')
+    parser.add_option('--rpc-ms', type='float', default=5.0,
+                      help='Simulated cost of the fixed ip lookup rpc call')
+    return parser.parse_args()
+
+
+class LegacyMetadataRequestHandler(handler.MetadataRequestHandler):
+    """Caches in memorycache for 15 seconds, as it used to."""
+
+    def __init__(self):
+        super(LegacyMetadataRequestHandler, self).__init__()
+        self._legacy_cache = memorycache.Client()
+
+    def get_metadata(self, address):
+        cache_key = 'metadata-%s' % address
+        data = self._legacy_cache.get(cache_key)
+        if data:
+            return data
+        data, _uuid = self._load_metadata(address)
+        if data is not None:
+            self._legacy_cache.set(cache_key, data, 15)
+        return data
+
+
+def address(i):
+    return '10.0.%d.%d' % (i / 256, i % 256)
+
+
+def populate(count):
+    session = get_session()
+    session.execute(models.Service.__table__.insert(),
+            dict(host='host1', binary='nova-compute', topic='compute',
+                 report_count=0, disabled=False, availability_zone='nova',
+                 deleted=False))
+    session.execute(models.Instance.__table__.insert(),
+            [dict(id=i + 1, uuid=str(utils.gen_uuid()), host='host1',
+                  hostname='server-%d' % i, instance_type_id=1,
+                  image_ref=str(utils.gen_uuid()), launch_index=0,
+                  reservation_id='r-%08x' % i,
+                  user_data=base64.b64encode('#!/bin/sh\n'), deleted=False)
+             for i in xrange(count)])
+    session.execute(models.FixedIp.__table__.insert(),
+            [dict(address=address(i), network_id=1, instance_id=i + 1,
+                  allocated=True, deleted=False)
+             for i in xrange(count)])
+
+
+def run(app, count, parallel, rpc_ms):
+    """Return the requests/sec and the metadata loaded per instance."""
+    loads = []
+
+    def get_fixed_ip_by_address(self, context, address):
+        loads.append(address)
+        eventlet.sleep(rpc_ms / 1000.0)
+        return db.fixed_ip_get_by_address(context, address)
+
+    network.API.get_fixed_ip_by_address = get_fixed_ip_by_address
+
+    def fetch(i, path):
+        request = webob.Request.blank(path)
+        request.remote_addr = address(i)
+        response = request.get_response(app)
+        assert response.status_int == 200, response.status
+
+    def boot(i):
+        pool = eventlet.GreenPool(parallel)
+        for path in PATHS:
+            pool.spawn_n(fetch, i, path)
+        pool.waitall()
+
+    pool = eventlet.GreenPool()
+    start = time.time()
+    for i in xrange(count):
+        pool.spawn_n(boot, i)
+    pool.waitall()
+    seconds = time.time() - start
+    return count * len(PATHS) / seconds, float(len(loads)) / count
+
+
+def main():
+    options, _args = parse_options()
+    rows = []
+    for count in [int(s) for s in options.instances.split(',')]:
+        path = bench_utils.setup_database()
+        try:
+            populate(count)
+            # map the image ids once, both handlers share the mappings
+            run(handler.MetadataRequestHandler(), count, options.parallel,
+                options.rpc_ms)
+            old, old_loads = run(LegacyMetadataRequestHandler(), count,
+                                 options.parallel, options.rpc_ms)
+            new, new_loads = run(handler.MetadataRequestHandler(), count,
+                                 options.parallel, options.rpc_ms)
+            rows.append((count, old, new, old_loads, new_loads))
+        finally:
+            os.unlink(path)
+    bench_utils.report('metadata requests/sec of one worker, %d paths per '
+                       'instance, %d at a time, %.0f ms fixed ip lookup' %
+                       (len(PATHS), options.parallel, options.rpc_ms), rows,
+                       ['instances', 'req/s old', 'req/s lru',
+                        'loads old', 'loads lru'])
+
+
+if __name__ == '__main__':
+    main()
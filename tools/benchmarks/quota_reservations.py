@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""quota_reservations.py - Throughput and over-commit of concurrent boots
+
+Boots --boots instances in each of --projects projects from --concurrency
+green threads against a sqlite database, with an instance quota of
+--quota, each project having a history of deleted instances.  Each boot
+checks the quota, yields as the image lookup of the request would, and
+creates its instance.  Compares the check as it was, summing the
+instances of the project and reading its quotas every time, with the boot
+reserving its instance from the usages and cached quotas kept by
+nova.quota, as compute.api does, and committing the reservation once the
+instance is created.  Counts the instances booted over quota.
+
+Fails unless no instance is booted over quota with the reservations.
+
+"""
+
+import gettext
+import optparse
+import os
+import sys
+import time
+
+import eventlet
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy.session import get_session
+from nova import exception
+from nova import flags
+from nova import quota
+from nova import utils
+
+import bench_utils
+
+
+FLAGS = flags.FLAGS
+
+INSTANCE_TYPE = {'vcpus': 1, 'memory_mb': 512}
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--history', default='0,20000',
+                      help='Comma separated numbers of deleted instances of '
+                           'each project')
+    parser.add_option('--projects', type='int', default=10,
+                      help='Number of projects booting')
+    parser.add_option('--boots', type='int', default=50,
+                      help='Boots requested in each project')
+    parser.add_option('--quota', type='int', default=25,
+                      help='Instance quota of each project')
+    parser.add_option('--concurrency', type='int', default=100,
+                      help='Number of boots in flight')
+    return parser.parse_args()
+
+
+def populate(projects, history):
+    if not history:
+        return
+    get_session().execute(models.Instance.__table__.insert(),
+            [dict(uuid=str(utils.gen_uuid()),
+                  project_id='project-%d' % (i % projects), user_id='user',
+                  vcpus=1, memory_mb=512, vm_state='deleted', deleted=True)
+             for i in xrange(projects * history)])
+
+
+def _instance_values(ctxt):
+    return {'project_id': ctxt.project_id, 'user_id': ctxt.user_id,
+            'vcpus': INSTANCE_TYPE['vcpus'],
+            'memory_mb': INSTANCE_TYPE['memory_mb'], 'vm_state': 'building'}
+
+
+def boot_checked(ctxt):
+    """What compute.api did: check the quota, then create the instance."""
+    if quota.allowed_instances(ctxt, 1, INSTANCE_TYPE) < 1:
+        return False
+    # the image lookup and the rest of the request
+    eventlet.sleep(0)
+    db.instance_create(ctxt, _instance_values(ctxt))
+    return True
+
+
+def boot_reserved(ctxt):
+    """Reserve the quota, and commit it once the instance is created."""
+    try:
+        reservations = quota.reserve(ctxt, instances=1,
+                                     cores=INSTANCE_TYPE['vcpus'],
+                                     ram=INSTANCE_TYPE['memory_mb'])
+    except exception.OverQuota:
+        # what compute.api counts the instances still allowed with
+        quota.allowed_instances(ctxt, 1, INSTANCE_TYPE)
+        return False
+    eventlet.sleep(0)
+    try:
+        db.instance_create(ctxt, _instance_values(ctxt))
+    except Exception:
+        with utils.save_and_reraise_exception():
+            quota.rollback(ctxt, reservations)
+    quota.commit(ctxt, reservations)
+    return True
+
+
+def stub_summing():
+    """Make nova.quota sum the instances and read the quotas of a project
+    every time, as it did, and return a function undoing it.
+    """
+    orig_get_usages = quota._get_usages
+    orig_cache_ttl = FLAGS.quota_cache_ttl
+
+    def _get_usages(ctxt, project_id, resources):
+        return db.instance_data_get_for_project(ctxt, project_id)
+
+    quota._get_usages = _get_usages
+    FLAGS.set_override('quota_cache_ttl', 0)
+
+    def restore():
+        quota._get_usages = orig_get_usages
+        FLAGS.set_override('quota_cache_ttl', orig_cache_ttl)
+
+    return restore
+
+
+def run(boot, history, options):
+    """Boot in a fresh database, return boots per second and how many
+    instances went over quota.
+    """
+    path = bench_utils.setup_database()
+    try:
+        populate(options.projects, history)
+        contexts = [context.RequestContext('user', 'project-%d' % i)
+                    for i in xrange(options.projects)]
+        requests = [contexts[i % options.projects]
+                    for i in xrange(options.projects * options.boots)]
+        pool = eventlet.GreenPool(options.concurrency)
+        start = time.time()
+        booted = sum(pool.imap(boot, requests))
+        elapsed = time.time() - start
+
+        admin = context.get_admin_context()
+        over = 0
+        for ctxt in contexts:
+            instances = db.instance_data_get_for_project(admin,
+                                                         ctxt.project_id)[0]
+            over += max(0, instances - options.quota)
+        assert booted - over == options.projects * min(options.quota,
+                                                       options.boots)
+        return len(requests) / elapsed, over
+    finally:
+        os.unlink(path)
+
+
+def main():
+    options, _args = parse_options()
+    FLAGS.set_override('quota_instances', options.quota)
+    FLAGS.set_override('quota_cores', -1)
+    FLAGS.set_override('quota_ram', -1)
+    rows = []
+    for history in [int(s) for s in options.history.split(',')]:
+        restore = stub_summing()
+        try:
+            old_rate, old_over = run(boot_checked, history, options)
+        finally:
+            restore()
+        new_rate, new_over = run(boot_reserved, history, options)
+        assert new_over == 0, new_over
+        rows.append((history, old_rate, new_rate, old_over, new_over))
+    bench_utils.report('%d projects booting %d instances each, %d in '
+                       'flight, quota of %d' %
+                       (options.projects, options.boots,
+                        options.concurrency, options.quota),
+                       rows,
+                       ['history', 'old boots/s', 'new boots/s',
+                        'old over', 'new over'])
+
+
+if __name__ == '__main__':
+    main()
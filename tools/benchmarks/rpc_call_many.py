@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""rpc_call_many.py - Asking every host with rpc.call and rpc.call_many
+
+Asks each of a number of compute hosts for its uptime, once with a
+call() per host, as the admin paths did, and once with a single
+call_many().  The hosts are consumers of the fake rpc driver which take
+between --min-ms and --max-ms to answer, so the call() loop takes the sum
+of the host latencies and call_many() the largest of them.
+
+"""
+
+import gettext
+import optparse
+import os
+import random
+import sys
+import time
+
+import eventlet
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova.rpc import impl_fake
+
+import bench_utils
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--hosts', default='5,20,100',
+                      help='Comma separated numbers of hosts')
+    parser.add_option('--min-ms', type='float', default=5.0,
+                      help='Fastest answer of a host')
+    parser.add_option('--max-ms', type='float', default=50.0,
+                      help='Slowest answer of a host')
+    return parser.parse_args()
+
+
+class Host(object):
+    def __init__(self, latency):
+        self.latency = latency
+
+    def get_host_uptime(self, context):
+        eventlet.sleep(self.latency)
+        return 'up'
+
+
+def main():
+    options, _args = parse_options()
+    ctxt = context.get_admin_context()
+    rows = []
+    for count in [int(s) for s in options.hosts.split(',')]:
+        conn = impl_fake.create_connection()
+        for i in xrange(count):
+            latency = random.uniform(options.min_ms, options.max_ms) / 1000
+            conn.create_consumer('compute.host%d' % i, Host(latency))
+
+        def calls():
+            return [('compute.host%d' % i,
+                     {'method': 'get_host_uptime', 'args': {}})
+                    for i in xrange(count)]
+
+        start = time.time()
+        for topic, msg in calls():
+            impl_fake.call(ctxt, topic, msg)
+        sequential = time.time() - start
+
+        start = time.time()
+        results = impl_fake.call_many(ctxt, calls())
+        gathered = time.time() - start
+        assert results == [('up', None)] * count
+
+        conn.close()
+        rows.append((count, sequential * 1000, gathered * 1000,
+                     sequential / gathered))
+    bench_utils.report('get_host_uptime on every host, %.0f to %.0f ms '
+                       'per host' % (options.min_ms, options.max_ms),
+                       rows, ['hosts', 'call ms', 'call_many ms', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""rpc_cast_many.py - Messages per second of rpc.cast and rpc.cast_many
+
+Sends a refresh_security_group_rules message to each of a number of
+compute hosts, once with a cast() per host and once with a single
+cast_many(), through nova.rpc.amqp and its connection pool.  No broker
+is needed: the connection behaves like the kombu one, every synchronous
+AMQP method (channel open and close, exchange declare, tx select and
+commit) costs a round trip of --rtt-ms and a publish, which is not
+waited for, costs --publish-ms.
+
+"""
+
+import gettext
+import optparse
+import os
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import flags
+from nova.rpc import amqp as rpc_amqp
+
+import bench_utils
+
+
+FLAGS = flags.FLAGS
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--hosts', default='10,100,1000',
+                      help='Comma separated numbers of messages per batch')
+    parser.add_option('--rtt-ms', type='float', default=0.2,
+                      help='Simulated round trip to the broker')
+    parser.add_option('--publish-ms', type='float', default=0.01,
+                      help='Simulated cost of writing one message')
+    return parser.parse_args()
+
+
+class SimulatedConnection(object):
+    """Counts the round trips of the kombu Connection."""
+
+    rtt = 0
+    publish = 0
+    round_trips = 0
+
+    def _round_trip(self, count=1):
+        SimulatedConnection.round_trips += count
+        time.sleep(self.rtt * count)
+
+    def _publish(self, msg):
+        time.sleep(self.publish)
+
+    def reset(self):
+        # channel close and open
+        self._round_trip(2)
+
+    def close(self):
+        pass
+
+    def topic_send(self, topic, msg):
+        # a TopicPublisher per message declares the exchange
+        self._round_trip()
+        self._publish(msg)
+
+    def topic_send_many(self, messages, confirm=False):
+        if confirm:
+            # channel open and tx select
+            self._round_trip(2)
+        self._round_trip()
+        for _topic, msg in messages:
+            self._publish(msg)
+        if confirm:
+            # tx commit and channel close
+            self._round_trip(2)
+
+
+def run(hosts, batch, confirm=False):
+    """Return the messages/sec and the round trips per message."""
+    ctxt = context.get_admin_context()
+    pool = rpc_amqp.Pool(connection_cls=SimulatedConnection)
+    messages = [('compute.host%d' % i,
+                 {'method': 'refresh_security_group_rules',
+                  'args': {'security_group_id': 1}})
+                for i in xrange(hosts)]
+    SimulatedConnection.round_trips = 0
+    start = time.time()
+    if batch:
+        rpc_amqp.cast_many(ctxt, messages, confirm, pool)
+    else:
+        for topic, msg in messages:
+            rpc_amqp.cast(ctxt, topic, msg, pool)
+    seconds = time.time() - start
+    return hosts / seconds, float(SimulatedConnection.round_trips) / hosts
+
+
+def main():
+    options, _args = parse_options()
+    SimulatedConnection.rtt = options.rtt_ms / 1000.0
+    SimulatedConnection.publish = options.publish_ms / 1000.0
+    rows = []
+    for hosts in [int(s) for s in options.hosts.split(',')]:
+        looped, looped_trips = run(hosts, False)
+        confirmed, confirmed_trips = run(hosts, True, confirm=True)
+        batched, batched_trips = run(hosts, True)
+        rows.append((hosts, looped, confirmed, batched, looped_trips,
+                     confirmed_trips, batched_trips))
+    bench_utils.report('msgs/sec and broker round trips per message, %.2f '
+                       'ms round trip' % options.rtt_ms, rows,
+                       ['messages', 'cast loop', 'many confirm', 'many',
+                        'rtts loop', 'rtts confirm', 'rtts many'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""rpc_dispatch.py - Scheduler latency during a capability storm
+
+Feeds a scheduler-like consumer with --storm update_service_capabilities
+casts, as every compute host sends them at once, with --instances
+run_instance calls spread in between.  The consumer only blocks every
+--chunk messages, when it has read the socket buffer.  A capability update
+burns --caps-ms of CPU, a run_instance does the same and waits --db-ms on
+the database.  Compares the GreenPool the consumers used to spawn every
+message into with the Dispatcher, and reports the run_instance latency
+from its arrival to its end.
+
+"""
+
+import gettext
+import optparse
+import os
+import sys
+import time
+
+import eventlet
+from eventlet import greenpool
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import flags
+from nova.rpc import dispatcher
+
+import bench_utils
+
+
+FLAGS = flags.FLAGS
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--storm', default='500,2000',
+                      help='Comma separated numbers of capability updates')
+    parser.add_option('--instances', type='int', default=50,
+                      help='Number of run_instance calls')
+    parser.add_option('--chunk', type='int', default=100,
+                      help='Messages read off the socket without blocking')
+    parser.add_option('--caps-ms', type='float', default=0.5,
+                      help='CPU time of a capability update')
+    parser.add_option('--db-ms', type='float', default=5.0,
+                      help='Database time of a run_instance')
+    return parser.parse_args()
+
+
+def burn(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class GreenPoolDispatcher(object):
+    """What ProxyCallback did: a green thread per message."""
+
+    def __init__(self):
+        self.pool = greenpool.GreenPool(FLAGS.rpc_thread_pool_size)
+
+    def dispatch(self, method, fn, *args):
+        self.pool.spawn_n(fn, *args)
+
+
+def run(disp, storm, options):
+    """Return the p50, p99 and max run_instance latency in ms and the
+    seconds taken to process every message.
+    """
+    latencies = []
+    updates = []
+
+    def update_service_capabilities():
+        burn(options.caps_ms / 1000.0)
+        updates.append(None)
+
+    def run_instance(arrived_at):
+        burn(options.caps_ms / 1000.0)
+        eventlet.sleep(options.db_ms / 1000.0)
+        latencies.append((time.time() - arrived_at) * 1000)
+
+    every = max(storm / options.instances, 1)
+    start = time.time()
+    instances = 0
+    for i in xrange(storm):
+        disp.dispatch('update_service_capabilities',
+                      update_service_capabilities)
+        if i % every == 0 and instances < options.instances:
+            instances += 1
+            disp.dispatch('run_instance', run_instance, time.time())
+        if i % options.chunk == 0:
+            # the socket buffer is empty, wait for the broker
+            eventlet.sleep(0)
+    while len(latencies) < instances or len(updates) < storm:
+        eventlet.sleep(0.01)
+    seconds = time.time() - start
+    latencies.sort()
+    return (latencies[len(latencies) / 2],
+            latencies[min(len(latencies) - 1, len(latencies) * 99 / 100)],
+            latencies[-1], seconds)
+
+
+def main():
+    options, _args = parse_options()
+    rows = []
+    for storm in [int(s) for s in options.storm.split(',')]:
+        old = run(GreenPoolDispatcher(), storm, options)
+        new = run(dispatcher.Dispatcher(), storm, options)
+        rows.append((storm,) + old[:3] + new[:3] + (old[3], new[3]))
+    bench_utils.report('run_instance latency in ms during a capability '
+                       'storm, %s' % ', '.join(FLAGS.rpc_method_concurrency),
+                       rows,
+                       ['updates', 'pool p50', 'pool p99', 'pool max',
+                        'disp p50', 'disp p99', 'disp max', 'pool secs',
+                        'disp secs'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""run_instance_batch.py - Time FilterScheduler placement of N instances
+
+Compares provisioning the instances of a request one at a time, each with
+its own DB entry, notification and cast (the old behaviour), with the
+batched provisioning of schedule_run_instance.  Host selection is not
+timed; casts go to the fake rpc backend.
+
+"""
+
+import gettext
+import optparse
+import os
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import context
+from nova import db
+from nova import flags
+from nova.scheduler import filter_scheduler
+from nova.scheduler import host_manager
+from nova.scheduler import least_cost
+
+import bench_utils
+
+
+FLAGS = flags.FLAGS
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--sizes', default='50,200,1000',
+                      help='Comma separated num_instances per request')
+    parser.add_option('--hosts', type='int', default=20,
+                      help='Number of compute hosts')
+    return parser.parse_args()
+
+
+def make_request_spec(num_instances):
+    instance_type = {'id': 1, 'memory_mb': 512, 'vcpus': 1, 'root_gb': 10,
+                     'ephemeral_gb': 0}
+    instance_properties = {'project_id': 'fake', 'user_id': 'fake',
+                           'instance_type_id': 1, 'memory_mb': 512,
+                           'vcpus': 1, 'root_gb': 10, 'ephemeral_gb': 0,
+                           'image_ref': 'fake-image', 'user_data': '',
+                           'display_name': None}
+    return {'num_instances': num_instances,
+            'image': {'properties': {}},
+            'instance_type': instance_type,
+            'instance_properties': instance_properties,
+            'security_group': 'default',
+            'block_device_mapping': []}
+
+
+def make_weighted_hosts(count, hosts):
+    return [least_cost.WeightedHost(float(i),
+                host_state=host_manager.HostState('host%d' % (i % hosts),
+                                                  'compute'))
+            for i in xrange(count)]
+
+
+def one_at_a_time(sched, ctxt, weighted_hosts, request_spec):
+    """schedule_run_instance provisioning as done before batching."""
+    for num, weighted_host in enumerate(weighted_hosts):
+        request_spec['instance_properties']['launch_index'] = num
+        sched._provision_resource(ctxt, weighted_host, request_spec, {})
+
+
+def main():
+    options, _args = parse_options()
+    FLAGS.set_override('rpc_backend', 'nova.rpc.impl_fake')
+    ctxt = context.RequestContext('fake', 'fake', is_admin=True)
+    rows = []
+    for size in [int(s) for s in options.sizes.split(',')]:
+        path = bench_utils.setup_database()
+        try:
+            db.security_group_create(ctxt, {'name': 'default',
+                                            'user_id': 'fake',
+                                            'project_id': 'fake'})
+            sched = filter_scheduler.FilterScheduler()
+            weighted_hosts = make_weighted_hosts(size, options.hosts)
+
+            request_spec = make_request_spec(size)
+            old = bench_utils.timeit(lambda: one_at_a_time(sched, ctxt,
+                    weighted_hosts, request_spec), 1)
+
+            request_spec = make_request_spec(size)
+            sched._schedule = lambda *args, **kwargs: list(weighted_hosts)
+            new = bench_utils.timeit(lambda: sched.schedule_run_instance(
+                    ctxt, request_spec), 1)
+            rows.append((size, old, new, old / new))
+        finally:
+            os.unlink(path)
+    bench_utils.report('Provisioning latency per request on %d hosts '
+                       '(seconds)' % options.hosts, rows,
+                       ['instances', 'one at a time', 'batched', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""scheduler_host_table.py - Filter and weigh throughput per host count
+
+Runs the host selection loop of FilterScheduler._schedule() with the per
+host filters and least_cost.weighted_sum(), and the same selection over a
+HostTable, and reports scheduling requests per second.  Requires numpy.
+
+"""
+
+import base64
+import copy
+import gettext
+import optparse
+import os
+import random
+import sys
+import time
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import flags
+from nova import utils
+from nova.scheduler import host_manager
+from nova.scheduler import host_table
+from nova.scheduler import least_cost
+
+import bench_utils
+
+
+FLAGS = flags.FLAGS
+
+FILTERS = ['nova.scheduler.filters.ram_filter.RamFilter',
+           'nova.scheduler.filters.core_filter.CoreFilter',
+           'nova.scheduler.filters.compute_filter.ComputeFilter',
+           'nova.scheduler.filters.availability_zone_filter.'
+           'AvailabilityZoneFilter']
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--hosts', default='1000,10000',
+                      help='Comma separated host counts')
+    parser.add_option('--instances', default='1,10',
+                      help='Comma separated num_instances per request')
+    parser.add_option('--requests', type='int', default=20,
+                      help='Scheduling requests per measure')
+    return parser.parse_args()
+
+
+def make_host_states(count):
+    now = utils.utcnow()
+    host_states = []
+    for i in xrange(count):
+        caps = {'compute': {'beta_cpu': str(random.random()),
+                            'beta_io': str(random.random()),
+                            'beta_mem': str(random.random()),
+                            'beta_und': '0', 'enabled': True}}
+        service = {'disabled': random.random() < 0.05,
+                   'availability_zone': 'nova',
+                   'updated_at': now, 'created_at': now}
+        host_state = host_manager.HostState('host%d' % i, 'compute',
+                capabilities=caps, service=service)
+        host_state.update_from_compute_node(dict(
+                local_gb=1024, memory_mb=random.choice([8192, 32768]),
+                vcpus=16, n_cpu_vms=float(random.randint(0, 20)),
+                n_io_vms=float(random.randint(0, 20)),
+                n_mem_vms=float(random.randint(0, 20)),
+                n_und_vms=float(random.randint(0, 20))))
+        host_states.append(host_state)
+    return host_states
+
+
+def schedule_per_host(manager, cost_fns, host_states, props, num_instances):
+    hosts = iter(host_states)
+    instance = props['request_spec']['instance_properties']
+    for num in xrange(num_instances):
+        hosts = manager.filter_hosts(hosts, props)
+        if not hosts:
+            break
+        weighted_host = least_cost.weighted_sum(cost_fns, hosts, props)
+        weighted_host.host_state.consume_from_instance(instance)
+
+
+def schedule_host_table(manager, cost_fns, host_states, props,
+                        num_instances):
+    table = host_table.HostTable(host_states)
+    instance = props['request_spec']['instance_properties']
+    for num in xrange(num_instances):
+        mask = manager.filter_host_table(table, props)
+        if not mask.any():
+            break
+        index, weighted_host = host_table.weighted_sum(cost_fns, table,
+                                                       mask, props)
+        table.consume_from_instance(index, instance)
+
+
+def throughput(fn, manager, cost_fns, host_states, props, num_instances,
+               requests):
+    elapsed = 0.0
+    for i in xrange(requests):
+        # Every request starts from the same, unconsumed, host states.
+        states = [copy.copy(h) for h in host_states]
+        start = time.time()
+        fn(manager, cost_fns, states, props, num_instances)
+        elapsed += time.time() - start
+    return requests / elapsed
+
+
+def main():
+    options, _args = parse_options()
+    if host_table.numpy is None:
+        sys.exit('numpy is required')
+    FLAGS.set_override('scheduler_available_filters', FILTERS)
+    FLAGS.set_override('scheduler_default_filters',
+                       ['AvailabilityZoneFilter', 'RamFilter', 'CoreFilter',
+                        'ComputeFilter'])
+    manager = host_manager.HostManager()
+    cost_fns = [(1.0, least_cost.compute_fill_first_cost_Enea_fn),
+                (-1.0, least_cost.compute_fill_first_cost_fn)]
+    instance = {'root_gb': 10, 'ephemeral_gb': 0, 'memory_mb': 2048,
+                'vcpus': 1, 'availability_zone': 'nova',
+                'user_data': base64.b64encode('cpu')}
+    props = {'instance_type': {'memory_mb': 2048, 'vcpus': 1},
+             'request_spec': {'instance_properties': instance}}
+
+    rows = []
+    for count in [int(h) for h in options.hosts.split(',')]:
+        host_states = make_host_states(count)
+        for num_instances in [int(n) for n in options.instances.split(',')]:
+            per_host = throughput(schedule_per_host, manager, cost_fns,
+                                  host_states, props, num_instances,
+                                  options.requests)
+            table = throughput(schedule_host_table, manager, cost_fns,
+                               host_states, props, num_instances,
+                               options.requests)
+            rows.append((count, num_instances, per_host, table,
+                         table / per_host))
+    bench_utils.report('Scheduling requests per second', rows,
+                       ['hosts', 'instances', 'per host', 'host table',
+                        'speedup'])
+
+
+if __name__ == '__main__':
+    main()
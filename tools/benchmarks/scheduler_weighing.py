@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""scheduler_weighing.py - Time weighing of hosts per scheduling request
+
+Builds HostStates carrying the beta_* capabilities the way the HostManager
+does and times least_cost.weighted_sum() with the workload class cost
+function for a growing number of hosts.
+
+"""
+
+import base64
+import gettext
+import optparse
+import os
+import random
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova.scheduler import host_manager
+from nova.scheduler import least_cost
+
+import bench_utils
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--hosts', default='100,500,1000,5000',
+                      help='Comma separated host counts')
+    parser.add_option('--repeat', type='int', default=5)
+    return parser.parse_args()
+
+
+def make_host_states(count):
+    host_states = []
+    for i in xrange(count):
+        caps = {'compute': {'beta_cpu': str(random.random()),
+                            'beta_io': str(random.random()),
+                            'beta_mem': str(random.random()),
+                            'beta_und': '0'}}
+        host_state = host_manager.HostState('host%d' % i, 'compute',
+                                            capabilities=caps)
+        host_state.update_from_compute_node(dict(
+                local_gb=1024, memory_mb=32768, vcpus=16,
+                n_cpu_vms=float(random.randint(0, 20)),
+                n_io_vms=float(random.randint(0, 20)),
+                n_mem_vms=float(random.randint(0, 20)),
+                n_und_vms=float(random.randint(0, 20))))
+        host_states.append(host_state)
+    return host_states
+
+
+def main():
+    options, _args = parse_options()
+    weighted_fns = [(1.0, least_cost.compute_fill_first_cost_Enea_fn)]
+    props = {'request_spec': {'instance_properties': {
+                'user_data': base64.b64encode('cpu')}}}
+    rows = []
+    for count in [int(h) for h in options.hosts.split(',')]:
+        host_states = make_host_states(count)
+        elapsed = bench_utils.timeit(
+                lambda: least_cost.weighted_sum(weighted_fns, host_states,
+                                                props),
+                options.repeat)
+        rows.append((count, elapsed * 1000.0, elapsed * 1e6 / count))
+    bench_utils.report('Weighing latency per request (best of %d)' %
+                       options.repeat, rows,
+                       ['hosts', 'ms/request', 'us/host'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""server_addresses.py - Addresses of GET /servers/detail
+
+Renders the detail view of a number of servers read from a sqlite
+database, each with --vifs interfaces in its info cache, a fixed and a
+floating address on each.  Compares the addresses converted as they were,
+formatting the whole network info into the debug messages whether they
+are logged or not, with the per request networks.  Counts the rpc calls
+and the network info deserializations, and fails unless there is no rpc
+call and one deserialization per server.
+
+"""
+
+import datetime
+import gettext
+import optparse
+import os
+import sys
+
+import webob
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova.api.openstack import common
+from nova.api.openstack.compute.views import servers as views_servers
+from nova import compute
+from nova import context
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy.session import get_session
+from nova import log as logging
+from nova.network import model as network_model
+from nova import rpc
+from nova import utils
+
+import bench_utils
+
+
+LOG = logging.getLogger('nova.api.openstack.common')
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--instances', default='100,1000',
+                      help='Comma separated numbers of instances')
+    parser.add_option('--vifs', type='int', default=2,
+                      help='Interfaces of each instance')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='Best of this many renderings')
+    return parser.parse_args()
+
+
+def network_info(i, vifs):
+    nw_info = network_model.NetworkInfo()
+    for n in xrange(vifs):
+        floating_ip = network_model.IP(address='172.16.%d.%d' %
+                                       (i / 250, i % 250 + 1),
+                                       type='floating')
+        fixed_ip = network_model.FixedIP(address='10.%d.%d.%d' %
+                                         (n, i / 250, i % 250 + 1),
+                                         floating_ips=[floating_ip])
+        subnet = network_model.Subnet(cidr='10.%d.0.0/16' % n,
+                                      ips=[fixed_ip])
+        network = network_model.Network(id=str(n), label='net%d' % n,
+                                        subnets=[subnet])
+        nw_info.append(network_model.VIF(id='vif-%d-%d' % (i, n),
+                                         address='02:16:3e:00:%02x:%02x' %
+                                         (i % 256, n),
+                                         network=network))
+    return nw_info.as_cache()
+
+
+def populate(count, vifs):
+    session = get_session()
+    start = datetime.datetime(2012, 1, 1)
+    uuids = [str(utils.gen_uuid()) for i in xrange(count)]
+    session.execute(models.Instance.__table__.insert(),
+            [dict(id=i + 1, uuid=uuids[i], host='host%d' % (i % 50),
+                  hostname='server-%d' % i, display_name='server-%d' % i,
+                  project_id='project', user_id='user', instance_type_id=1,
+                  image_ref='1', launch_index=0, vm_state='active',
+                  created_at=start + datetime.timedelta(seconds=i),
+                  updated_at=start + datetime.timedelta(seconds=i),
+                  deleted=False)
+             for i in xrange(count)])
+    session.execute(models.InstanceInfoCache.__table__.insert(),
+            [dict(instance_id=uuids[i], network_info=network_info(i, vifs),
+                  deleted=False)
+             for i in xrange(count)])
+
+
+def old_get_networks_for_instance(request, instance):
+    """What the view did: the messages are formatted before being logged."""
+    context = request.environ['nova.context']
+    nw_info = common.get_nw_info_for_instance(context, instance)
+    networks = {}
+    LOG.debug(_('Converting nw_info: %s') % nw_info)
+    for vif in nw_info:
+        label = vif['network']['label']
+        if label not in networks:
+            networks[label] = {'ips': [], 'floating_ips': []}
+        networks[label]['ips'].extend(vif.fixed_ips())
+        networks[label]['floating_ips'].extend(vif.floating_ips())
+        LOG.debug(_('Converted networks: %s') % networks)
+    return networks
+
+
+def main():
+    options, _args = parse_options()
+    ctxt = context.RequestContext('user', 'project', is_admin=True)
+    compute_api = compute.API()
+    builder = views_servers.ViewBuilder()
+    calls = []
+    hydrated = []
+    orig_call = rpc.call
+    orig_hydrate = network_model.NetworkInfo.hydrate
+    orig_get_networks = common.get_networks_for_instance_in_request
+
+    def count_call(*args, **kwargs):
+        calls.append(None)
+        return orig_call(*args, **kwargs)
+
+    def count_hydrate(network_info):
+        hydrated.append(None)
+        return orig_hydrate(network_info)
+
+    def _detail():
+        request = webob.Request.blank('/servers/detail',
+                                     base_url='http://localhost/v2')
+        request.environ['nova.context'] = ctxt
+        return builder.detail(request, instances)
+
+    rows = []
+    rpc.call = count_call
+    network_model.NetworkInfo.hydrate = staticmethod(count_hydrate)
+    for count in [int(s) for s in options.instances.split(',')]:
+        path = bench_utils.setup_database()
+        try:
+            populate(count, options.vifs)
+            instances = compute_api.get_all(ctxt, search_opts={})
+            common.get_networks_for_instance_in_request = \
+                    old_get_networks_for_instance
+            try:
+                expected = _detail()
+                old = bench_utils.timeit(_detail, options.repeat)
+            finally:
+                common.get_networks_for_instance_in_request = \
+                        orig_get_networks
+            del calls[:]
+            del hydrated[:]
+            assert _detail() == expected
+            assert not calls, len(calls)
+            assert len(hydrated) == count, len(hydrated)
+            new = bench_utils.timeit(_detail, options.repeat)
+            rows.append((count, 0, count, old * 1000, new * 1000,
+                         old / new))
+        finally:
+            os.unlink(path)
+    rpc.call = orig_call
+    network_model.NetworkInfo.hydrate = orig_hydrate
+    bench_utils.report('detail view of servers with %d interfaces' %
+                       options.vifs, rows,
+                       ['servers', 'rpc calls', 'hydrations', 'old ms',
+                        'new ms', 'speedup'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""server_pages.py - Latency of a page of GET /servers
+
+Lists a page of --limit servers the way GET /servers?all_tenants=1 does,
+from a sqlite database of a number of instances: the first page, a page
+from the middle of the listing by marker, and the first page of servers
+whose name matches a regular expression, which only --match-every'th
+instance does.  Compares compute_api.get_all() reading every instance and
+slicing the page out of them, as the servers controller did, with the
+limit and marker given to get_all().
+
+"""
+
+import datetime
+import gettext
+import optparse
+import os
+import sys
+
+POSSIBLE_TOPDIR = os.path.normpath(os.path.join(os.path.abspath(sys.argv[0]),
+                                   os.pardir,
+                                   os.pardir,
+                                   os.pardir))
+if os.path.exists(os.path.join(POSSIBLE_TOPDIR, 'nova', '__init__.py')):
+    sys.path.insert(0, POSSIBLE_TOPDIR)
+
+gettext.install('nova', unicode=1)
+
+from nova import compute
+from nova import context
+from nova.db.sqlalchemy import models
+from nova.db.sqlalchemy.session import get_session
+from nova import utils
+
+import bench_utils
+
+
+def parse_options():
+    parser = optparse.OptionParser('usage: %prog [options]')
+    parser.add_option('--instances', default='10000,100000',
+                      help='Comma separated numbers of instances')
+    parser.add_option('--limit', type='int', default=20,
+                      help='Servers per page')
+    parser.add_option('--match-every', type='int', default=10,
+                      help='One instance in this many matches the name')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='Best of this many listings')
+    return parser.parse_args()
+
+
+def populate(count, match_every):
+    """Insert count instances and return their uuids, newest first."""
+    session = get_session()
+    start = datetime.datetime(2012, 1, 1)
+    uuids = [str(utils.gen_uuid()) for i in xrange(count)]
+    for first in xrange(0, count, 10000):
+        session.execute(models.Instance.__table__.insert(),
+                [dict(id=i + 1, uuid=uuids[i], host='host%d' % (i % 50),
+                      hostname='server-%d' % i,
+                      display_name=('web-%d' if i % match_every == 0
+                                    else 'db-%d') % i,
+                      project_id='project%d' % (i % 100),
+                      user_id='user', instance_type_id=1,
+                      image_ref='1', launch_index=0, vm_state='active',
+                      created_at=start + datetime.timedelta(seconds=i),
+                      deleted=False)
+                 for i in xrange(first, min(first + 10000, count))])
+    uuids.reverse()
+    return uuids
+
+
+def old_page(compute_api, ctxt, search_opts, limit, marker=None):
+    instances = compute_api.get_all(ctxt, search_opts=dict(search_opts))
+    start = 0
+    if marker:
+        start = [i['uuid'] for i in instances].index(marker) + 1
+    return instances[start:start + limit]
+
+
+def new_page(compute_api, ctxt, search_opts, limit, marker=None):
+    return compute_api.get_all(ctxt, search_opts=dict(search_opts),
+                               limit=limit, marker=marker)
+
+
+def main():
+    options, _args = parse_options()
+    compute_api = compute.API()
+    ctxt = context.get_admin_context()
+    rows = []
+    for count in [int(s) for s in options.instances.split(',')]:
+        path = bench_utils.setup_database()
+        try:
+            uuids = populate(count, options.match_every)
+            pages = [('first', {'deleted': False}, None),
+                     ('middle', {'deleted': False}, uuids[count / 2]),
+                     ('name', {'deleted': False, 'name': '^web-'}, None)]
+            for name, search_opts, marker in pages:
+                expected = old_page(compute_api, ctxt, search_opts,
+                                    options.limit, marker)
+                got = new_page(compute_api, ctxt, search_opts,
+                               options.limit, marker)
+                assert ([i['uuid'] for i in expected] ==
+                        [i['uuid'] for i in got])
+                old = bench_utils.timeit(lambda: old_page(compute_api, ctxt,
+                        search_opts, options.limit, marker), options.repeat)
+                new = bench_utils.timeit(lambda: new_page(compute_api, ctxt,
+                        search_opts, options.limit, marker), options.repeat)
+                rows.append((count, name, old * 1000, new * 1000, old / new))
+        finally:
+            os.unlink(path)
+    bench_utils.report('ms per page of %d servers, all tenants, a name '
+                       'matching 1 in %d instances' %
+                       (options.limit, options.match_every), rows,
+                       ['instances', 'page', 'get_all ms', 'paged ms',
+                        'speedup'])
+
+
+if __name__ == '__main__':
+    main()